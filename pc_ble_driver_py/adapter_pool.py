@@ -0,0 +1,537 @@
+#
+# Copyright (c) 2016 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""
+Connections to many peers spread over several adapters.
+"""
+
+import logging
+from threading import Condition, Lock, RLock
+
+from pc_ble_driver_py.ble_driver import *
+from pc_ble_driver_py.exceptions import NordicSemiException
+from pc_ble_driver_py.observers import BLEAdapterObserver, BLEDriverObserver
+
+logger = logging.getLogger(__name__)
+
+if nrf_sd_ble_api_ver == 5:
+    CENTRAL_ROLE_COUNT_DEFAULT = driver.BLE_GAP_ROLE_COUNT_CENTRAL_DEFAULT
+    CONN_COUNT_DEFAULT = driver.BLE_GAP_CONN_COUNT_DEFAULT
+    EVENT_LENGTH_DEFAULT = driver.BLE_GAP_EVENT_LENGTH_DEFAULT
+else:
+    # The S130 has no GAP configuration, pass links_per_adapter instead
+    CENTRAL_ROLE_COUNT_DEFAULT = 1
+    CONN_COUNT_DEFAULT = 1
+    EVENT_LENGTH_DEFAULT = 3
+
+# Status codes after which an adapter is given up
+ADAPTER_LOST_STATUS = (
+    RpcAppStatus.ioResourcesUnavailable,
+    RpcAppStatus.pktSendMaxRetriesReached,
+)
+
+
+def _key(address):
+    return tuple(address.addr)
+
+
+class PoolLink(object):
+    """Connection held by a member of an AdapterPool."""
+
+    def __init__(self, address, member, conn_handle, interval_ms):
+        self.address = address
+        self.member = member
+        self.conn_handle = conn_handle
+        self.interval_ms = interval_ms
+
+    @property
+    def adapter(self):
+        return self.member.adapter
+
+
+class PoolMember(object):
+    """One adapter of an AdapterPool and the links it holds.
+
+    capacity is the number of central links the adapter can hold and
+    event_length the connection event length in 1.25 ms units, both from the
+    configuration set on its driver unless overridden.
+    """
+
+    def __init__(self, adapter, capacity, event_length):
+        self.adapter = adapter
+        self.capacity = capacity
+        self.event_length_ms = event_length * 1.25
+        self.links = dict()
+        # Key of the peer being connected to, the SoftDevice initiates one
+        # connection at a time
+        self.connecting = None
+        self.scan_airtime = 0.0
+        self.alive = True
+
+    @property
+    def airtime(self):
+        """Share of the radio time taken by the links and by scanning."""
+        return self.scan_airtime + sum(
+            min(1.0, self.event_length_ms / link.interval_ms)
+            for link in self.links.values()
+        )
+
+    @property
+    def active(self):
+        return len(self.links) + (self.connecting is not None)
+
+    @property
+    def full(self):
+        return self.active >= self.capacity
+
+    def load(self):
+        return (self.active, self.airtime)
+
+    def stats(self):
+        return dict(
+            links=len(self.links),
+            capacity=self.capacity,
+            connecting=self.connecting is not None,
+            airtime=self.airtime,
+            alive=self.alive,
+        )
+
+
+class AdapterPool(BLEDriverObserver, BLEAdapterObserver):
+    """Connections to many peers spread over several BLEAdapters.
+
+    Peers are addressed by their BLEGapAddr, the pool picks the adapter. A
+    new connection goes to the adapter with the fewest active links, then
+    the least airtime, that still has room. Scanning runs on one adapter,
+    the scanner, and is restarted there after it was used to connect.
+
+    The pool keeps the peers passed to connect() connected until they are
+    passed to disconnect(). With reconnect, links that drop are connected
+    again. When an adapter is lost, its peers are connected again on the
+    adapters left, and scanning moves to one of them.
+    """
+
+    def __init__(
+        self,
+        adapters,
+        scanner=None,
+        links_per_adapter=None,
+        conn_params=None,
+        connect_scan_params=None,
+        tag=BLEConfigBase.conn_cfg_tag,
+        reconnect=True,
+    ):
+        super(AdapterPool, self).__init__()
+        self.links_per_adapter = links_per_adapter
+        self.conn_params = conn_params
+        self.connect_scan_params = connect_scan_params
+        self.tag = tag
+        self.reconnect = reconnect
+
+        self.lock = RLock()
+        self.cond = Condition(self.lock)
+        # Copy on write, like BLEDriver.observers
+        self.observers = list()
+        self.observer_lock = Lock()
+        self.members = list()
+        # Peer key -> BLEGapAddr of the peers to keep connected
+        self.peers = dict()
+        # Peer key -> PoolLink
+        self.links = dict()
+        self.scanner = None
+        self.scan_params = None
+
+        for adapter in adapters:
+            self.add_adapter(adapter)
+        if scanner is not None:
+            self.scanner = self._member(adapter=scanner)
+        elif self.members:
+            self.scanner = self.members[0]
+
+    def observer_register(self, observer):
+        with self.observer_lock:
+            self.observers = self.observers + [observer]
+
+    def observer_unregister(self, observer):
+        with self.observer_lock:
+            observers = list(self.observers)
+            observers.remove(observer)
+            self.observers = observers
+
+    def add_adapter(self, adapter):
+        """Add an open adapter, new connections are balanced onto it."""
+        ble_driver = adapter.driver
+        capacity = self.links_per_adapter
+        if capacity is None:
+            central_role_count = ble_driver.central_role_count
+            if central_role_count is None:
+                central_role_count = CENTRAL_ROLE_COUNT_DEFAULT
+            capacity = min(
+                central_role_count, ble_driver.conn_counts.get(self.tag, CONN_COUNT_DEFAULT)
+            )
+        event_length = ble_driver.event_lengths.get(self.tag, EVENT_LENGTH_DEFAULT)
+        member = PoolMember(adapter, capacity, event_length)
+        with self.lock:
+            self.members.append(member)
+            ble_driver.observer_register(self)
+            adapter.observer_register(self)
+            if self.scanner is None or not self.scanner.alive:
+                self.scanner = member
+                self._start_scan()
+            self._schedule()
+        return member
+
+    def close(self):
+        """Stop observing the adapters, they are left open."""
+        with self.lock:
+            for member in self.members:
+                member.adapter.driver.observer_unregister(self)
+                member.adapter.observer_unregister(self)
+            self.members = list()
+            self.peers = dict()
+            self.links = dict()
+            self.scanner = None
+            self.scan_params = None
+            self.cond.notify_all()
+
+    def _member(self, driver=None, adapter=None):
+        for member in self.members:
+            if member.alive and (
+                member.adapter is adapter or member.adapter.driver is driver
+            ):
+                return member
+        return None
+
+    def stats(self):
+        """Load of every adapter, in the order they were added."""
+        with self.lock:
+            return [member.stats() for member in self.members]
+
+    # Scanning
+
+    def start_scan(self, scan_params=None):
+        """Scan on the scanner, reports go to on_pool_adv_report."""
+        with self.lock:
+            if self.scanner is None:
+                raise NordicSemiException("No adapter to scan with")
+            self.scan_params = scan_params or BLEDriver.scan_params_setup()
+            self._start_scan()
+
+    def stop_scan(self):
+        with self.lock:
+            scanner, self.scan_params = self.scanner, None
+            if scanner is None or not scanner.scan_airtime:
+                return
+            scanner.scan_airtime = 0.0
+            if scanner.connecting is None:
+                scanner.adapter.driver.ble_gap_scan_stop()
+
+    def _start_scan(self):
+        scanner = self.scanner
+        if self.scan_params is None or scanner is None or scanner.connecting is not None:
+            return
+        try:
+            scanner.adapter.driver.ble_gap_scan_start(scan_params=self.scan_params)
+        except NordicSemiException as ex:
+            logger.warning("Scan start failed: {}".format(ex))
+            return
+        scanner.scan_airtime = self.scan_params.window_ms / self.scan_params.interval_ms
+
+    # Connections
+
+    def connect(self, address, timeout=10):
+        """Connect to address, returns its PoolLink.
+
+        Raises NordicSemiException if the peer is not connected within
+        timeout seconds, the pool then stops trying.
+        """
+        return self.connect_all([address], timeout)[0]
+
+    def connect_all(self, addresses, timeout=10):
+        """Connect to all addresses, in parallel on different adapters."""
+        keys = [_key(address) for address in addresses]
+        with self.lock:
+            for key, address in zip(keys, addresses):
+                self.peers[key] = address
+            self._schedule()
+            done = self.cond.wait_for(
+                lambda: all(key in self.links or key not in self.peers for key in keys),
+                timeout,
+            )
+            missing = [key for key in keys if key not in self.links]
+            if not done or missing:
+                for key in missing:
+                    self._forget(key)
+                raise NordicSemiException(
+                    "Failed to connect to {} of {} peers".format(len(missing), len(keys))
+                )
+            return [self.links[key] for key in keys]
+
+    def disconnect(self, address):
+        """Disconnect from address and stop reconnecting to it."""
+        with self.lock:
+            key = _key(address)
+            link = self.links.get(key)
+            self._forget(key)
+            if link is not None:
+                link.adapter.disconnect(link.conn_handle)
+
+    def link(self, address):
+        """PoolLink of address, or None if it is not connected."""
+        return self.links.get(_key(address))
+
+    def _link(self, address):
+        link = self.links.get(_key(address))
+        if link is None:
+            raise NordicSemiException("Not connected to {}".format(address.addr))
+        return link
+
+    def _forget(self, key):
+        self.peers.pop(key, None)
+        for member in self.members:
+            if member.connecting == key:
+                try:
+                    member.adapter.driver.ble_gap_connect_cancel()
+                except NordicSemiException:
+                    pass
+                member.connecting = None
+                member.adapter.conn_in_progress = False
+                self._resume_scan(member)
+        self.cond.notify_all()
+
+    def _choose(self, exclude=()):
+        candidates = [
+            member
+            for member in self.members
+            if member.alive and member.connecting is None and not member.full
+            and member not in exclude
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=PoolMember.load)
+
+    def _schedule(self):
+        """Start connecting to waiting peers, called with the lock held."""
+        connecting = set(member.connecting for member in self.members)
+        failed = set()
+        for key, address in list(self.peers.items()):
+            if key in self.links or key in connecting:
+                continue
+            member = self._choose(failed)
+            if member is None:
+                return
+            try:
+                # The SoftDevice stops scanning to initiate the connection
+                member.adapter.connect(
+                    address,
+                    scan_params=self.connect_scan_params,
+                    conn_params=self.conn_params,
+                    tag=self.tag,
+                )
+            except NordicSemiException as ex:
+                if ex.error_code == driver.NRF_ERROR_CONN_COUNT:
+                    member.capacity = len(member.links)
+                logger.warning("Connect failed: {}".format(ex))
+                failed.add(member)
+                continue
+            member.connecting = key
+
+    def _resume_scan(self, member):
+        if member is self.scanner and member.connecting is None:
+            self._start_scan()
+
+    def adapter_lost(self, adapter):
+        """Give up adapter and move its peers and scanning to the others."""
+        with self.lock:
+            member = self._member(adapter=adapter)
+            if member is None:
+                return
+            member.alive = False
+            member.connecting = None
+            lost = list(member.links.values())
+            member.links = dict()
+            for link in lost:
+                self.links.pop(_key(link.address), None)
+                if not self.reconnect:
+                    self.peers.pop(_key(link.address), None)
+            if member is self.scanner:
+                member.scan_airtime = 0.0
+                alive = [m for m in self.members if m.alive]
+                self.scanner = min(alive, key=PoolMember.load) if alive else None
+                self._start_scan()
+            self._schedule()
+            self.cond.notify_all()
+        logger.warning("Adapter lost, {} links to move".format(len(lost)))
+        for obs in self.observers:
+            obs.on_pool_adapter_lost(pool=self, adapter=adapter)
+            for link in lost:
+                obs.on_pool_disconnected(pool=self, peer_addr=link.address, reason=None)
+
+    # Keyed BLEAdapter operations
+
+    def service_discovery(self, address, uuid=None):
+        link = self._link(address)
+        return link.adapter.service_discovery(link.conn_handle, uuid)
+
+    def enable_notification(self, address, uuid, attr_handle=None):
+        link = self._link(address)
+        return link.adapter.enable_notification(link.conn_handle, uuid, attr_handle)
+
+    def disable_notification(self, address, uuid, attr_handle=None):
+        link = self._link(address)
+        return link.adapter.disable_notification(link.conn_handle, uuid, attr_handle)
+
+    def write_req(self, address, uuid, data, attr_handle=None):
+        link = self._link(address)
+        return link.adapter.write_req(link.conn_handle, uuid, data, attr_handle)
+
+    def write_cmd(self, address, uuid, data, attr_handle=None):
+        link = self._link(address)
+        return link.adapter.write_cmd(link.conn_handle, uuid, data, attr_handle)
+
+    def read_req(self, address, uuid, offset=0, attr_handle=None):
+        link = self._link(address)
+        return link.adapter.read_req(link.conn_handle, uuid, offset, attr_handle)
+
+    def att_mtu_exchange(self, address, mtu):
+        link = self._link(address)
+        return link.adapter.att_mtu_exchange(link.conn_handle, mtu)
+
+    # BLEDriverObserver
+
+    def on_gap_evt_connected(self, ble_driver, conn_handle, peer_addr, role, conn_params):
+        if role != BLEGapRoles.central:
+            return
+        key = _key(peer_addr)
+        with self.lock:
+            member = self._member(driver=ble_driver)
+            if member is None:
+                return
+            if member.connecting == key:
+                member.connecting = None
+            link = PoolLink(peer_addr, member, conn_handle, conn_params.max_conn_interval_ms)
+            member.links[conn_handle] = link
+            self.links[key] = link
+            wanted = key in self.peers
+            self._resume_scan(member)
+            self._schedule()
+            self.cond.notify_all()
+        if not wanted:
+            # Connected after connect() gave up on it
+            member.adapter.disconnect(conn_handle)
+            return
+        for obs in self.observers:
+            obs.on_pool_connected(
+                pool=self, peer_addr=peer_addr, adapter=member.adapter, conn_handle=conn_handle
+            )
+
+    def on_gap_evt_disconnected(self, ble_driver, conn_handle, reason):
+        with self.lock:
+            member = self._member(driver=ble_driver)
+            if member is None:
+                return
+            link = member.links.pop(conn_handle, None)
+            if link is None:
+                return
+            key = _key(link.address)
+            if self.links.get(key) is link:
+                del self.links[key]
+            if not self.reconnect:
+                self.peers.pop(key, None)
+            self._schedule()
+            self.cond.notify_all()
+        for obs in self.observers:
+            obs.on_pool_disconnected(pool=self, peer_addr=link.address, reason=reason)
+
+    def on_gap_evt_conn_param_update(self, ble_driver, conn_handle, conn_params):
+        with self.lock:
+            member = self._member(driver=ble_driver)
+            link = member.links.get(conn_handle) if member is not None else None
+            if link is not None:
+                link.interval_ms = conn_params.max_conn_interval_ms
+
+    def on_gap_evt_timeout(self, ble_driver, conn_handle, src):
+        with self.lock:
+            member = self._member(driver=ble_driver)
+            if member is None:
+                return
+            if src == BLEGapTimeoutSrc.conn:
+                member.connecting = None
+                self._resume_scan(member)
+                self._schedule()
+            elif src == BLEGapTimeoutSrc.scan and member is self.scanner:
+                member.scan_airtime = 0.0
+                self.scan_params = None
+
+    def on_gap_evt_adv_report(
+        self, ble_driver, conn_handle, peer_addr, rssi, adv_type, adv_data
+    ):
+        scanner = self.scanner
+        if scanner is None or scanner.adapter.driver is not ble_driver:
+            return
+        for obs in self.observers:
+            obs.on_pool_adv_report(
+                pool=self, peer_addr=peer_addr, rssi=rssi, adv_type=adv_type, adv_data=adv_data
+            )
+
+    def on_rpc_status(self, ble_driver, code, message):
+        if code not in ADAPTER_LOST_STATUS:
+            return
+        # Status is reported with the RPC adapter, not the BLEDriver
+        for member in list(self.members):
+            if member.alive and member.adapter.driver.rpc_adapter.internal == ble_driver.internal:
+                self.adapter_lost(member.adapter)
+
+    # BLEAdapterObserver
+
+    def _hvx_link(self, ble_adapter, conn_handle):
+        member = self._member(adapter=ble_adapter)
+        return member.links.get(conn_handle) if member is not None else None
+
+    def on_notification(self, ble_adapter, conn_handle, uuid, data):
+        link = self._hvx_link(ble_adapter, conn_handle)
+        if link is None:
+            return
+        for obs in self.observers:
+            obs.on_pool_notification(pool=self, peer_addr=link.address, uuid=uuid, data=data)
+
+    def on_indication(self, ble_adapter, conn_handle, uuid, data):
+        link = self._hvx_link(ble_adapter, conn_handle)
+        if link is None:
+            return
+        for obs in self.observers:
+            obs.on_pool_indication(pool=self, peer_addr=link.address, uuid=uuid, data=data)
@@ -0,0 +1,284 @@
+#
+# Copyright (c) 2016 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""
+Capture of raw advertising reports to a binary file, and replay of it.
+
+The file starts with FILE_HEADER and holds blocks of records. Each block
+starts with BLOCK_HEADER: the byte length and number of its records and
+the timestamps of the first and last one, so that readers can skip blocks
+by time. Each record is a 16-bit length followed by RECORD and the
+advertising data. All fields are little endian.
+"""
+
+import collections
+import logging
+import struct
+import threading
+import time
+
+from pc_ble_driver_py.ble_driver import driver, util
+
+logger = logging.getLogger(__name__)
+
+FILE_MAGIC = b"ADVCAPT\x00"
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct("<8sHH")  # magic, version, reserved
+BLOCK_HEADER = struct.Struct("<IIdd")  # length, count, first and last timestamp
+RECORD_LENGTH = struct.Struct("<H")
+# timestamp, addr_type, addr, rssi, adv_type, scan_rsp
+RECORD = struct.Struct("<dB6sbBB")
+
+AdvCaptureRecord = collections.namedtuple(
+    "AdvCaptureRecord", "timestamp addr_type addr rssi adv_type scan_rsp data"
+)
+AdvCaptureRecord.__doc__ = """Advertising report as captured.
+
+timestamp is from time.time(), addr is least significant byte first and
+adv_type is the raw SoftDevice value.
+"""
+
+
+class AdvRecorder(object):
+    """Appends advertising reports to a capture file.
+
+    Records are packed into a block in memory, and the block is written
+    once it holds block_records records or a record arrives when it is
+    block_interval seconds old, so that capturing costs no system call per
+    report. flush() and close() write out the block as it is. Pass it to
+    BLEDriver.adv_recorder_set() to capture every report the adapter
+    receives, before the advertising filter.
+    """
+
+    def __init__(self, path, block_records=1000, block_interval=1.0):
+        self.path = path
+        self.block_records = block_records
+        self.block_interval = block_interval
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, 0))
+        self._block = bytearray()
+        self._count = 0
+        self._first = None
+        self._last = None
+        self._opened = None
+
+    def record(self, adv_report):
+        """Append a ble_gap_evt_adv_report_t."""
+        peer_addr = adv_report.peer_addr
+        self.record_fields(
+            time.time(),
+            peer_addr.addr_type,
+            util.uint8_array_to_bytes(peer_addr.addr, driver.BLE_GAP_ADDR_LEN),
+            adv_report.rssi,
+            adv_report.type,
+            adv_report.scan_rsp,
+            util.uint8_array_to_bytes(adv_report.data, adv_report.dlen),
+        )
+
+    def record_fields(self, timestamp, addr_type, addr, rssi, adv_type, scan_rsp, data):
+        packed = RECORD.pack(timestamp, addr_type, addr, rssi, adv_type, scan_rsp)
+        with self._lock:
+            if self._file is None:
+                return
+            block = self._block
+            block += RECORD_LENGTH.pack(len(packed) + len(data))
+            block += packed
+            block += data
+            if self._first is None:
+                self._first = timestamp
+                self._opened = time.monotonic()
+            self._last = timestamp
+            self._count += 1
+            self.recorded += 1
+            if (
+                self._count >= self.block_records
+                or time.monotonic() - self._opened >= self.block_interval
+            ):
+                self._write_block()
+
+    def _write_block(self):
+        if not self._count:
+            return
+        self._file.write(
+            BLOCK_HEADER.pack(len(self._block), self._count, self._first, self._last)
+        )
+        self._file.write(self._block)
+        self._block = bytearray()
+        self._count = 0
+        self._first = None
+
+    def flush(self):
+        """Write the records of the current block out."""
+        with self._lock:
+            if self._file is not None:
+                self._write_block()
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._write_block()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_adv_capture(path, start=None, end=None):
+    """Yield the AdvCaptureRecords of a capture file, oldest first.
+
+    Only records with a timestamp from start up to end are yielded, the
+    blocks outside of that are skipped unread. A block cut short, as left
+    by a capture that did not close its file, ends the iteration.
+    """
+    with open(path, "rb") as capture:
+        header = capture.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size:
+            return
+        magic, version, _ = FILE_HEADER.unpack(header)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            raise ValueError("{} is not an advertising capture file".format(path))
+
+        while True:
+            header = capture.read(BLOCK_HEADER.size)
+            if len(header) < BLOCK_HEADER.size:
+                return
+            length, count, first, last = BLOCK_HEADER.unpack(header)
+            if start is not None and last < start:
+                capture.seek(length, 1)
+                continue
+            if end is not None and first > end:
+                return
+            block = capture.read(length)
+            if len(block) < length:
+                logger.warning("Capture {} ends in the middle of a block".format(path))
+                return
+
+            offset = 0
+            for _ in range(count):
+                (record_length,) = RECORD_LENGTH.unpack_from(block, offset)
+                offset += RECORD_LENGTH.size
+                fields = RECORD.unpack_from(block, offset)
+                data = block[offset + RECORD.size:offset + record_length]
+                offset += record_length
+                timestamp = fields[0]
+                if start is not None and timestamp < start:
+                    continue
+                if end is not None and timestamp > end:
+                    return
+                yield AdvCaptureRecord(*fields, data=bytes(data))
+
+
+class _Struct(object):
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def adv_report_event(record):
+    """Stand-in for a ble_evt_t carrying the report of an AdvCaptureRecord.
+
+    Holds what the BLEDriver event path reads from an advertising report.
+    """
+    addr = util.list_to_uint8_array(list(record.addr))
+    data = util.list_to_uint8_array(list(record.data))
+    adv_report = _Struct(
+        peer_addr=_Struct(addr_type=record.addr_type, addr=addr.cast()),
+        rssi=record.rssi,
+        type=record.adv_type,
+        scan_rsp=record.scan_rsp,
+        dlen=len(record.data),
+        data=data.cast(),
+        # The casts point into these
+        arrays=(addr, data),
+    )
+    conn_handle = driver.BLE_CONN_HANDLE_INVALID
+    return _Struct(
+        header=_Struct(evt_id=driver.BLE_GAP_EVT_ADV_REPORT),
+        evt=_Struct(
+            common_evt=_Struct(conn_handle=conn_handle),
+            gap_evt=_Struct(conn_handle=conn_handle, params=_Struct(adv_report=adv_report)),
+        ),
+    )
+
+
+class AdvReplayer(object):
+    """Feeds a capture file to a BLEDriver as if the reports came from its adapter.
+
+    speed scales the recorded pace, 2.0 plays twice as fast and None as
+    fast as possible. With queued, reports go through the advertising
+    filter and the event queue of an open driver, as received reports do.
+    Otherwise they are decoded and dispatched in the calling thread, after
+    the advertising filter, which needs no open adapter. Replayed reports
+    are never recorded by the adv_recorder of the driver.
+    """
+
+    def __init__(self, ble_driver, path, speed=1.0, queued=True):
+        self.ble_driver = ble_driver
+        self.path = path
+        self.speed = speed
+        self.queued = queued
+
+    def run(self, start=None, end=None):
+        """Replay the records from start up to end, returns how many."""
+        ble_driver = self.ble_driver
+        count = 0
+        first = None
+        began = time.monotonic()
+        for record in read_adv_capture(self.path, start, end):
+            if self.speed:
+                if first is None:
+                    first = record.timestamp
+                delay = began + (record.timestamp - first) / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            ble_event = adv_report_event(record)
+            if self.queued:
+                ble_driver.ble_event_queue_put(ble_event)
+            elif ble_driver.adv_filter_match(ble_event):
+                ble_driver.ble_event_handler_sync(ble_driver.rpc_adapter, ble_event)
+            else:
+                ble_driver.adv_filtered += 1
+            count += 1
+        return count
@@ -0,0 +1,233 @@
+#
+# Copyright (c) 2016 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""
+Filters on raw advertising reports, matched before the reports are queued.
+"""
+
+# AD types from the Bluetooth assigned numbers
+AD_TYPE_SERVICE_UUIDS = {
+    2: (0x02, 0x03),  # 16-bit, incomplete and complete lists
+    4: (0x04, 0x05),  # 32-bit
+    16: (0x06, 0x07),  # 128-bit
+}
+AD_TYPE_NAMES = (0x08, 0x09)  # Shortened and complete local name
+AD_TYPE_MANUFACTURER_SPECIFIC_DATA = 0xFF
+
+# SoftDevice UUID type of Bluetooth SIG UUIDs, BLE_UUID_TYPE_BLE
+UUID_TYPE_BLE = 0x01
+
+# Bluetooth Base UUID, most significant byte first
+BLUETOOTH_BASE_UUID = bytes(
+    [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x10, 0x00,
+     0x80, 0x00, 0x00, 0x80, 0x5F, 0x9B, 0x34, 0xFB]
+)
+
+
+def _ad_fields(data, ad_types):
+    """Values of the AD structures with a type in ad_types, by type."""
+    fields = dict()
+    index = 0
+    end = len(data)
+    while index + 1 < end:
+        ad_len = data[index]
+        if ad_len == 0:
+            break
+        ad_type = data[index + 1]
+        if ad_type in ad_types:
+            fields.setdefault(ad_type, []).append(data[index + 2:index + ad_len + 1])
+        index += ad_len + 1
+    return fields
+
+
+def _uuid_bytes(uuid):
+    """UUID as sent in advertising data, least significant byte first.
+
+    uuid is a 16 or 32-bit int, 16 bytes most significant first, or a
+    BLEUUID. A vendor specific BLEUUID needs the bytes of its base, which
+    BLEUUIDs from events and discovery leave out.
+    """
+    base = getattr(uuid, "base", None)
+    if base is not None:
+        value = getattr(uuid.value, "value", uuid.value)
+        if base.base is None:
+            if base.type != UUID_TYPE_BLE:
+                raise ValueError(
+                    "Vendor specific UUID 0x{:04X} of type {} has no base bytes, "
+                    "give the 128-bit UUID instead".format(value, base.type)
+                )
+            uuid = value
+        elif bytes(base.base) == BLUETOOTH_BASE_UUID:
+            uuid = value
+        else:
+            uuid = bytes(base.base[:2]) + value.to_bytes(2, "big") + bytes(base.base[4:])
+    if isinstance(uuid, int):
+        return uuid.to_bytes(2 if uuid <= 0xFFFF else 4, "little")
+    uuid = bytes(uuid)
+    if len(uuid) != 16:
+        raise ValueError("Invalid UUID length: {}".format(len(uuid)))
+    return uuid[::-1]
+
+
+class AdvFilter(object):
+    """Advertising reports to let through, all conditions given must hold.
+
+    addr: address or leading bytes of it, most significant byte first as in
+        BLEGapAddr.addr, or a BLEGapAddr.
+    addr_type: BLEGapAddr.Types or int, or several of them.
+    rssi_min: weakest signal strength in dBm.
+    service_uuid: UUID in a service UUID list, a 16 or 32-bit int, 16 bytes
+        most significant first, or a BLEUUID.
+    company_id: company identifier of manufacturer specific data.
+    name_prefix: str or bytes the shortened or complete local name starts with.
+
+    Every report is matched on its own, so a scan response only matches on
+    the fields it carries.
+    """
+
+    def __init__(
+        self,
+        addr=None,
+        addr_type=None,
+        rssi_min=None,
+        service_uuid=None,
+        company_id=None,
+        name_prefix=None,
+    ):
+        self.addr = addr
+        self.addr_type = addr_type
+        self.rssi_min = rssi_min
+        self.service_uuid = service_uuid
+        self.company_id = company_id
+        self.name_prefix = name_prefix
+
+    def compile(self):
+        """Predicate of (addr_type, addr, rssi, data) for this filter.
+
+        addr and data are the raw bytes of the report, the address least
+        significant byte first.
+        """
+        # Cheap checks on the report header first, then one walk over the
+        # AD structures for the rest
+        checks = list()
+        ad_checks = list()
+        ad_types = set()
+
+        if self.addr_type is not None:
+            addr_types = self.addr_type
+            if not isinstance(addr_types, (list, tuple, set, frozenset)):
+                addr_types = [addr_types]
+            addr_types = frozenset(getattr(t, "value", t) for t in addr_types)
+            checks.append(lambda addr_type, addr, rssi: addr_type in addr_types)
+
+        if self.rssi_min is not None:
+            rssi_min = self.rssi_min
+            checks.append(lambda addr_type, addr, rssi: rssi >= rssi_min)
+
+        if self.addr is not None:
+            suffix = bytes(getattr(self.addr, "addr", self.addr))[::-1]
+            checks.append(lambda addr_type, addr, rssi: addr.endswith(suffix))
+
+        if self.service_uuid is not None:
+            uuid = _uuid_bytes(self.service_uuid)
+            size = len(uuid)
+            uuid_types = AD_TYPE_SERVICE_UUIDS[size]
+            ad_types.update(uuid_types)
+
+            def has_uuid(fields):
+                for ad_type in uuid_types:
+                    for value in fields.get(ad_type, ()):
+                        for i in range(0, len(value) - size + 1, size):
+                            if value[i:i + size] == uuid:
+                                return True
+                return False
+
+            ad_checks.append(has_uuid)
+
+        if self.company_id is not None:
+            company_id = self.company_id.to_bytes(2, "little")
+            ad_types.add(AD_TYPE_MANUFACTURER_SPECIFIC_DATA)
+            ad_checks.append(
+                lambda fields: any(
+                    value[:2] == company_id
+                    for value in fields.get(AD_TYPE_MANUFACTURER_SPECIFIC_DATA, ())
+                )
+            )
+
+        if self.name_prefix is not None:
+            prefix = self.name_prefix
+            if isinstance(prefix, str):
+                prefix = prefix.encode("utf-8")
+            prefix = bytes(prefix)
+            ad_types.update(AD_TYPE_NAMES)
+            ad_checks.append(
+                lambda fields: any(
+                    value.startswith(prefix)
+                    for ad_type in AD_TYPE_NAMES
+                    for value in fields.get(ad_type, ())
+                )
+            )
+
+        ad_types = frozenset(ad_types)
+
+        def matches(addr_type, addr, rssi, data):
+            for check in checks:
+                if not check(addr_type, addr, rssi):
+                    return False
+            if ad_checks:
+                fields = _ad_fields(data, ad_types)
+                for check in ad_checks:
+                    if not check(fields):
+                        return False
+            return True
+
+        return matches
+
+
+def compile_adv_filters(filters):
+    """Predicate that matches reports matching any of filters."""
+    predicates = [adv_filter.compile() for adv_filter in filters]
+    if len(predicates) == 1:
+        return predicates[0]
+
+    def matches(addr_type, addr, rssi, data):
+        for predicate in predicates:
+            if predicate(addr_type, addr, rssi, data):
+                return True
+        return False
+
+    return matches
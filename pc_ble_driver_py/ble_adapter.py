@@ -40,89 +40,221 @@ This module implements convenience methods on top of ble_driver
 """
 
 from threading import Condition
+import bisect
+import collections
 import logging
+import time
 
 from pc_ble_driver_py.ble_driver import *
+from pc_ble_driver_py.bond_store import Bond
 from pc_ble_driver_py.exceptions import NordicSemiException
+from pc_ble_driver_py.gatt_cache import GattCacheEntry
+from pc_ble_driver_py.gatt_discovery import GattDiscovery
 from pc_ble_driver_py.observers import *
 
 logger = logging.getLogger(__name__)
 
 MAX_TRIES = 10  # Maximum Number of Tries by driver.ble_gattc_write
 
+# Error codes returned when the SoftDevice TX queue is full
+if nrf_sd_ble_api_ver == 2:
+    TX_QUEUE_FULL_ERRORS = (driver.NRF_ERROR_RESOURCES, driver.BLE_ERROR_NO_TX_PACKETS)
+else:
+    TX_QUEUE_FULL_ERRORS = (driver.NRF_ERROR_RESOURCES,)
+
+
+class DbIndex(object):
+    """Lookup tables over a discovered GATT database.
+
+    Mirrors the results of a linear scan over services, characteristics and
+    descriptors in discovery order, so lookups do not depend on database size.
+    """
+
+    def __init__(self, services):
+        # (uuid value, base type) -> [(service, char, value handle)]
+        self.chars_by_uuid = dict()
+        # (uuid value, base type) -> CCCD of the first matching char in a service
+        self.cccd_by_uuid = dict()
+        # (uuid value, base type, value handle) -> CCCD handle
+        self.cccd_by_value_handle = dict()
+
+        chars = list()
+        for s in services:
+            seen_in_service = set()
+            for c in s.chars:
+                key = (c.uuid.value, c.uuid.base.type)
+                value_handle = None
+                cccd_handle = None
+                for d in c.descs:
+                    if value_handle is None and d.uuid.value == c.uuid.value:
+                        value_handle = d.handle
+                    if cccd_handle is None and d.uuid.value == BLEUUID.Standard.cccd:
+                        cccd_handle = d.handle
+
+                self.chars_by_uuid.setdefault(key, list()).append((s, c, value_handle))
+                if key not in seen_in_service:
+                    seen_in_service.add(key)
+                    if cccd_handle is not None:
+                        self.cccd_by_uuid.setdefault(key, cccd_handle)
+                if cccd_handle is not None:
+                    self.cccd_by_value_handle.setdefault(
+                        key + (c.handle_value,), cccd_handle
+                    )
+                chars.append(c)
+
+        # Sorted on declaration handle for range lookups with bisect
+        chars.sort(key=lambda c: c.handle_decl)
+        self.chars = chars
+        self.decl_handles = [c.handle_decl for c in chars]
+
+    def char_by_handle(self, handle):
+        i = bisect.bisect_right(self.decl_handles, handle) - 1
+        if i >= 0 and self.chars[i].end_handle >= handle:
+            return self.chars[i]
+        return None
+
 
 class DbConnection(object):
     def __init__(self):
-        self.services = list()
+        self._services = list()
+        self._index = None
         self.att_mtu = ATT_MTU_DEFAULT
 
+    @property
+    def services(self):
+        return self._services
+
+    @services.setter
+    def services(self, services):
+        self._services = services
+        self._index = None
+
+    def invalidate_index(self):
+        """Drop the lookup index, must be called after services are modified."""
+        self._index = None
+
+    def build_index(self):
+        self._index = DbIndex(self._services)
+        return self._index
+
+    def _get_index(self):
+        index = self._index
+        if index is None:
+            index = self.build_index()
+        return index
+
     def get_char_value_handle(self, uuid, service_uuid=None):
         assert isinstance(uuid, BLEUUID), "Invalid argument type"
 
         if service_uuid is not None:
             assert isinstance(service_uuid, BLEUUID), "Invalid argument type"
 
-        for s in self.services:
+        key = (uuid.value, uuid.base.type)
+        for s, c, value_handle in self._get_index().chars_by_uuid.get(key, ()):
+            if value_handle is None:
+                continue
             if service_uuid is None or (
                 (s.uuid.value == service_uuid.value)
                 and (s.uuid.base.type == service_uuid.base.type)
             ):
-                for c in s.chars:
-                    if (c.uuid.value == uuid.value) and (
-                        c.uuid.base.type == uuid.base.type
-                    ):
-                        for d in c.descs:
-                            if d.uuid.value == uuid.value:
-                                return d.handle
+                return value_handle
         return None
 
     def get_cccd_handle(self, uuid, attr_handle=None):
         assert isinstance(uuid, BLEUUID), "Invalid argument type"
-        for s in self.services:
-            for c in s.chars:
-                if (c.uuid.value == uuid.value) and (
-                    c.uuid.base.type == uuid.base.type):
-                    if attr_handle is None:
-                        for d in c.descs:
-                            if d.uuid.value == BLEUUID.Standard.cccd:
-                                return d.handle
-                        break
-                    elif attr_handle == c.handle_value:
-                        for d in c.descs:
-                            if d.uuid.value == BLEUUID.Standard.cccd:
-                                return d.handle
-        return None
+        index = self._get_index()
+        key = (uuid.value, uuid.base.type)
+        if attr_handle is None:
+            return index.cccd_by_uuid.get(key)
+        return index.cccd_by_value_handle.get(key + (attr_handle,))
 
     def get_char_handle(self, uuid):
         assert isinstance(uuid, BLEUUID), "Invalid argument type"
 
-        for s in self.services:
-            for c in s.chars:
-                if (c.uuid.value == uuid.value) and (
-                    c.uuid.base.type == uuid.base.type
-                ):
-                    return c.handle_decl
+        chars = self._get_index().chars_by_uuid.get((uuid.value, uuid.base.type))
+        if chars:
+            return chars[0][1].handle_decl
         return None
 
     def get_char_uuid(self, handle):
-        for s in self.services:
-            for c in s.chars:
-                if (c.handle_decl <= handle) and (c.end_handle >= handle):
-                    return c.uuid
+        c = self._get_index().char_by_handle(handle)
+        if c is not None:
+            return c.uuid
 
     def get_char_props(self, handle):
-        for s in self.services:
-            for c in s.chars:
-                if (c.handle_decl <= handle) and (c.end_handle >= handle):
-                    return c.char_props
+        c = self._get_index().char_by_handle(handle)
+        if c is not None:
+            return c.char_props
+
+
+def _split_chunks(data, size):
+    if isinstance(data, (list, tuple)):
+        data = bytes(data)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = [data]
+    for chunk in data:
+        if not isinstance(chunk, (bytes, bytearray, memoryview)):
+            chunk = bytes(chunk)
+        view = memoryview(chunk).cast("B")
+        for i in range(0, len(view), size):
+            yield view[i:i + size]
+
+
+class TxCredits(object):
+    """Free buffers in a SoftDevice TX queue.
+
+    A credit is taken for every packet queued in the SoftDevice and given back
+    when a TX complete event reports the packet as sent.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.available = size
+        self.cond = Condition(Lock())
+
+    def acquire(self, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.available > 0, timeout):
+                return False
+            self.available -= 1
+            return True
+
+    def release(self, count=1):
+        with self.cond:
+            self.available = min(self.size, self.available + count)
+            self.cond.notify_all()
+
+    def clear(self):
+        """Mark the queue as full, e.g. after NRF_ERROR_RESOURCES."""
+        with self.cond:
+            self.available = 0
+
+    def wait_all(self, timeout=None):
+        """Wait until all queued packets have been sent."""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.available == self.size, timeout)
 
 
 class Connection(DbConnection):
-    def __init__(self, peer_addr, role):
+    def __init__(
+        self, peer_addr, role, conn_cfg_tag=0, write_cmd_tx_queue_size=1, hvn_tx_queue_size=1
+    ):
         super(Connection, self).__init__()
         self.role = role
         self.peer_addr = peer_addr
+        self.conn_cfg_tag = conn_cfg_tag
         self._keyset = None
+        self.write_cmd_credits = TxCredits(write_cmd_tx_queue_size)
+        if nrf_sd_ble_api_ver == 2:
+            # Write commands and notifications share the application TX buffers
+            self.hvn_credits = self.write_cmd_credits
+        else:
+            self.hvn_credits = TxCredits(hvn_tx_queue_size)
+        # Bonding identity of the peer (e.g. IRK), part of the GATT cache key
+        self.identity = None
+        # Set by a Service Changed indication, services are discovered again
+        # before the next lookup
+        self.services_stale = False
 
     def __str__(self):
         s = (
@@ -143,35 +275,110 @@ class Connection(DbConnection):
         return self.__str__()
 
 
+class EvtQueue(object):
+    """Events of one type received while the queue is open.
+
+    Created with EvtSync.expect before the request is sent, so a response
+    arriving before wait is called is kept instead of lost.
+    """
+
+    def __init__(self, evt_sync, evt):
+        self.evt_sync = evt_sync
+        self.evt = evt
+        self.items = collections.deque()
+        self.closed = False
+        self.cond = Condition(Lock())
+
+    def put(self, data):
+        with self.cond:
+            self.items.append(data)
+            self.cond.notify_all()
+
+    def wait(self, timeout=5):
+        """Return the next event data, or None on timeout or disconnect."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.items or self.closed, timeout):
+                return None
+            if self.items:
+                return self.items.popleft()
+            return None
+
+    def close(self):
+        self.evt_sync._remove(self)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 class EvtSync(object):
+    """Delivers the events of a connection to the threads waiting for them.
+
+    Each event goes to the oldest open EvtQueue for its type, in the order
+    the requests were sent, so responses of different types do not
+    overwrite each other.
+    """
+
     def __init__(self, events):
-        self.conds = dict()
+        self.lock = Lock()
+        self.queues = dict()
         for evt in events:
-            self.conds[evt] = Condition(Lock())
-        self.data = None
+            self.queues[evt] = collections.deque()
+
+    def expect(self, evt):
+        evt_queue = EvtQueue(self, evt)
+        with self.lock:
+            self.queues[evt].append(evt_queue)
+        return evt_queue
 
     def wait(self, evt, timeout=5):
-        self.data = None
-        with self.conds[evt]:
-            self.conds[evt].wait(timeout=timeout)
-            return self.data
+        with self.expect(evt) as evt_queue:
+            return evt_queue.wait(timeout)
 
     def notify(self, evt, data=None):
-        with self.conds[evt]:
-            self.data = data
-            self.conds[evt].notify_all()
+        with self.lock:
+            if not self.queues[evt]:
+                return
+            evt_queue = self.queues[evt][0]
+        evt_queue.put(data)
+
+    def close(self):
+        """Wake up all waiters, e.g. on disconnect."""
+        with self.lock:
+            evt_queues = [q for queues in self.queues.values() for q in queues]
+        for evt_queue in evt_queues:
+            evt_queue.close()
+
+    def _remove(self, evt_queue):
+        with self.lock:
+            try:
+                self.queues[evt_queue.evt].remove(evt_queue)
+            except ValueError:
+                pass
 
 
 class BLEAdapter(BLEDriverObserver):
-    observer_lock = Lock()
-
-    def __init__(self, ble_driver):
+    def __init__(self, ble_driver, gatt_cache=None, bond_store=None):
         super(BLEAdapter, self).__init__()
         self.driver = ble_driver
         self.driver.observer_register(self)
+        # Optional GattCache, used by service_discovery
+        self.gatt_cache = gatt_cache
+        # Optional BondStore. Bonds are saved when pairing completes, answer
+        # the encryption requests of bonded centrals, and are used by encrypt()
+        # The store owns the security info reply, gap_evt_sec_info_request is
+        # then only passed on when the reply fails.
+        self.bond_store = bond_store
 
         self.conn_in_progress = False
+        # Copy on write, like BLEDriver.observers
         self.observers = list()
+        self.observer_lock = Lock()
         self.db_conns = dict()
         self.evt_sync = dict()
         self.default_mtu = ATT_MTU_DEFAULT
@@ -191,40 +398,51 @@ class BLEAdapter(BLEDriverObserver):
     def connect(self, address, scan_params=None, conn_params=None, tag=0):
         if self.conn_in_progress:
             return
-        if nrf_sd_ble_api_ver == 2:
-            self.driver.ble_gap_connect(
-                address=address, scan_params=scan_params, conn_params=conn_params
-            )
-        elif nrf_sd_ble_api_ver == 5:
-            self.driver.ble_gap_connect(
-                address=address,
-                scan_params=scan_params,
-                conn_params=conn_params,
-                tag=tag,
-            )
+        # Set first, the connected event can be handled before the call returns
         self.conn_in_progress = True
+        try:
+            if nrf_sd_ble_api_ver == 2:
+                self.driver.ble_gap_connect(
+                    address=address, scan_params=scan_params, conn_params=conn_params
+                )
+            elif nrf_sd_ble_api_ver == 5:
+                self.driver.ble_gap_connect(
+                    address=address,
+                    scan_params=scan_params,
+                    conn_params=conn_params,
+                    tag=tag,
+                )
+        except Exception:
+            self.conn_in_progress = False
+            raise
 
     def disconnect(self, conn_handle):
         self.driver.ble_gap_disconnect(conn_handle)
 
-    @wrapt.synchronized(observer_lock)
+    def adv_filter_set(self, *filters):
+        self.driver.adv_filter_set(*filters)
+
     def observer_register(self, observer):
-        self.observers.append(observer)
+        with self.observer_lock:
+            self.observers = self.observers + [observer]
 
-    @wrapt.synchronized(observer_lock)
     def observer_unregister(self, observer):
-        self.observers.remove(observer)
+        with self.observer_lock:
+            observers = list(self.observers)
+            observers.remove(observer)
+            self.observers = observers
 
     def att_mtu_exchange(self, conn_handle, mtu):
-        try:
-            self.driver.ble_gattc_exchange_mtu_req(conn_handle, mtu)
-        except NordicSemiException as ex:
-            raise NordicSemiException(
-                "MTU exchange request failed. Common causes are: "
-                "missing att_mtu setting in ble_cfg_set, "
-                "different config tags used in ble_cfg_set and connect.") from ex
+        with self.evt_sync[conn_handle].expect(BLEEvtID.gattc_evt_exchange_mtu_rsp) as responses:
+            try:
+                self.driver.ble_gattc_exchange_mtu_req(conn_handle, mtu)
+            except NordicSemiException as ex:
+                raise NordicSemiException(
+                    "MTU exchange request failed. Common causes are: "
+                    "missing att_mtu setting in ble_cfg_set, "
+                    "different config tags used in ble_cfg_set and connect.") from ex
 
-        response = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gattc_evt_exchange_mtu_rsp)
+            response = responses.wait()
 
         if response is None:
             return self.db_conns[conn_handle].att_mtu
@@ -236,13 +454,10 @@ class BLEAdapter(BLEDriverObserver):
         return new_mtu
 
     def phy_update(self, conn_handle, req_phys):
-        try:
+        with self.evt_sync[conn_handle].expect(BLEEvtID.gap_evt_phy_update) as responses:
             gap_phys = BLEGapPhys(*req_phys)
             self.driver.ble_gap_phy_update(conn_handle, gap_phys)
-        except NordicSemiException as ex:
-            raise ex
-
-        response = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gap_evt_phy_update)
+            response = responses.wait()
 
         if response is None:
             return
@@ -250,16 +465,13 @@ class BLEAdapter(BLEDriverObserver):
         return response
 
     def data_length_update(self, conn_handle, data_length):
-        try:
+        with self.evt_sync[conn_handle].expect(BLEEvtID.gap_evt_data_length_update) as responses:
             dl_params = BLEGapDataLengthParams()
             dl_params.max_tx_octets = data_length
             dl_params.max_rx_octets = data_length
             self.driver.ble_gap_data_length_update(
                 conn_handle, dl_params, data_length_limitation=None)
-        except NordicSemiException as ex:
-            raise ex
-
-        response = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gap_evt_data_length_update)
+            response = responses.wait()
 
         if response is None:
             return
@@ -271,130 +483,254 @@ class BLEAdapter(BLEDriverObserver):
 
     @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
     def service_discovery(self, conn_handle, uuid=None):
+        db_conn = self.db_conns[conn_handle]
+        db_conn.invalidate_index()
+        try:
+            if self.gatt_cache is None or uuid is not None:
+                return self._service_discovery(conn_handle, uuid)
+
+            if self._gatt_cache_validate(conn_handle):
+                db_conn.services_stale = False
+                return BLEGattStatusCode.success
+
+            db_conn.services = list()
+            status = self._service_discovery(conn_handle, uuid)
+            if status == BLEGattStatusCode.success:
+                db_conn.services_stale = False
+                self._gatt_cache_store(conn_handle)
+            return status
+        finally:
+            # Services are modified in place during discovery
+            db_conn.build_index()
+
+    def discover_services(self, conn_handle, service_uuids=None, char_uuids=None):
+        """Discover services with GattDiscovery, optionally limited to the
+        given service and characteristic UUIDs.
+
+        Returns the number of requests and time spent per discovery phase.
+        """
+        discovery = GattDiscovery(self.driver, conn_handle, service_uuids, char_uuids)
+        status = discovery.run()
+        if status != BLEGattStatusCode.success:
+            raise NordicSemiException(
+                "Failed to discover services. Error code: {}".format(status),
+                error_code=status,
+            )
+
+        self._merge_services(conn_handle, discovery.services)
+        return discovery.stats
+
+    def _db_conn(self, conn_handle):
+        """Connection of conn_handle, discovering services again if they are stale."""
+        db_conn = self.db_conns[conn_handle]
+        if db_conn.services_stale:
+            logger.info("Services of connection {} changed, discovering services".format(
+                conn_handle))
+            self.service_discovery(conn_handle)
+        return db_conn
+
+    def _merge_services(self, conn_handle, discovered):
+        db_conn = self.db_conns[conn_handle]
+        services = dict((s.start_handle, s) for s in db_conn.services)
+        services.update((s.start_handle, s) for s in discovered)
+        db_conn.services = sorted(services.values(), key=lambda s: s.start_handle)
+        db_conn.build_index()
+
+    def _gatt_cache_restore(self, db_conn):
+        entry = self.gatt_cache.load(db_conn.peer_addr, db_conn.identity)
+        if entry is None:
+            return None
+
+        # Without a Database Hash to compare, only a bonded peer is trusted
+        # to report changes with a Service Changed indication.
+        if entry.db_hash is None and db_conn.identity is None:
+            return None
+
+        # Vendor specific UUID types are assigned per session, so register
+        # the bases again and update the cached types.
+        uuid_types = dict()
+        try:
+            for base in entry.vendor_bases():
+                new_base = BLEUUIDBase(base.base, base.type)
+                self.driver.ble_vs_uuid_add(new_base)
+                uuid_types[base.type] = new_base.type
+        except NordicSemiException as e:
+            logger.warning("Unable to restore GATT cache entry: {}".format(e))
+            return None
+        entry.remap_uuid_types(uuid_types)
+        return entry
+
+    def _gatt_cache_validate(self, conn_handle):
+        """Use the cached services of the peer if its Database Hash is unchanged."""
+        db_conn = self.db_conns[conn_handle]
+        entry = self._gatt_cache_restore(db_conn)
+        if entry is None:
+            return False
+
+        if entry.db_hash is not None:
+            # Not published before the check, lookups must not see stale handles
+            cached = DbConnection()
+            cached.services = entry.services
+            db_hash = self._read_db_hash(conn_handle, cached)
+            if db_hash != entry.db_hash:
+                logger.info("GATT database of {} changed, discovering services".format(
+                    self.gatt_cache.key(db_conn.peer_addr, db_conn.identity)))
+                return False
+        db_conn.services = entry.services
+        return True
+
+    def _gatt_cache_store(self, conn_handle):
+        db_conn = self.db_conns[conn_handle]
+        db_conn.build_index()
+        db_hash = self._read_db_hash(conn_handle)
+        if db_hash is None and db_conn.identity is None:
+            # Could never be validated, see _gatt_cache_restore
+            return
+        self.gatt_cache.store(
+            db_conn.peer_addr,
+            GattCacheEntry(db_conn.services, db_hash),
+            db_conn.identity,
+        )
+
+    def _read_db_hash(self, conn_handle, db_conn=None):
+        if db_conn is None:
+            db_conn = self.db_conns[conn_handle]
+        handle = db_conn.get_char_value_handle(BLEUUID(BLEUUID.Standard.database_hash))
+        if handle is None:
+            return None
+        with self.evt_sync[conn_handle].expect(BLEEvtID.gattc_evt_read_rsp) as responses:
+            self.driver.ble_gattc_read(conn_handle, handle, 0)
+            response = responses.wait()
+        if response is None or response["status"] != BLEGattStatusCode.success:
+            return None
+        return bytes(response["data"])
+
+    def _service_discovery(self, conn_handle, uuid):
         # Don't add repeat handles
         # See: https://github.com/NordicSemiconductor/pc-ble-driver-py/issues/219
         if uuid is not None and uuid in [service.uuid for service in self.db_conns[conn_handle].services]:
             return BLEGattStatusCode.success
-        
-        vendor_services = []
-        self.driver.ble_gattc_prim_srvc_disc(conn_handle, uuid, 0x0001)
-
-        while True:
-            if conn_handle in self.evt_sync.keys():
-                response = self.evt_sync[conn_handle].wait(
-                    evt=BLEEvtID.gattc_evt_prim_srvc_disc_rsp
-                )
-                if response:
-                    if response["status"] == BLEGattStatusCode.success:
-                        for s in response["services"]:
-                            # Don't add repeat handles
-                            # See: https://github.com/NordicSemiconductor/pc-ble-driver-py/issues/219
-                            if s.uuid not in [service.uuid for service in self.db_conns[conn_handle].services]:
-                                if s.uuid.value == BLEUUID.Standard.unknown:
-                                    vendor_services.append(s)
-                                else:
-                                    self.db_conns[conn_handle].services.append(s)
-                    elif response["status"] == BLEGattStatusCode.attribute_not_found:
-                        break
-                    else:
-                        return response["status"]
 
-                    if response["services"][-1].end_handle == 0xFFFF:
-                        break
-                    else:
-                        self.driver.ble_gattc_prim_srvc_disc(
-                            conn_handle, uuid, response["services"][-1].end_handle + 1
-                        )
-            else:
-                raise NordicSemiException(
-                    "conn_handle not available. common cause is disconnect after"
-                    "starting service_discovery")
+        evt_sync = self.evt_sync[conn_handle]
+        srvc_rsps = evt_sync.expect(BLEEvtID.gattc_evt_prim_srvc_disc_rsp)
+        read_rsps = evt_sync.expect(BLEEvtID.gattc_evt_read_rsp)
+        char_rsps = evt_sync.expect(BLEEvtID.gattc_evt_char_disc_rsp)
+        desc_rsps = evt_sync.expect(BLEEvtID.gattc_evt_desc_disc_rsp)
+        try:
+            vendor_services = []
+            self.driver.ble_gattc_prim_srvc_disc(conn_handle, uuid, 0x0001)
 
+            while True:
+                if conn_handle in self.evt_sync.keys():
+                    response = srvc_rsps.wait()
+                    if response:
+                        if response["status"] == BLEGattStatusCode.success:
+                            for s in response["services"]:
+                                # Don't add repeat handles
+                                # See: https://github.com/NordicSemiconductor/pc-ble-driver-py/issues/219
+                                if s.uuid not in [service.uuid for service in self.db_conns[conn_handle].services]:
+                                    if s.uuid.value == BLEUUID.Standard.unknown:
+                                        vendor_services.append(s)
+                                    else:
+                                        self.db_conns[conn_handle].services.append(s)
+                        elif response["status"] == BLEGattStatusCode.attribute_not_found:
+                            break
+                        else:
+                            return response["status"]
 
-        for s in vendor_services:
-            # Read service handle to obtain full 128-bit UUID.
-            self.driver.ble_gattc_read(conn_handle, s.start_handle, 0)
-            response = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gattc_evt_read_rsp)
-            if response:
-                if response["status"] != BLEGattStatusCode.success:
-                    continue
+                        if response["services"][-1].end_handle == 0xFFFF:
+                            break
+                        else:
+                            self.driver.ble_gattc_prim_srvc_disc(
+                                conn_handle, uuid, response["services"][-1].end_handle + 1
+                            )
+                else:
+                    raise NordicSemiException(
+                        "conn_handle not available. common cause is disconnect after"
+                        "starting service_discovery")
 
-                # Check response length.
-                if len(response["data"]) != 16:
-                    continue
 
-                # Create UUIDBase object and register it in softdevice
-                base = BLEUUIDBase(
-                    response["data"][::-1], driver.BLE_UUID_TYPE_VENDOR_BEGIN
-                )
-                self.driver.ble_vs_uuid_add(base)
+            for s in vendor_services:
+                # Read service handle to obtain full 128-bit UUID.
+                self.driver.ble_gattc_read(conn_handle, s.start_handle, 0)
+                response = read_rsps.wait()
+                if response:
+                    if response["status"] != BLEGattStatusCode.success:
+                        continue
 
-                # Rediscover this service.
-                self.driver.ble_gattc_prim_srvc_disc(conn_handle, uuid, s.start_handle)
-                response = self.evt_sync[conn_handle].wait(
-                    evt=BLEEvtID.gattc_evt_prim_srvc_disc_rsp
-                )
-                if response["status"] == BLEGattStatusCode.success:
-                    # Assign UUIDBase manually
-                    # See:
-                    #  https://github.com/NordicSemiconductor/pc-ble-driver-py/issues/38
-                    for s.uuid in [service.uuid for service in response["services"]]:
-                        s.uuid.base = base
-                    self.db_conns[conn_handle].services.extend(response["services"])
-
-        for s in self.db_conns[conn_handle].services:
-            self.driver.ble_gattc_char_disc(conn_handle, s.start_handle, s.end_handle)
-            while True:
-                response = self.evt_sync[conn_handle].wait(
-                    evt=BLEEvtID.gattc_evt_char_disc_rsp
-                )
-                if response and "status" in response.keys():
-                    if response["status"] == BLEGattStatusCode.success:
-                        for char in response["characteristics"]:
-                            # Don't add repeat handles
-                            # See: https://github.com/NordicSemiconductor/pc-ble-driver-py/issues/219
-                            if char.uuid not in [c.uuid for c in s.chars]:
-                                s.char_add(char)
-                    elif response["status"] == BLEGattStatusCode.attribute_not_found:
-                        break
-                    else:
-                        return response["status"]
+                    # Check response length.
+                    if len(response["data"]) != 16:
+                        continue
 
-                    self.driver.ble_gattc_char_disc(
-                        conn_handle,
-                        response["characteristics"][-1].handle_decl + 1,
-                        s.end_handle,
+                    # Create UUIDBase object and register it in softdevice
+                    base = BLEUUIDBase(
+                        response["data"][::-1], driver.BLE_UUID_TYPE_VENDOR_BEGIN
                     )
+                    self.driver.ble_vs_uuid_add(base)
 
-            for ch in s.chars:
-                self.driver.ble_gattc_desc_disc(
-                    conn_handle, ch.handle_value, ch.end_handle
-                )
+                    # Rediscover this service.
+                    self.driver.ble_gattc_prim_srvc_disc(conn_handle, uuid, s.start_handle)
+                    response = srvc_rsps.wait()
+                    if response["status"] == BLEGattStatusCode.success:
+                        # Assign UUIDBase manually
+                        # See:
+                        #  https://github.com/NordicSemiconductor/pc-ble-driver-py/issues/38
+                        for s.uuid in [service.uuid for service in response["services"]]:
+                            s.uuid.base = base
+                        self.db_conns[conn_handle].services.extend(response["services"])
+
+            for s in self.db_conns[conn_handle].services:
+                self.driver.ble_gattc_char_disc(conn_handle, s.start_handle, s.end_handle)
                 while True:
-                    response = self.evt_sync[conn_handle].wait(
-                        evt=BLEEvtID.gattc_evt_desc_disc_rsp
-                    )
+                    response = char_rsps.wait()
                     if response and "status" in response.keys():
                         if response["status"] == BLEGattStatusCode.success:
-                            for desc in response["descriptors"]:
+                            for char in response["characteristics"]:
                                 # Don't add repeat handles
                                 # See: https://github.com/NordicSemiconductor/pc-ble-driver-py/issues/219
-                                if desc not in [d.uuid for d in ch.descs]:
-                                    ch.descs.append(desc)
+                                if char.uuid not in [c.uuid for c in s.chars]:
+                                    s.char_add(char)
                         elif response["status"] == BLEGattStatusCode.attribute_not_found:
                             break
                         else:
                             return response["status"]
 
-                        if response["descriptors"][-1].handle == ch.end_handle:
-                            break
-                        else:
-                            self.driver.ble_gattc_desc_disc(
-                                conn_handle,
-                                response["descriptors"][-1].handle + 1,
-                                ch.end_handle,
-                            )
-        return BLEGattStatusCode.success
+                        self.driver.ble_gattc_char_disc(
+                            conn_handle,
+                            response["characteristics"][-1].handle_decl + 1,
+                            s.end_handle,
+                        )
+
+                for ch in s.chars:
+                    self.driver.ble_gattc_desc_disc(
+                        conn_handle, ch.handle_value, ch.end_handle
+                    )
+                    while True:
+                        response = desc_rsps.wait()
+                        if response and "status" in response.keys():
+                            if response["status"] == BLEGattStatusCode.success:
+                                for desc in response["descriptors"]:
+                                    # Don't add repeat handles
+                                    # See: https://github.com/NordicSemiconductor/pc-ble-driver-py/issues/219
+                                    if desc not in [d.uuid for d in ch.descs]:
+                                        ch.descs.append(desc)
+                            elif response["status"] == BLEGattStatusCode.attribute_not_found:
+                                break
+                            else:
+                                return response["status"]
+
+                            if response["descriptors"][-1].handle == ch.end_handle:
+                                break
+                            else:
+                                self.driver.ble_gattc_desc_disc(
+                                    conn_handle,
+                                    response["descriptors"][-1].handle + 1,
+                                    ch.end_handle,
+                                )
+            return BLEGattStatusCode.success
+        finally:
+            for responses in (srvc_rsps, read_rsps, char_rsps, desc_rsps):
+                responses.close()
 
     @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
     def enable_notification(self, conn_handle, uuid, attr_handle=None):
@@ -410,7 +746,7 @@ class BLEAdapter(BLEDriverObserver):
 
         cccd_list = [1, 0]
 
-        cccd_handle = self.db_conns[conn_handle].get_cccd_handle(uuid, attr_handle)
+        cccd_handle = self._db_conn(conn_handle).get_cccd_handle(uuid, attr_handle)
         if cccd_handle is None:
             raise NordicSemiException("CCCD not found")
         write_params = BLEGattcWriteParams(
@@ -421,8 +757,9 @@ class BLEAdapter(BLEDriverObserver):
             0,
         )
 
-        self.driver.ble_gattc_write(conn_handle, write_params)
-        result = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gattc_evt_write_rsp)
+        with self.evt_sync[conn_handle].expect(BLEEvtID.gattc_evt_write_rsp) as responses:
+            self.driver.ble_gattc_write(conn_handle, write_params)
+            result = responses.wait()
         return result["status"]
 
     @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
@@ -439,7 +776,7 @@ class BLEAdapter(BLEDriverObserver):
 
         cccd_list = [0, 0]
 
-        cccd_handle = self.db_conns[conn_handle].get_cccd_handle(uuid, attr_handle)
+        cccd_handle = self._db_conn(conn_handle).get_cccd_handle(uuid, attr_handle)
         if cccd_handle is None:
             raise NordicSemiException("CCCD not found")
 
@@ -451,8 +788,9 @@ class BLEAdapter(BLEDriverObserver):
             0,
         )
 
-        self.driver.ble_gattc_write(conn_handle, write_params)
-        result = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gattc_evt_write_rsp)
+        with self.evt_sync[conn_handle].expect(BLEEvtID.gattc_evt_write_rsp) as responses:
+            self.driver.ble_gattc_write(conn_handle, write_params)
+            result = responses.wait()
         return result["status"]
 
     @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
@@ -469,7 +807,7 @@ class BLEAdapter(BLEDriverObserver):
 
         cccd_list = [2, 0]
 
-        cccd_handle = self.db_conns[conn_handle].get_cccd_handle(uuid, attr_handle)
+        cccd_handle = self._db_conn(conn_handle).get_cccd_handle(uuid, attr_handle)
         if cccd_handle is None:
             raise NordicSemiException("CCCD not found")
 
@@ -481,8 +819,9 @@ class BLEAdapter(BLEDriverObserver):
             0,
         )
 
-        self.driver.ble_gattc_write(conn_handle, write_params)
-        result = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gattc_evt_write_rsp)
+        with self.evt_sync[conn_handle].expect(BLEEvtID.gattc_evt_write_rsp) as responses:
+            self.driver.ble_gattc_write(conn_handle, write_params)
+            result = responses.wait()
         return result["status"]
 
     @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
@@ -490,14 +829,15 @@ class BLEAdapter(BLEDriverObserver):
         return self.disable_notification(conn_handle, uuid, attr_handle)
 
     def conn_param_update(self, conn_handle, conn_params):
-        self.driver.ble_gap_conn_param_update(conn_handle, conn_params)
-        result = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gap_evt_conn_param_update)
+        with self.evt_sync[conn_handle].expect(BLEEvtID.gap_evt_conn_param_update) as responses:
+            self.driver.ble_gap_conn_param_update(conn_handle, conn_params)
+            result = responses.wait()
         return result["conn_params"]
 
     @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
     def write_req(self, conn_handle, uuid, data, attr_handle=None):
         if attr_handle is None:
-            attr_handle = self.db_conns[conn_handle].get_char_value_handle(uuid)
+            attr_handle = self._db_conn(conn_handle).get_char_value_handle(uuid)
         if attr_handle is None:
             raise NordicSemiException("Characteristic value handler not found")
         write_params = BLEGattcWriteParams(
@@ -507,14 +847,15 @@ class BLEAdapter(BLEDriverObserver):
             data,
             0,
         )
-        self.driver.ble_gattc_write(conn_handle, write_params)
-        result = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gattc_evt_write_rsp)
+        with self.evt_sync[conn_handle].expect(BLEEvtID.gattc_evt_write_rsp) as responses:
+            self.driver.ble_gattc_write(conn_handle, write_params)
+            result = responses.wait()
         return result["status"]
 
     @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
     def write_prep(self, conn_handle, uuid, data, offset, attr_handle=None):
         if attr_handle is None:
-            attr_handle = self.db_conns[conn_handle].get_char_value_handle(uuid)
+            attr_handle = self._db_conn(conn_handle).get_char_value_handle(uuid)
         if attr_handle is None:
             raise NordicSemiException("Characteristic value handler not found")
         write_params = BLEGattcWriteParams(
@@ -524,8 +865,9 @@ class BLEAdapter(BLEDriverObserver):
             data,
             offset,
         )
-        self.driver.ble_gattc_write(conn_handle, write_params)
-        result = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gattc_evt_write_rsp)
+        with self.evt_sync[conn_handle].expect(BLEEvtID.gattc_evt_write_rsp) as responses:
+            self.driver.ble_gattc_write(conn_handle, write_params)
+            result = responses.wait()
         return result["status"]
 
     @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
@@ -537,17 +879,19 @@ class BLEAdapter(BLEDriverObserver):
             [],
             0,
         )
-        self.driver.ble_gattc_write(conn_handle, write_params)
-        result = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gattc_evt_write_rsp)
+        with self.evt_sync[conn_handle].expect(BLEEvtID.gattc_evt_write_rsp) as responses:
+            self.driver.ble_gattc_write(conn_handle, write_params)
+            result = responses.wait()
         return result["status"]
 
     def read_req(self, conn_handle, uuid, offset=0, attr_handle=None):
         if attr_handle is None:
-            attr_handle = self.db_conns[conn_handle].get_char_value_handle(uuid)
+            attr_handle = self._db_conn(conn_handle).get_char_value_handle(uuid)
         if attr_handle is None:
             raise NordicSemiException("Characteristic value handler not found")
-        self.driver.ble_gattc_read(conn_handle, attr_handle, offset)
-        result = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gattc_evt_read_rsp)
+        with self.evt_sync[conn_handle].expect(BLEEvtID.gattc_evt_read_rsp) as responses:
+            self.driver.ble_gattc_read(conn_handle, attr_handle, offset)
+            result = responses.wait()
         gatt_res = result["status"]
         if gatt_res == BLEGattStatusCode.success:
             return gatt_res, result["data"]
@@ -560,7 +904,7 @@ class BLEAdapter(BLEDriverObserver):
         except Exception:
             tx_complete = BLEEvtID.gattc_evt_write_cmd_tx_complete
         if attr_handle is None:
-            attr_handle = self.db_conns[conn_handle].get_char_value_handle(uuid)
+            attr_handle = self._db_conn(conn_handle).get_char_value_handle(uuid)
         if attr_handle is None:
             raise NordicSemiException("Characteristic value handler not found")
         write_params = BLEGattcWriteParams(
@@ -572,25 +916,75 @@ class BLEAdapter(BLEDriverObserver):
         )
 
         # Send packet and skip waiting for TX-complete event. Try maximum 3 times.
-        for _ in range(MAX_TRIES):
-            try:
-                response = self.driver.ble_gattc_write(conn_handle, write_params)
-                logger.debug(
-                    "Call ble_gattc_write: response({}) write_params({})".format(
-                        response, write_params
+        with self.evt_sync[conn_handle].expect(tx_complete) as tx_completes:
+            for _ in range(MAX_TRIES):
+                try:
+                    response = self.driver.ble_gattc_write(conn_handle, write_params)
+                    logger.debug(
+                        "Call ble_gattc_write: response({}) write_params({})".format(
+                            response, write_params
+                        )
                     )
-                )
-                return
-            except NordicSemiException as e:
-                # Retry if NRF_ERROR_RESOURCES error code.
-                err = str(e)
-                if (("Error code: 19" in err) or ("NRF_ERROR_RESOURCES" in err) or
-                    ("Error code: 12292" in err) or ("BLE_ERROR_NO_TX_PACKETS" in err)):
-                    self.evt_sync[conn_handle].wait(evt=tx_complete, timeout=2)
-                else:
-                    raise e
+                    return
+                except NordicSemiException as e:
+                    # Retry if NRF_ERROR_RESOURCES error code.
+                    err = str(e)
+                    if (("Error code: 19" in err) or ("NRF_ERROR_RESOURCES" in err) or
+                        ("Error code: 12292" in err) or ("BLE_ERROR_NO_TX_PACKETS" in err)):
+                        tx_completes.wait(timeout=2)
+                    else:
+                        raise e
         raise NordicSemiException("Unable to successfully call ble_gattc_write")
 
+    def write_cmd_stream(self, conn_handle, uuid, data, attr_handle=None, timeout=5):
+        """Send data with write commands, split to the negotiated ATT MTU.
+
+        data is a bytes-like object, a list of ints, or an iterable of
+        bytes-like chunks. Packets are queued as long as the SoftDevice has
+        room, tracked with credits from write_cmd_tx_queue_size and TX
+        complete events. Returns the number of bytes and packets sent, the
+        time taken and the throughput in bytes per second.
+        """
+        db_conn = self.db_conns[conn_handle]
+        if attr_handle is None:
+            attr_handle = self._db_conn(conn_handle).get_char_value_handle(uuid)
+        if attr_handle is None:
+            raise NordicSemiException("Characteristic value handler not found")
+
+        credits = db_conn.write_cmd_credits
+        stats = dict(bytes=0, packets=0, resource_errors=0)
+        start = time.perf_counter()
+
+        for chunk in _split_chunks(data, db_conn.att_mtu - 3):
+            write_params = BLEGattcWriteParams(
+                BLEGattWriteOperation.write_cmd,
+                BLEGattExecWriteFlag.unused,
+                attr_handle,
+                chunk,
+                0,
+            )
+            while True:
+                if not credits.acquire(timeout):
+                    raise NordicSemiException("Timed out waiting for TX credits")
+                try:
+                    self.driver.ble_gattc_write(conn_handle, write_params)
+                    break
+                except NordicSemiException as e:
+                    if e.error_code not in TX_QUEUE_FULL_ERRORS:
+                        raise
+                    # Queue shared with other writers, wait for the next TX complete
+                    credits.clear()
+                    stats["resource_errors"] += 1
+            stats["bytes"] += len(chunk)
+            stats["packets"] += 1
+
+        if not credits.wait_all(timeout):
+            raise NordicSemiException("Timed out waiting for TX complete")
+
+        stats["time"] = time.perf_counter() - start
+        stats["throughput"] = stats["bytes"] / stats["time"] if stats["time"] else 0.0
+        return stats
+
     @NordicSemiErrorCheck(expected=BLEGapSecStatus.success)
     def authenticate(
         self,
@@ -630,29 +1024,31 @@ class BLEAdapter(BLEDriverObserver):
             kdist_peer=kdist_peer,
         )
 
-        self.driver.ble_gap_authenticate(conn_handle, sec_params)
-        result = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gap_evt_sec_params_request, timeout=10)
-        # LE Secure Connections used only if both sides support it.
-        if not sec_params.lesc or not result["peer_params"].lesc:
-            # sd_ble_gap_sec_params_reply ... In the central role, sec_params must be set to NULL,
-            # as the parameters have already been provided during a previous call to
-            # sd_ble_gap_authenticate.
-            sec_params = (
-                None
-                if self.db_conns[conn_handle].role == BLEGapRoles.central
-                else sec_params
-            )
-            self.driver.ble_gap_sec_params_reply(
-                conn_handle, BLEGapSecStatus.success, sec_params=sec_params, keyset=None
-            )
-        else:
-            self.evt_sync[conn_handle].wait(evt=BLEEvtID.gap_evt_lesc_dhkey_request, timeout=5)
+        evt_sync = self.evt_sync[conn_handle]
+        with evt_sync.expect(BLEEvtID.gap_evt_sec_params_request) as sec_params_reqs, \
+                evt_sync.expect(BLEEvtID.gap_evt_lesc_dhkey_request) as dhkey_reqs, \
+                evt_sync.expect(BLEEvtID.gap_evt_auth_status) as auth_statuses:
+            self.driver.ble_gap_authenticate(conn_handle, sec_params)
+            result = sec_params_reqs.wait(timeout=10)
+            # LE Secure Connections used only if both sides support it.
+            if not sec_params.lesc or not result["peer_params"].lesc:
+                # sd_ble_gap_sec_params_reply ... In the central role, sec_params must be set to NULL,
+                # as the parameters have already been provided during a previous call to
+                # sd_ble_gap_authenticate.
+                sec_params = (
+                    None
+                    if self.db_conns[conn_handle].role == BLEGapRoles.central
+                    else sec_params
+                )
+                self.driver.ble_gap_sec_params_reply(
+                    conn_handle, BLEGapSecStatus.success, sec_params=sec_params, keyset=None
+                )
+            else:
+                dhkey_reqs.wait(timeout=5)
 
-        result = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gap_evt_auth_status)
+            result = auth_statuses.wait()
 
-        # TODO: The result returned is sometimes of a different type than
-        # TODO: gap_evt_auth_status. This is a bug that needs further investigation.
-        if "auth_status" not in result:
+        if result is None:
             return None
 
         # If success then keys are stored in self.driver._keyset.
@@ -662,35 +1058,113 @@ class BLEAdapter(BLEDriverObserver):
             )
         return result["auth_status"]
 
-    def encrypt(self, conn_handle, ediv, rand, ltk, auth=0, lesc=0, ltk_len=16):
+    def encrypt(self, conn_handle, ediv=None, rand=None, ltk=None, auth=0, lesc=0, ltk_len=16):
+        """Encrypt the link with a key from an earlier bonding.
+
+        Without ltk, the key comes from the bond store.
+        """
+        master_id, enc_info = self._encrypt_keys(
+            conn_handle, ediv, rand, ltk, auth, lesc, ltk_len
+        )
+        with self.evt_sync[conn_handle].expect(BLEEvtID.gap_evt_conn_sec_update) as responses:
+            self.driver.ble_gap_encrypt(conn_handle, master_id, enc_info, enc_info.lesc)
+            result = responses.wait()
+        return result["conn_sec"]
+
+    def _encrypt_keys(self, conn_handle, ediv, rand, ltk, auth, lesc, ltk_len):
+        """Master ID and encryption info for encrypt, from the bond store without ltk."""
         # @assert note that sd_ble_gap_encrypt results in
         # BLE_ERROR_INVALID_ROLE if not Central.
+        db_conn = self.db_conns[conn_handle]
         assert (
-            self.db_conns[conn_handle].role == BLEGapRoles.central
+            db_conn.role == BLEGapRoles.central
         ), "Invalid role. Encryption can only be initiated by a Central Device."
-        master_id = BLEGapMasterId(ediv=ediv, rand=rand)
-        enc_info = BLEGapEncInfo(ltk=ltk, auth=auth, lesc=lesc, ltk_len=ltk_len)
-        self.driver.ble_gap_encrypt(conn_handle, master_id, enc_info, lesc)
-        result = self.evt_sync[conn_handle].wait(evt=BLEEvtID.gap_evt_conn_sec_update)
-        return result["conn_sec"]
+        if ltk is not None:
+            master_id = BLEGapMasterId(ediv=ediv, rand=rand)
+            enc_info = BLEGapEncInfo(ltk=ltk, auth=auth, lesc=lesc, ltk_len=ltk_len)
+            return master_id, enc_info
+        bond = None
+        if self.bond_store is not None:
+            bond = self.bond_store.find(db_conn.peer_addr)
+        enc_key = bond.central_enc_key() if bond is not None else None
+        if enc_key is None:
+            raise NordicSemiException("No bond with the peer of connection {}".format(
+                conn_handle))
+        return enc_key.master_id, enc_key.enc_info
+
+    def _bond_store_save(self, conn_handle, kdist_own, kdist_peer):
+        db_conn = self.db_conns.get(conn_handle)
+        if db_conn is None:
+            return
+        keyset = BLEGapSecKeyset.from_c(self.driver._keyset)
+        own, peer = keyset.keys_own, keyset.keys_peer
+        # With LE Secure Connections the LTK is not distributed, both sides
+        # find it in their own keys
+        lesc = bool(own.enc_key.enc_info.lesc)
+        bond = Bond(
+            db_conn.peer_addr,
+            own_enc_key=own.enc_key if kdist_own.enc or lesc else None,
+            peer_enc_key=peer.enc_key if kdist_peer.enc else None,
+            peer_id_key=peer.id_key if kdist_peer.id else None,
+        )
+        if bond.own_enc_key is None and bond.peer_enc_key is None:
+            return
+        self.bond_store.store(bond)
+        db_conn.identity = bond.irk
+        logger.debug("Stored {}".format(bond))
+
+    def _bond_store_reply(self, conn_handle, peer_addr, master_id, enc_info, **kwargs):
+        master_id = BLEGapMasterId.from_c(master_id)
+        if master_id.ediv or any(master_id.rand):
+            bond = self.bond_store.find_master_id(master_id)
+        else:
+            bond = self.bond_store.find(BLEGapAddr.from_c(peer_addr))
+        # Without keys the SoftDevice turns the encryption request down
+        reply = None
+        if enc_info and bond is not None and bond.own_enc_key is not None:
+            reply = bond.own_enc_key.enc_info
+        try:
+            self.driver.ble_gap_sec_info_reply(conn_handle, reply, None, None)
+        except NordicSemiException as e:
+            logger.warning("Unable to reply to security info request: {}".format(e))
+            return False
+        return True
 
     # ...............................................................................................
     def on_gap_evt_connected(
         self, ble_driver, conn_handle, peer_addr, role, conn_params
     ):
-        self.db_conns[conn_handle] = Connection(peer_addr, role)
+        tag = ble_driver.conn_cfg_tags.get(role, 0)
+        self.db_conns[conn_handle] = Connection(
+            peer_addr,
+            role,
+            tag,
+            ble_driver.write_cmd_tx_queue_sizes.get(tag, 1),
+            ble_driver.hvn_tx_queue_sizes.get(tag, 1),
+        )
         self.evt_sync[conn_handle] = EvtSync(events=BLEEvtID)
         self.conn_in_progress = False
 
+        if self.bond_store is not None:
+            bond = self.bond_store.find(peer_addr)
+            if bond is not None:
+                self.db_conns[conn_handle].identity = bond.irk
+
     def on_gap_evt_disconnected(self, ble_driver, conn_handle, reason):
         try:
-            del self.db_conns[conn_handle]
+            db_conn = self.db_conns.pop(conn_handle)
         except KeyError:
             pass
+        else:
+            # Wake up writers waiting for credits, further writes will fail
+            db_conn.write_cmd_credits.release(db_conn.write_cmd_credits.size)
+            db_conn.hvn_credits.release(db_conn.hvn_credits.size)
         try:
-            del self.evt_sync[conn_handle]
+            evt_sync = self.evt_sync.pop(conn_handle)
         except KeyError:
             pass
+        else:
+            evt_sync.close()
 
     def on_gap_evt_timeout(self, ble_driver, conn_handle, src):
         if src == BLEGapTimeoutSrc.conn:
@@ -702,6 +1176,9 @@ class BLEAdapter(BLEDriverObserver):
         )
 
     def on_gap_evt_sec_info_request(self, ble_driver, conn_handle, **kwargs):
+        if self.bond_store is not None and self._bond_store_reply(conn_handle, **kwargs):
+            # A second reply would fail with an invalid state error
+            return
         self.evt_sync[conn_handle].notify(
             evt=BLEEvtID.gap_evt_sec_info_request, data=kwargs
         )
@@ -713,6 +1190,12 @@ class BLEAdapter(BLEDriverObserver):
         self.evt_sync[conn_handle].notify(evt=BLEEvtID.gap_evt_lesc_dhkey_request, data=kwargs)
 
     def on_gap_evt_auth_status(self, ble_driver, conn_handle, **kwargs):
+        if (
+            self.bond_store is not None
+            and kwargs["auth_status"] == BLEGapSecStatus.success
+            and kwargs["bonded"]
+        ):
+            self._bond_store_save(conn_handle, kwargs["kdist_own"], kwargs["kdist_peer"])
         self.evt_sync[conn_handle].notify(evt=BLEEvtID.gap_evt_auth_status, data=kwargs)
 
     def on_gap_evt_conn_sec_update(self, ble_driver, conn_handle, **kwargs):
@@ -742,9 +1225,11 @@ class BLEAdapter(BLEDriverObserver):
         )
 
     def on_evt_tx_complete(self, ble_driver, conn_handle, **kwargs):
+        self.db_conns[conn_handle].write_cmd_credits.release(kwargs["count"])
         self.evt_sync[conn_handle].notify(evt=BLEEvtID.evt_tx_complete, data=kwargs)
 
     def on_gattc_evt_write_cmd_tx_complete(self, ble_driver, conn_handle, **kwargs):
+        self.db_conns[conn_handle].write_cmd_credits.release(kwargs["count"])
         self.evt_sync[conn_handle].notify(
             evt=BLEEvtID.gattc_evt_write_cmd_tx_complete, data=kwargs
         )
@@ -776,6 +1261,7 @@ class BLEAdapter(BLEDriverObserver):
         )
 
     def on_gatts_evt_hvn_tx_complete(self, ble_driver, conn_handle, **kwargs):
+        self.db_conns[conn_handle].hvn_credits.release(kwargs["count"])
         self.evt_sync[conn_handle].notify(
             evt=BLEEvtID.gatts_evt_hvn_tx_complete, data=kwargs
         )
@@ -817,7 +1303,6 @@ class BLEAdapter(BLEDriverObserver):
     def on_rpc_status(self, ble_driver, code, message):
         logger.debug("{}: {}".format(code, message))
 
-    @wrapt.synchronized(observer_lock)
     def on_gap_evt_conn_param_update_request(
         self, ble_driver, conn_handle, conn_params
     ):
@@ -826,7 +1311,6 @@ class BLEAdapter(BLEDriverObserver):
                 ble_adapter=self, conn_handle=conn_handle, conn_params=conn_params
             )
 
-    @wrapt.synchronized(observer_lock)
     def on_gattc_evt_hvx(
         self, ble_driver, conn_handle, status, error_handle, attr_handle, hvx_type, data
     ):
@@ -849,6 +1333,13 @@ class BLEAdapter(BLEDriverObserver):
             uuid = self.db_conns[conn_handle].get_char_uuid(attr_handle)
             if uuid is None:
                 logger.info(f"Not able to look up UUID for attr_handle {attr_handle}")
+            elif (uuid.value == BLEUUID.Standard.service_changed
+                  and self.gatt_cache is not None):
+                db_conn = self.db_conns[conn_handle]
+                self.gatt_cache.invalidate(db_conn.peer_addr, db_conn.identity)
+                # Discovery waits for responses from this thread, see _db_conn
+                db_conn.services = list()
+                db_conn.services_stale = True
 
             for obs in self.observers:
                 obs.on_indication(self, conn_handle, uuid, data)
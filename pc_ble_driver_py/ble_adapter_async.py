@@ -0,0 +1,667 @@
+#
+# Copyright (c) 2016 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""
+asyncio front-end for BLEAdapter.
+"""
+
+import asyncio
+import collections
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pc_ble_driver_py.ble_adapter import TX_QUEUE_FULL_ERRORS, _split_chunks
+from pc_ble_driver_py.ble_driver import *
+from pc_ble_driver_py.event_queue import QueuePolicy
+from pc_ble_driver_py.exceptions import NordicSemiException
+from pc_ble_driver_py.gatt_discovery import GattDiscovery
+from pc_ble_driver_py.observers import BLEAdapterObserver, BLEDriverObserver
+
+logger = logging.getLogger(__name__)
+
+if nrf_sd_ble_api_ver == 2:
+    WRITE_CMD_TX_COMPLETE = BLEEvtID.evt_tx_complete
+else:
+    WRITE_CMD_TX_COMPLETE = BLEEvtID.gattc_evt_write_cmd_tx_complete
+
+# Default bounds of the advertising_reports and notifications queues
+ADV_REPORT_QUEUE_SIZE = 256
+HVX_QUEUE_SIZE = 1024
+
+
+class AsyncEvtQueue(object):
+    """Events of one type for one connection, read from the event loop."""
+
+    def __init__(self, owner, key):
+        self.owner = owner
+        self.key = key
+        self.queue = asyncio.Queue()
+
+    async def wait(self, timeout=5):
+        """Return the next event data, or None on timeout or disconnect."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.owner._remove(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class AsyncSubscriber(object):
+    """Queue of one advertising_reports or notifications iterator.
+
+    Holds up to maxsize items, without bound when 0. When full, policy
+    QueuePolicy.drop_oldest discards the oldest queued item and
+    QueuePolicy.drop_newest the new one.
+    """
+
+    def __init__(self, maxsize, policy):
+        if policy not in (QueuePolicy.drop_oldest, QueuePolicy.drop_newest):
+            raise ValueError("Unsupported subscriber policy: {}".format(policy))
+        self.queue = asyncio.Queue(maxsize)
+        self.policy = policy
+        self.dropped = 0
+
+    def put(self, data):
+        if self.queue.full():
+            self.dropped += 1
+            if self.policy == QueuePolicy.drop_newest:
+                return
+            self.queue.get_nowait()
+        self.queue.put_nowait(data)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class AsyncBLEAdapter(BLEDriverObserver, BLEAdapterObserver):
+    """Coroutine versions of the BLEAdapter operations.
+
+    Events are handed from the driver event thread to the event loop with
+    call_soon_threadsafe, so a single thread can drive many connections and
+    adapters. Connection state is kept by the wrapped BLEAdapter. Driver
+    calls block for a serial round trip, they are run in order on executor,
+    by default a thread of this adapter, so the loop is never held up.
+
+    loop defaults to the running loop, so it must be given when the adapter
+    is made outside a coroutine.
+    """
+
+    def __init__(self, adapter, loop=None, executor=None):
+        super(AsyncBLEAdapter, self).__init__()
+        self.adapter = adapter
+        self.driver = adapter.driver
+        self.loop = loop if loop is not None else asyncio.get_running_loop()
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1)
+        self.executor = executor
+        # (conn_handle, BLEEvtID) -> AsyncEvtQueues, oldest first
+        self._queues = dict()
+        # Subscribers to advertising reports and notifications
+        self._adv_reports = list()
+        self._hvx = list()
+        self.driver.observer_register(self)
+        self.adapter.observer_register(self)
+
+    def expect(self, conn_handle, evt):
+        """Open a queue for evt on conn_handle, before sending the request."""
+        evt_queue = AsyncEvtQueue(self, (conn_handle, evt))
+        self._queues.setdefault(evt_queue.key, collections.deque()).append(evt_queue)
+        return evt_queue
+
+    def _remove(self, evt_queue):
+        queues = self._queues.get(evt_queue.key)
+        if queues is not None and evt_queue in queues:
+            queues.remove(evt_queue)
+            if not queues:
+                del self._queues[evt_queue.key]
+
+    def _post(self, conn_handle, evt, data):
+        self.loop.call_soon_threadsafe(self._deliver, (conn_handle, evt), data)
+
+    def _deliver(self, key, data):
+        queues = self._queues.get(key)
+        if queues:
+            queues[0].queue.put_nowait(data)
+
+    def _deliver_disconnected(self, conn_handle, data):
+        for key, queues in list(self._queues.items()):
+            if key[0] != conn_handle:
+                continue
+            for evt_queue in queues:
+                if key[1] == BLEEvtID.gap_evt_disconnected:
+                    evt_queue.queue.put_nowait(data)
+                else:
+                    evt_queue.queue.put_nowait(None)
+
+    def _publish(self, subscribers, data):
+        for subscriber in subscribers:
+            subscriber.put(data)
+
+    def _call(self, func, *args, **kwargs):
+        """Run a blocking driver call on the executor."""
+        call = functools.partial(func, *args, **kwargs)
+        return self.loop.run_in_executor(self.executor, call)
+
+    # ...............................................................................................
+    async def open(self):
+        await self._call(self.adapter.open)
+
+    async def close(self):
+        await self._call(self.adapter.close)
+
+    async def connect(self, address, scan_params=None, conn_params=None, tag=0, timeout=None):
+        """Connect as central and return the connection handle."""
+        if self.adapter.conn_in_progress:
+            raise NordicSemiException("Connection already in progress")
+        with self.expect(None, BLEEvtID.gap_evt_connected) as connections:
+            await self._call(self.adapter.connect, address, scan_params, conn_params, tag)
+            while True:
+                result = await connections.wait(timeout)
+                if result is None:
+                    self.adapter.conn_in_progress = False
+                    raise NordicSemiException("Connection timed out")
+                if result["role"] == BLEGapRoles.central:
+                    return result["conn_handle"]
+
+    async def disconnect(self, conn_handle, timeout=5):
+        with self.expect(conn_handle, BLEEvtID.gap_evt_disconnected) as responses:
+            await self._call(self.adapter.disconnect, conn_handle)
+            result = await responses.wait(timeout)
+        if result is None:
+            return None
+        return result["reason"]
+
+    async def att_mtu_exchange(self, conn_handle, mtu):
+        with self.expect(conn_handle, BLEEvtID.gattc_evt_exchange_mtu_rsp) as responses:
+            try:
+                await self._call(self.driver.ble_gattc_exchange_mtu_req, conn_handle, mtu)
+            except NordicSemiException as ex:
+                raise NordicSemiException(
+                    "MTU exchange request failed. Common causes are: "
+                    "missing att_mtu setting in ble_cfg_set, "
+                    "different config tags used in ble_cfg_set and connect.") from ex
+            response = await responses.wait()
+
+        if response is None:
+            return self.adapter.db_conns[conn_handle].att_mtu
+
+        new_mtu = min(mtu, response["att_mtu"])
+        self.adapter.db_conns[conn_handle].att_mtu = new_mtu
+        return new_mtu
+
+    async def phy_update(self, conn_handle, req_phys):
+        with self.expect(conn_handle, BLEEvtID.gap_evt_phy_update) as responses:
+            await self._call(self.driver.ble_gap_phy_update, conn_handle, BLEGapPhys(*req_phys))
+            return await responses.wait()
+
+    async def data_length_update(self, conn_handle, data_length):
+        with self.expect(conn_handle, BLEEvtID.gap_evt_data_length_update) as responses:
+            dl_params = BLEGapDataLengthParams()
+            dl_params.max_tx_octets = data_length
+            dl_params.max_rx_octets = data_length
+            await self._call(
+                self.driver.ble_gap_data_length_update,
+                conn_handle,
+                dl_params,
+                data_length_limitation=None,
+            )
+            return await responses.wait()
+
+    async def conn_param_update(self, conn_handle, conn_params):
+        with self.expect(conn_handle, BLEEvtID.gap_evt_conn_param_update) as responses:
+            await self._call(self.driver.ble_gap_conn_param_update, conn_handle, conn_params)
+            result = await responses.wait()
+        if result is None:
+            raise NordicSemiException("Connection parameter update timed out")
+        return result["conn_params"]
+
+    async def discover_services(
+        self, conn_handle, service_uuids=None, char_uuids=None, timeout=5
+    ):
+        """Coroutine version of BLEAdapter.discover_services."""
+        discovery = GattDiscovery(self.driver, conn_handle, service_uuids, char_uuids)
+        done = asyncio.Event()
+        progress = asyncio.Event()
+
+        def set_done():
+            done.set()
+            progress.set()
+
+        discovery.done_callback = lambda: self.loop.call_soon_threadsafe(set_done)
+        discovery.progress_callback = lambda: self.loop.call_soon_threadsafe(progress.set)
+        await self._call(discovery.start)
+        try:
+            # timeout is the maximum time to wait for a response
+            while not done.is_set():
+                progress.clear()
+                try:
+                    await asyncio.wait_for(progress.wait(), timeout)
+                except asyncio.TimeoutError:
+                    raise discovery.timeout_error()
+        finally:
+            discovery.stop()
+
+        status = discovery.result()
+        if status != BLEGattStatusCode.success:
+            raise NordicSemiException(
+                "Failed to discover services. Error code: {}".format(status),
+                error_code=status,
+            )
+        self.adapter._merge_services(conn_handle, discovery.services)
+        return discovery.stats
+
+    async def service_discovery(self, conn_handle, uuid=None):
+        await self.discover_services(
+            conn_handle, service_uuids=None if uuid is None else [uuid]
+        )
+        return BLEGattStatusCode.success
+
+    async def _write_cccd(self, conn_handle, uuid, attr_handle, cccd_list):
+        assert isinstance(uuid, BLEUUID), "Invalid argument type"
+
+        if uuid.base.base is not None and uuid.base.type is None:
+            await self._call(self.driver.ble_uuid_decode, uuid.base.base, uuid)
+
+        db_conn = await self._db_conn(conn_handle)
+        cccd_handle = db_conn.get_cccd_handle(uuid, attr_handle)
+        if cccd_handle is None:
+            raise NordicSemiException("CCCD not found")
+        return await self._write(
+            conn_handle,
+            BLEGattcWriteParams(
+                BLEGattWriteOperation.write_req,
+                BLEGattExecWriteFlag.unused,
+                cccd_handle,
+                cccd_list,
+                0,
+            ),
+        )
+
+    async def _write(self, conn_handle, write_params):
+        with self.expect(conn_handle, BLEEvtID.gattc_evt_write_rsp) as responses:
+            await self._call(self.driver.ble_gattc_write, conn_handle, write_params)
+            result = await responses.wait()
+        if result is None:
+            raise NordicSemiException("Write response timed out")
+        return result["status"]
+
+    async def _db_conn(self, conn_handle):
+        db_conn = self.adapter.db_conns[conn_handle]
+        if db_conn.services_stale:
+            await self._call(self.adapter._db_conn, conn_handle)
+        return db_conn
+
+    async def _value_handle(self, conn_handle, uuid, attr_handle):
+        if attr_handle is None:
+            db_conn = await self._db_conn(conn_handle)
+            attr_handle = db_conn.get_char_value_handle(uuid)
+        if attr_handle is None:
+            raise NordicSemiException("Characteristic value handler not found")
+        return attr_handle
+
+    @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
+    async def enable_notification(self, conn_handle, uuid, attr_handle=None):
+        return await self._write_cccd(conn_handle, uuid, attr_handle, [1, 0])
+
+    @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
+    async def disable_notification(self, conn_handle, uuid, attr_handle=None):
+        return await self._write_cccd(conn_handle, uuid, attr_handle, [0, 0])
+
+    @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
+    async def enable_indication(self, conn_handle, uuid, attr_handle=None):
+        return await self._write_cccd(conn_handle, uuid, attr_handle, [2, 0])
+
+    @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
+    async def disable_indication(self, conn_handle, uuid, attr_handle=None):
+        return await self._write_cccd(conn_handle, uuid, attr_handle, [0, 0])
+
+    @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
+    async def write_req(self, conn_handle, uuid, data, attr_handle=None):
+        write_params = BLEGattcWriteParams(
+            BLEGattWriteOperation.write_req,
+            BLEGattExecWriteFlag.unused,
+            await self._value_handle(conn_handle, uuid, attr_handle),
+            data,
+            0,
+        )
+        return await self._write(conn_handle, write_params)
+
+    @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
+    async def write_prep(self, conn_handle, uuid, data, offset, attr_handle=None):
+        write_params = BLEGattcWriteParams(
+            BLEGattWriteOperation.prepare_write_req,
+            BLEGattExecWriteFlag.prepared_write,
+            await self._value_handle(conn_handle, uuid, attr_handle),
+            data,
+            offset,
+        )
+        return await self._write(conn_handle, write_params)
+
+    @NordicSemiErrorCheck(expected=BLEGattStatusCode.success)
+    async def write_exec(self, conn_handle):
+        write_params = BLEGattcWriteParams(
+            BLEGattWriteOperation.execute_write_req,
+            BLEGattExecWriteFlag.prepared_write,
+            0,
+            [],
+            0,
+        )
+        return await self._write(conn_handle, write_params)
+
+    async def read_req(self, conn_handle, uuid, offset=0, attr_handle=None):
+        attr_handle = await self._value_handle(conn_handle, uuid, attr_handle)
+        with self.expect(conn_handle, BLEEvtID.gattc_evt_read_rsp) as responses:
+            await self._call(self.driver.ble_gattc_read, conn_handle, attr_handle, offset)
+            result = await responses.wait()
+        if result is None:
+            raise NordicSemiException("Read response timed out")
+        gatt_res = result["status"]
+        if gatt_res == BLEGattStatusCode.success:
+            return gatt_res, result["data"]
+        else:
+            return gatt_res, None
+
+    async def write_cmd(self, conn_handle, uuid, data, attr_handle=None):
+        await self.write_cmd_stream(conn_handle, uuid, [data], attr_handle)
+
+    async def write_cmd_stream(self, conn_handle, uuid, data, attr_handle=None, timeout=5):
+        """Coroutine version of BLEAdapter.write_cmd_stream."""
+        attr_handle = await self._value_handle(conn_handle, uuid, attr_handle)
+        db_conn = self.adapter.db_conns[conn_handle]
+        credits = db_conn.write_cmd_credits
+        stats = dict(bytes=0, packets=0, resource_errors=0)
+        start = time.perf_counter()
+
+        with self.expect(conn_handle, WRITE_CMD_TX_COMPLETE) as tx_completes:
+            for chunk in _split_chunks(data, db_conn.att_mtu - 3):
+                write_params = BLEGattcWriteParams(
+                    BLEGattWriteOperation.write_cmd,
+                    BLEGattExecWriteFlag.unused,
+                    attr_handle,
+                    chunk,
+                    0,
+                )
+                while True:
+                    # Credits are given back by BLEAdapter before the event gets here
+                    if not credits.acquire(0):
+                        if await tx_completes.wait(timeout) is None:
+                            raise NordicSemiException("Timed out waiting for TX credits")
+                        continue
+                    try:
+                        await self._call(self.driver.ble_gattc_write, conn_handle, write_params)
+                        break
+                    except NordicSemiException as e:
+                        if e.error_code not in TX_QUEUE_FULL_ERRORS:
+                            credits.release()
+                            raise
+                        credits.clear()
+                        stats["resource_errors"] += 1
+                stats["bytes"] += len(chunk)
+                stats["packets"] += 1
+
+            while credits.available < credits.size:
+                if await tx_completes.wait(timeout) is None:
+                    raise NordicSemiException("Timed out waiting for TX complete")
+
+        stats["time"] = time.perf_counter() - start
+        stats["throughput"] = stats["bytes"] / stats["time"] if stats["time"] else 0.0
+        return stats
+
+    @NordicSemiErrorCheck(expected=BLEGapSecStatus.success)
+    async def authenticate(
+        self,
+        conn_handle,
+        _role,
+        bond=False,
+        mitm=False,
+        lesc=False,
+        keypress=False,
+        io_caps=BLEGapIOCaps.none,
+        oob=False,
+        min_key_size=7,
+        max_key_size=16,
+        enc_own=True,
+        id_own=False,
+        sign_own=False,
+        link_own=False,
+        enc_peer=True,
+        id_peer=False,
+        sign_peer=False,
+        link_peer=False,
+    ):
+        kdist_own = BLEGapSecKDist(enc=enc_own, id=id_own, sign=sign_own, link=link_own)
+        kdist_peer = BLEGapSecKDist(
+            enc=enc_peer, id=id_peer, sign=sign_peer, link=link_peer
+        )
+        sec_params = BLEGapSecParams(
+            bond=bond,
+            mitm=mitm,
+            lesc=lesc,
+            keypress=keypress,
+            io_caps=io_caps,
+            oob=oob,
+            min_key_size=min_key_size,
+            max_key_size=max_key_size,
+            kdist_own=kdist_own,
+            kdist_peer=kdist_peer,
+        )
+
+        with self.expect(conn_handle, BLEEvtID.gap_evt_sec_params_request) as sec_params_reqs, \
+                self.expect(conn_handle, BLEEvtID.gap_evt_lesc_dhkey_request) as dhkey_reqs, \
+                self.expect(conn_handle, BLEEvtID.gap_evt_auth_status) as auth_statuses:
+            await self._call(self.driver.ble_gap_authenticate, conn_handle, sec_params)
+            result = await sec_params_reqs.wait(timeout=10)
+            if result is None:
+                raise NordicSemiException("Security parameters request timed out")
+            # LE Secure Connections used only if both sides support it.
+            if not sec_params.lesc or not result["peer_params"].lesc:
+                sec_params = (
+                    None
+                    if self.adapter.db_conns[conn_handle].role == BLEGapRoles.central
+                    else sec_params
+                )
+                await self._call(
+                    self.driver.ble_gap_sec_params_reply,
+                    conn_handle,
+                    BLEGapSecStatus.success,
+                    sec_params=sec_params,
+                    keyset=None,
+                )
+            else:
+                await dhkey_reqs.wait(timeout=5)
+
+            result = await auth_statuses.wait()
+
+        if result is None:
+            return None
+
+        # If success then keys are stored in self.driver._keyset.
+        if result["auth_status"] == BLEGapSecStatus.success:
+            self.adapter.db_conns[conn_handle]._keyset = BLEGapSecKeyset.from_c(
+                self.driver._keyset
+            )
+        return result["auth_status"]
+
+    async def encrypt(
+        self, conn_handle, ediv=None, rand=None, ltk=None, auth=0, lesc=0, ltk_len=16
+    ):
+        """Coroutine version of BLEAdapter.encrypt."""
+        master_id, enc_info = self.adapter._encrypt_keys(
+            conn_handle, ediv, rand, ltk, auth, lesc, ltk_len
+        )
+        with self.expect(conn_handle, BLEEvtID.gap_evt_conn_sec_update) as responses:
+            await self._call(
+                self.driver.ble_gap_encrypt, conn_handle, master_id, enc_info, enc_info.lesc
+            )
+            result = await responses.wait()
+        if result is None:
+            raise NordicSemiException("Encryption timed out")
+        return result["conn_sec"]
+
+    async def advertising_reports(
+        self, maxsize=ADV_REPORT_QUEUE_SIZE, policy=QueuePolicy.drop_oldest
+    ):
+        """Yield advertising reports as dicts with the on_gap_evt_adv_report arguments.
+
+        Up to maxsize reports wait for the consumer, see AsyncSubscriber.
+        """
+        subscriber = AsyncSubscriber(maxsize, policy)
+        self._adv_reports.append(subscriber)
+        try:
+            while True:
+                yield await subscriber.get()
+        finally:
+            self._adv_reports.remove(subscriber)
+            if subscriber.dropped:
+                logger.info("Dropped %d advertising reports", subscriber.dropped)
+
+    async def notifications(
+        self,
+        conn_handle=None,
+        uuid=None,
+        attr_handle=None,
+        maxsize=HVX_QUEUE_SIZE,
+        policy=QueuePolicy.drop_oldest,
+    ):
+        """Yield notifications and indications, optionally filtered.
+
+        Items are dicts with conn_handle, uuid, attr_handle, hvx_type and data.
+        Up to maxsize items wait for the consumer, see AsyncSubscriber.
+        """
+        subscriber = AsyncSubscriber(maxsize, policy)
+        self._hvx.append(subscriber)
+        try:
+            while True:
+                hvx = await subscriber.get()
+                if conn_handle is not None and hvx["conn_handle"] != conn_handle:
+                    continue
+                if uuid is not None and hvx["uuid"] != uuid:
+                    continue
+                if attr_handle is not None and hvx["attr_handle"] != attr_handle:
+                    continue
+                yield hvx
+        finally:
+            self._hvx.remove(subscriber)
+            if subscriber.dropped:
+                logger.info("Dropped %d notifications", subscriber.dropped)
+
+    # ...............................................................................................
+    def on_gap_evt_connected(self, ble_driver, conn_handle, peer_addr, role, conn_params):
+        self._post(
+            None,
+            BLEEvtID.gap_evt_connected,
+            dict(conn_handle=conn_handle, peer_addr=peer_addr, role=role, conn_params=conn_params),
+        )
+
+    def on_gap_evt_disconnected(self, ble_driver, conn_handle, reason):
+        self.loop.call_soon_threadsafe(
+            self._deliver_disconnected, conn_handle, dict(reason=reason)
+        )
+
+    def on_gap_evt_timeout(self, ble_driver, conn_handle, src):
+        if src == BLEGapTimeoutSrc.conn:
+            # Fails a pending connect
+            self._post(None, BLEEvtID.gap_evt_connected, None)
+
+    def on_gap_evt_adv_report(self, ble_driver, conn_handle, **kwargs):
+        self.loop.call_soon_threadsafe(self._publish, self._adv_reports, kwargs)
+
+    def on_gap_evt_sec_params_request(self, ble_driver, conn_handle, **kwargs):
+        self._post(conn_handle, BLEEvtID.gap_evt_sec_params_request, kwargs)
+
+    def on_gap_evt_lesc_dhkey_request(self, ble_driver, conn_handle, **kwargs):
+        self._post(conn_handle, BLEEvtID.gap_evt_lesc_dhkey_request, kwargs)
+
+    def on_gap_evt_auth_status(self, ble_driver, conn_handle, **kwargs):
+        self._post(conn_handle, BLEEvtID.gap_evt_auth_status, kwargs)
+
+    def on_gap_evt_conn_sec_update(self, ble_driver, conn_handle, **kwargs):
+        self._post(conn_handle, BLEEvtID.gap_evt_conn_sec_update, kwargs)
+
+    def on_gap_evt_conn_param_update(self, ble_driver, conn_handle, **kwargs):
+        self._post(conn_handle, BLEEvtID.gap_evt_conn_param_update, kwargs)
+
+    def on_gap_evt_phy_update(self, ble_driver, conn_handle, **kwargs):
+        self._post(conn_handle, BLEEvtID.gap_evt_phy_update, kwargs)
+
+    def on_gap_evt_data_length_update(self, ble_driver, conn_handle, **kwargs):
+        self._post(conn_handle, BLEEvtID.gap_evt_data_length_update, kwargs)
+
+    def on_gattc_evt_write_rsp(self, ble_driver, conn_handle, **kwargs):
+        self._post(conn_handle, BLEEvtID.gattc_evt_write_rsp, kwargs)
+
+    def on_gattc_evt_read_rsp(self, ble_driver, conn_handle, **kwargs):
+        self._post(conn_handle, BLEEvtID.gattc_evt_read_rsp, kwargs)
+
+    def on_gattc_evt_exchange_mtu_rsp(self, ble_driver, conn_handle, **kwargs):
+        self._post(conn_handle, BLEEvtID.gattc_evt_exchange_mtu_rsp, kwargs)
+
+    def on_gattc_evt_write_cmd_tx_complete(self, ble_driver, conn_handle, **kwargs):
+        self._post(conn_handle, WRITE_CMD_TX_COMPLETE, kwargs)
+
+    def on_evt_tx_complete(self, ble_driver, conn_handle, **kwargs):
+        self._post(conn_handle, WRITE_CMD_TX_COMPLETE, kwargs)
+
+    def on_notification_handle(self, ble_adapter, conn_handle, uuid, attr_handle, data):
+        hvx = dict(
+            conn_handle=conn_handle,
+            uuid=uuid,
+            attr_handle=attr_handle,
+            hvx_type=BLEGattHVXType.notification,
+            data=data,
+        )
+        self.loop.call_soon_threadsafe(self._publish, self._hvx, hvx)
+
+    def on_indication_handle(self, ble_adapter, conn_handle, uuid, attr_handle, data):
+        hvx = dict(
+            conn_handle=conn_handle,
+            uuid=uuid,
+            attr_handle=attr_handle,
+            hvx_type=BLEGattHVXType.indication,
+            data=data,
+        )
+        self.loop.call_soon_threadsafe(self._publish, self._hvx, hvx)
@@ -34,6 +34,7 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
+import asyncio
 import collections
 import functools
 import re
@@ -47,13 +48,18 @@ from abc import abstractmethod
 from threading import Thread, Lock
 
 from enum import Enum
-from typing import List
+from typing import Dict, Iterable, List
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.asymmetric import ec
 
 import wrapt
 
+from pc_ble_driver_py.adv_filter import AdvFilter, compile_adv_filters
+from pc_ble_driver_py.event_queue import EventQueue, QueuePolicy
+from pc_ble_driver_py.lesc_key_pool import LescKeyPool, generate_lesc_private_key
+from pc_ble_driver_py.rpa_resolver import RpaResolver
+from pc_ble_driver_py.scan_aggregator import ScanAggregator
 from pc_ble_driver_py.observers import *
 
 logger = logging.getLogger(__name__)
@@ -72,12 +78,20 @@ ATT_MTU_DEFAULT = None
 # Supports
 WORKER_QUEUE_WAIT_TIME = 1
 
+# Default bounds of the event, log and status queues, per class of event
+BLE_EVENT_QUEUE_SIZE = 1000
+LOG_QUEUE_SIZE = 1000
+STATUS_QUEUE_SIZE = 100
+
 if nrf_sd_ble_api_ver == 2:
     import pc_ble_driver_py.lib.nrf_ble_driver_sd_api_v2 as driver
 
     ATT_MTU_DEFAULT = driver.GATT_MTU_SIZE_DEFAULT
 elif nrf_sd_ble_api_ver == 5:
-    import pc_ble_driver_py.lib.nrf_ble_driver_sd_api_v5 as driver
+    if config.driver_backend_get() == "sim":
+        import pc_ble_driver_py.sim_driver as driver
+    else:
+        import pc_ble_driver_py.lib.nrf_ble_driver_sd_api_v5 as driver
 
     ATT_MTU_DEFAULT = driver.BLE_GATT_ATT_MTU_DEFAULT
 else:
@@ -99,9 +113,7 @@ def NordicSemiErrorCheck(wrapped=None, expected=driver.NRF_SUCCESS):
     if wrapped is None:
         return functools.partial(NordicSemiErrorCheck, expected=expected)
 
-    @wrapt.decorator
-    def wrapper(wrapped, _instance, args, kwargs):
-        err_code = wrapped(*args, **kwargs)
+    def check(err_code):
         if err_code != expected:
             raise NordicSemiException(
                 "Failed to {}. Error code: {}".format(
@@ -110,6 +122,18 @@ def NordicSemiErrorCheck(wrapped=None, expected=driver.NRF_SUCCESS):
                 error_code=err_code,
             )
 
+    if asyncio.iscoroutinefunction(wrapped):
+
+        @wrapt.decorator
+        async def async_wrapper(wrapped, _instance, args, kwargs):
+            check(await wrapped(*args, **kwargs))
+
+        return async_wrapper(wrapped)
+
+    @wrapt.decorator
+    def wrapper(wrapped, _instance, args, kwargs):
+        check(wrapped(*args, **kwargs))
+
     return wrapper(wrapped)
 
 
@@ -508,14 +532,19 @@ class BLEGapAddr(object):
         )
         anonymous = 0x7F  # driver.BLE_GAP_ADDR_TYPE_ANONYMOUS, available from SD v6
 
+    # Identity of a resolvable private address, set by the RpaResolver of
+    # BLEDriver on the addresses of advertising reports
+    identity = None
+
     def __init__(self, addr_type, addr):
         assert type(addr_type) in [BLEGapAddr.Types, int], "Invalid addr_type: {addr_type}"
         self.addr_type = addr_type
         self.addr = addr
 
     def __getstate__(self):
-        self.addr_type = self.addr_type.value
-        return self.__dict__
+        state = dict(self.__dict__)
+        state["addr_type"] = getattr(self.addr_type, "value", self.addr_type)
+        return state
 
     def __setstate__(self, state):
         self.__dict__ = state
@@ -556,19 +585,8 @@ class BLEGapSecKeyset(object):
 
     def to_c(self):
         keyset = driver.ble_gap_sec_keyset_t()
-        keyset.keys_own = BLEGapSecKeys(
-            self.keys_own.p_enc_key,
-            self.keys_own.p_id_key,
-            self.keys_own.p_sign_key,
-            self.keys_own.p_pk
-        ).to_c()
-        keyset.keys_peer = BLEGapSecKeys(
-            self.keys_peer.p_enc_key,
-            self.keys_peer.p_id_key,
-            self.keys_peer.p_sign_key,
-            self.keys_peer.p_pk
-        ).to_c()
-
+        keyset.keys_own = self.keys_own.to_c()
+        keyset.keys_peer = self.keys_peer.to_c()
         return keyset
 
     def __str__(self):
@@ -593,27 +611,45 @@ class BLEGapSecKeys(object):
 
     def to_c(self):
         sec_keys = driver.ble_gap_sec_keys_t()
-        sec_keys.p_enc_key = BLEGapEncKey(self.enc_key.master_id, self.enc_key.enc_info).to_c()
-        sec_keys.p_id_key = BLEGapIdKey(self.id_key.id_info, self.id_key.id_info).to_c()
-        sec_keys.p_sign_key = BLEGapSignInfo(self.sign_key.csrk).to_c()
-        sec_keys.p_pk = BLEGapLescP256Pk(self.pk.pk).to_c()
+        sec_keys.p_enc_key = self.enc_key.to_c() if self.enc_key else None
+        sec_keys.p_id_key = self.id_key.to_c() if self.id_key else None
+        sec_keys.p_sign_key = self.sign_key.to_c() if self.sign_key else None
+        sec_keys.p_pk = self.pk.to_c() if self.pk else None
         return sec_keys
 
     def __str__(self):
-        return "enc_key({0.p_enc_key}) id_key({0.p_id_key}) csrk({0.p_csrk}) pk({0.p_pk})".format(
+        return "enc_key({0.enc_key}) id_key({0.id_key}) sign_key({0.sign_key}) pk({0.pk})".format(
             self
         )
 
 
 class BLEGapLescP256Pk(object):
+    """P-256 public key, X then Y coordinate, each little endian."""
+
     def __init__(self, pk):
         self.pk = pk
 
     @classmethod
     def from_c(cls, p_pk):
         return cls(
-            pk=util.uint8_array_to_list(p_pk.pk, driver.BLE_GAP_LESC_P256_PK_LEN)
+            pk=util.uint8_array_to_bytes(p_pk.pk, driver.BLE_GAP_LESC_P256_PK_LEN)
+        )
+
+    @classmethod
+    def from_public_key(cls, public_key):
+        numbers = public_key.public_numbers()
+        length = driver.BLE_GAP_LESC_P256_PK_LEN // 2
+        return cls(pk=numbers.x.to_bytes(length, "little") + numbers.y.to_bytes(length, "little"))
+
+    def public_key(self):
+        pk = bytes(self.pk)
+        length = len(pk) // 2
+        numbers = ec.EllipticCurvePublicNumbers(
+            int.from_bytes(pk[:length], "little"),
+            int.from_bytes(pk[length:], "little"),
+            ec.SECP256R1(),
         )
+        return numbers.public_key(default_backend())
 
     def to_c(self):
         lescp256pk_array = util.list_to_uint8_array(self.pk)
@@ -622,12 +658,19 @@ class BLEGapLescP256Pk(object):
         return lescp256pk
 
     def __str__(self):
-        return ("pk({0.pk}))").format(self)
+        return "pk({})".format(bytes(self.pk).hex())
 
 
 class BLEGapDHKey(object):
+    """ECDH shared secret, little endian."""
+
     def __init__(self, key):
-        self.key=key
+        self.key = key
+
+    @classmethod
+    def from_shared_secret(cls, shared_secret):
+        """From the big endian secret of ECDH key exchange."""
+        return cls(key=bytes(shared_secret)[::-1])
 
     def to_c(self):
         key_array = util.list_to_uint8_array(self.key)
@@ -636,7 +679,7 @@ class BLEGapDHKey(object):
         return dh_key
 
     def __str__(self):
-        return ("p_dhkey({0.p_dhkey}))").format(self)
+        return "key({})".format(bytes(self.key).hex())
 
 
 class BLEGapEncKey(object):
@@ -653,8 +696,8 @@ class BLEGapEncKey(object):
 
     def to_c(self):
         enc_key = driver.ble_gap_enc_key_t()
-        enk_key.master_id = BLEGapMasterId(self.master_id).to_c()
-        enk_key.enc_info = BLEGapEncInfo(self.enc_info).to_c()
+        enc_key.master_id = self.master_id.to_c()
+        enc_key.enc_info = self.enc_info.to_c()
         return enc_key
 
     def __str__(self):
@@ -995,14 +1038,40 @@ class BLEAdvData(object):
         for k in kwargs:
             self.records[BLEAdvData.Types[k]] = kwargs[k]
         self.__data_array = None
+        # Undecoded advertising data, records is decoded from it on first access
+        self._raw = None
+        self._ad_types = None
+
+    @property
+    def records(self):
+        records = self._records
+        if records is None:
+            records = _decode_ad_records(self._raw, self._ad_types)
+            self._records = records
+        return records
+
+    @records.setter
+    def records(self, records):
+        self._records = records
+
+    @property
+    def raw(self):
+        """Advertising data as received, None if not decoded from a report."""
+        return self._raw
 
     def __getstate__(self):
-        self.records = {k.value: v for k, v in self.records.items()}
-        return self.__dict__
+        state = dict(self.__dict__)
+        del state["_records"]
+        state["records"] = {k.value: v for k, v in self.records.items()}
+        return state
 
     def __setstate__(self, state):
+        state = dict(state)
+        records = state.pop("records")
+        state.setdefault("_raw", None)
+        state.setdefault("_ad_types", None)
         self.__dict__ = state
-        self.records = {BLEAdvData.Types(k): v for k, v in self.records.items()}
+        self.records = {BLEAdvData.Types(k): v for k, v in records.items()}
 
     def to_c(self):
         data_list = list()
@@ -1027,41 +1096,60 @@ class BLEAdvData(object):
             self.__data_array = util.list_to_uint8_array(data_list)
             return data_len, self.__data_array.cast()
 
+    @staticmethod
+    def ad_type_values(ad_types):
+        """AD type numbers of BLEAdvData.Types or ints, None for all types."""
+        if ad_types is None:
+            return None
+        return frozenset(getattr(ad_type, "value", ad_type) for ad_type in ad_types)
+
     @classmethod
-    def from_c(cls, adv_report_evt):
-        ad_list = util.uint8_array_to_list(adv_report_evt.data, adv_report_evt.dlen)
+    def from_c(cls, adv_report_evt, ad_types=None, lazy=False):
+        data = util.uint8_array_to_bytes(adv_report_evt.data, adv_report_evt.dlen)
+        return cls.from_bytes(data, ad_types, lazy)
+
+    @classmethod
+    def from_bytes(cls, data, ad_types=None, lazy=False):
+        """Decode advertising data from bytes or a memoryview.
+
+        Only records with an AD type number in ad_types are kept, all known
+        types when None, see ad_type_values(). With lazy, decoding is
+        deferred until records is first read.
+        """
         ble_adv_data = cls()
-        index = 0
+        ble_adv_data._raw = bytes(data)
+        ble_adv_data._ad_types = ad_types
+        ble_adv_data._records = None
+        if not lazy:
+            ble_adv_data.records
+        return ble_adv_data
 
-        ad_len = None
-        ad_type = None
 
-        while index < len(ad_list):
-            try:
-                ad_len = ad_list[index]
-                if ad_len == 0:
-                    logger.info(f"ad_len is zero, discarding rest of ad_list")
-                    return ble_adv_data
-
-                ad_type = ad_list[index + 1]
-                offset = index + 2
-                key = BLEAdvData.Types(ad_type)
-                ble_adv_data.records[key] = ad_list[offset: offset + ad_len - 1]
-            except ValueError:
-                if ad_type:
-                    logger.info(
-                        "Unknown advertising data type: 0x{:02X}".format(ad_type)
-                    )
-                else:
-                    logger.info("Invalid advertising data")
-            except IndexError:
-                logger.info("Invalid advertising data: {}".format(ad_list))
-                return ble_adv_data
-
-            if ad_len:
-                index += ad_len + 1
+# AD type number -> BLEAdvData.Types, instead of an Enum lookup per record
+_AD_TYPES = {ad_type.value: ad_type for ad_type in BLEAdvData.Types}
 
-        return ble_adv_data
+
+def _decode_ad_records(data, ad_types=None):
+    """Records of advertising data, skipping unknown types and those not in ad_types.
+
+    Decoding stops at a zero length, a record running past the end keeps
+    the bytes that are there.
+    """
+    records = dict()
+    index = 0
+    end = len(data)
+    while index + 1 < end:
+        ad_len = data[index]
+        if ad_len == 0:
+            break
+        ad_type = data[index + 1]
+        next_index = index + ad_len + 1
+        if ad_types is None or ad_type in ad_types:
+            key = _AD_TYPES.get(ad_type)
+            if key is not None:
+                records[key] = list(data[index + 2:next_index])
+        index = next_index
+    return records
 
 
 class BLEGattWriteOperation(Enum):
@@ -1161,6 +1249,77 @@ class BLEGattcWriteParams(object):
         ).format(self)
 
 
+class BLEEvtPayload(object):
+    """Attribute value carried in a GATTC event, decoded on first access.
+
+    Keeps the SWIG owned event alive until the value has been copied out, so
+    events nobody looks at never pay for the conversion. Supports the read
+    only part of the list interface, and bytes(), view() and tobytes() for
+    bulk access. It does not export the buffer protocol itself, so use view()
+    where a memoryview is needed.
+    """
+
+    __slots__ = ("_event", "_array", "_length", "_value")
+
+    def __init__(self, event, array, length):
+        self._event = event
+        self._array = array
+        self._length = length
+        self._value = None
+
+    def tobytes(self):
+        value = self._value
+        if value is None:
+            event, array = self._event, self._array
+            if array is None:
+                # Decoded by another thread in the meantime
+                return self._value
+            # event is held locally so that the array stays valid while copying
+            value = util.uint8_array_to_bytes(array, self._length)
+            self._value = value
+            # Release the array before the event that owns its memory
+            self._array = None
+            self._event = None
+        return value
+
+    def tolist(self):
+        return list(self.tobytes())
+
+    def view(self):
+        return memoryview(self.tobytes())
+
+    def __bytes__(self):
+        return self.tobytes()
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return iter(self.tobytes())
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return list(self.tobytes()[key])
+        return self.tobytes()[key]
+
+    def __eq__(self, other):
+        if isinstance(other, BLEEvtPayload):
+            return self.tobytes() == other.tobytes()
+        if isinstance(other, (bytes, bytearray, memoryview)):
+            return self.tobytes() == bytes(other)
+        if isinstance(other, (list, tuple)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, self.tolist())
+
+    def __str__(self):
+        return str(self.tolist())
+
+
 class BLEHci(Enum):
     success = driver.BLE_HCI_STATUS_CODE_SUCCESS
     unknown_btle_command = driver.BLE_HCI_STATUS_CODE_UNKNOWN_BTLE_COMMAND
@@ -1233,6 +1392,14 @@ class BLEUUIDBase(object):
 
         self.__array = None
 
+    def __getstate__(self):
+        return {"base": self.base, "type": self.type}
+
+    def __setstate__(self, state):
+        self.base = state["base"]
+        self.type = state["type"]
+        self.__array = None
+
     @classmethod
     def from_c(cls, uuid):
         return cls(uuid_type=uuid.type)
@@ -1252,8 +1419,10 @@ class BLEUUID(object):
         service_secondary = 0x2801
         characteristic = 0x2803
         cccd = 0x2902
+        service_changed = 0x2A05
         battery_level = 0x2A19
         heart_rate = 0x2A37
+        database_hash = 0x2B2A
 
     def __init__(self, value, base=BLEUUIDBase()):
         assert isinstance(base, BLEUUIDBase), "Invalid argument type"
@@ -1848,9 +2017,96 @@ class RpcLogSeverity(Enum):
     fatal = driver.SD_RPC_LOG_FATAL
 
 
+class BLEEventClass(Enum):
+    """Classes of BLE events, each with its own queue lane, bound and policy."""
+
+    control = 0
+    adv_report = 1
+    notification = 2
+    gatt_response = 3
+
+
+# GATT client responses and server requests, answered by the application or
+# BLEAdapter while the peer waits
+_GATT_RESPONSE_EVT_IDS = frozenset(
+    evt.value
+    for evt in BLEEvtID
+    if evt.name.startswith(("gattc_evt_", "gatts_evt_"))
+    and not evt.name.endswith("tx_complete")
+)
+
+
+def ble_event_class(item):
+    """Class of an [adapter, ble_event] item of the event queue.
+
+    GATT events other than notifications and TX complete are GATT
+    responses, and everything else that is not an advertising report is a
+    control event. Indications count as GATT responses, as one that is
+    never confirmed stalls the server until the ATT timeout.
+    """
+    ble_event = item[1]
+    evt_id = ble_event.header.evt_id
+    if evt_id == driver.BLE_GAP_EVT_ADV_REPORT:
+        return BLEEventClass.adv_report
+    if evt_id in _GATT_RESPONSE_EVT_IDS:
+        if (
+            evt_id == driver.BLE_GATTC_EVT_HVX
+            and ble_event.evt.gattc_evt.params.hvx.type == driver.BLE_GATT_HVX_NOTIFICATION
+        ):
+            return BLEEventClass.notification
+        return BLEEventClass.gatt_response
+    return BLEEventClass.control
+
+
+def ble_event_connection(item):
+    """Connection handle of a queued event, None if it has none."""
+    conn_handle = item[1].evt.common_evt.conn_handle
+    if conn_handle == driver.BLE_CONN_HANDLE_INVALID:
+        return None
+    return conn_handle
+
+
+def adv_report_key(item):
+    """Advertiser and PDU kind of a queued advertising report."""
+    adv_report = item[1].evt.gap_evt.params.adv_report
+    peer_addr = adv_report.peer_addr
+    return (
+        peer_addr.addr_type,
+        util.uint8_array_to_bytes(peer_addr.addr, driver.BLE_GAP_ADDR_LEN),
+        adv_report.scan_rsp,
+    )
+
+
 class BLEDriver(object):
-    observer_lock = Lock()
+    # Serializes the calls that are global to the process. Calls to one
+    # adapter are serialized by a lock of that BLEDriver, so that adapters
+    # do not wait for each other.
     api_lock = Lock()
+    lazy_payloads = False
+    lazy_adv_data = True
+    adv_data_types = None
+    scan_aggregator = None
+    lesc_key_pool = None
+    rpa_resolver = None
+    # Only advertising reports are dropped by default. Control events and GATT
+    # responses are never dropped, as the adapter state depends on them, and
+    # notifications queue beyond the bound rather than get lost.
+    # QueuePolicy.block is opt-in: it waits in the RPC event callback, which
+    # holds back every later event, and drops the item after block_timeout.
+    event_queue_policies = {
+        BLEEventClass.control: QueuePolicy.never_drop,
+        BLEEventClass.gatt_response: QueuePolicy.never_drop,
+        BLEEventClass.adv_report: QueuePolicy.drop_oldest,
+        BLEEventClass.notification: QueuePolicy.never_drop,
+    }
+    # Lanes with lower numbers are served first, so that an advertising
+    # flood does not hold back disconnects or GATT responses
+    event_queue_priorities = {
+        BLEEventClass.control: 0,
+        BLEEventClass.gatt_response: 1,
+        BLEEventClass.notification: 2,
+        BLEEventClass.adv_report: 3,
+    }
 
     def __init__(
         self,
@@ -1860,9 +2116,61 @@ class BLEDriver(object):
         retransmission_interval=300,  # type: int
         response_timeout=1500,  # type: int
         log_severity_level="info",  # type: str
+        lazy_payloads=False,  # type: bool
+        lazy_adv_data=True,  # type: bool
+        adv_data_types=None,  # type: Iterable[BLEAdvData.Types]
+        scan_aggregator=None,  # type: ScanAggregator
+        lesc_key_pool=None,  # type: LescKeyPool
+        lesc_key_pool_size=0,  # type: int
+        rpa_resolver=None,  # type: RpaResolver
+        event_queue_size=BLE_EVENT_QUEUE_SIZE,  # type: int
+        event_queue_policies=None,  # type: Dict[BLEEventClass, QueuePolicy]
+        log_queue_size=LOG_QUEUE_SIZE,  # type: int
+        status_queue_size=STATUS_QUEUE_SIZE,  # type: int
+        dispatch_workers=0,  # type: int
     ):
         super(BLEDriver, self).__init__()
+        # Replaced, never changed in place, so that dispatch can go through
+        # it without the lock
         self.observers = list()  # type: List[BLEDriverObserver]
+        self.observer_lock = Lock()
+        # Held while the status, log and event threads call observers, so
+        # that the observers of one driver are called one at a time
+        self.dispatch_lock = Lock()
+        # With dispatch_workers > 0, events are dispatched by that many
+        # threads, one connection at a time per thread, instead of by a
+        # single EventThread, and without dispatch_lock. Events of one
+        # conn_handle are still delivered in order and one at a time, but
+        # events of different connections, and status and log entries, reach
+        # the observers concurrently. Observers, BLEAdapter included, must
+        # then guard any state they share between connections.
+        self.dispatch_workers = dispatch_workers
+        # With lazy_payloads, GATTC hvx/read/write responses carry a
+        # BLEEvtPayload, decoded on first access, instead of a list of ints
+        self.lazy_payloads = lazy_payloads
+        # Advertising reports keep only the records of adv_data_types, all
+        # of them when None, and with lazy_adv_data decode them when records
+        # is first read
+        self.lazy_adv_data = lazy_adv_data
+        self.adv_data_types = BLEAdvData.ad_type_values(adv_data_types)
+        # Optional ScanAggregator that holds back repeated advertising
+        # reports before they are decoded
+        self.scan_aggregator = scan_aggregator
+        # Optional LescKeyPool that generate_lesc_keyset takes keys from. With
+        # lesc_key_pool_size instead, the driver keeps a pool of its own that
+        # is refilled in the background while the driver is open.
+        self._lesc_key_pool_owned = lesc_key_pool is None and bool(lesc_key_pool_size)
+        if self._lesc_key_pool_owned:
+            lesc_key_pool = LescKeyPool(size=lesc_key_pool_size, fill=False)
+        self.lesc_key_pool = lesc_key_pool
+        # Optional RpaResolver that sets the identity of resolvable private
+        # addresses in advertising reports
+        self.rpa_resolver = rpa_resolver
+        # Predicate from adv_filter_set, and the reports it turned away
+        self.adv_filter = None
+        self.adv_filtered = 0
+        # AdvRecorder from adv_recorder_set
+        self.adv_recorder = None
 
         if auto_flash:
             try:
@@ -1898,9 +2206,59 @@ class BLEDriver(object):
         self.rpc_log_severity_filter(log_severity_level_enum)
         self._keyset = self.init_keyset()
 
-        self.log_queue = queue.Queue()
-        self.status_queue = queue.Queue()
-        self.ble_event_queue = queue.Queue()
+        # TX queue sizes set with ble_cfg_set, per connection configuration tag
+        self.write_cmd_tx_queue_sizes = dict()
+        self.hvn_tx_queue_sizes = dict()
+        # GAP configuration set with ble_cfg_set, None or missing tags mean
+        # the SoftDevice default
+        self.central_role_count = None
+        self.conn_counts = dict()
+        self.event_lengths = dict()
+        # Connection configuration tag of the last connect or advertising
+        # start, per GAP role
+        self.conn_cfg_tags = dict()
+
+        # Events are queued up to event_queue_size per BLEEventClass, with the
+        # policy from event_queue_policies. 0 means no bound. Lanes are served
+        # by event_queue_priorities, keeping the order within a connection.
+        policies = dict(self.event_queue_policies)
+        policies.update(event_queue_policies or {})
+        self.log_queue = EventQueue(maxsize=log_queue_size, policy=QueuePolicy.drop_oldest)
+        self.status_queue = EventQueue(
+            maxsize=status_queue_size, policy=QueuePolicy.drop_oldest
+        )
+        self.ble_event_queue = EventQueue(
+            maxsize=event_queue_size,
+            classify=ble_event_class,
+            policies=policies,
+            priorities=self.event_queue_priorities,
+            connection=ble_event_connection,
+            coalesce_key=adv_report_key,
+        )
+
+    def queue_stats(self):
+        """Drop counters and high-water marks of the event, log and status queues."""
+        return dict(
+            ble_event=self.ble_event_queue.stats(),
+            log=self.log_queue.stats(),
+            status=self.status_queue.stats(),
+            adv_filtered=self.adv_filtered,
+        )
+
+    def adv_filter_set(self, *filters):
+        """Only queue advertising reports that match one of the AdvFilters.
+
+        The filters are compiled here and matched on the raw report in the
+        RPC event callback. Without filters, all reports are queued.
+        """
+        self.adv_filter = compile_adv_filters(filters) if filters else None
+
+    def adv_recorder_set(self, adv_recorder):
+        """Capture every advertising report with adv_recorder, None to stop.
+
+        The recorder is not closed when replaced.
+        """
+        self.adv_recorder = adv_recorder
 
     def init_keyset(self):
         keyset = driver.ble_gap_sec_keyset_t()
@@ -1918,81 +2276,39 @@ class BLEDriver(object):
         return keyset
 
     def generate_lesc_keyset(self, private_key=None):
-        def _int_to_list(input_integer):
-            output_list = []
-            input_hex_string = "{:X}".format(input_integer)
-
-            # Add zeros to start key if they are stripped.
-            while len(input_hex_string) < 64:
-                input_hex_string = "0" + input_hex_string
-
-            for i in range(1, len(input_hex_string), 2):
-                output_list.append(int((input_hex_string[i - 1] + input_hex_string[i]), 16))
-
-            return output_list
-
-        self._lesc_private_key = ec.generate_private_key(ec.SECP256R1(), default_backend())
-        if not private_key:
-            private_key = self._lesc_private_key
-        lesc_own_public_key = private_key.public_key()
-        lesc_own_public_key_numbers = lesc_own_public_key.public_numbers()
-        lesc_own_public_key = private_key.public_key()
-        x = lesc_own_public_key_numbers.x
-        y = lesc_own_public_key_numbers.y
-
-        logger.debug("ECDH key: Before: x: {:X}".format(x))
-        logger.debug("ECDH key: Before: y: {:X}".format(y))
-
-        x_list = _int_to_list(x)[::-1]
-        y_list = _int_to_list(y)[::-1]
-
-        logger.debug("ECDH key: After: x: {}".format(" ".join(["0x{:02X}".format(i) for i in x_list])))
-        logger.debug("ECDH key: After: y: {}".format(" ".join(["0x{:02X}".format(i) for i in y_list])))
-        lesc_own_public_key_list = x_list + y_list
+        """Put the public key of private_key into the own keys of the keyset.
+
+        Without private_key, a key comes from lesc_key_pool, or is generated
+        when there is no pool. The key is kept for generate_lesc_dhkey.
+        """
+        if private_key is None:
+            if self.lesc_key_pool is not None:
+                private_key = self.lesc_key_pool.get()
+            else:
+                private_key = generate_lesc_private_key()
+        self._lesc_private_key = private_key
 
         # Put own lesc public key into keyset.
-        lesc_pk_own = BLEGapLescP256Pk(lesc_own_public_key_list)
-        logger.debug("lesc_pk_own {}".format(lesc_pk_own))
+        lesc_pk_own = BLEGapLescP256Pk.from_public_key(private_key.public_key())
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("lesc_pk_own {}".format(lesc_pk_own))
         self._keyset.keys_own.p_pk = lesc_pk_own.to_c()
 
         return self._keyset
 
     def generate_lesc_dhkey(self, peer_public_key):
-        def _change_endianness(input_string):
-            output = ""
-            for i in range(len(input_string) - 1, 0, -2):
-                output += input_string[i - 1]
-                output += input_string[i]
-            return output
-        lesc_pk_peer = peer_public_key
-        # Translate incoming peer public key to x an y components as integers.
-        peer_public_key_list = lesc_pk_peer.pk
-        peer_public_key_x = int(_change_endianness("".join(["{:02X}".format(i) for i in peer_public_key_list[:32]])), 16)
-        peer_public_key_y = int(_change_endianness("".join(["{:02X}".format(i) for i in peer_public_key_list[32:]])), 16)
-
-        logger.debug("Peer public DH key, big endian, x: 0x{:X}, y: 0x{:X}".format(peer_public_key_x, peer_public_key_y))
-
-        # Generate a _EllipticCurvePublicKey object of the received peer public key.
-        lesc_peer_public_key_obj = ec.EllipticCurvePublicNumbers(peer_public_key_x,
-                                                                 peer_public_key_y,
-                                                                 ec.SECP256R1())
-        lesc_peer_public_key_obj2 = lesc_peer_public_key_obj.public_key(default_backend())
-
         # Calculate shared secret based on own private key and peer public key.
-        shared_key_list = self._lesc_private_key.exchange(ec.ECDH(), lesc_peer_public_key_obj2)
-        shared_key_list = list(shared_key_list)
-        shared_key_list = shared_key_list[::-1]
-        logger.debug("shared_key_list = {}".format(shared_key_list))
-
-        key_list_string = " ".join(["0x{:02X}".format(i) for i in shared_key_list])
-        logger.debug("Shared secret list, little endian: {} \n".format(key_list_string))
-        logger.debug("len(shared_key_list) = {}".format(len(shared_key_list)))
+        shared_secret = self._lesc_private_key.exchange(
+            ec.ECDH(), peer_public_key.public_key()
+        )
+        lesc_dhkey = BLEGapDHKey.from_shared_secret(shared_secret)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Shared secret, little endian: {}".format(lesc_dhkey))
         # Reply to Softdevice with shared key
-        lesc_dhkey = BLEGapDHKey(shared_key_list).to_c()
-        return lesc_dhkey
+        return lesc_dhkey.to_c()
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def rpc_log_severity_filter(self, severity):
         # type: (RpcLogSeverity) -> ()
         return driver.sd_rpc_log_handler_severity_filter_set(
@@ -2000,14 +2316,26 @@ class BLEDriver(object):
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_cfg_set(self, cfg_id, cfg):
         app_ram_base = 0
         assert isinstance(cfg, BLEConfigBase)
         assert isinstance(cfg_id, BLEConfig)
-        return driver.sd_ble_cfg_set(
+        err_code = driver.sd_ble_cfg_set(
             self.rpc_adapter, cfg_id.value, cfg.to_c(), app_ram_base
         )
+        if err_code == driver.NRF_SUCCESS:
+            tag = cfg.conn_cfg_tag
+            if isinstance(cfg, BLEConfigConnGattc):
+                self.write_cmd_tx_queue_sizes[tag] = cfg.write_cmd_tx_queue_size
+            elif isinstance(cfg, BLEConfigConnGatts):
+                self.hvn_tx_queue_sizes[tag] = cfg.hvn_tx_queue_size
+            elif isinstance(cfg, BLEConfigConnGap):
+                self.conn_counts[tag] = cfg.conn_count
+                self.event_lengths[tag] = cfg.event_length
+            elif isinstance(cfg, BLEConfigGapRoleCount):
+                self.central_role_count = cfg.central_role_count
+        return err_code
 
     @wrapt.synchronized(api_lock)
     @classmethod
@@ -2033,7 +2361,7 @@ class BLEDriver(object):
         return list(map(SerialPortDescriptor.from_c, descs))
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def open(self):
         self.run_workers = True
 
@@ -2049,11 +2377,24 @@ class BLEDriver(object):
         self.status_worker.daemon = True
         self.status_worker.start()
 
-        self.ble_event_worker = Thread(
-            target=self.ble_event_handler_thread, name="EventThread"
-        )
-        self.ble_event_worker.daemon = True
-        self.ble_event_worker.start()
+        if self.dispatch_workers:
+            self.ble_event_workers = [
+                Thread(
+                    target=self.ble_event_dispatch_thread,
+                    name="EventThread-{}".format(i),
+                )
+                for i in range(self.dispatch_workers)
+            ]
+        else:
+            self.ble_event_workers = [
+                Thread(target=self.ble_event_handler_thread, name="EventThread")
+            ]
+        for worker in self.ble_event_workers:
+            worker.daemon = True
+            worker.start()
+
+        if self._lesc_key_pool_owned:
+            self.lesc_key_pool.start()
 
         return driver.sd_rpc_open(
             self.rpc_adapter,
@@ -2063,11 +2404,14 @@ class BLEDriver(object):
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def close(self):
         result = driver.sd_rpc_close(self.rpc_adapter)
         logger.debug("close result %s", result)
 
+        if self._lesc_key_pool_owned:
+            self.lesc_key_pool.stop()
+
         # Cleanup workers
         if self.run_workers:
             self.run_workers = False
@@ -2092,7 +2436,8 @@ class BLEDriver(object):
             except queue.Empty:
                 pass
 
-            self.ble_event_worker.join()
+            for worker in self.ble_event_workers:
+                worker.join()
 
             # Empty ble_event_queue
             try:
@@ -2105,13 +2450,15 @@ class BLEDriver(object):
 
         return result
 
-    @wrapt.synchronized(observer_lock)
     def observer_register(self, observer):
-        self.observers.append(observer)
+        with self.observer_lock:
+            self.observers = self.observers + [observer]
 
-    @wrapt.synchronized(observer_lock)
     def observer_unregister(self, observer):
-        self.observers.remove(observer)
+        with self.observer_lock:
+            observers = list(self.observers)
+            observers.remove(observer)
+            self.observers = observers
 
     @staticmethod
     def adv_params_setup():
@@ -2131,7 +2478,7 @@ class BLEDriver(object):
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_enable(self, ble_enable_params=None):
         app_ram_base = driver.new_uint32()
         if nrf_sd_ble_api_ver == 2:
@@ -2147,7 +2494,7 @@ class BLEDriver(object):
             err_code = driver.sd_ble_enable(self.rpc_adapter, app_ram_base)
         return err_code
 
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_version_get(self):
         version = driver.ble_version_t()
         err_code = driver.sd_ble_version_get(self.rpc_adapter, version)
@@ -2160,7 +2507,7 @@ class BLEDriver(object):
         return BLEVersion.from_c(version)
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_addr_set(self, gap_addr):
         assert isinstance(gap_addr, BLEGapAddr), "Invalid argument type"
         if gap_addr:
@@ -2170,7 +2517,7 @@ class BLEDriver(object):
         elif nrf_sd_ble_api_ver == 5:
             return driver.sd_ble_gap_addr_set(self.rpc_adapter, gap_addr)
 
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_addr_get(self):
         address = BLEGapAddr(BLEGapAddr.Types.public, [0] * 6)
         addr = address.to_c()
@@ -2185,25 +2532,26 @@ class BLEDriver(object):
         return BLEGapAddr.from_c(addr)
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_privacy_set(self, privacy_params):
         assert isinstance(privacy_params, BLEGapPrivacyParams), "Invalid argument type"
         privacy_params = privacy_params.to_c()
         return driver.sd_ble_gap_privacy_set(self.rpc_adapter, privacy_params)
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_adv_start(self, adv_params=None, tag=0):
         if not adv_params:
             adv_params = self.adv_params_setup()
         assert isinstance(adv_params, BLEGapAdvParams), "Invalid argument type"
+        self.conn_cfg_tags[BLEGapRoles.periph] = tag
         if nrf_sd_ble_api_ver == 5:
             return driver.sd_ble_gap_adv_start(self.rpc_adapter, adv_params.to_c(), tag)
         else:
             return driver.sd_ble_gap_adv_start(self.rpc_adapter, adv_params.to_c())
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_conn_param_update(self, conn_handle, conn_params):
         assert isinstance(
             conn_params, (BLEGapConnParams, type(None))
@@ -2215,12 +2563,12 @@ class BLEDriver(object):
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_adv_stop(self):
         return driver.sd_ble_gap_adv_stop(self.rpc_adapter)
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_scan_start(self, scan_params=None):
         if not scan_params:
             scan_params = self.scan_params_setup()
@@ -2228,12 +2576,12 @@ class BLEDriver(object):
         return driver.sd_ble_gap_scan_start(self.rpc_adapter, scan_params.to_c())
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_scan_stop(self):
         return driver.sd_ble_gap_scan_stop(self.rpc_adapter)
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_connect(self, address, scan_params=None, conn_params=None, tag=0):
         assert isinstance(address, BLEGapAddr), "Invalid argument type"
 
@@ -2245,6 +2593,7 @@ class BLEDriver(object):
             conn_params = self.conn_params_setup()
         assert isinstance(conn_params, BLEGapConnParams), "Invalid argument type"
 
+        self.conn_cfg_tags[BLEGapRoles.central] = tag
         if nrf_sd_ble_api_ver == 2:
             return driver.sd_ble_gap_connect(
                 self.rpc_adapter, address.to_c(), scan_params.to_c(), conn_params.to_c()
@@ -2259,7 +2608,12 @@ class BLEDriver(object):
             )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
+    def ble_gap_connect_cancel(self):
+        return driver.sd_ble_gap_connect_cancel(self.rpc_adapter)
+
+    @NordicSemiErrorCheck
+    @wrapt.synchronized
     def ble_gap_disconnect(
         self, conn_handle, hci_status_code=BLEHci.remote_user_terminated_connection
     ):
@@ -2269,7 +2623,7 @@ class BLEDriver(object):
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_adv_data_set(self, adv_data=BLEAdvData(), scan_data=BLEAdvData()):
         assert isinstance(adv_data, BLEAdvData), "Invalid argument type"
         assert isinstance(scan_data, BLEAdvData), "Invalid argument type"
@@ -2281,7 +2635,7 @@ class BLEDriver(object):
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_authenticate(self, conn_handle, sec_params):
         assert isinstance(
             sec_params, (BLEGapSecParams, type(None))
@@ -2291,7 +2645,7 @@ class BLEDriver(object):
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_sec_params_reply(self, conn_handle, sec_status, sec_params, keyset=None):
         assert isinstance(sec_status, BLEGapSecStatus), "Invalid argument type"
         assert isinstance(sec_params, (BLEGapSecParams, NoneType)), "Invalid argument type"
@@ -2308,7 +2662,7 @@ class BLEDriver(object):
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_lesc_dhkey_reply(self, conn_handle, p_dhkey):
         return driver.sd_ble_gap_lesc_dhkey_reply(
             self.rpc_adapter,
@@ -2317,13 +2671,17 @@ class BLEDriver(object):
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_sec_info_reply(self, conn_handle, enc_info, id_info, sign_info):
+        if isinstance(enc_info, BLEGapEncInfo):
+            enc_info = enc_info.to_c()
+        if isinstance(sign_info, BLEGapSignInfo):
+            sign_info = sign_info.to_c()
         return driver.sd_ble_gap_sec_info_reply(
             self.rpc_adapter, conn_handle, enc_info, id_info, sign_info
         )
 
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_conn_sec_get(self, conn_handle):
         conn_sec = driver.ble_gap_conn_sec_t()
         conn_sec.sec_mode = driver.ble_gap_conn_sec_mode_t()
@@ -2337,16 +2695,16 @@ class BLEDriver(object):
         return conn_sec
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_encrypt(self, conn_handle, master_id, enc_info, lesc):
         if not master_id or not enc_info:
             keyset = BLEGapSecKeyset.from_c(self._keyset)
             if lesc:
-                master_id = keyset.keys_own.p_enc_key.master_id
-                enc_info = keyset.keys_own.p_enc_key.enc_info
+                master_id = keyset.keys_own.enc_key.master_id
+                enc_info = keyset.keys_own.enc_key.enc_info
             else:
-                master_id = keyset.keys_peer.p_enc_key.master_id
-                enc_info = keyset.keys_peer.p_enc_key.enc_info
+                master_id = keyset.keys_peer.enc_key.master_id
+                enc_info = keyset.keys_peer.enc_key.enc_info
         assert isinstance(master_id, BLEGapMasterId), 'Invalid argument type'
         assert isinstance(enc_info, BLEGapEncInfo), 'Invalid argument type'
         logger.info("ble_gap_encrypt. \n   master_id: {}\n   enc_info: {}".format(master_id, enc_info))
@@ -2355,7 +2713,7 @@ class BLEDriver(object):
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_data_length_update(
         self, conn_handle, data_length_params, data_length_limitation
     ):
@@ -2378,24 +2736,24 @@ class BLEDriver(object):
         return err_code
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_rssi_start(self, conn_handle, threshold_dbm, skip_count):
         return driver.sd_ble_gap_rssi_start(
             self.rpc_adapter, conn_handle, threshold_dbm, skip_count
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_rssi_stop(self, conn_handle):
         return driver.sd_ble_gap_rssi_stop(self.rpc_adapter, conn_handle)
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_tx_power_set(self, tx_power):
         return driver.sd_ble_gap_tx_power_set(self.rpc_adapter, tx_power)
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gap_phy_update(self, conn_handle, gap_phys):
         assert nrf_sd_ble_api_ver >= 5, 'PHY Update requires SD API v5 or higher'
         assert isinstance(gap_phys, BLEGapPhys)
@@ -2408,7 +2766,7 @@ class BLEDriver(object):
         return err_code
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_vs_uuid_add(self, uuid_base):
         assert isinstance(uuid_base, BLEUUIDBase), "Invalid argument type"
         uuid_type = driver.new_uint8()
@@ -2421,7 +2779,7 @@ class BLEDriver(object):
         return err_code
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_uuid_decode(self, uuid_list, uuid):
         uuid_len = len(uuid_list)
         assert isinstance(uuid_list, list), "Invalid argument type"
@@ -2443,7 +2801,7 @@ class BLEDriver(object):
         return err_code
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gattc_write(self, conn_handle, write_params):
         assert isinstance(write_params, BLEGattcWriteParams), "Invalid argument type"
         return driver.sd_ble_gattc_write(
@@ -2451,12 +2809,12 @@ class BLEDriver(object):
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gattc_read(self, conn_handle, handle, offset):
         return driver.sd_ble_gattc_read(self.rpc_adapter, conn_handle, handle, offset)
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gattc_prim_srvc_disc(self, conn_handle, srvc_uuid, start_handle):
         assert isinstance(srvc_uuid, (BLEUUID, type(None))), "Invalid argument type"
         return driver.sd_ble_gattc_primary_services_discover(
@@ -2467,7 +2825,7 @@ class BLEDriver(object):
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gattc_char_disc(self, conn_handle, start_handle, end_handle):
         handle_range = driver.ble_gattc_handle_range_t()
         handle_range.start_handle = start_handle
@@ -2477,7 +2835,7 @@ class BLEDriver(object):
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gattc_desc_disc(self, conn_handle, start_handle, end_handle):
         handle_range = driver.ble_gattc_handle_range_t()
         handle_range.start_handle = start_handle
@@ -2487,21 +2845,21 @@ class BLEDriver(object):
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gattc_exchange_mtu_req(self, conn_handle, mtu):
         return driver.sd_ble_gattc_exchange_mtu_request(
             self.rpc_adapter, conn_handle, mtu
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gattc_hv_confirm(self, conn_handle, attr_handle):
         return driver.sd_ble_gattc_hv_confirm(
             self.rpc_adapter, conn_handle, attr_handle
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gatts_service_add(self, service_type, uuid, service_handle):
         assert isinstance(service_handle, BLEGattHandle)
         assert isinstance(uuid, BLEUUID)
@@ -2515,7 +2873,7 @@ class BLEDriver(object):
         return err_code
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gatts_characteristic_add(
         self, service_handle, char_md, attr_char_value, char_handle
     ):
@@ -2534,14 +2892,14 @@ class BLEDriver(object):
         return err_code
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gatts_exchange_mtu_reply(self, conn_handle, mtu):
         return driver.sd_ble_gatts_exchange_mtu_reply(
             self.rpc_adapter, conn_handle, mtu
         )
 
     @NordicSemiErrorCheck
-    @wrapt.synchronized(api_lock)
+    @wrapt.synchronized
     def ble_gatts_hvx(self, conn_handle, hvx_params):
         assert isinstance(hvx_params, BLEGattsHVXParams), "Invalid argument type"
         hvx_params = hvx_params.to_c()
@@ -2562,12 +2920,12 @@ class BLEDriver(object):
         else:
             logger.error("status_handler")
 
-    @wrapt.synchronized(observer_lock)
     def status_handler_sync(self, adapter, status_code, status_message):
         statusEnum = RpcAppStatus(status_code)
 
-        for obs in self.observers:
-            obs.on_rpc_status(adapter, statusEnum, status_message)
+        with self.dispatch_lock:
+            for obs in self.observers:
+                obs.on_rpc_status(adapter, statusEnum, status_message)
 
     def status_handler_thread(self):
         while self.run_workers:
@@ -2589,7 +2947,6 @@ class BLEDriver(object):
         else:
             logger.error("log_message_handler")
 
-    @wrapt.synchronized(observer_lock)
     def log_message_handler_sync(self, adapter, severity, log_message):
         severityEnum = RpcLogSeverity(severity)
         logLevel = None  # type: int
@@ -2605,8 +2962,9 @@ class BLEDriver(object):
         elif severityEnum == RpcLogSeverity.fatal:
             logLevel = logging.FATAL
 
-        for obs in self.observers:
-            obs.on_rpc_log_entry(adapter, logLevel, log_message)
+        with self.dispatch_lock:
+            for obs in self.observers:
+                obs.on_rpc_log_entry(adapter, logLevel, log_message)
 
     def log_message_handler_thread(self):
         while self.run_workers:
@@ -2628,9 +2986,26 @@ class BLEDriver(object):
             except Exception as ex:
                 logger.exception("Exception in event handler: {}".format(ex))
 
+    def ble_event_dispatch_thread(self):
+        while self.run_workers:
+            try:
+                conn, item = self.ble_event_queue.get_exclusive(WORKER_QUEUE_WAIT_TIME)
+            except queue.Empty:
+                continue
+            try:
+                self.ble_event_handler_sync(*item)
+            except Exception as ex:
+                logger.exception("Exception in event handler: {}".format(ex))
+            finally:
+                self.ble_event_queue.release(conn)
+
     def ble_event_handler(self, adapter, ble_event):
         if self.rpc_adapter.internal == adapter.internal:
-            self.ble_event_queue.put([adapter, ble_event])
+            if ble_event.header.evt_id == driver.BLE_GAP_EVT_ADV_REPORT:
+                adv_recorder = self.adv_recorder
+                if adv_recorder is not None:
+                    adv_recorder.record(ble_event.evt.gap_evt.params.adv_report)
+            self.ble_event_queue_put(ble_event)
         else:
             logger.error(
                 "ble_event_handler, event for adapter %d, current adapter is %d",
@@ -2638,435 +3013,55 @@ class BLEDriver(object):
                 self.rpc_adapter.internal,
             )
 
-    @wrapt.synchronized(observer_lock)
+    def ble_event_queue_put(self, ble_event):
+        """Queue ble_event after the advertising filter, without recording it.
+
+        Used by AdvReplayer, so that replayed reports never reach adv_recorder.
+        """
+        if (
+            ble_event.header.evt_id == driver.BLE_GAP_EVT_ADV_REPORT
+            and not self.adv_filter_match(ble_event)
+        ):
+            self.adv_filtered += 1
+            return
+        self.ble_event_queue.put([self.rpc_adapter, ble_event])
+
+    def adv_filter_match(self, ble_event):
+        """True if the advertising report matches the filter from adv_filter_set."""
+        adv_filter = self.adv_filter
+        if adv_filter is None:
+            return True
+        adv_report = ble_event.evt.gap_evt.params.adv_report
+        return adv_filter(
+            adv_report.peer_addr.addr_type,
+            util.uint8_array_to_bytes(adv_report.peer_addr.addr, driver.BLE_GAP_ADDR_LEN),
+            adv_report.rssi,
+            util.uint8_array_to_bytes(adv_report.data, adv_report.dlen),
+        )
+
     def ble_event_handler_sync(self, _adapter, ble_event):
+        if self.dispatch_workers:
+            self._ble_event_dispatch(ble_event)
+        else:
+            with self.dispatch_lock:
+                self._ble_event_dispatch(ble_event)
 
+    def _ble_event_dispatch(self, ble_event):
+        evt_id = ble_event.header.evt_id
         try:
-            evt_id = BLEEvtID(ble_event.header.evt_id)
-        except Exception:
-            logger.error(
-                "Invalid received BLE event id: 0x{:02X}".format(
-                    ble_event.header.evt_id
-                )
-            )
+            decoder, observer_method = BLE_EVT_DECODERS[evt_id]
+        except KeyError:
+            if evt_id not in BLE_EVT_IDS:
+                logger.error("Invalid received BLE event id: 0x{:02X}".format(evt_id))
             return
-        try:
-
-            if evt_id == BLEEvtID.gap_evt_connected:
-                connected_evt = ble_event.evt.gap_evt.params.connected
-
-                for obs in self.observers:
-                    obs.on_gap_evt_connected(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gap_evt.conn_handle,
-                        peer_addr=BLEGapAddr.from_c(connected_evt.peer_addr),
-                        role=BLEGapRoles(connected_evt.role),
-                        conn_params=BLEGapConnParams.from_c(connected_evt.conn_params),
-                    )
-
-            elif evt_id == BLEEvtID.gap_evt_disconnected:
-                disconnected_evt = ble_event.evt.gap_evt.params.disconnected
-                try:
-                    reason = BLEHci(disconnected_evt.reason)
-                except ValueError:
-                    reason = disconnected_evt.reason
-                for obs in self.observers:
-                    obs.on_gap_evt_disconnected(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gap_evt.conn_handle,
-                        reason=reason,
-                    )
-
-            elif evt_id == BLEEvtID.gap_evt_sec_params_request:
-                sec_params_request_evt = ble_event.evt.gap_evt.params.sec_params_request
-
-                for obs in self.observers:
-                    obs.on_gap_evt_sec_params_request(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gap_evt.conn_handle,
-                        peer_params=BLEGapSecParams.from_c(
-                            sec_params_request_evt.peer_params
-                        ),
-                    )
-
-            elif evt_id == BLEEvtID.gap_evt_sec_info_request:
-                seq_info_evt = ble_event.evt.gap_evt.params.sec_info_request
-
-                for obs in self.observers:
-                    obs.on_gap_evt_sec_info_request(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gap_evt.conn_handle,
-                        peer_addr=seq_info_evt.peer_addr,
-                        master_id=seq_info_evt.master_id,
-                        enc_info=seq_info_evt.enc_info,
-                        id_info=seq_info_evt.id_info,
-                        sign_info=seq_info_evt.sign_info,
-                    )
-
-            elif evt_id == BLEEvtID.gap_evt_sec_request:
-                seq_req_evt = ble_event.evt.gap_evt.params.sec_request
-
-                for obs in self.observers:
-                    obs.on_gap_evt_sec_request(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gap_evt.conn_handle,
-                        bond=seq_req_evt.bond,
-                        mitm=seq_req_evt.mitm,
-                        lesc=seq_req_evt.lesc,
-                        keypress=seq_req_evt.keypress,
-                    )
-            elif evt_id == BLEEvtID.gap_evt_passkey_display:
-                for obs in self.observers:
-                    passkey = BLEGapPasskeyDisplay.from_c(ble_event.evt.gap_evt.params.passkey_display)
-
-                    obs.on_gap_evt_passkey_display(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gap_evt.conn_handle,
-                        passkey=passkey.passkey
-                    )
-            elif evt_id == BLEEvtID.gap_evt_timeout:
-                timeout_evt = ble_event.evt.gap_evt.params.timeout
-                try:
-                    src = BLEGapTimeoutSrc(timeout_evt.src)
-                except ValueError:
-                    src = timeout_evt.src
-                for obs in self.observers:
-                    obs.on_gap_evt_timeout(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gap_evt.conn_handle,
-                        src=src,
-                    )
-
-            elif evt_id == BLEEvtID.gap_evt_adv_report:
-                adv_report_evt = ble_event.evt.gap_evt.params.adv_report
-                adv_type = None
-                if not adv_report_evt.scan_rsp:
-                    adv_type = BLEGapAdvType(adv_report_evt.type)
-
-                for obs in self.observers:
-                    obs.on_gap_evt_adv_report(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gap_evt.conn_handle,
-                        peer_addr=BLEGapAddr.from_c(adv_report_evt.peer_addr),
-                        rssi=adv_report_evt.rssi,
-                        adv_type=adv_type,
-                        adv_data=BLEAdvData.from_c(adv_report_evt),
-                    )
-
-            elif evt_id == BLEEvtID.gap_evt_conn_param_update_request:
-                conn_params = (
-                    ble_event.evt.gap_evt.params.conn_param_update_request.conn_params
-                )
 
-                for obs in self.observers:
-                    obs.on_gap_evt_conn_param_update_request(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.common_evt.conn_handle,
-                        conn_params=BLEGapConnParams.from_c(conn_params),
-                    )
-
-            elif evt_id == BLEEvtID.gap_evt_conn_param_update:
-                conn_params = ble_event.evt.gap_evt.params.conn_param_update.conn_params
-                for obs in self.observers:
-                    obs.on_gap_evt_conn_param_update(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.common_evt.conn_handle,
-                        conn_params=BLEGapConnParams.from_c(conn_params),
-                    )
-
-            elif evt_id == BLEEvtID.gap_evt_lesc_dhkey_request:
-                lesc_dhkey_request_evt = ble_event.evt.gap_evt.params.lesc_dhkey_request
-                self._keyset.keys_peer.p_pk = lesc_dhkey_request_evt.p_pk_peer
-
-                for obs in self.observers:
-                    obs.on_gap_evt_lesc_dhkey_request(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.common_evt.conn_handle,
-                        peer_public_key=BLEGapLescP256Pk.from_c(lesc_dhkey_request_evt.p_pk_peer),
-                        oobd_req=lesc_dhkey_request_evt.oobd_req
-                    )
-
-            elif evt_id == BLEEvtID.gap_evt_auth_status:
-                auth_status_evt = ble_event.evt.gap_evt.params.auth_status
-
-                for obs in self.observers:
-                    obs.on_gap_evt_auth_status(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.common_evt.conn_handle,
-                        error_src=auth_status_evt.error_src,
-                        bonded=auth_status_evt.bonded,
-                        sm1_levels=auth_status_evt.sm1_levels,
-                        sm2_levels=auth_status_evt.sm2_levels,
-                        kdist_own=BLEGapSecKDist.from_c(auth_status_evt.kdist_own),
-                        kdist_peer=BLEGapSecKDist.from_c(auth_status_evt.kdist_peer),
-                        auth_status=BLEGapSecStatus(auth_status_evt.auth_status),
-                    )
-
-            elif evt_id == BLEEvtID.gap_evt_auth_key_request:
-                auth_key_request_evt = ble_event.evt.gap_evt.params.auth_key_request
-
-                for obs in self.observers:
-                    obs.on_gap_evt_auth_key_request(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.common_evt.conn_handle,
-                        key_type=auth_key_request_evt.key_type,
-                    )
-
-            elif evt_id == BLEEvtID.gap_evt_conn_sec_update:
-                conn_sec_update_evt = ble_event.evt.gap_evt.params.conn_sec_update
-
-                for obs in self.observers:
-                    obs.on_gap_evt_conn_sec_update(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.common_evt.conn_handle,
-                        conn_sec=BLEGapConnSec.from_c(conn_sec_update_evt.conn_sec),
-                    )
-            elif evt_id == BLEEvtID.gap_evt_rssi_changed:
-                rssi_changed_evt = ble_event.evt.gap_evt.params.rssi_changed
-
-                for obs in self.observers:
-                    obs.on_gap_evt_rssi_changed(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.common_evt.conn_handle,
-                        rssi=rssi_changed_evt.rssi,
-                    )
-
-            elif evt_id == BLEEvtID.gattc_evt_write_rsp:
-                write_rsp_evt = ble_event.evt.gattc_evt.params.write_rsp
-
-                for obs in self.observers:
-                    obs.on_gattc_evt_write_rsp(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gattc_evt.conn_handle,
-                        status=BLEGattStatusCode(ble_event.evt.gattc_evt.gatt_status),
-                        error_handle=ble_event.evt.gattc_evt.error_handle,
-                        attr_handle=write_rsp_evt.handle,
-                        write_op=BLEGattWriteOperation(write_rsp_evt.write_op),
-                        offset=write_rsp_evt.offset,
-                        data=util.uint8_array_to_list(
-                            write_rsp_evt.data, write_rsp_evt.len
-                        ),
-                    )
-
-            elif evt_id == BLEEvtID.gattc_evt_read_rsp:
-                read_rsp_evt = ble_event.evt.gattc_evt.params.read_rsp
-                for obs in self.observers:
-                    obs.on_gattc_evt_read_rsp(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gattc_evt.conn_handle,
-                        status=BLEGattStatusCode(ble_event.evt.gattc_evt.gatt_status),
-                        error_handle=ble_event.evt.gattc_evt.error_handle,
-                        attr_handle=read_rsp_evt.handle,
-                        offset=read_rsp_evt.offset,
-                        data=util.uint8_array_to_list(
-                            read_rsp_evt.data, read_rsp_evt.len
-                        ),
-                    )
-
-            elif evt_id == BLEEvtID.gattc_evt_hvx:
-                hvx_evt = ble_event.evt.gattc_evt.params.hvx
-                for obs in self.observers:
-                    obs.on_gattc_evt_hvx(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gattc_evt.conn_handle,
-                        status=BLEGattStatusCode(ble_event.evt.gattc_evt.gatt_status),
-                        error_handle=ble_event.evt.gattc_evt.error_handle,
-                        attr_handle=hvx_evt.handle,
-                        hvx_type=BLEGattHVXType(hvx_evt.type),
-                        data=util.uint8_array_to_list(hvx_evt.data, hvx_evt.len),
-                    )
-
-            elif evt_id == BLEEvtID.gattc_evt_prim_srvc_disc_rsp:
-                prim_srvc_disc_rsp_evt = (
-                    ble_event.evt.gattc_evt.params.prim_srvc_disc_rsp
-                )
+        try:
+            params = decoder(self, ble_event)
+            if params is None:
+                return
 
-                services = list()
-                for s in util.service_array_to_list(
-                    prim_srvc_disc_rsp_evt.services, prim_srvc_disc_rsp_evt.count
-                ):
-                    services.append(BLEService.from_c(s))
-
-                for obs in self.observers:
-                    obs.on_gattc_evt_prim_srvc_disc_rsp(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gattc_evt.conn_handle,
-                        status=BLEGattStatusCode(ble_event.evt.gattc_evt.gatt_status),
-                        services=services,
-                    )
-
-            elif evt_id == BLEEvtID.gattc_evt_char_disc_rsp:
-                char_disc_rsp_evt = ble_event.evt.gattc_evt.params.char_disc_rsp
-
-                characteristics = list()
-                for ch in util.ble_gattc_char_array_to_list(
-                    char_disc_rsp_evt.chars, char_disc_rsp_evt.count
-                ):
-                    characteristics.append(BLECharacteristic.from_c(ch))
-
-                for obs in self.observers:
-                    obs.on_gattc_evt_char_disc_rsp(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gattc_evt.conn_handle,
-                        status=BLEGattStatusCode(ble_event.evt.gattc_evt.gatt_status),
-                        characteristics=characteristics,
-                    )
-
-            elif evt_id == BLEEvtID.gattc_evt_desc_disc_rsp:
-                desc_disc_rsp_evt = ble_event.evt.gattc_evt.params.desc_disc_rsp
-
-                descriptors = list()
-                for d in util.desc_array_to_list(
-                    desc_disc_rsp_evt.descs, desc_disc_rsp_evt.count
-                ):
-                    descriptors.append(BLEDescriptor.from_c(d))
-
-                for obs in self.observers:
-                    obs.on_gattc_evt_desc_disc_rsp(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gattc_evt.conn_handle,
-                        status=BLEGattStatusCode(ble_event.evt.gattc_evt.gatt_status),
-                        descriptors=descriptors,
-                    )
-
-            elif evt_id == BLEEvtID.gatts_evt_hvc:
-                hvc_evt = ble_event.evt.gatts_evt.params.hvc
-
-                for obs in self.observers:
-                    obs.on_gatts_evt_hvc(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gatts_evt.conn_handle,
-                        attr_handle=hvc_evt.handle,
-                    )
-
-            elif evt_id == BLEEvtID.gatts_evt_write:
-                write_evt = ble_event.evt.gatts_evt.params.write
-
-                for obs in self.observers:
-                    obs.on_gatts_evt_write(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gatts_evt.conn_handle,
-                        attr_handle=write_evt.handle,
-                        uuid=write_evt.uuid,
-                        op=write_evt.op,
-                        auth_required=write_evt.auth_required,
-                        offset=write_evt.offset,
-                        length=write_evt.len,
-                        data=write_evt.data,
-                    )
-
-            elif evt_id == BLEEvtID.gatts_evt_sys_attr_missing:
-                sys_attr_missing_evt = ble_event.evt.gatts_evt.params.sys_attr_missing
-
-                for obs in self.observers:
-                    obs.on_gatts_evt_sys_attr_missing(
-                        ble_driver=self,
-                        conn_handle=ble_event.evt.gatts_evt.conn_handle,
-                        hint=sys_attr_missing_evt.hint
-                    )
-
-            elif nrf_sd_ble_api_ver == 2:
-                if evt_id == BLEEvtID.evt_tx_complete:
-                    for obs in self.observers:
-                        obs.on_evt_tx_complete(
-                            ble_driver=self,
-                            conn_handle=ble_event.evt.common_evt.conn_handle,
-                            count=ble_event.evt.common_evt.params.tx_complete.count,
-                        )
-
-            elif nrf_sd_ble_api_ver == 5:
-                if evt_id == BLEEvtID.gattc_evt_write_cmd_tx_complete:
-                    tx_complete_evt = (
-                        ble_event.evt.gattc_evt.params.write_cmd_tx_complete
-                    )
-
-                    for obs in self.observers:
-                        obs.on_gattc_evt_write_cmd_tx_complete(
-                            ble_driver=self,
-                            conn_handle=ble_event.evt.gattc_evt.conn_handle,
-                            count=tx_complete_evt.count,
-                        )
-
-                elif evt_id == BLEEvtID.gatts_evt_hvn_tx_complete:
-                    tx_complete_evt = ble_event.evt.gatts_evt.params.hvn_tx_complete
-
-                    for obs in self.observers:
-                        obs.on_gatts_evt_hvn_tx_complete(
-                            ble_driver=self,
-                            conn_handle=ble_event.evt.gatts_evt.conn_handle,
-                            count=tx_complete_evt.count,
-                        )
-                elif evt_id == BLEEvtID.gatts_evt_exchange_mtu_request:
-                    for obs in self.observers:
-                        obs.on_gatts_evt_exchange_mtu_request(
-                            ble_driver=self,
-                            conn_handle=ble_event.evt.gatts_evt.conn_handle,
-                            client_mtu=ble_event.evt.gatts_evt.params.exchange_mtu_request.client_rx_mtu,
-                        )
-
-                elif evt_id == BLEEvtID.gattc_evt_exchange_mtu_rsp:
-                    xchg_mtu_evt = ble_event.evt.gattc_evt.params.exchange_mtu_rsp
-                    _status = BLEGattStatusCode(ble_event.evt.gattc_evt.gatt_status)
-                    _server_rx_mtu = 0
-
-                    if _status == BLEGattStatusCode.success:
-                        _server_rx_mtu = xchg_mtu_evt.server_rx_mtu
-                    else:
-                        _server_rx_mtu = ATT_MTU_DEFAULT
-
-                    for obs in self.observers:
-                        obs.on_gattc_evt_exchange_mtu_rsp(
-                            ble_driver=self,
-                            conn_handle=ble_event.evt.gattc_evt.conn_handle,
-                            status=BLEGattStatusCode(
-                                ble_event.evt.gattc_evt.gatt_status
-                            ),
-                            att_mtu=_server_rx_mtu,
-                        )
-
-                elif evt_id == BLEEvtID.gap_evt_data_length_update:
-                    params = (
-                        ble_event.evt.gap_evt.params.data_length_update.effective_params
-                    )
-                    for obs in self.observers:
-                        obs.on_gap_evt_data_length_update(
-                            ble_driver=self,
-                            conn_handle=ble_event.evt.gap_evt.conn_handle,
-                            data_length_params=BLEGapDataLengthParams.from_c(params),
-                        )
-
-                elif evt_id == BLEEvtID.gap_evt_data_length_update_request:
-                    params = (
-                        ble_event.evt.gap_evt.params.data_length_update_request.peer_params
-                    )
-                    for obs in self.observers:
-                        obs.on_gap_evt_data_length_update_request(
-                            ble_driver=self,
-                            conn_handle=ble_event.evt.gap_evt.conn_handle,
-                            data_length_params=BLEGapDataLengthParams.from_c(params),
-                        )
-
-                elif evt_id == BLEEvtID.gap_evt_phy_update_request:
-                    requested_phy_update = ble_event.evt.gap_evt.params.phy_update_request
-
-                    for obs in self.observers:
-                        obs.on_gap_evt_phy_update_request(
-                            ble_driver=self,
-                            conn_handle=ble_event.evt.common_evt.conn_handle,
-                            peer_preferred_phys=BLEGapPhys.from_c(requested_phy_update.peer_preferred_phys)
-                        )
-
-                elif evt_id == BLEEvtID.gap_evt_phy_update:
-                    updated_phy = ble_event.evt.gap_evt.params.phy_update
-
-                    for obs in self.observers:
-                        obs.on_gap_evt_phy_update(
-                            ble_driver=self,
-                            conn_handle=ble_event.evt.common_evt.conn_handle,
-                            status=BLEHci(updated_phy.status),
-                            tx_phy=updated_phy.tx_phy,
-                            rx_phy=updated_phy.rx_phy,
-                        )
+            for obs in self.observers:
+                getattr(obs, observer_method)(ble_driver=self, **params)
 
         except Exception as e:
             logger.error("Exception: {}".format(str(e)))
@@ -3075,6 +3070,421 @@ class BLEDriver(object):
             logger.error("")
 
 
+# Decoders for BLE events. Each decoder turns a ble_evt_t into the keyword
+# arguments passed to the matching BLEDriverObserver method. Returning None
+# skips observer dispatch for that event.
+#
+# The decoders are collected into BLE_EVT_DECODERS, keyed on the raw
+# header.evt_id, once at import time for the selected SoftDevice API version.
+BLE_EVT_IDS = frozenset(evt.value for evt in BLEEvtID)
+BLE_EVT_DECODERS = dict()
+
+
+def ble_evt_decoder(evt_id):
+    def register(decoder):
+        BLE_EVT_DECODERS[evt_id.value] = (decoder, "on_{}".format(evt_id.name))
+        return decoder
+
+    return register
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_connected)
+def _decode_gap_evt_connected(ble_driver, ble_event):
+    connected_evt = ble_event.evt.gap_evt.params.connected
+    return dict(
+        conn_handle=ble_event.evt.gap_evt.conn_handle,
+        peer_addr=BLEGapAddr.from_c(connected_evt.peer_addr),
+        role=BLEGapRoles(connected_evt.role),
+        conn_params=BLEGapConnParams.from_c(connected_evt.conn_params),
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_disconnected)
+def _decode_gap_evt_disconnected(ble_driver, ble_event):
+    disconnected_evt = ble_event.evt.gap_evt.params.disconnected
+    try:
+        reason = BLEHci(disconnected_evt.reason)
+    except ValueError:
+        reason = disconnected_evt.reason
+    return dict(conn_handle=ble_event.evt.gap_evt.conn_handle, reason=reason)
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_sec_params_request)
+def _decode_gap_evt_sec_params_request(ble_driver, ble_event):
+    sec_params_request_evt = ble_event.evt.gap_evt.params.sec_params_request
+    return dict(
+        conn_handle=ble_event.evt.gap_evt.conn_handle,
+        peer_params=BLEGapSecParams.from_c(sec_params_request_evt.peer_params),
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_sec_info_request)
+def _decode_gap_evt_sec_info_request(ble_driver, ble_event):
+    seq_info_evt = ble_event.evt.gap_evt.params.sec_info_request
+    return dict(
+        conn_handle=ble_event.evt.gap_evt.conn_handle,
+        peer_addr=seq_info_evt.peer_addr,
+        master_id=seq_info_evt.master_id,
+        enc_info=seq_info_evt.enc_info,
+        id_info=seq_info_evt.id_info,
+        sign_info=seq_info_evt.sign_info,
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_sec_request)
+def _decode_gap_evt_sec_request(ble_driver, ble_event):
+    seq_req_evt = ble_event.evt.gap_evt.params.sec_request
+    return dict(
+        conn_handle=ble_event.evt.gap_evt.conn_handle,
+        bond=seq_req_evt.bond,
+        mitm=seq_req_evt.mitm,
+        lesc=seq_req_evt.lesc,
+        keypress=seq_req_evt.keypress,
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_passkey_display)
+def _decode_gap_evt_passkey_display(ble_driver, ble_event):
+    passkey = BLEGapPasskeyDisplay.from_c(ble_event.evt.gap_evt.params.passkey_display)
+    return dict(
+        conn_handle=ble_event.evt.gap_evt.conn_handle,
+        passkey=passkey.passkey,
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_timeout)
+def _decode_gap_evt_timeout(ble_driver, ble_event):
+    timeout_evt = ble_event.evt.gap_evt.params.timeout
+    try:
+        src = BLEGapTimeoutSrc(timeout_evt.src)
+    except ValueError:
+        src = timeout_evt.src
+    return dict(conn_handle=ble_event.evt.gap_evt.conn_handle, src=src)
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_adv_report)
+def _decode_gap_evt_adv_report(ble_driver, ble_event):
+    adv_report_evt = ble_event.evt.gap_evt.params.adv_report
+    data = util.uint8_array_to_bytes(adv_report_evt.data, adv_report_evt.dlen)
+    scan_aggregator = ble_driver.scan_aggregator
+    if scan_aggregator is not None:
+        peer_addr = adv_report_evt.peer_addr
+        if not scan_aggregator.update(
+            peer_addr.addr_type,
+            util.uint8_array_to_bytes(peer_addr.addr, driver.BLE_GAP_ADDR_LEN),
+            adv_report_evt.scan_rsp,
+            data,
+            adv_report_evt.rssi,
+        ):
+            return None
+    adv_type = None
+    if not adv_report_evt.scan_rsp:
+        adv_type = BLEGapAdvType(adv_report_evt.type)
+    peer_addr = BLEGapAddr.from_c(adv_report_evt.peer_addr)
+    rpa_resolver = ble_driver.rpa_resolver
+    if (
+        rpa_resolver is not None
+        and adv_report_evt.peer_addr.addr_type
+        == driver.BLE_GAP_ADDR_TYPE_RANDOM_PRIVATE_RESOLVABLE
+    ):
+        peer_addr.identity = rpa_resolver.resolve(peer_addr)
+    return dict(
+        conn_handle=ble_event.evt.gap_evt.conn_handle,
+        peer_addr=peer_addr,
+        rssi=adv_report_evt.rssi,
+        adv_type=adv_type,
+        adv_data=BLEAdvData.from_bytes(
+            data, ble_driver.adv_data_types, ble_driver.lazy_adv_data
+        ),
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_conn_param_update_request)
+def _decode_gap_evt_conn_param_update_request(ble_driver, ble_event):
+    conn_params = ble_event.evt.gap_evt.params.conn_param_update_request.conn_params
+    return dict(
+        conn_handle=ble_event.evt.common_evt.conn_handle,
+        conn_params=BLEGapConnParams.from_c(conn_params),
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_conn_param_update)
+def _decode_gap_evt_conn_param_update(ble_driver, ble_event):
+    conn_params = ble_event.evt.gap_evt.params.conn_param_update.conn_params
+    return dict(
+        conn_handle=ble_event.evt.common_evt.conn_handle,
+        conn_params=BLEGapConnParams.from_c(conn_params),
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_lesc_dhkey_request)
+def _decode_gap_evt_lesc_dhkey_request(ble_driver, ble_event):
+    lesc_dhkey_request_evt = ble_event.evt.gap_evt.params.lesc_dhkey_request
+    ble_driver._keyset.keys_peer.p_pk = lesc_dhkey_request_evt.p_pk_peer
+    return dict(
+        conn_handle=ble_event.evt.common_evt.conn_handle,
+        peer_public_key=BLEGapLescP256Pk.from_c(lesc_dhkey_request_evt.p_pk_peer),
+        oobd_req=lesc_dhkey_request_evt.oobd_req,
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_auth_status)
+def _decode_gap_evt_auth_status(ble_driver, ble_event):
+    auth_status_evt = ble_event.evt.gap_evt.params.auth_status
+    return dict(
+        conn_handle=ble_event.evt.common_evt.conn_handle,
+        error_src=auth_status_evt.error_src,
+        bonded=auth_status_evt.bonded,
+        sm1_levels=auth_status_evt.sm1_levels,
+        sm2_levels=auth_status_evt.sm2_levels,
+        kdist_own=BLEGapSecKDist.from_c(auth_status_evt.kdist_own),
+        kdist_peer=BLEGapSecKDist.from_c(auth_status_evt.kdist_peer),
+        auth_status=BLEGapSecStatus(auth_status_evt.auth_status),
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_auth_key_request)
+def _decode_gap_evt_auth_key_request(ble_driver, ble_event):
+    auth_key_request_evt = ble_event.evt.gap_evt.params.auth_key_request
+    return dict(
+        conn_handle=ble_event.evt.common_evt.conn_handle,
+        key_type=auth_key_request_evt.key_type,
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_conn_sec_update)
+def _decode_gap_evt_conn_sec_update(ble_driver, ble_event):
+    conn_sec_update_evt = ble_event.evt.gap_evt.params.conn_sec_update
+    return dict(
+        conn_handle=ble_event.evt.common_evt.conn_handle,
+        conn_sec=BLEGapConnSec.from_c(conn_sec_update_evt.conn_sec),
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gap_evt_rssi_changed)
+def _decode_gap_evt_rssi_changed(ble_driver, ble_event):
+    rssi_changed_evt = ble_event.evt.gap_evt.params.rssi_changed
+    return dict(
+        conn_handle=ble_event.evt.common_evt.conn_handle,
+        rssi=rssi_changed_evt.rssi,
+    )
+
+
+def _gattc_payload(ble_driver, ble_event, array, length):
+    if ble_driver.lazy_payloads:
+        return BLEEvtPayload(ble_event, array, length)
+    return util.uint8_array_to_list(array, length)
+
+
+@ble_evt_decoder(BLEEvtID.gattc_evt_write_rsp)
+def _decode_gattc_evt_write_rsp(ble_driver, ble_event):
+    write_rsp_evt = ble_event.evt.gattc_evt.params.write_rsp
+    return dict(
+        conn_handle=ble_event.evt.gattc_evt.conn_handle,
+        status=BLEGattStatusCode(ble_event.evt.gattc_evt.gatt_status),
+        error_handle=ble_event.evt.gattc_evt.error_handle,
+        attr_handle=write_rsp_evt.handle,
+        write_op=BLEGattWriteOperation(write_rsp_evt.write_op),
+        offset=write_rsp_evt.offset,
+        data=_gattc_payload(ble_driver, ble_event, write_rsp_evt.data, write_rsp_evt.len),
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gattc_evt_read_rsp)
+def _decode_gattc_evt_read_rsp(ble_driver, ble_event):
+    read_rsp_evt = ble_event.evt.gattc_evt.params.read_rsp
+    return dict(
+        conn_handle=ble_event.evt.gattc_evt.conn_handle,
+        status=BLEGattStatusCode(ble_event.evt.gattc_evt.gatt_status),
+        error_handle=ble_event.evt.gattc_evt.error_handle,
+        attr_handle=read_rsp_evt.handle,
+        offset=read_rsp_evt.offset,
+        data=_gattc_payload(ble_driver, ble_event, read_rsp_evt.data, read_rsp_evt.len),
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gattc_evt_hvx)
+def _decode_gattc_evt_hvx(ble_driver, ble_event):
+    hvx_evt = ble_event.evt.gattc_evt.params.hvx
+    return dict(
+        conn_handle=ble_event.evt.gattc_evt.conn_handle,
+        status=BLEGattStatusCode(ble_event.evt.gattc_evt.gatt_status),
+        error_handle=ble_event.evt.gattc_evt.error_handle,
+        attr_handle=hvx_evt.handle,
+        hvx_type=BLEGattHVXType(hvx_evt.type),
+        data=_gattc_payload(ble_driver, ble_event, hvx_evt.data, hvx_evt.len),
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gattc_evt_prim_srvc_disc_rsp)
+def _decode_gattc_evt_prim_srvc_disc_rsp(ble_driver, ble_event):
+    prim_srvc_disc_rsp_evt = ble_event.evt.gattc_evt.params.prim_srvc_disc_rsp
+    services = [
+        BLEService.from_c(s)
+        for s in util.service_array_to_list(
+            prim_srvc_disc_rsp_evt.services, prim_srvc_disc_rsp_evt.count
+        )
+    ]
+    return dict(
+        conn_handle=ble_event.evt.gattc_evt.conn_handle,
+        status=BLEGattStatusCode(ble_event.evt.gattc_evt.gatt_status),
+        services=services,
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gattc_evt_char_disc_rsp)
+def _decode_gattc_evt_char_disc_rsp(ble_driver, ble_event):
+    char_disc_rsp_evt = ble_event.evt.gattc_evt.params.char_disc_rsp
+    characteristics = [
+        BLECharacteristic.from_c(ch)
+        for ch in util.ble_gattc_char_array_to_list(
+            char_disc_rsp_evt.chars, char_disc_rsp_evt.count
+        )
+    ]
+    return dict(
+        conn_handle=ble_event.evt.gattc_evt.conn_handle,
+        status=BLEGattStatusCode(ble_event.evt.gattc_evt.gatt_status),
+        characteristics=characteristics,
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gattc_evt_desc_disc_rsp)
+def _decode_gattc_evt_desc_disc_rsp(ble_driver, ble_event):
+    desc_disc_rsp_evt = ble_event.evt.gattc_evt.params.desc_disc_rsp
+    descriptors = [
+        BLEDescriptor.from_c(d)
+        for d in util.desc_array_to_list(
+            desc_disc_rsp_evt.descs, desc_disc_rsp_evt.count
+        )
+    ]
+    return dict(
+        conn_handle=ble_event.evt.gattc_evt.conn_handle,
+        status=BLEGattStatusCode(ble_event.evt.gattc_evt.gatt_status),
+        descriptors=descriptors,
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gatts_evt_hvc)
+def _decode_gatts_evt_hvc(ble_driver, ble_event):
+    hvc_evt = ble_event.evt.gatts_evt.params.hvc
+    return dict(
+        conn_handle=ble_event.evt.gatts_evt.conn_handle,
+        attr_handle=hvc_evt.handle,
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gatts_evt_write)
+def _decode_gatts_evt_write(ble_driver, ble_event):
+    write_evt = ble_event.evt.gatts_evt.params.write
+    return dict(
+        conn_handle=ble_event.evt.gatts_evt.conn_handle,
+        attr_handle=write_evt.handle,
+        uuid=write_evt.uuid,
+        op=write_evt.op,
+        auth_required=write_evt.auth_required,
+        offset=write_evt.offset,
+        length=write_evt.len,
+        data=write_evt.data,
+    )
+
+
+@ble_evt_decoder(BLEEvtID.gatts_evt_sys_attr_missing)
+def _decode_gatts_evt_sys_attr_missing(ble_driver, ble_event):
+    sys_attr_missing_evt = ble_event.evt.gatts_evt.params.sys_attr_missing
+    return dict(
+        conn_handle=ble_event.evt.gatts_evt.conn_handle,
+        hint=sys_attr_missing_evt.hint,
+    )
+
+
+if nrf_sd_ble_api_ver == 2:
+
+    @ble_evt_decoder(BLEEvtID.evt_tx_complete)
+    def _decode_evt_tx_complete(ble_driver, ble_event):
+        return dict(
+            conn_handle=ble_event.evt.common_evt.conn_handle,
+            count=ble_event.evt.common_evt.params.tx_complete.count,
+        )
+
+
+if nrf_sd_ble_api_ver == 5:
+
+    @ble_evt_decoder(BLEEvtID.gattc_evt_write_cmd_tx_complete)
+    def _decode_gattc_evt_write_cmd_tx_complete(ble_driver, ble_event):
+        tx_complete_evt = ble_event.evt.gattc_evt.params.write_cmd_tx_complete
+        return dict(
+            conn_handle=ble_event.evt.gattc_evt.conn_handle,
+            count=tx_complete_evt.count,
+        )
+
+    @ble_evt_decoder(BLEEvtID.gatts_evt_hvn_tx_complete)
+    def _decode_gatts_evt_hvn_tx_complete(ble_driver, ble_event):
+        tx_complete_evt = ble_event.evt.gatts_evt.params.hvn_tx_complete
+        return dict(
+            conn_handle=ble_event.evt.gatts_evt.conn_handle,
+            count=tx_complete_evt.count,
+        )
+
+    @ble_evt_decoder(BLEEvtID.gatts_evt_exchange_mtu_request)
+    def _decode_gatts_evt_exchange_mtu_request(ble_driver, ble_event):
+        return dict(
+            conn_handle=ble_event.evt.gatts_evt.conn_handle,
+            client_mtu=ble_event.evt.gatts_evt.params.exchange_mtu_request.client_rx_mtu,
+        )
+
+    @ble_evt_decoder(BLEEvtID.gattc_evt_exchange_mtu_rsp)
+    def _decode_gattc_evt_exchange_mtu_rsp(ble_driver, ble_event):
+        xchg_mtu_evt = ble_event.evt.gattc_evt.params.exchange_mtu_rsp
+        status = BLEGattStatusCode(ble_event.evt.gattc_evt.gatt_status)
+
+        if status == BLEGattStatusCode.success:
+            server_rx_mtu = xchg_mtu_evt.server_rx_mtu
+        else:
+            server_rx_mtu = ATT_MTU_DEFAULT
+
+        return dict(
+            conn_handle=ble_event.evt.gattc_evt.conn_handle,
+            status=status,
+            att_mtu=server_rx_mtu,
+        )
+
+    @ble_evt_decoder(BLEEvtID.gap_evt_data_length_update)
+    def _decode_gap_evt_data_length_update(ble_driver, ble_event):
+        params = ble_event.evt.gap_evt.params.data_length_update.effective_params
+        return dict(
+            conn_handle=ble_event.evt.gap_evt.conn_handle,
+            data_length_params=BLEGapDataLengthParams.from_c(params),
+        )
+
+    @ble_evt_decoder(BLEEvtID.gap_evt_data_length_update_request)
+    def _decode_gap_evt_data_length_update_request(ble_driver, ble_event):
+        params = ble_event.evt.gap_evt.params.data_length_update_request.peer_params
+        return dict(
+            conn_handle=ble_event.evt.gap_evt.conn_handle,
+            data_length_params=BLEGapDataLengthParams.from_c(params),
+        )
+
+    @ble_evt_decoder(BLEEvtID.gap_evt_phy_update_request)
+    def _decode_gap_evt_phy_update_request(ble_driver, ble_event):
+        requested_phy_update = ble_event.evt.gap_evt.params.phy_update_request
+        return dict(
+            conn_handle=ble_event.evt.common_evt.conn_handle,
+            peer_preferred_phys=BLEGapPhys.from_c(
+                requested_phy_update.peer_preferred_phys
+            ),
+        )
+
+    @ble_evt_decoder(BLEEvtID.gap_evt_phy_update)
+    def _decode_gap_evt_phy_update(ble_driver, ble_event):
+        updated_phy = ble_event.evt.gap_evt.params.phy_update
+        return dict(
+            conn_handle=ble_event.evt.common_evt.conn_handle,
+            status=BLEHci(updated_phy.status),
+            tx_phy=updated_phy.tx_phy,
+            rx_phy=updated_phy.rx_phy,
+        )
+
+
 class Flasher(object):
     api_lock = Lock()
 
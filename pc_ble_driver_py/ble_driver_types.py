@@ -43,7 +43,10 @@ nrf_sd_ble_api_ver = config.sd_api_ver_get()
 if nrf_sd_ble_api_ver == 2:
     import pc_ble_driver_py.lib.nrf_ble_driver_sd_api_v2 as ble_driver
 elif nrf_sd_ble_api_ver == 5:
-    import pc_ble_driver_py.lib.nrf_ble_driver_sd_api_v5 as ble_driver
+    if config.driver_backend_get() == "sim":
+        import pc_ble_driver_py.sim_driver as ble_driver
+    else:
+        import pc_ble_driver_py.lib.nrf_ble_driver_sd_api_v5 as ble_driver
 else:
     raise NordicSemiException(
         "SoftDevice API {} not supported".format(nrf_sd_ble_api_ver)
@@ -73,11 +76,14 @@ def char_array_to_list(array_pointer, length):
     return data_list
 
 
+def uint8_array_to_bytes(array_pointer, length):
+    """Convert uint8_array to python bytes with a single copy."""
+    return ble_driver.uint8_array_to_bytes(array_pointer, length)
+
+
 def uint8_array_to_list(array_pointer, length):
     """Convert uint8_array to python list."""
-    data_array = ble_driver.uint8_array.frompointer(array_pointer)
-    data_list = _populate_list(data_array, length)
-    return data_list
+    return list(uint8_array_to_bytes(array_pointer, length))
 
 
 def uint16_array_to_list(array_pointer, length):
@@ -164,11 +170,21 @@ def list_to_char_array(data_list):
     return data_array
 
 
+def bytes_to_uint8_array(data):
+    """Convert bytes, bytearray or memoryview to uint8_array with a single copy."""
+
+    length = data.nbytes if isinstance(data, memoryview) else len(data)
+    data_array = ble_driver.uint8_array(length)
+    ble_driver.uint8_array_memmove(data, data_array.cast())
+    return data_array
+
+
 def list_to_uint8_array(data_list):
     """Convert python list to uint8_array."""
 
-    data_array = _populate_array(data_list, ble_driver.uint8_array)
-    return data_array
+    if not isinstance(data_list, (bytes, bytearray, memoryview)):
+        data_list = bytes(data_list)
+    return bytes_to_uint8_array(data_list)
 
 
 def list_to_uint16_array(data_list):
@@ -0,0 +1,233 @@
+#
+# Copyright (c) 2016 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""
+Persistent store of the keys exchanged when bonding, used by BLEAdapter to
+encrypt the link again on reconnect instead of pairing.
+
+Bonds are stored with pickle, like the GATT cache, so the store directory
+must not be writable by untrusted users.
+"""
+
+import logging
+import os
+import pickle
+import tempfile
+import threading
+
+from pc_ble_driver_py.ble_driver import BLEGapAddr
+from pc_ble_driver_py.rpa_resolver import RpaResolver
+
+logger = logging.getLogger(__name__)
+
+BOND_FORMAT_VERSION = 1
+
+
+def _addr_type_value(addr):
+    return getattr(addr.addr_type, "value", addr.addr_type)
+
+
+def is_resolvable(peer_addr):
+    """True if peer_addr is a resolvable private address."""
+    return _addr_type_value(peer_addr) == BLEGapAddr.Types.random_private_resolvable.value
+
+
+class Bond(object):
+    """Keys of a bonded peer.
+
+    own_enc_key is the BLEGapEncKey distributed to the peer, or with LE
+    Secure Connections the LTK of both sides. peer_enc_key is the one the
+    peer distributed, peer_id_key the IRK and identity address of the peer.
+    """
+
+    def __init__(self, peer_addr, own_enc_key=None, peer_enc_key=None, peer_id_key=None):
+        assert isinstance(peer_addr, BLEGapAddr), "Invalid argument type"
+        self.peer_addr = peer_addr
+        self.own_enc_key = own_enc_key
+        self.peer_enc_key = peer_enc_key
+        self.peer_id_key = peer_id_key
+
+    @property
+    def identity_addr(self):
+        if self.peer_id_key is not None:
+            return self.peer_id_key.id_addr_info
+        return self.peer_addr
+
+    @property
+    def irk(self):
+        if self.peer_id_key is None:
+            return None
+        return bytes(self.peer_id_key.irk)
+
+    @property
+    def lesc(self):
+        return self.own_enc_key is not None and bool(self.own_enc_key.enc_info.lesc)
+
+    @property
+    def key(self):
+        return BondStore.key(self.identity_addr)
+
+    def central_enc_key(self):
+        """The BLEGapEncKey a central encrypts the link with, or None."""
+        return self.own_enc_key if self.lesc else self.peer_enc_key
+
+    def __str__(self):
+        return "Bond {} lesc({})".format(self.key, self.lesc)
+
+
+class BondStore(object):
+    """Bonds stored on disk, one file per peer, keyed on the identity address.
+
+    All bonds are kept in memory as well, so that lookups on reconnect do not
+    touch the disk. A peer using resolvable private addresses is found by its
+    IRK, with resolver. The resolver maps addresses to identity addresses, and
+    can be given to BLEDriver to resolve the addresses of advertising reports.
+    """
+
+    def __init__(self, path, resolver=None):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.resolver = resolver if resolver is not None else RpaResolver()
+        self._lock = threading.Lock()
+        self._bonds = dict()
+        for name in os.listdir(path):
+            if name.endswith(".bond"):
+                bond = self._load(os.path.join(path, name))
+                if bond is not None:
+                    self._add(bond)
+
+    def _add(self, bond):
+        with self._lock:
+            self._bonds[bond.key] = bond
+        if bond.irk is not None:
+            self.resolver.add(bond.irk, bond.identity_addr)
+
+    @staticmethod
+    def key(peer_addr):
+        assert isinstance(peer_addr, BLEGapAddr), "Invalid argument type"
+        return "{}_{}".format(
+            _addr_type_value(peer_addr), "".join("{:02X}".format(b) for b in peer_addr.addr)
+        )
+
+    def _file_name(self, key):
+        return os.path.join(self.path, key + ".bond")
+
+    def _load(self, file_name):
+        try:
+            with open(file_name, "rb") as f:
+                version, bond = pickle.load(f)
+        except Exception as e:
+            logger.warning("Discarding unreadable bond {}: {}".format(file_name, e))
+            self._remove(file_name)
+            return None
+
+        if version != BOND_FORMAT_VERSION:
+            self._remove(file_name)
+            return None
+        return bond
+
+    def store(self, bond):
+        assert isinstance(bond, Bond), "Invalid argument type"
+        key = bond.key
+        # Write to a temporary file first so readers never see partial bonds
+        fd, tmp_name = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((BOND_FORMAT_VERSION, bond), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_name, self._file_name(key))
+        except Exception:
+            self._remove(tmp_name)
+            raise
+        self._add(bond)
+
+    def find(self, peer_addr):
+        """Bond of the peer with address peer_addr, or None."""
+        bond = self._bonds.get(self.key(peer_addr))
+        if bond is None and is_resolvable(peer_addr):
+            identity_addr = self.resolver.resolve(peer_addr)
+            if identity_addr is not None:
+                bond = self._bonds.get(self.key(identity_addr))
+        return bond
+
+    def find_master_id(self, master_id):
+        """Bond with the own legacy LTK identified by master_id, or None."""
+        rand = list(master_id.rand)
+        for bond in list(self._bonds.values()):
+            key = bond.own_enc_key
+            if (
+                key is not None
+                and key.master_id.ediv == master_id.ediv
+                and list(key.master_id.rand) == rand
+            ):
+                return bond
+        return None
+
+    def remove(self, peer_addr):
+        bond = self.find(peer_addr)
+        if bond is None:
+            return
+        with self._lock:
+            self._bonds.pop(bond.key, None)
+        if bond.irk is not None:
+            self.resolver.remove(bond.irk)
+        self._remove(self._file_name(bond.key))
+
+    def clear(self):
+        with self._lock:
+            bonds = list(self._bonds.values())
+            self._bonds.clear()
+        # The resolver may be shared, so only the IRKs of these bonds go
+        for bond in bonds:
+            if bond.irk is not None:
+                self.resolver.remove(bond.irk)
+        for name in os.listdir(self.path):
+            if name.endswith(".bond"):
+                self._remove(os.path.join(self.path, name))
+
+    def bonds(self):
+        return list(self._bonds.values())
+
+    def __len__(self):
+        return len(self._bonds)
+
+    @staticmethod
+    def _remove(file_name):
+        try:
+            os.remove(file_name)
+        except FileNotFoundError:
+            pass
@@ -43,6 +43,14 @@
 # * "NRF52"
 __conn_ic_id__ = None
 
+# Driver backend
+# Like __conn_ic_id__ this needs to be set before importing pc_ble_driver_py
+# Currently functional variants are:
+#
+# * None or "serial", the connectivity firmware on a serial port
+# * "sim", the simulated SoftDevice in pc_ble_driver_py.sim_driver (NRF52 only)
+__driver_backend__ = None
+
 import os
 
 
@@ -61,6 +69,16 @@ def sd_api_ver_get():
     return _sd_api_v
 
 
+def driver_backend_get():
+    if __driver_backend__ is None or __driver_backend__ == "serial":
+        return "serial"
+    if __driver_backend__ == "sim":
+        if sd_api_ver_get() != 5:
+            raise RuntimeError("The sim driver backend requires SoftDevice API v5")
+        return "sim"
+    raise RuntimeError("Invalid driver backend: {}.".format(__driver_backend__))
+
+
 def _get_hex_path(sd_api_type="s132", sd_api_version="5.1.0"):
     return os.path.join(
         os.path.dirname(__file__),
@@ -0,0 +1,328 @@
+#
+# Copyright (c) 2016 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""
+Bounded queues between the RPC callbacks and the worker threads.
+"""
+
+import collections
+import itertools
+import queue
+import threading
+import time
+from enum import Enum
+
+
+class QueuePolicy(Enum):
+    """What put() does when the queue for a class of items is full."""
+
+    never_drop = 0  # Queue beyond the bound
+    drop_oldest = 1  # Discard the oldest queued item of the class
+    drop_newest = 2  # Discard the item being put
+    block = 3  # Wait for room up to block_timeout, then discard the item
+    coalesce = 4  # Replace a queued item with the same key, else drop_oldest
+
+
+class _Entry(object):
+    __slots__ = ("seq", "item", "key", "conn", "lane", "alive")
+
+    def __init__(self, seq, item, key, conn, lane):
+        self.seq = seq
+        self.item = item
+        self.key = key
+        self.conn = conn
+        self.lane = lane
+        self.alive = True
+
+
+def _head(entries):
+    """Oldest live entry of a deque, dropping the entries taken out of turn."""
+    while entries and not entries[0].alive:
+        entries.popleft()
+    return entries[0] if entries else None
+
+
+class _Lane(object):
+    """Queued items of one class, oldest first."""
+
+    def __init__(self, policy, maxsize, priority):
+        self.policy = policy
+        self.maxsize = maxsize
+        self.priority = priority
+        self.entries = collections.deque()
+        self.count = 0
+        self.keys = dict()
+        self.high_water = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.blocked = 0
+
+    @property
+    def full(self):
+        return bool(self.maxsize) and self.count >= self.maxsize
+
+    def stats(self):
+        return dict(
+            policy=self.policy.name,
+            maxsize=self.maxsize,
+            priority=self.priority,
+            queued=self.count,
+            high_water=self.high_water,
+            dropped=self.dropped,
+            coalesced=self.coalesced,
+            blocked=self.blocked,
+        )
+
+
+class EventQueue(object):
+    """Queue with a bound, a drop policy and a priority per class of item.
+
+    classify maps an item to its class, the policy, bound and priority of
+    which come from policies, limits and priorities, falling back to
+    policy, maxsize and 0. A maxsize of 0 means no bound. coalesce_key maps
+    an item to the key used by QueuePolicy.coalesce.
+
+    get() serves the class with the lowest priority number first, and items
+    of the same priority in the order they were put. connection maps an
+    item to the connection it belongs to, or None. Items of one connection
+    always come out in the order they were put: an item waits for the older
+    items of its connection, which are taken out of turn from their lanes.
+
+    Several workers can share the queue with get_exclusive(), which holds
+    back the other items of a connection until the worker calls release()
+    for it. Items without a connection count as one connection there.
+
+    Implements the part of the queue.Queue interface used by the worker
+    threads, and raises queue.Empty the same way.
+    """
+
+    def __init__(
+        self,
+        maxsize=0,
+        policy=QueuePolicy.never_drop,
+        classify=None,
+        policies=None,
+        limits=None,
+        priorities=None,
+        connection=None,
+        coalesce_key=None,
+        block_timeout=1.0,
+    ):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.classify = classify
+        self.policies = dict(policies or {})
+        self.limits = dict(limits or {})
+        self.priorities = dict(priorities or {})
+        self.connection = connection
+        self.coalesce_key = coalesce_key
+        self.block_timeout = block_timeout
+
+        self._mutex = threading.Lock()
+        self._not_empty = threading.Condition(self._mutex)
+        self._not_full = threading.Condition(self._mutex)
+        self._lanes = dict()
+        self._conns = dict()
+        self._seq = itertools.count()
+        self._size = 0
+        self._consumers = set()
+        self._busy = set()
+        self.high_water = 0
+
+    def _lane(self, cls):
+        lane = self._lanes.get(cls)
+        if lane is None:
+            lane = _Lane(
+                self.policies.get(cls, self.policy),
+                self.limits.get(cls, self.maxsize),
+                self.priorities.get(cls, 0),
+            )
+            self._lanes[cls] = lane
+        return lane
+
+    def put(self, item):
+        """Queue item, returns False if it was discarded."""
+        cls = self.classify(item) if self.classify else None
+        conn = self.connection(item) if self.connection else None
+        key = None
+        with self._mutex:
+            lane = self._lane(cls)
+            policy = lane.policy
+
+            if policy == QueuePolicy.coalesce:
+                key = self.coalesce_key(item)
+                entry = lane.keys.get(key)
+                if entry is not None:
+                    entry.item = item
+                    lane.coalesced += 1
+                    return True
+
+            if lane.full:
+                if policy in (QueuePolicy.drop_oldest, QueuePolicy.coalesce):
+                    self._remove(_head(lane.entries))
+                    lane.dropped += 1
+                elif policy == QueuePolicy.drop_newest:
+                    lane.dropped += 1
+                    return False
+                elif policy == QueuePolicy.block:
+                    # The consumer waiting on itself would never wake up
+                    if threading.get_ident() not in self._consumers:
+                        lane.blocked += 1
+                        self._not_full.wait_for(
+                            lambda: not lane.full, self.block_timeout
+                        )
+                        if lane.full:
+                            lane.dropped += 1
+                            return False
+
+            entry = _Entry(next(self._seq), item, key, conn, lane)
+            lane.entries.append(entry)
+            lane.count += 1
+            if key is not None:
+                lane.keys[key] = entry
+            if conn is not None:
+                self._conns.setdefault(conn, collections.deque()).append(entry)
+            lane.high_water = max(lane.high_water, lane.count)
+            self._size += 1
+            self.high_water = max(self.high_water, self._size)
+            self._not_empty.notify()
+        return True
+
+    def _remove(self, entry):
+        """Take a live entry out of the queue, called with the mutex held."""
+        lane = entry.lane
+        entry.alive = False
+        lane.count -= 1
+        self._size -= 1
+        if entry.key is not None and lane.keys.get(entry.key) is entry:
+            del lane.keys[entry.key]
+        _head(lane.entries)
+        if entry.conn is not None:
+            entries = self._conns[entry.conn]
+            if _head(entries) is None:
+                del self._conns[entry.conn]
+        if lane.policy == QueuePolicy.block:
+            self._not_full.notify_all()
+
+    def _select(self, busy=()):
+        """Next entry to serve, skipping connections in busy, or None."""
+        entry = None
+        for lane in self._lanes.values():
+            head = _head(lane.entries)
+            if busy:
+                for candidate in lane.entries:
+                    if candidate.alive and candidate.conn not in busy:
+                        head = candidate
+                        break
+                else:
+                    head = None
+            if head is not None and (
+                entry is None
+                or (lane.priority, head.seq) < (entry.lane.priority, entry.seq)
+            ):
+                entry = head
+        if entry is not None and entry.conn is not None:
+            # Older items of the same connection go first
+            entry = _head(self._conns[entry.conn])
+        return entry
+
+    def get(self, block=True, timeout=None):
+        with self._mutex:
+            self._consumers.add(threading.get_ident())
+            if not block:
+                if not self._size:
+                    raise queue.Empty
+            elif not self._not_empty.wait_for(lambda: self._size, timeout):
+                raise queue.Empty
+
+            entry = self._select()
+            self._remove(entry)
+            return entry.item
+
+    def get_exclusive(self, timeout=None):
+        """Take the next item of a connection no other worker holds.
+
+        Returns the connection and the item. The connection is held until
+        release() is called with it.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._mutex:
+            self._consumers.add(threading.get_ident())
+            while True:
+                entry = self._select(self._busy)
+                if entry is not None:
+                    break
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                self._not_empty.wait(remaining)
+
+            self._busy.add(entry.conn)
+            self._remove(entry)
+            return entry.conn, entry.item
+
+    def release(self, conn):
+        with self._mutex:
+            self._busy.discard(conn)
+            self._not_empty.notify_all()
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def qsize(self):
+        return self._size
+
+    def empty(self):
+        return not self._size
+
+    def stats(self):
+        """Counters per class, keyed on the class name, and for the whole queue."""
+        with self._mutex:
+            stats = dict(
+                ("default" if cls is None else getattr(cls, "name", cls), lane.stats())
+                for cls, lane in self._lanes.items()
+            )
+            stats["total"] = dict(
+                queued=self._size,
+                connections=len(self._conns),
+                high_water=self.high_water,
+                dropped=sum(lane.dropped for lane in self._lanes.values()),
+                coalesced=sum(lane.coalesced for lane in self._lanes.values()),
+            )
+            return stats
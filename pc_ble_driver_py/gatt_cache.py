@@ -0,0 +1,165 @@
+#
+# Copyright (c) 2016 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""
+Persistent cache of discovered GATT databases, used by BLEAdapter to skip
+service discovery when reconnecting to a known peer.
+
+Entries are stored with pickle, so the cache directory must not be writable
+by untrusted users.
+"""
+
+import logging
+import os
+import pickle
+import tempfile
+
+from pc_ble_driver_py.ble_driver import BLEGapAddr, driver
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT_VERSION = 1
+
+
+class GattCacheEntry(object):
+    def __init__(self, services, db_hash=None):
+        self.services = services
+        self.db_hash = db_hash
+
+    def vendor_bases(self):
+        """Distinct vendor specific UUID bases used in the database."""
+        bases = dict()
+        for uuid in self.uuids():
+            base = uuid.base
+            if base.base is None or base.type is None:
+                continue
+            if base.type >= driver.BLE_UUID_TYPE_VENDOR_BEGIN:
+                bases.setdefault(tuple(base.base), base)
+        return list(bases.values())
+
+    def uuids(self):
+        for s in self.services:
+            yield s.uuid
+            for c in s.chars:
+                yield c.uuid
+                for d in c.descs:
+                    yield d.uuid
+
+    def remap_uuid_types(self, uuid_types):
+        """Update vendor UUID types after the bases have been registered again.
+
+        uuid_types maps the type stored in the cache to the type assigned by
+        the SoftDevice in this session.
+        """
+        bases = dict()
+        for uuid in self.uuids():
+            bases[id(uuid.base)] = uuid.base
+        for base in bases.values():
+            base.type = uuid_types.get(base.type, base.type)
+
+
+class GattCache(object):
+    """Discovered GATT databases stored on disk, one file per peer.
+
+    Peers are identified by address, and by bonding identity (for example the
+    peer IRK) when one is given. A peer using resolvable private addresses
+    only gets cache hits when its identity is known.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    @staticmethod
+    def key(peer_addr, identity=None):
+        assert isinstance(peer_addr, BLEGapAddr), "Invalid argument type"
+        addr_type = getattr(peer_addr.addr_type, "value", peer_addr.addr_type)
+        key = "{}_{}".format(addr_type, "".join("{:02X}".format(b) for b in peer_addr.addr))
+        if identity is not None:
+            key += "_" + "".join("{:02X}".format(b) for b in identity)
+        return key
+
+    def _file_name(self, peer_addr, identity):
+        return os.path.join(self.path, self.key(peer_addr, identity) + ".gatt")
+
+    def load(self, peer_addr, identity=None):
+        file_name = self._file_name(peer_addr, identity)
+        try:
+            with open(file_name, "rb") as f:
+                version, entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(
+                "Discarding unreadable GATT cache entry {}: {}".format(file_name, e)
+            )
+            self._remove(file_name)
+            return None
+
+        if version != CACHE_FORMAT_VERSION:
+            self._remove(file_name)
+            return None
+        return entry
+
+    def store(self, peer_addr, entry, identity=None):
+        assert isinstance(entry, GattCacheEntry), "Invalid argument type"
+        file_name = self._file_name(peer_addr, identity)
+        # Write to a temporary file first so readers never see partial entries
+        fd, tmp_name = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((CACHE_FORMAT_VERSION, entry), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_name, file_name)
+        except Exception:
+            self._remove(tmp_name)
+            raise
+
+    def invalidate(self, peer_addr, identity=None):
+        self._remove(self._file_name(peer_addr, identity))
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith(".gatt"):
+                self._remove(os.path.join(self.path, name))
+
+    @staticmethod
+    def _remove(file_name):
+        try:
+            os.remove(file_name)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,317 @@
+#
+# Copyright (c) 2016 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""
+Event driven GATT service discovery.
+"""
+
+import collections
+import logging
+import time
+from threading import Event
+
+from pc_ble_driver_py.ble_driver import (
+    BLEDescriptor,
+    BLEGattStatusCode,
+    BLEUUID,
+    BLEUUIDBase,
+    driver,
+)
+from pc_ble_driver_py.exceptions import NordicSemiException
+from pc_ble_driver_py.observers import BLEDriverObserver
+
+logger = logging.getLogger(__name__)
+
+
+def uuid_matches(uuid, wanted):
+    if uuid.value != wanted.value:
+        return False
+    if uuid.base.base is not None and wanted.base.base is not None:
+        return uuid.base.base == wanted.base.base
+    return uuid.base.type == wanted.base.type
+
+
+class GattDiscovery(BLEDriverObserver):
+    """Service discovery as a state machine over GATTC discovery responses.
+
+    Every response is handled on the driver event thread, which sends the next
+    request right away instead of waking up a thread blocked in a wait. ATT
+    only allows one outstanding request per connection, so requests are still
+    sent one at a time, but no round trip is spent on ranges known to be
+    empty: descriptor discovery is skipped for characteristics without room
+    for descriptors, and vendor specific service UUIDs are resolved from the
+    service declaration instead of rediscovering the service.
+
+    service_uuids and char_uuids limit discovery to the given services and
+    characteristics. Vendor specific UUIDs must have their base registered.
+    """
+
+    PHASES = ("services", "vendor_uuids", "characteristics", "descriptors")
+
+    def __init__(self, ble_driver, conn_handle, service_uuids=None, char_uuids=None):
+        super(GattDiscovery, self).__init__()
+        self.driver = ble_driver
+        self.conn_handle = conn_handle
+        self.service_uuids = service_uuids
+        self.char_uuids = char_uuids
+        self.services = list()
+        self.status = None
+        self.stats = dict()
+        # Called on the event thread when discovery has finished
+        self.done_callback = None
+        # Called on the event thread for every response, before it is handled
+        self.progress_callback = None
+
+        self._error = None
+        self._phase = None
+        self._phase_start = None
+        self._pending = collections.deque()
+        self._progress = 0
+        self._done = Event()
+
+    def run(self, timeout=5):
+        """Run discovery, timeout is the maximum time to wait for a response."""
+        self.start()
+        try:
+            progress = self._progress
+            while not self._done.wait(timeout):
+                if progress == self._progress:
+                    raise self.timeout_error()
+                progress = self._progress
+        finally:
+            self.stop()
+        return self.result()
+
+    def start(self):
+        """Send the first request, the rest is sent from the event thread."""
+        self.driver.observer_register(self)
+        try:
+            self._start_phase("services")
+            self._request(self.driver.ble_gattc_prim_srvc_disc, None, 0x0001)
+        except Exception:
+            self.stop()
+            raise
+
+    def stop(self):
+        self.driver.observer_unregister(self)
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self.status
+
+    def timeout_error(self):
+        return NordicSemiException(
+            "Service discovery timed out in phase {}".format(self._phase)
+        )
+
+    def on_gap_evt_disconnected(self, ble_driver, conn_handle, reason):
+        if conn_handle == self.conn_handle:
+            self._error = NordicSemiException(
+                "Disconnected during service discovery: {}".format(reason)
+            )
+            self._finish(None)
+
+    def on_gattc_evt_prim_srvc_disc_rsp(self, ble_driver, conn_handle, status, services):
+        if conn_handle == self.conn_handle and self._phase == "services":
+            self._step(self._on_services, status, services)
+
+    def on_gattc_evt_read_rsp(
+        self, ble_driver, conn_handle, status, error_handle, attr_handle, offset, data
+    ):
+        if conn_handle == self.conn_handle and self._phase == "vendor_uuids":
+            self._step(self._on_vendor_uuid, status, data)
+
+    def on_gattc_evt_char_disc_rsp(self, ble_driver, conn_handle, status, characteristics):
+        if conn_handle == self.conn_handle and self._phase == "characteristics":
+            self._step(self._on_characteristics, status, characteristics)
+
+    def on_gattc_evt_desc_disc_rsp(self, ble_driver, conn_handle, status, descriptors):
+        if conn_handle == self.conn_handle and self._phase == "descriptors":
+            self._step(self._on_descriptors, status, descriptors)
+
+    def _step(self, handler, status, *args):
+        self._progress += 1
+        if self.progress_callback is not None:
+            self.progress_callback()
+        try:
+            if status == BLEGattStatusCode.success:
+                handler(status, *args)
+            elif status == BLEGattStatusCode.attribute_not_found:
+                # End of the current range, handlers treat it as an empty response
+                handler(status, None)
+            else:
+                self._finish(status)
+        except Exception as e:
+            self._error = e
+            self._finish(None)
+
+    def _request(self, api_call, *args):
+        self.stats[self._phase]["requests"] += 1
+        api_call(self.conn_handle, *args)
+
+    def _start_phase(self, phase):
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.stats[self._phase]["time"] = now - self._phase_start
+        self._phase = phase
+        self._phase_start = now
+        if phase is not None:
+            self.stats[phase] = dict(requests=0, time=0.0)
+
+    def _finish(self, status):
+        self._start_phase(None)
+        self.status = status
+        self._done.set()
+        if self.done_callback is not None:
+            self.done_callback()
+
+    # Primary services
+    def _on_services(self, status, services):
+        if services:
+            known = set(s.start_handle for s in self.services)
+            self.services.extend(s for s in services if s.start_handle not in known)
+            if services[-1].end_handle != 0xFFFF:
+                self._request(
+                    self.driver.ble_gattc_prim_srvc_disc,
+                    None,
+                    services[-1].end_handle + 1,
+                )
+                return
+
+        self._start_phase("vendor_uuids")
+        self._pending = collections.deque(
+            s for s in self.services if s.uuid.value == BLEUUID.Standard.unknown
+        )
+        self._next_vendor_uuid()
+
+    # Vendor specific service UUIDs, read from the service declaration
+    def _next_vendor_uuid(self):
+        if self._pending:
+            self._request(self.driver.ble_gattc_read, self._pending[0].start_handle, 0)
+            return
+
+        if self.service_uuids is not None:
+            self.services = [
+                s
+                for s in self.services
+                if any(uuid_matches(s.uuid, u) for u in self.service_uuids)
+            ]
+        self._start_phase("characteristics")
+        self._pending = collections.deque(self.services)
+        self._next_service()
+
+    def _on_vendor_uuid(self, status, data):
+        service = self._pending.popleft()
+        if data is not None and len(data) == 16:
+            base = BLEUUIDBase(list(data)[::-1], driver.BLE_UUID_TYPE_VENDOR_BEGIN)
+            self.driver.ble_vs_uuid_add(base)
+            service.uuid = BLEUUID(data[12] | (data[13] << 8), base)
+        self._next_vendor_uuid()
+
+    # Characteristics
+    def _next_service(self):
+        if self._pending:
+            service = self._pending[0]
+            self._request(
+                self.driver.ble_gattc_char_disc, service.start_handle, service.end_handle
+            )
+            return
+
+        self._start_phase("descriptors")
+        self._pending = collections.deque(c for s in self.services for c in s.chars)
+        self._next_characteristic()
+
+    def _on_characteristics(self, status, characteristics):
+        service = self._pending[0]
+        if characteristics:
+            known = set(c.handle_decl for c in service.chars)
+            for char in characteristics:
+                if char.handle_decl not in known:
+                    service.char_add(char)
+            # A further characteristic needs room for a declaration and a value
+            last = characteristics[-1]
+            if last.handle_value + 1 < service.end_handle:
+                self._request(
+                    self.driver.ble_gattc_char_disc,
+                    last.handle_value + 1,
+                    service.end_handle,
+                )
+                return
+
+        if self.char_uuids is not None:
+            service.chars = [
+                c
+                for c in service.chars
+                if any(uuid_matches(c.uuid, u) for u in self.char_uuids)
+            ]
+        self._pending.popleft()
+        self._next_service()
+
+    # Descriptors
+    def _next_characteristic(self):
+        while self._pending:
+            char = self._pending[0]
+            if char.handle_value < char.end_handle:
+                self._request(
+                    self.driver.ble_gattc_desc_disc, char.handle_value, char.end_handle
+                )
+                return
+
+            # No room for descriptors, only the value attribute is in range
+            char.descs.append(
+                BLEDescriptor(BLEUUID(char.uuid.value, char.uuid.base), char.handle_value)
+            )
+            self._pending.popleft()
+
+        self._finish(BLEGattStatusCode.success)
+
+    def _on_descriptors(self, status, descriptors):
+        char = self._pending[0]
+        if descriptors:
+            known = set(d.handle for d in char.descs)
+            char.descs.extend(d for d in descriptors if d.handle not in known)
+            if descriptors[-1].handle < char.end_handle:
+                self._request(
+                    self.driver.ble_gattc_desc_disc,
+                    descriptors[-1].handle + 1,
+                    char.end_handle,
+                )
+                return
+
+        self._pending.popleft()
+        self._next_characteristic()
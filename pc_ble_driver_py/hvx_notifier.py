@@ -0,0 +1,332 @@
+#
+# Copyright (c) 2016 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""
+Notification and indication streams for GATT servers.
+"""
+
+import collections
+import logging
+import queue
+import time
+from threading import Condition, Thread
+
+from pc_ble_driver_py.ble_adapter import TX_QUEUE_FULL_ERRORS
+from pc_ble_driver_py.ble_driver import BLEGattHVXType, BLEGattsHVXParams
+from pc_ble_driver_py.exceptions import NordicSemiException
+from pc_ble_driver_py.observers import BLEDriverObserver
+
+logger = logging.getLogger(__name__)
+
+
+class HvxStream(object):
+    """Values to send on one characteristic of one connection.
+
+    Values are added with put(), or pulled from source: an iterable, or a
+    queue.Queue where None ends the stream.
+    """
+
+    def __init__(self, notifier, conn_handle, char_handles, hvx_type, source=None):
+        self.notifier = notifier
+        self.conn_handle = conn_handle
+        self.char_handles = char_handles
+        self.hvx_type = hvx_type
+        self.values = collections.deque()
+        self.closed = False
+        self.error = None
+
+        self.sent = 0
+        self.bytes = 0
+        self.resource_errors = 0
+        self.first_sent = None
+        self.last_sent = None
+
+        self._queue = None
+        self._iter = None
+        if isinstance(source, queue.Queue):
+            self._queue = source
+        elif source is not None:
+            self._iter = iter(source)
+
+    @property
+    def value_handle(self):
+        return self.char_handles.value_handle
+
+    @property
+    def pending(self):
+        return len(self.values)
+
+    @property
+    def done(self):
+        return self.error is not None or (self.closed and not self.values)
+
+    def put(self, value):
+        self.notifier._put(self, value)
+
+    def close(self):
+        self.notifier._close(self)
+
+    def stats(self):
+        elapsed = 0.0
+        if self.first_sent is not None:
+            elapsed = self.last_sent - self.first_sent
+        return dict(
+            sent=self.sent,
+            bytes=self.bytes,
+            pending=self.pending,
+            resource_errors=self.resource_errors,
+            throughput=self.bytes / elapsed if elapsed else 0.0,
+        )
+
+    def _fill(self):
+        """Pull the next value from the source, called with the notifier lock held."""
+        if self.values or self.closed:
+            return
+        if self._queue is not None:
+            try:
+                value = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if value is None:
+                self.closed = True
+            else:
+                self.values.append(value)
+        elif self._iter is not None:
+            try:
+                self.values.append(next(self._iter))
+            except StopIteration:
+                self.closed = True
+
+
+class HvxNotifier(BLEDriverObserver):
+    """Sends notifications and indications from a worker thread.
+
+    Notifications are sent as long as the connection has HVN TX credits,
+    sized from hvn_tx_queue_size and given back by hvn_tx_complete events,
+    so the SoftDevice queue is kept full. Only one indication can be
+    outstanding per connection, the next one is sent on confirmation.
+    Streams are served round robin.
+    """
+
+    def __init__(self, adapter, poll_interval=0.005):
+        super(HvxNotifier, self).__init__()
+        self.adapter = adapter
+        self.poll_interval = poll_interval
+        self.streams = list()
+        self.cond = Condition()
+        self._indicating = set()
+        self._next = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        with self.cond:
+            if self._running:
+                return
+            self._running = True
+        self.adapter.driver.observer_register(self)
+        self._thread = Thread(target=self._run, name="HvxNotifier", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self.cond:
+            self._running = False
+            self.cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.adapter.driver.observer_unregister(self)
+
+    def stream(
+        self, conn_handle, char_handles, source=None, hvx_type=BLEGattHVXType.notification
+    ):
+        """Add a stream of values for char_handles on conn_handle."""
+        stream = HvxStream(self, conn_handle, char_handles, hvx_type, source)
+        with self.cond:
+            self.streams.append(stream)
+            self.cond.notify_all()
+        return stream
+
+    def publish(self, char_handles, value, conn_handles=None):
+        """Queue value on every stream for char_handles, limited to conn_handles if given."""
+        with self.cond:
+            for stream in self.streams:
+                if stream.value_handle != char_handles.value_handle or stream.closed:
+                    continue
+                if conn_handles is None or stream.conn_handle in conn_handles:
+                    stream.values.append(value)
+            self.cond.notify_all()
+
+    def drain(self, timeout=None):
+        """Wait until all closed streams are sent and their TX complete events received."""
+
+        def drained():
+            for stream in self.streams:
+                if not stream.done:
+                    return False
+                conn = self.adapter.db_conns.get(stream.conn_handle)
+                if conn is not None and conn.hvn_credits.available < conn.hvn_credits.size:
+                    return False
+            return not self._indicating
+
+        with self.cond:
+            if not self.cond.wait_for(drained, timeout):
+                raise NordicSemiException("Timed out waiting for notifications to be sent")
+
+    def stats(self):
+        """Counters per (conn_handle, value_handle), with in_flight for the connection."""
+        with self.cond:
+            result = dict()
+            for stream in self.streams:
+                stats = stream.stats()
+                conn = self.adapter.db_conns.get(stream.conn_handle)
+                stats["in_flight"] = 0
+                if conn is not None:
+                    stats["in_flight"] = conn.hvn_credits.size - conn.hvn_credits.available
+                result[(stream.conn_handle, stream.value_handle)] = stats
+            return result
+
+    def on_gatts_evt_hvn_tx_complete(self, ble_driver, conn_handle, count):
+        with self.cond:
+            self.cond.notify_all()
+
+    def on_evt_tx_complete(self, ble_driver, conn_handle, count):
+        with self.cond:
+            self.cond.notify_all()
+
+    def on_gatts_evt_hvc(self, ble_driver, conn_handle, attr_handle):
+        with self.cond:
+            self._indicating.discard(conn_handle)
+            self.cond.notify_all()
+
+    def on_gap_evt_disconnected(self, ble_driver, conn_handle, reason):
+        with self.cond:
+            self._indicating.discard(conn_handle)
+            for stream in self.streams:
+                if stream.conn_handle == conn_handle and not stream.done:
+                    stream.error = NordicSemiException(
+                        "Disconnected: {}".format(reason)
+                    )
+            self.streams = [s for s in self.streams if s.conn_handle != conn_handle]
+            self.cond.notify_all()
+
+    def _put(self, stream, value):
+        with self.cond:
+            if stream.closed:
+                raise NordicSemiException("Stream is closed")
+            stream.values.append(value)
+            self.cond.notify_all()
+
+    def _close(self, stream):
+        with self.cond:
+            stream.closed = True
+            self.cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if not self._running:
+                    return
+                work = self._take()
+                if work is None:
+                    polling = any(s._queue is not None and not s.closed for s in self.streams)
+                    self.cond.wait(self.poll_interval if polling else None)
+                    continue
+            self._send(*work)
+
+    def _take(self):
+        """Pick the next value that can be sent, round robin over the streams."""
+        count = len(self.streams)
+        for i in range(count):
+            stream = self.streams[(self._next + i) % count]
+            if stream.error is not None:
+                continue
+            conn = self.adapter.db_conns.get(stream.conn_handle)
+            if conn is None:
+                continue
+            stream._fill()
+            if not stream.values:
+                continue
+
+            if stream.hvx_type == BLEGattHVXType.indication:
+                if stream.conn_handle in self._indicating:
+                    continue
+                self._indicating.add(stream.conn_handle)
+                credits = None
+            elif conn.hvn_credits.acquire(0):
+                credits = conn.hvn_credits
+            else:
+                continue
+
+            self._next = (self._next + i + 1) % count
+            return stream, stream.values.popleft(), credits
+        return None
+
+    def _send(self, stream, value, credits):
+        hvx_params = BLEGattsHVXParams(stream.char_handles, stream.hvx_type, value)
+        try:
+            self.adapter.driver.ble_gatts_hvx(stream.conn_handle, hvx_params)
+        except NordicSemiException as e:
+            with self.cond:
+                if credits is None:
+                    self._indicating.discard(stream.conn_handle)
+                if e.error_code in TX_QUEUE_FULL_ERRORS:
+                    # Queue shared with other senders, wait for the next TX complete
+                    if credits is not None:
+                        credits.clear()
+                    stream.values.appendleft(value)
+                    stream.resource_errors += 1
+                else:
+                    if credits is not None:
+                        credits.release()
+                    logger.error(
+                        "Stream on conn %d handle %d failed: %s",
+                        stream.conn_handle,
+                        stream.value_handle,
+                        e,
+                    )
+                    stream.error = e
+                self.cond.notify_all()
+            return
+
+        now = time.perf_counter()
+        with self.cond:
+            if stream.first_sent is None:
+                stream.first_sent = now
+            stream.last_sent = now
+            stream.sent += 1
+            stream.bytes += len(value)
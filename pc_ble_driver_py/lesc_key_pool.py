@@ -0,0 +1,206 @@
+#
+# Copyright (c) 2016 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""
+Pre-generated LE Secure Connections key pairs.
+"""
+
+import collections
+import logging
+import threading
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import ec
+
+logger = logging.getLogger(__name__)
+
+
+def generate_lesc_private_key():
+    """New P-256 private key for LE Secure Connections pairing."""
+    return ec.generate_private_key(ec.SECP256R1(), default_backend())
+
+
+class _PoolKey(object):
+    __slots__ = ("key", "created", "uses")
+
+    def __init__(self, key, created):
+        self.key = key
+        self.created = created
+        self.uses = 0
+
+
+class LescKeyPool(object):
+    """P-256 private keys generated ahead of the pairings that use them.
+
+    get() hands out a key up to max_uses times, and never a key older than
+    max_age seconds, None meaning no limit. When the pool is empty, get()
+    generates a key on the spot and counts a miss.
+
+    fill() tops the pool up to size, and runs from the constructor unless
+    fill is False. Between start() and stop(), a worker thread does so
+    whenever a key is taken or expires.
+    """
+
+    def __init__(self, size=4, fill=True, max_uses=1, max_age=None, clock=time.monotonic):
+        self.size = size
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.clock = clock
+        self._keys = collections.deque()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._running = False
+        self._worker = None
+        self.generated = 0
+        self.taken = 0
+        self.misses = 0
+        self.expired = 0
+        if fill:
+            self.fill()
+
+    def _add(self, key):
+        """Put a new key at the back, called with the lock held."""
+        entry = _PoolKey(key, self.clock())
+        self._keys.append(entry)
+        self.generated += 1
+        return entry
+
+    def _expire(self):
+        """Drop the keys older than max_age, called with the lock held."""
+        if self.max_age is None:
+            return
+        now = self.clock()
+        # Oldest first, so the expired keys are at the front
+        while self._keys and now - self._keys[0].created >= self.max_age:
+            self._keys.popleft()
+            self.expired += 1
+
+    def _next_expiry(self):
+        if self.max_age is None or not self._keys:
+            return None
+        return max(0.0, self._keys[0].created + self.max_age - self.clock())
+
+    def fill(self):
+        """Generate keys until the pool holds size keys, returns how many."""
+        count = 0
+        while True:
+            with self._lock:
+                self._expire()
+                if len(self._keys) >= self.size:
+                    return count
+            key = generate_lesc_private_key()
+            with self._lock:
+                self._add(key)
+            count += 1
+
+    def get(self):
+        with self._lock:
+            self._expire()
+            self.taken += 1
+            if self._keys:
+                entry = self._keys[0]
+                entry.uses += 1
+                if self.max_uses and entry.uses >= self.max_uses:
+                    self._keys.popleft()
+                    self._changed.notify()
+                return entry.key
+            self.misses += 1
+            self._changed.notify()
+
+        logger.debug("LESC key pool empty, generating a key")
+        key = generate_lesc_private_key()
+        if self.max_uses != 1:
+            with self._lock:
+                self._add(key).uses = 1
+        return key
+
+    def start(self):
+        """Keep the pool filled from a worker thread."""
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._running = True
+            self._worker = threading.Thread(
+                target=self._refill_thread, name="LescKeyPoolThread"
+            )
+            self._worker.daemon = True
+        self._worker.start()
+
+    def stop(self, timeout=None):
+        with self._lock:
+            worker, self._worker = self._worker, None
+            self._running = False
+            self._changed.notify_all()
+        if worker is not None:
+            worker.join(timeout)
+
+    def _refill_thread(self):
+        while True:
+            with self._lock:
+                while self._running:
+                    self._expire()
+                    if len(self._keys) < self.size:
+                        break
+                    self._changed.wait(self._next_expiry())
+                if not self._running:
+                    return
+            key = generate_lesc_private_key()
+            with self._lock:
+                self._add(key)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                ready=len(self._keys),
+                size=self.size,
+                generated=self.generated,
+                taken=self.taken,
+                misses=self.misses,
+                expired=self.expired,
+                running=self._running,
+            )
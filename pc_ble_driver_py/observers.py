@@ -370,3 +370,32 @@ class BLEAdapterObserver(object):
                 conn_handle, gen_conn_params_str(conn_params)
             )
         )
+
+
+class AdapterPoolObserver(object):
+    """
+    Observer used by AdapterPool, peers are identified by their BLEGapAddr
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(AdapterPoolObserver, self).__init__()
+
+    def on_pool_adv_report(self, pool, peer_addr, rssi, adv_type, adv_data):
+        pass
+
+    def on_pool_connected(self, pool, peer_addr, adapter, conn_handle):
+        logger.debug("evt> pool connected peer({})".format(peer_addr))
+
+    def on_pool_disconnected(self, pool, peer_addr, reason):
+        logger.debug(
+            "evt> pool disconnected peer({})\n reason({})".format(peer_addr, reason)
+        )
+
+    def on_pool_notification(self, pool, peer_addr, uuid, data):
+        pass
+
+    def on_pool_indication(self, pool, peer_addr, uuid, data):
+        pass
+
+    def on_pool_adapter_lost(self, pool, adapter):
+        logger.debug("evt> pool adapter lost")
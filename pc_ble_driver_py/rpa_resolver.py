@@ -0,0 +1,198 @@
+#
+# Copyright (c) 2016 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""
+Resolution of resolvable private addresses against the IRKs of bonded peers.
+"""
+
+import collections
+import threading
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+# Default time a peer keeps one resolvable private address, in seconds
+RPA_ROTATION_PERIOD = 900.0
+
+
+def _irk_encryptor(irk):
+    # IRKs are least significant byte first, AES keys most significant first
+    return Cipher(
+        algorithms.AES(bytes(irk)[::-1]), modes.ECB(), backend=default_backend()
+    ).encryptor()
+
+
+def _ah_block(addr):
+    # ah(irk, prand): prand is the upper half of the address, padded to 128 bits
+    return bytes(13) + addr[:3]
+
+
+def is_rpa(addr):
+    """True if addr, most significant byte first, has the form of an RPA."""
+    return len(addr) == 6 and addr[0] & 0xC0 == 0x40
+
+
+def resolve_rpa(irk, addr):
+    """True if the resolvable private address addr was generated from irk.
+
+    addr is most significant byte first, as in BLEGapAddr, and irk least
+    significant byte first, as distributed by the SoftDevice.
+    """
+    addr = bytes(addr)
+    encryptor = _irk_encryptor(irk)
+    block = encryptor.update(_ah_block(addr)) + encryptor.finalize()
+    return block[-3:] == addr[3:]
+
+
+class RpaResolver(object):
+    """Maps resolvable private addresses to the identity of the peer.
+
+    add() registers an IRK with the identity it resolves to, by default the
+    IRK itself. resolve() takes a BLEGapAddr or the address bytes, most
+    significant byte first, and returns the identity, or None.
+
+    Results, misses included, are kept in an LRU cache of cache_size
+    addresses for rotation_period seconds, after which the peer has moved on
+    to a new address. Uncached addresses are checked with one AES-ECB pass
+    per IRK, over all the addresses given to resolve_many().
+    """
+
+    def __init__(self, cache_size=4096, rotation_period=RPA_ROTATION_PERIOD,
+                 clock=time.monotonic):
+        self.cache_size = cache_size
+        self.rotation_period = rotation_period
+        self.clock = clock
+        self._lock = threading.Lock()
+        # IRK to ECB encryptor, which is never finalized, and identity
+        self._irks = dict()
+        # Address to identity and expiry time, least recently used first
+        self._cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.resolved = 0
+
+    def add(self, irk, identity=None):
+        irk = bytes(irk)
+        if identity is None:
+            identity = irk
+        with self._lock:
+            self._irks[irk] = (_irk_encryptor(irk), identity)
+            # Addresses that resolved to nothing may resolve to this IRK
+            self._cache = collections.OrderedDict(
+                (addr, entry) for addr, entry in self._cache.items() if entry[0] is not None
+            )
+
+    def remove(self, irk):
+        with self._lock:
+            removed = self._irks.pop(bytes(irk), None)
+            if removed is not None:
+                identity = removed[1]
+                self._cache = collections.OrderedDict(
+                    (addr, entry)
+                    for addr, entry in self._cache.items()
+                    if entry[0] is not identity
+                )
+
+    def clear(self):
+        with self._lock:
+            self._irks.clear()
+            self._cache.clear()
+
+    def resolve(self, addr):
+        return self.resolve_many([addr])[0]
+
+    def resolve_many(self, addrs):
+        """Identities of addrs, in the same order, None where unresolved."""
+        addrs = [bytes(getattr(addr, "addr", addr)) for addr in addrs]
+        results = [None] * len(addrs)
+        pending = collections.OrderedDict()
+        now = self.clock()
+        with self._lock:
+            for i, addr in enumerate(addrs):
+                if not is_rpa(addr):
+                    continue
+                entry = self._cache.get(addr)
+                if entry is not None and entry[1] > now:
+                    self._cache.move_to_end(addr)
+                    results[i] = entry[0]
+                    self.hits += 1
+                else:
+                    pending.setdefault(addr, []).append(i)
+            if not pending:
+                return results
+
+            self.misses += len(pending)
+            identities = self._search(list(pending))
+            for (addr, indexes), identity in zip(pending.items(), identities):
+                self._cache[addr] = (identity, now + self.rotation_period)
+                self._cache.move_to_end(addr)
+                for i in indexes:
+                    results[i] = identity
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return results
+
+    def _search(self, addrs):
+        """Identities of addrs by AES over all IRKs, called with the lock held."""
+        found = [None] * len(addrs)
+        blocks = b"".join(_ah_block(addr) for addr in addrs)
+        hashes = [addr[3:] for addr in addrs]
+        left = len(addrs)
+        for encryptor, identity in self._irks.values():
+            out = encryptor.update(blocks)
+            for j, addr_hash in enumerate(hashes):
+                if found[j] is None and out[16 * j + 13:16 * j + 16] == addr_hash:
+                    found[j] = identity
+                    left -= 1
+            if not left:
+                break
+        self.resolved += len(addrs) - left
+        return found
+
+    def __len__(self):
+        return len(self._irks)
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                irks=len(self._irks),
+                cached=len(self._cache),
+                hits=self.hits,
+                misses=self.misses,
+                resolved=self.resolved,
+            )
@@ -0,0 +1,198 @@
+#
+# Copyright (c) 2016 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""
+Deduplication of advertising reports, per advertiser.
+"""
+
+import threading
+import time
+
+
+class ScanEntry(object):
+    """What is known about one advertiser.
+
+    addr is the address as sent over the air, least significant byte first.
+    Times are time.monotonic() values, or from the clock of the aggregator.
+    """
+
+    __slots__ = (
+        "addr_type",
+        "addr",
+        "first_seen",
+        "last_seen",
+        "last_reported",
+        "count",
+        "adv_hash",
+        "scan_rsp_hash",
+        "rssi",
+        "rssi_min",
+        "rssi_max",
+        "rssi_sum",
+    )
+
+    def __init__(self, addr_type, addr, now, rssi):
+        self.addr_type = addr_type
+        self.addr = addr
+        self.first_seen = now
+        self.last_seen = now
+        self.last_reported = None
+        self.count = 0
+        self.adv_hash = None
+        self.scan_rsp_hash = None
+        self.rssi = rssi
+        self.rssi_min = rssi
+        self.rssi_max = rssi
+        self.rssi_sum = 0
+
+    @property
+    def rssi_mean(self):
+        return self.rssi_sum / self.count if self.count else self.rssi
+
+    def copy(self):
+        entry = ScanEntry.__new__(ScanEntry)
+        for name in ScanEntry.__slots__:
+            setattr(entry, name, getattr(self, name))
+        return entry
+
+    def __repr__(self):
+        return "ScanEntry({}, {}, count={}, rssi={}/{:.1f}/{})".format(
+            self.addr_type,
+            ":".join("{:02X}".format(b) for b in reversed(self.addr)),
+            self.count,
+            self.rssi_min,
+            self.rssi_mean,
+            self.rssi_max,
+        )
+
+
+class ScanAggregator(object):
+    """Table of advertisers that decides which reports are passed on.
+
+    A report is passed on when its advertiser is new, when its advertising
+    or scan response data changed, and otherwise at most once every
+    report_interval seconds. With report_interval None, repeated reports
+    are never passed on. Every report updates the table, read it with
+    snapshot().
+
+    Advertisers not seen for max_age seconds are new when they come back,
+    expire() drops them from the table.
+    """
+
+    def __init__(self, report_interval=None, max_age=None, clock=time.monotonic):
+        self.report_interval = report_interval
+        self.max_age = max_age
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = dict()
+        self.received = 0
+        self.reported = 0
+
+    def update(self, addr_type, addr, scan_rsp, data, rssi):
+        """Record an advertising report, returns True to pass it on.
+
+        addr and data are bytes, so that the decision is made before a
+        report is decoded.
+        """
+        now = self.clock()
+        key = (addr_type, addr)
+        data_hash = hash(data)
+        with self._lock:
+            self.received += 1
+            entry = self._entries.get(key)
+            if entry is None or (
+                self.max_age is not None and now - entry.last_seen > self.max_age
+            ):
+                entry = ScanEntry(addr_type, addr, now, rssi)
+                self._entries[key] = entry
+            entry.last_seen = now
+            entry.count += 1
+            entry.rssi = rssi
+            entry.rssi_sum += rssi
+            if rssi < entry.rssi_min:
+                entry.rssi_min = rssi
+            elif rssi > entry.rssi_max:
+                entry.rssi_max = rssi
+
+            if scan_rsp:
+                changed = entry.scan_rsp_hash != data_hash
+                entry.scan_rsp_hash = data_hash
+            else:
+                changed = entry.adv_hash != data_hash
+                entry.adv_hash = data_hash
+
+            if not changed and (
+                self.report_interval is None
+                or now - entry.last_reported < self.report_interval
+            ):
+                return False
+            entry.last_reported = now
+            self.reported += 1
+            return True
+
+    def snapshot(self, since=None):
+        """Copies of the entries, only those seen at or after since if given."""
+        with self._lock:
+            return [
+                entry.copy()
+                for entry in self._entries.values()
+                if since is None or entry.last_seen >= since
+            ]
+
+    def expire(self, max_age=None):
+        """Drop advertisers not seen for max_age seconds, returns how many."""
+        max_age = self.max_age if max_age is None else max_age
+        if max_age is None:
+            return 0
+        deadline = self.clock() - max_age
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.last_seen < deadline]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries = dict()
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                advertisers=len(self._entries),
+                received=self.received,
+                reported=self.reported,
+            )
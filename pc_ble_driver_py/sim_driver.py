@@ -0,0 +1,3190 @@
+#
+# Copyright (c) 2016 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""
+Simulated SoftDevice API v5 connectivity.
+
+Stands in for the nrf_ble_driver_sd_api_v5 bindings when
+config.__driver_backend__ is "sim". All adapters created in the process share
+one VirtualRadio that links them with a connection event based model of the
+link layer. Latency, connection interval, ATT MTU and packet loss are set with
+radio.configure().
+"""
+
+import collections
+import copy
+import hashlib
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+NRF_SUCCESS = 0
+NRF_ERROR_SVC_HANDLER_MISSING = 1
+NRF_ERROR_SOFTDEVICE_NOT_ENABLED = 2
+NRF_ERROR_INTERNAL = 3
+NRF_ERROR_NO_MEM = 4
+NRF_ERROR_NOT_FOUND = 5
+NRF_ERROR_NOT_SUPPORTED = 6
+NRF_ERROR_INVALID_PARAM = 7
+NRF_ERROR_INVALID_STATE = 8
+NRF_ERROR_INVALID_LENGTH = 9
+NRF_ERROR_INVALID_FLAGS = 10
+NRF_ERROR_INVALID_DATA = 11
+NRF_ERROR_DATA_SIZE = 12
+NRF_ERROR_TIMEOUT = 13
+NRF_ERROR_NULL = 14
+NRF_ERROR_FORBIDDEN = 15
+NRF_ERROR_INVALID_ADDR = 16
+NRF_ERROR_BUSY = 17
+NRF_ERROR_CONN_COUNT = 18
+NRF_ERROR_RESOURCES = 19
+
+BLE_ERROR_NOT_ENABLED = 0x3001
+BLE_ERROR_INVALID_CONN_HANDLE = 0x3002
+BLE_ERROR_INVALID_ATTR_HANDLE = 0x3003
+BLE_ERROR_INVALID_ROLE = 0x3004
+BLE_ERROR_GATTS_INVALID_ATTR_TYPE = 0x3400
+BLE_ERROR_GATTS_SYS_ATTR_MISSING = 0x3401
+
+BLE_GAP_EVT_CONNECTED = 0x10
+BLE_GAP_EVT_DISCONNECTED = 0x11
+BLE_GAP_EVT_CONN_PARAM_UPDATE = 0x12
+BLE_GAP_EVT_SEC_PARAMS_REQUEST = 0x13
+BLE_GAP_EVT_SEC_INFO_REQUEST = 0x14
+BLE_GAP_EVT_PASSKEY_DISPLAY = 0x15
+BLE_GAP_EVT_KEY_PRESSED = 0x16
+BLE_GAP_EVT_AUTH_KEY_REQUEST = 0x17
+BLE_GAP_EVT_LESC_DHKEY_REQUEST = 0x18
+BLE_GAP_EVT_AUTH_STATUS = 0x19
+BLE_GAP_EVT_CONN_SEC_UPDATE = 0x1A
+BLE_GAP_EVT_TIMEOUT = 0x1B
+BLE_GAP_EVT_RSSI_CHANGED = 0x1C
+BLE_GAP_EVT_ADV_REPORT = 0x1D
+BLE_GAP_EVT_SEC_REQUEST = 0x1E
+BLE_GAP_EVT_CONN_PARAM_UPDATE_REQUEST = 0x1F
+BLE_GAP_EVT_SCAN_REQ_REPORT = 0x20
+BLE_GAP_EVT_PHY_UPDATE_REQUEST = 0x21
+BLE_GAP_EVT_PHY_UPDATE = 0x22
+BLE_GAP_EVT_DATA_LENGTH_UPDATE_REQUEST = 0x23
+BLE_GAP_EVT_DATA_LENGTH_UPDATE = 0x24
+
+BLE_GATTC_EVT_PRIM_SRVC_DISC_RSP = 0x30
+BLE_GATTC_EVT_REL_DISC_RSP = 0x31
+BLE_GATTC_EVT_CHAR_DISC_RSP = 0x32
+BLE_GATTC_EVT_DESC_DISC_RSP = 0x33
+BLE_GATTC_EVT_ATTR_INFO_DISC_RSP = 0x34
+BLE_GATTC_EVT_CHAR_VAL_BY_UUID_READ_RSP = 0x35
+BLE_GATTC_EVT_READ_RSP = 0x36
+BLE_GATTC_EVT_CHAR_VALS_READ_RSP = 0x37
+BLE_GATTC_EVT_WRITE_RSP = 0x38
+BLE_GATTC_EVT_HVX = 0x39
+BLE_GATTC_EVT_EXCHANGE_MTU_RSP = 0x3A
+BLE_GATTC_EVT_TIMEOUT = 0x3B
+BLE_GATTC_EVT_WRITE_CMD_TX_COMPLETE = 0x3C
+
+BLE_GATTS_EVT_WRITE = 0x50
+BLE_GATTS_EVT_RW_AUTHORIZE_REQUEST = 0x51
+BLE_GATTS_EVT_SYS_ATTR_MISSING = 0x52
+BLE_GATTS_EVT_HVC = 0x53
+BLE_GATTS_EVT_SC_CONFIRM = 0x54
+BLE_GATTS_EVT_EXCHANGE_MTU_REQUEST = 0x55
+BLE_GATTS_EVT_TIMEOUT = 0x56
+BLE_GATTS_EVT_HVN_TX_COMPLETE = 0x57
+
+BLE_CONN_CFG_GAP = 0x20
+BLE_CONN_CFG_GATTC = 0x21
+BLE_CONN_CFG_GATTS = 0x22
+BLE_CONN_CFG_GATT = 0x23
+BLE_CONN_CFG_L2CAP = 0x24
+BLE_COMMON_CFG_VS_UUID = 0x01
+BLE_GAP_CFG_ROLE_COUNT = 0x40
+BLE_GAP_CFG_DEVICE_NAME = 0x41
+BLE_GATTS_CFG_SERVICE_CHANGED = 0xA0
+BLE_GATTS_CFG_ATTR_TAB_SIZE = 0xA1
+
+BLE_CONN_CFG_TAG_DEFAULT = 0
+BLE_CONN_HANDLE_INVALID = 0xFFFF
+BLE_GAP_CONN_COUNT_DEFAULT = 1
+BLE_GAP_EVENT_LENGTH_DEFAULT = 3
+BLE_GAP_ROLE_COUNT_PERIPH_DEFAULT = 1
+BLE_GAP_ROLE_COUNT_CENTRAL_DEFAULT = 3
+BLE_GAP_ROLE_COUNT_CENTRAL_SEC_DEFAULT = 1
+BLE_GATTC_WRITE_CMD_TX_QUEUE_SIZE_DEFAULT = 1
+BLE_GATTS_HVN_TX_QUEUE_SIZE_DEFAULT = 1
+BLE_GATTS_ATTR_TAB_SIZE_DEFAULT = 1408
+BLE_UUID_VS_COUNT_DEFAULT = 10
+BLE_GAP_DEVNAME_DEFAULT = "nRF5x"
+
+BLE_GAP_ADDR_LEN = 6
+BLE_GAP_ADDR_TYPE_PUBLIC = 0x00
+BLE_GAP_ADDR_TYPE_RANDOM_STATIC = 0x01
+BLE_GAP_ADDR_TYPE_RANDOM_PRIVATE_RESOLVABLE = 0x02
+BLE_GAP_ADDR_TYPE_RANDOM_PRIVATE_NON_RESOLVABLE = 0x03
+
+BLE_GAP_ADV_TYPE_ADV_IND = 0x00
+BLE_GAP_ADV_TYPE_ADV_DIRECT_IND = 0x01
+BLE_GAP_ADV_TYPE_ADV_SCAN_IND = 0x02
+BLE_GAP_ADV_TYPE_ADV_NONCONN_IND = 0x03
+BLE_GAP_ADV_FP_ANY = 0x00
+BLE_GAP_ADV_FP_FILTER_SCANREQ = 0x01
+BLE_GAP_ADV_FP_FILTER_CONNREQ = 0x02
+BLE_GAP_ADV_FP_FILTER_BOTH = 0x03
+BLE_GAP_ADV_INTERVAL_MIN = 0x0020
+BLE_GAP_ADV_INTERVAL_MAX = 0x4000
+BLE_GAP_ADV_MAX_SIZE = 31
+
+BLE_GAP_ROLE_INVALID = 0x0
+BLE_GAP_ROLE_PERIPH = 0x1
+BLE_GAP_ROLE_CENTRAL = 0x2
+
+BLE_GAP_TIMEOUT_SRC_ADVERTISING = 0x00
+BLE_GAP_TIMEOUT_SRC_SCAN = 0x01
+BLE_GAP_TIMEOUT_SRC_CONN = 0x02
+BLE_GAP_TIMEOUT_SRC_AUTH_PAYLOAD = 0x03
+
+BLE_GAP_IO_CAPS_DISPLAY_ONLY = 0x00
+BLE_GAP_IO_CAPS_DISPLAY_YESNO = 0x01
+BLE_GAP_IO_CAPS_KEYBOARD_ONLY = 0x02
+BLE_GAP_IO_CAPS_NONE = 0x03
+BLE_GAP_IO_CAPS_KEYBOARD_DISPLAY = 0x04
+
+BLE_GAP_AUTH_KEY_TYPE_NONE = 0x00
+BLE_GAP_AUTH_KEY_TYPE_PASSKEY = 0x01
+BLE_GAP_AUTH_KEY_TYPE_OOB = 0x02
+BLE_GAP_PASSKEY_LEN = 6
+BLE_GAP_SEC_KEY_LEN = 16
+BLE_GAP_SEC_RAND_LEN = 8
+BLE_GAP_LESC_P256_PK_LEN = 64
+BLE_GAP_LESC_DHKEY_LEN = 32
+
+BLE_GAP_SEC_STATUS_SUCCESS = 0x00
+BLE_GAP_SEC_STATUS_TIMEOUT = 0x01
+BLE_GAP_SEC_STATUS_PDU_INVALID = 0x02
+BLE_GAP_SEC_STATUS_RFU_RANGE1_BEGIN = 0x03
+BLE_GAP_SEC_STATUS_RFU_RANGE1_END = 0x80
+BLE_GAP_SEC_STATUS_PASSKEY_ENTRY_FAILED = 0x81
+BLE_GAP_SEC_STATUS_OOB_NOT_AVAILABLE = 0x82
+BLE_GAP_SEC_STATUS_AUTH_REQ = 0x83
+BLE_GAP_SEC_STATUS_CONFIRM_VALUE = 0x84
+BLE_GAP_SEC_STATUS_PAIRING_NOT_SUPP = 0x85
+BLE_GAP_SEC_STATUS_ENC_KEY_SIZE = 0x86
+BLE_GAP_SEC_STATUS_SMP_CMD_UNSUPPORTED = 0x87
+BLE_GAP_SEC_STATUS_UNSPECIFIED = 0x88
+BLE_GAP_SEC_STATUS_REPEATED_ATTEMPTS = 0x89
+BLE_GAP_SEC_STATUS_INVALID_PARAMS = 0x8A
+BLE_GAP_SEC_STATUS_DHKEY_FAILURE = 0x8B
+BLE_GAP_SEC_STATUS_NUM_COMP_FAILURE = 0x8C
+BLE_GAP_SEC_STATUS_BR_EDR_IN_PROG = 0x8D
+BLE_GAP_SEC_STATUS_X_TRANS_KEY_DISALLOWED = 0x8E
+BLE_GAP_SEC_STATUS_RFU_RANGE2_BEGIN = 0x8F
+BLE_GAP_SEC_STATUS_RFU_RANGE2_END = 0xFF
+BLE_GAP_SEC_STATUS_SOURCE_LOCAL = 0x00
+BLE_GAP_SEC_STATUS_SOURCE_REMOTE = 0x01
+
+BLE_GAP_PHY_AUTO = 0x00
+BLE_GAP_PHY_1MBPS = 0x01
+BLE_GAP_PHY_2MBPS = 0x02
+BLE_GAP_PHY_CODED = 0x04
+BLE_GAP_DATA_LENGTH_AUTO = 0
+
+BLE_GAP_AD_TYPE_FLAGS = 0x01
+BLE_GAP_AD_TYPE_16BIT_SERVICE_UUID_MORE_AVAILABLE = 0x02
+BLE_GAP_AD_TYPE_16BIT_SERVICE_UUID_COMPLETE = 0x03
+BLE_GAP_AD_TYPE_32BIT_SERVICE_UUID_MORE_AVAILABLE = 0x04
+BLE_GAP_AD_TYPE_32BIT_SERVICE_UUID_COMPLETE = 0x05
+BLE_GAP_AD_TYPE_128BIT_SERVICE_UUID_MORE_AVAILABLE = 0x06
+BLE_GAP_AD_TYPE_128BIT_SERVICE_UUID_COMPLETE = 0x07
+BLE_GAP_AD_TYPE_SHORT_LOCAL_NAME = 0x08
+BLE_GAP_AD_TYPE_COMPLETE_LOCAL_NAME = 0x09
+BLE_GAP_AD_TYPE_TX_POWER_LEVEL = 0x0A
+BLE_GAP_AD_TYPE_CLASS_OF_DEVICE = 0x0D
+BLE_GAP_AD_TYPE_SIMPLE_PAIRING_HASH_C = 0x0E
+BLE_GAP_AD_TYPE_SIMPLE_PAIRING_RANDOMIZER_R = 0x0F
+BLE_GAP_AD_TYPE_SECURITY_MANAGER_TK_VALUE = 0x10
+BLE_GAP_AD_TYPE_SECURITY_MANAGER_OOB_FLAGS = 0x11
+BLE_GAP_AD_TYPE_SLAVE_CONNECTION_INTERVAL_RANGE = 0x12
+BLE_GAP_AD_TYPE_SOLICITED_SERVICE_UUIDS_16BIT = 0x14
+BLE_GAP_AD_TYPE_SOLICITED_SERVICE_UUIDS_128BIT = 0x15
+BLE_GAP_AD_TYPE_SERVICE_DATA = 0x16
+BLE_GAP_AD_TYPE_PUBLIC_TARGET_ADDRESS = 0x17
+BLE_GAP_AD_TYPE_RANDOM_TARGET_ADDRESS = 0x18
+BLE_GAP_AD_TYPE_APPEARANCE = 0x19
+BLE_GAP_AD_TYPE_ADVERTISING_INTERVAL = 0x1A
+BLE_GAP_AD_TYPE_LE_BLUETOOTH_DEVICE_ADDRESS = 0x1B
+BLE_GAP_AD_TYPE_LE_ROLE = 0x1C
+BLE_GAP_AD_TYPE_SIMPLE_PAIRING_HASH_C256 = 0x1D
+BLE_GAP_AD_TYPE_SIMPLE_PAIRING_RANDOMIZER_R256 = 0x1E
+BLE_GAP_AD_TYPE_SERVICE_DATA_32BIT_UUID = 0x20
+BLE_GAP_AD_TYPE_SERVICE_DATA_128BIT_UUID = 0x21
+BLE_GAP_AD_TYPE_URI = 0x24
+BLE_GAP_AD_TYPE_3D_INFORMATION_DATA = 0x3D
+BLE_GAP_AD_TYPE_MANUFACTURER_SPECIFIC_DATA = 0xFF
+
+BLE_GATT_ATT_MTU_DEFAULT = 23
+BLE_GATT_HANDLE_INVALID = 0x0000
+BLE_GATT_HANDLE_START = 0x0001
+BLE_GATT_HANDLE_END = 0xFFFF
+
+BLE_GATT_OP_INVALID = 0x00
+BLE_GATT_OP_WRITE_REQ = 0x01
+BLE_GATT_OP_WRITE_CMD = 0x02
+BLE_GATT_OP_SIGN_WRITE_CMD = 0x03
+BLE_GATT_OP_PREP_WRITE_REQ = 0x04
+BLE_GATT_OP_EXEC_WRITE_REQ = 0x05
+BLE_GATT_EXEC_WRITE_FLAG_PREPARED_CANCEL = 0x00
+BLE_GATT_EXEC_WRITE_FLAG_PREPARED_WRITE = 0x01
+
+BLE_GATT_HVX_INVALID = 0x00
+BLE_GATT_HVX_NOTIFICATION = 0x01
+BLE_GATT_HVX_INDICATION = 0x02
+
+BLE_GATT_STATUS_SUCCESS = 0x0000
+BLE_GATT_STATUS_UNKNOWN = 0x0001
+BLE_GATT_STATUS_ATTERR_INVALID = 0x0100
+BLE_GATT_STATUS_ATTERR_INVALID_HANDLE = 0x0101
+BLE_GATT_STATUS_ATTERR_READ_NOT_PERMITTED = 0x0102
+BLE_GATT_STATUS_ATTERR_WRITE_NOT_PERMITTED = 0x0103
+BLE_GATT_STATUS_ATTERR_INVALID_PDU = 0x0104
+BLE_GATT_STATUS_ATTERR_INSUF_AUTHENTICATION = 0x0105
+BLE_GATT_STATUS_ATTERR_REQUEST_NOT_SUPPORTED = 0x0106
+BLE_GATT_STATUS_ATTERR_INVALID_OFFSET = 0x0107
+BLE_GATT_STATUS_ATTERR_INSUF_AUTHORIZATION = 0x0108
+BLE_GATT_STATUS_ATTERR_PREPARE_QUEUE_FULL = 0x0109
+BLE_GATT_STATUS_ATTERR_ATTRIBUTE_NOT_FOUND = 0x010A
+BLE_GATT_STATUS_ATTERR_ATTRIBUTE_NOT_LONG = 0x010B
+BLE_GATT_STATUS_ATTERR_INSUF_ENC_KEY_SIZE = 0x010C
+BLE_GATT_STATUS_ATTERR_INVALID_ATT_VAL_LENGTH = 0x010D
+BLE_GATT_STATUS_ATTERR_UNLIKELY_ERROR = 0x010E
+BLE_GATT_STATUS_ATTERR_INSUF_ENCRYPTION = 0x010F
+BLE_GATT_STATUS_ATTERR_UNSUPPORTED_GROUP_TYPE = 0x0110
+BLE_GATT_STATUS_ATTERR_INSUF_RESOURCES = 0x0111
+BLE_GATT_STATUS_ATTERR_RFU_RANGE1_BEGIN = 0x0112
+BLE_GATT_STATUS_ATTERR_RFU_RANGE1_END = 0x017F
+BLE_GATT_STATUS_ATTERR_APP_BEGIN = 0x0180
+BLE_GATT_STATUS_ATTERR_APP_END = 0x019F
+BLE_GATT_STATUS_ATTERR_RFU_RANGE2_BEGIN = 0x01A0
+BLE_GATT_STATUS_ATTERR_RFU_RANGE2_END = 0x01DF
+BLE_GATT_STATUS_ATTERR_RFU_RANGE3_BEGIN = 0x01E0
+BLE_GATT_STATUS_ATTERR_RFU_RANGE3_END = 0x01FC
+BLE_GATT_STATUS_ATTERR_CPS_CCCD_CONFIG_ERROR = 0x01FD
+BLE_GATT_STATUS_ATTERR_CPS_PROC_ALR_IN_PROG = 0x01FE
+BLE_GATT_STATUS_ATTERR_CPS_OUT_OF_RANGE = 0x01FF
+
+BLE_GATTS_SRVC_TYPE_INVALID = 0x00
+BLE_GATTS_SRVC_TYPE_PRIMARY = 0x01
+BLE_GATTS_SRVC_TYPE_SECONDARY = 0x02
+BLE_GATTS_VLOC_INVALID = 0x00
+BLE_GATTS_VLOC_STACK = 0x01
+BLE_GATTS_VLOC_USER = 0x02
+BLE_GATTS_OP_INVALID = 0x00
+BLE_GATTS_OP_WRITE_REQ = 0x01
+BLE_GATTS_OP_WRITE_CMD = 0x02
+BLE_GATTS_OP_SIGN_WRITE_CMD = 0x03
+BLE_GATTS_OP_PREP_WRITE_REQ = 0x04
+BLE_GATTS_OP_EXEC_WRITE_REQ_CANCEL = 0x05
+BLE_GATTS_OP_EXEC_WRITE_REQ_NOW = 0x06
+
+BLE_UUID_TYPE_UNKNOWN = 0x00
+BLE_UUID_TYPE_BLE = 0x01
+BLE_UUID_TYPE_VENDOR_BEGIN = 0x02
+BLE_UUID_SERVICE_PRIMARY = 0x2800
+BLE_UUID_SERVICE_SECONDARY = 0x2801
+BLE_UUID_CHARACTERISTIC = 0x2803
+BLE_UUID_DESCRIPTOR_CHAR_USER_DESC = 0x2901
+BLE_UUID_DESCRIPTOR_CLIENT_CHAR_CONFIG = 0x2902
+BLE_UUID_GAP = 0x1800
+BLE_UUID_GATT = 0x1801
+BLE_UUID_GAP_CHARACTERISTIC_DEVICE_NAME = 0x2A00
+BLE_UUID_GAP_CHARACTERISTIC_APPEARANCE = 0x2A01
+BLE_UUID_GAP_CHARACTERISTIC_PPCP = 0x2A04
+BLE_UUID_GATT_CHARACTERISTIC_SERVICE_CHANGED = 0x2A05
+
+BLE_HCI_STATUS_CODE_SUCCESS = 0x00
+BLE_HCI_STATUS_CODE_UNKNOWN_BTLE_COMMAND = 0x01
+BLE_HCI_STATUS_CODE_UNKNOWN_CONNECTION_IDENTIFIER = 0x02
+BLE_HCI_AUTHENTICATION_FAILURE = 0x05
+BLE_HCI_STATUS_CODE_PIN_OR_KEY_MISSING = 0x06
+BLE_HCI_MEMORY_CAPACITY_EXCEEDED = 0x07
+BLE_HCI_CONNECTION_TIMEOUT = 0x08
+BLE_HCI_STATUS_CODE_COMMAND_DISALLOWED = 0x0C
+BLE_HCI_STATUS_CODE_INVALID_BTLE_COMMAND_PARAMETERS = 0x12
+BLE_HCI_REMOTE_USER_TERMINATED_CONNECTION = 0x13
+BLE_HCI_REMOTE_DEV_TERMINATION_DUE_TO_LOW_RESOURCES = 0x14
+BLE_HCI_REMOTE_DEV_TERMINATION_DUE_TO_POWER_OFF = 0x15
+BLE_HCI_LOCAL_HOST_TERMINATED_CONNECTION = 0x16
+BLE_HCI_UNSUPPORTED_REMOTE_FEATURE = 0x1A
+BLE_HCI_STATUS_CODE_INVALID_LMP_PARAMETERS = 0x1E
+BLE_HCI_STATUS_CODE_UNSPECIFIED_ERROR = 0x1F
+BLE_HCI_STATUS_CODE_LMP_RESPONSE_TIMEOUT = 0x22
+BLE_HCI_STATUS_CODE_LMP_PDU_NOT_ALLOWED = 0x24
+BLE_HCI_INSTANT_PASSED = 0x28
+BLE_HCI_PAIRING_WITH_UNIT_KEY_UNSUPPORTED = 0x29
+BLE_HCI_DIFFERENT_TRANSACTION_COLLISION = 0x2A
+BLE_HCI_CONTROLLER_BUSY = 0x3A
+BLE_HCI_CONN_INTERVAL_UNACCEPTABLE = 0x3B
+BLE_HCI_DIRECTED_ADVERTISER_TIMEOUT = 0x3C
+BLE_HCI_CONN_TERMINATED_DUE_TO_MIC_FAILURE = 0x3D
+BLE_HCI_CONN_FAILED_TO_BE_ESTABLISHED = 0x3E
+
+SD_RPC_FLOW_CONTROL_NONE = 0
+SD_RPC_FLOW_CONTROL_HARDWARE = 1
+SD_RPC_PARITY_NONE = 0
+SD_RPC_PARITY_EVEN = 1
+SD_RPC_LOG_TRACE = 0
+SD_RPC_LOG_DEBUG = 1
+SD_RPC_LOG_INFO = 2
+SD_RPC_LOG_WARNING = 3
+SD_RPC_LOG_ERROR = 4
+SD_RPC_LOG_FATAL = 5
+SD_RPC_MAXPATHLEN = 512
+
+PKT_SEND_MAX_RETRIES_REACHED = 0
+PKT_UNEXPECTED = 1
+PKT_ENCODE_ERROR = 2
+PKT_DECODE_ERROR = 3
+PKT_SEND_ERROR = 4
+IO_RESOURCES_UNAVAILABLE = 5
+RESET_PERFORMED = 6
+CONNECTION_ACTIVE = 7
+
+# Values reported by sd_ble_version_get, s132 5.1.0
+_VERSION_NUMBER = 9
+_COMPANY_ID = 0x0059
+_SUBVERSION_NUMBER = 0xA5
+
+
+class uint8_array(bytearray):
+    def __init__(self, nelements=0):
+        super(uint8_array, self).__init__(nelements)
+
+    def cast(self):
+        return self
+
+    @staticmethod
+    def frompointer(pointer):
+        return pointer
+
+
+class _Array(list):
+    _default = 0
+
+    def __init__(self, nelements=0):
+        super(_Array, self).__init__(
+            self._default() if callable(self._default) else self._default
+            for _ in range(nelements)
+        )
+
+    def cast(self):
+        return self
+
+    @staticmethod
+    def frompointer(pointer):
+        return pointer
+
+
+class uint16_array(_Array):
+    pass
+
+
+class uint32_array(_Array):
+    pass
+
+
+class char_array(_Array):
+    _default = "\0"
+
+
+def uint8_array_to_bytes(array_pointer, length):
+    if array_pointer is None:
+        return b""
+    return bytes(array_pointer[:length])
+
+
+def uint8_array_memmove(data, dest):
+    data = memoryview(data).cast("B")
+    dest[: len(data)] = data
+
+
+def _bytes(array_pointer, length=None):
+    """Copy of application memory taken at call time, as the serialization does."""
+    if array_pointer is None:
+        return b""
+    if length is None:
+        return bytes(array_pointer)
+    return bytes(array_pointer[:length])
+
+
+def _array(data):
+    array = uint8_array(len(data))
+    array[:] = data
+    return array
+
+
+class _Pointer(object):
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+
+def _pointer_functions():
+    def new():
+        return _Pointer()
+
+    def assign(pointer, value):
+        pointer.value = value
+
+    def value(pointer):
+        return pointer.value
+
+    def delete(pointer):
+        pass
+
+    return new, assign, value, delete
+
+
+new_uint8, uint8_assign, uint8_value, delete_uint8 = _pointer_functions()
+new_uint16, uint16_assign, uint16_value, delete_uint16 = _pointer_functions()
+new_uint32, uint32_assign, uint32_value, delete_uint32 = _pointer_functions()
+
+
+class _Struct(object):
+    """Zero initialised stand-in for a SWIG struct proxy."""
+
+    _fields = ()
+
+    def __init__(self):
+        for name, default in self._fields:
+            setattr(self, name, default() if callable(default) else default)
+
+    def __repr__(self):
+        return "{}({})".format(
+            type(self).__name__,
+            ", ".join("{}={!r}".format(k, v) for k, v in sorted(self.__dict__.items())),
+        )
+
+
+def _struct(name, *fields):
+    return type(name, (_Struct,), {"_fields": fields, "__module__": __name__})
+
+
+def _u8(length):
+    return lambda: uint8_array(length)
+
+
+ble_version_t = _struct(
+    "ble_version_t", ("version_number", 0), ("company_id", 0), ("subversion_number", 0)
+)
+ble_uuid_t = _struct("ble_uuid_t", ("uuid", 0), ("type", BLE_UUID_TYPE_UNKNOWN))
+ble_uuid128_t = _struct("ble_uuid128_t", ("uuid128", _u8(16)))
+
+ble_gap_addr_t = _struct(
+    "ble_gap_addr_t",
+    ("addr_id_peer", 0),
+    ("addr_type", 0),
+    ("addr", _u8(BLE_GAP_ADDR_LEN)),
+)
+ble_gap_conn_params_t = _struct(
+    "ble_gap_conn_params_t",
+    ("min_conn_interval", 0),
+    ("max_conn_interval", 0),
+    ("slave_latency", 0),
+    ("conn_sup_timeout", 0),
+)
+ble_gap_conn_sec_mode_t = _struct("ble_gap_conn_sec_mode_t", ("sm", 0), ("lv", 0))
+ble_gap_conn_sec_t = _struct(
+    "ble_gap_conn_sec_t", ("sec_mode", ble_gap_conn_sec_mode_t), ("encr_key_size", 0)
+)
+ble_gap_adv_params_t = _struct(
+    "ble_gap_adv_params_t",
+    ("type", 0),
+    ("p_peer_addr", None),
+    ("fp", 0),
+    ("p_whitelist", None),
+    ("interval", 0),
+    ("timeout", 0),
+)
+ble_gap_scan_params_t = _struct(
+    "ble_gap_scan_params_t",
+    ("active", 0),
+    ("selective", 0),
+    ("p_whitelist", None),
+    ("interval", 0),
+    ("window", 0),
+    ("timeout", 0),
+)
+ble_gap_privacy_params_t = _struct(
+    "ble_gap_privacy_params_t",
+    ("privacy_mode", 0),
+    ("private_addr_type", 0),
+    ("private_addr_cycle_s", 0),
+    ("p_device_irk", None),
+)
+ble_gap_phys_t = _struct("ble_gap_phys_t", ("tx_phys", 0), ("rx_phys", 0))
+ble_gap_data_length_params_t = _struct(
+    "ble_gap_data_length_params_t",
+    ("max_tx_octets", 0),
+    ("max_rx_octets", 0),
+    ("max_tx_time_us", 0),
+    ("max_rx_time_us", 0),
+)
+ble_gap_data_length_limitation_t = _struct(
+    "ble_gap_data_length_limitation_t",
+    ("tx_payload_limited_octets", 0),
+    ("rx_payload_limited_octets", 0),
+    ("tx_rx_time_limited_us", 0),
+)
+
+ble_gap_irk_t = _struct("ble_gap_irk_t", ("irk", _u8(BLE_GAP_SEC_KEY_LEN)))
+ble_gap_id_key_t = _struct(
+    "ble_gap_id_key_t", ("id_info", ble_gap_irk_t), ("id_addr_info", ble_gap_addr_t)
+)
+ble_gap_enc_info_t = _struct(
+    "ble_gap_enc_info_t",
+    ("ltk", _u8(BLE_GAP_SEC_KEY_LEN)),
+    ("lesc", 0),
+    ("auth", 0),
+    ("ltk_len", 0),
+)
+ble_gap_master_id_t = _struct(
+    "ble_gap_master_id_t", ("ediv", 0), ("rand", _u8(BLE_GAP_SEC_RAND_LEN))
+)
+ble_gap_enc_key_t = _struct(
+    "ble_gap_enc_key_t",
+    ("enc_info", ble_gap_enc_info_t),
+    ("master_id", ble_gap_master_id_t),
+)
+ble_gap_sign_info_t = _struct("ble_gap_sign_info_t", ("csrk", _u8(BLE_GAP_SEC_KEY_LEN)))
+ble_gap_lesc_p256_pk_t = _struct(
+    "ble_gap_lesc_p256_pk_t", ("pk", _u8(BLE_GAP_LESC_P256_PK_LEN))
+)
+ble_gap_lesc_dhkey_t = _struct("ble_gap_lesc_dhkey_t", ("key", _u8(BLE_GAP_LESC_DHKEY_LEN)))
+ble_gap_sec_keys_t = _struct(
+    "ble_gap_sec_keys_t",
+    ("p_enc_key", None),
+    ("p_id_key", None),
+    ("p_sign_key", None),
+    ("p_pk", None),
+)
+ble_gap_sec_keyset_t = _struct(
+    "ble_gap_sec_keyset_t",
+    ("keys_own", ble_gap_sec_keys_t),
+    ("keys_peer", ble_gap_sec_keys_t),
+)
+ble_gap_sec_kdist_t = _struct(
+    "ble_gap_sec_kdist_t", ("enc", 0), ("id", 0), ("sign", 0), ("link", 0)
+)
+ble_gap_sec_levels_t = _struct(
+    "ble_gap_sec_levels_t", ("lv1", 0), ("lv2", 0), ("lv3", 0), ("lv4", 0)
+)
+ble_gap_sec_params_t = _struct(
+    "ble_gap_sec_params_t",
+    ("bond", 0),
+    ("mitm", 0),
+    ("lesc", 0),
+    ("keypress", 0),
+    ("io_caps", 0),
+    ("oob", 0),
+    ("min_key_size", 0),
+    ("max_key_size", 0),
+    ("kdist_own", ble_gap_sec_kdist_t),
+    ("kdist_peer", ble_gap_sec_kdist_t),
+)
+
+ble_gatt_char_props_t = _struct(
+    "ble_gatt_char_props_t",
+    ("broadcast", 0),
+    ("read", 0),
+    ("write_wo_resp", 0),
+    ("write", 0),
+    ("notify", 0),
+    ("indicate", 0),
+    ("auth_signed_wr", 0),
+)
+ble_gatt_char_ext_props_t = _struct(
+    "ble_gatt_char_ext_props_t", ("reliable_wr", 0), ("wr_aux", 0)
+)
+ble_gattc_handle_range_t = _struct(
+    "ble_gattc_handle_range_t", ("start_handle", 0), ("end_handle", 0)
+)
+ble_gattc_service_t = _struct(
+    "ble_gattc_service_t", ("uuid", ble_uuid_t), ("handle_range", ble_gattc_handle_range_t)
+)
+ble_gattc_char_t = _struct(
+    "ble_gattc_char_t",
+    ("uuid", ble_uuid_t),
+    ("char_props", ble_gatt_char_props_t),
+    ("char_ext_props", 0),
+    ("handle_decl", 0),
+    ("handle_value", 0),
+)
+ble_gattc_desc_t = _struct("ble_gattc_desc_t", ("handle", 0), ("uuid", ble_uuid_t))
+ble_gattc_include_t = _struct(
+    "ble_gattc_include_t", ("handle", 0), ("included_srvc", ble_gattc_service_t)
+)
+ble_gattc_handle_value_t = _struct(
+    "ble_gattc_handle_value_t", ("handle", 0), ("p_value", None)
+)
+ble_gattc_attr_info_t = _struct("ble_gattc_attr_info_t", ("handle", 0), ("info", None))
+ble_gattc_attr_info16_t = _struct(
+    "ble_gattc_attr_info16_t", ("handle", 0), ("uuid", ble_uuid_t)
+)
+ble_gattc_attr_info128_t = _struct(
+    "ble_gattc_attr_info128_t", ("handle", 0), ("uuid", ble_uuid128_t)
+)
+ble_gattc_write_params_t = _struct(
+    "ble_gattc_write_params_t",
+    ("write_op", 0),
+    ("flags", 0),
+    ("handle", 0),
+    ("offset", 0),
+    ("len", 0),
+    ("p_value", None),
+)
+
+ble_gatts_attr_md_t = _struct(
+    "ble_gatts_attr_md_t",
+    ("read_perm", ble_gap_conn_sec_mode_t),
+    ("write_perm", ble_gap_conn_sec_mode_t),
+    ("vlen", 0),
+    ("vloc", 0),
+    ("rd_auth", 0),
+    ("wr_auth", 0),
+)
+ble_gatts_attr_t = _struct(
+    "ble_gatts_attr_t",
+    ("p_uuid", None),
+    ("p_attr_md", None),
+    ("init_len", 0),
+    ("init_offs", 0),
+    ("max_len", 0),
+    ("p_value", None),
+)
+ble_gatts_char_md_t = _struct(
+    "ble_gatts_char_md_t",
+    ("char_props", ble_gatt_char_props_t),
+    ("char_ext_props", ble_gatt_char_ext_props_t),
+    ("p_char_user_desc", None),
+    ("char_user_desc_max_size", 0),
+    ("char_user_desc_size", 0),
+    ("p_char_pf", None),
+    ("p_user_desc_md", None),
+    ("p_cccd_md", None),
+    ("p_sccd_md", None),
+)
+ble_gatts_char_handles_t = _struct(
+    "ble_gatts_char_handles_t",
+    ("value_handle", 0),
+    ("user_desc_handle", 0),
+    ("cccd_handle", 0),
+    ("sccd_handle", 0),
+)
+ble_gatts_hvx_params_t = _struct(
+    "ble_gatts_hvx_params_t",
+    ("handle", 0),
+    ("type", 0),
+    ("offset", 0),
+    ("p_len", None),
+    ("p_data", None),
+)
+
+ble_gap_conn_cfg_t = _struct("ble_gap_conn_cfg_t", ("conn_count", 0), ("event_length", 0))
+ble_gattc_conn_cfg_t = _struct("ble_gattc_conn_cfg_t", ("write_cmd_tx_queue_size", 0))
+ble_gatts_conn_cfg_t = _struct("ble_gatts_conn_cfg_t", ("hvn_tx_queue_size", 0))
+ble_gatt_conn_cfg_t = _struct("ble_gatt_conn_cfg_t", ("att_mtu", 0))
+ble_l2cap_conn_cfg_t = _struct(
+    "ble_l2cap_conn_cfg_t",
+    ("rx_mps", 0),
+    ("tx_mps", 0),
+    ("rx_queue_size", 0),
+    ("tx_queue_size", 0),
+    ("ch_count", 0),
+)
+_ble_conn_cfg_params_t = _struct(
+    "_ble_conn_cfg_params_t",
+    ("gap_conn_cfg", ble_gap_conn_cfg_t),
+    ("gattc_conn_cfg", ble_gattc_conn_cfg_t),
+    ("gatts_conn_cfg", ble_gatts_conn_cfg_t),
+    ("gatt_conn_cfg", ble_gatt_conn_cfg_t),
+    ("l2cap_conn_cfg", ble_l2cap_conn_cfg_t),
+)
+ble_conn_cfg_t = _struct(
+    "ble_conn_cfg_t", ("conn_cfg_tag", 0), ("params", _ble_conn_cfg_params_t)
+)
+ble_common_cfg_vs_uuid_t = _struct("ble_common_cfg_vs_uuid_t", ("vs_uuid_count", 0))
+ble_common_cfg_t = _struct("ble_common_cfg_t", ("vs_uuid_cfg", ble_common_cfg_vs_uuid_t))
+ble_gap_cfg_role_count_t = _struct(
+    "ble_gap_cfg_role_count_t",
+    ("periph_role_count", 0),
+    ("central_role_count", 0),
+    ("central_sec_count", 0),
+)
+ble_gap_cfg_device_name_t = _struct(
+    "ble_gap_cfg_device_name_t",
+    ("write_perm", ble_gap_conn_sec_mode_t),
+    ("vloc", 0),
+    ("p_value", None),
+    ("current_len", 0),
+    ("max_len", 0),
+)
+ble_gap_cfg_t = _struct(
+    "ble_gap_cfg_t",
+    ("role_count_cfg", ble_gap_cfg_role_count_t),
+    ("device_name_cfg", ble_gap_cfg_device_name_t),
+)
+ble_gatts_cfg_service_changed_t = _struct(
+    "ble_gatts_cfg_service_changed_t", ("service_changed", 0)
+)
+ble_gatts_cfg_attr_tab_size_t = _struct(
+    "ble_gatts_cfg_attr_tab_size_t", ("attr_tab_size", 0)
+)
+ble_gatts_cfg_t = _struct(
+    "ble_gatts_cfg_t",
+    ("service_changed", ble_gatts_cfg_service_changed_t),
+    ("attr_tab_size", ble_gatts_cfg_attr_tab_size_t),
+)
+ble_cfg_t = _struct(
+    "ble_cfg_t",
+    ("conn_cfg", ble_conn_cfg_t),
+    ("common_cfg", ble_common_cfg_t),
+    ("gap_cfg", ble_gap_cfg_t),
+    ("gatts_cfg", ble_gatts_cfg_t),
+)
+
+sd_rpc_serial_port_desc_t = _struct(
+    "sd_rpc_serial_port_desc_t",
+    ("port", ""),
+    ("manufacturer", ""),
+    ("serialNumber", ""),
+    ("pnpId", ""),
+    ("locationId", ""),
+    ("vendorId", ""),
+    ("productId", ""),
+)
+
+
+class ble_gattc_service_array(_Array):
+    _default = ble_gattc_service_t
+
+
+class ble_gattc_char_array(_Array):
+    _default = ble_gattc_char_t
+
+
+class ble_gattc_desc_array(_Array):
+    _default = ble_gattc_desc_t
+
+
+class ble_gattc_include_array(_Array):
+    _default = ble_gattc_include_t
+
+
+class ble_gattc_handle_value_array(_Array):
+    _default = ble_gattc_handle_value_t
+
+
+class ble_gattc_attr_info_array(_Array):
+    _default = ble_gattc_attr_info_t
+
+
+class ble_gattc_attr_info16_array(_Array):
+    _default = ble_gattc_attr_info16_t
+
+
+class ble_gattc_attr_info128_array(_Array):
+    _default = ble_gattc_attr_info128_t
+
+
+class sd_rpc_serial_port_desc_array(_Array):
+    _default = sd_rpc_serial_port_desc_t
+
+
+def new_ble_gap_data_length_limitation():
+    return ble_gap_data_length_limitation_t()
+
+
+def ble_gap_data_length_limitation_value(pointer):
+    return pointer
+
+
+def delete_ble_gap_data_length_limitation(pointer):
+    pass
+
+
+class _Record(object):
+    """Event member, holding whatever the decoders read from it."""
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def __repr__(self):
+        return "_Record({})".format(
+            ", ".join("{}={!r}".format(k, v) for k, v in sorted(self.__dict__.items()))
+        )
+
+
+ble_evt_hdr_t = _struct("ble_evt_hdr_t", ("evt_id", 0), ("evt_len", 0))
+
+
+class _ble_evt_union_t(object):
+    """The members of the ble_evt_t union alias one record, as they do in C."""
+
+    def __init__(self):
+        self._record = _Record(
+            conn_handle=BLE_CONN_HANDLE_INVALID,
+            gatt_status=BLE_GATT_STATUS_SUCCESS,
+            error_handle=BLE_GATT_HANDLE_INVALID,
+            params=_Record(),
+        )
+
+    @property
+    def common_evt(self):
+        return self._record
+
+    gap_evt = gattc_evt = gatts_evt = common_evt
+
+
+ble_evt_t = _struct("ble_evt_t", ("header", ble_evt_hdr_t), ("evt", _ble_evt_union_t))
+
+
+def _evt(evt_id, conn_handle, name=None, **params):
+    ble_evt = ble_evt_t()
+    ble_evt.header.evt_id = evt_id
+    ble_evt.evt.common_evt.conn_handle = conn_handle
+    if name is not None:
+        setattr(ble_evt.evt.common_evt.params, name, _Record(**params))
+    return ble_evt
+
+
+def _gattc_evt(evt_id, conn_handle, gatt_status, error_handle, name, **params):
+    ble_evt = _evt(evt_id, conn_handle, name, **params)
+    ble_evt.evt.gattc_evt.gatt_status = gatt_status
+    ble_evt.evt.gattc_evt.error_handle = error_handle
+    return ble_evt
+
+
+def _array_of(array_type, items):
+    array = array_type(0)
+    array.extend(items)
+    return array
+
+
+def _conn_params(interval, slave_latency, conn_sup_timeout):
+    params = ble_gap_conn_params_t()
+    params.min_conn_interval = interval
+    params.max_conn_interval = interval
+    params.slave_latency = slave_latency
+    params.conn_sup_timeout = conn_sup_timeout
+    return params
+
+
+def _sec_levels(level):
+    levels = ble_gap_sec_levels_t()
+    for lv in range(1, level + 1):
+        setattr(levels, "lv{}".format(lv), 1)
+    return levels
+
+
+def _kdist(kdist_a, kdist_b):
+    kdist = ble_gap_sec_kdist_t()
+    for name in ("enc", "id", "sign", "link"):
+        setattr(kdist, name, int(bool(getattr(kdist_a, name) and getattr(kdist_b, name))))
+    return kdist
+
+
+# Passkey entry roles, indexed [initiator io_caps][responder io_caps]. Each entry
+# names who displays and who inputs the passkey, None for Just Works.
+_D, _I = "display", "input"
+_PASSKEY_ROLES = (
+    (None, None, (_D, _I), None, (_D, _I)),
+    (None, None, (_D, _I), None, (_D, _I)),
+    ((_I, _D), (_I, _D), (_I, _I), None, (_I, _D)),
+    (None, None, None, None, None),
+    ((_I, _D), (_I, _D), (_D, _I), None, (_D, _I)),
+)
+
+
+class VirtualRadio(object):
+    """Shared medium and clock of the simulated adapters.
+
+    latency_ms: one way delay between the host and the connectivity IC. Every
+        command blocks for a round trip and every event arrives one delay late.
+    conn_interval_ms: connection interval of all links. None uses the interval
+        from the connection parameters.
+    att_mtu: largest ATT MTU a link can negotiate. None puts no limit on top of
+        the configuration of both sides.
+    packet_loss: probability that a link layer packet has to be resent in the
+        next transmit slot.
+    packets_per_event: link layer packets per direction in a connection event.
+        None derives it from the event length, data length and PHY.
+    rssi: signal strength reported for advertising reports and connections.
+    seed: seed of the generator behind packet loss and advertising delay.
+    """
+
+    defaults = dict(
+        latency_ms=0.0,
+        conn_interval_ms=None,
+        att_mtu=None,
+        packet_loss=0.0,
+        packets_per_event=None,
+        rssi=-50,
+        seed=None,
+    )
+
+    def __init__(self, **params):
+        self.lock = threading.RLock()
+        self.devices = list()
+        self.random = random.Random()
+        self._internal = itertools.count(1)
+        self._timers = list()
+        self._timer_seq = itertools.count()
+        self._timer_cond = threading.Condition()
+        self._thread = None
+        for name, value in self.defaults.items():
+            setattr(self, name, value)
+        self.configure(**params)
+
+    def configure(self, **params):
+        unknown = set(params) - set(self.defaults)
+        if unknown:
+            raise ValueError("Unknown radio parameter: {}".format(", ".join(sorted(unknown))))
+        if not 0.0 <= params.get("packet_loss", self.packet_loss) < 1.0:
+            raise ValueError("packet_loss must be at least 0 and below 1")
+        with self.lock:
+            for name, value in params.items():
+                setattr(self, name, value)
+            if "seed" in params:
+                self.random.seed(self.seed)
+
+    def reset(self):
+        """Restore the default parameters, for use between test cases."""
+        self.configure(**self.defaults)
+
+    def call_later(self, delay, function, *args):
+        when = time.monotonic() + delay
+        with self._timer_cond:
+            heapq.heappush(self._timers, (when, next(self._timer_seq), function, args))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="sim_driver radio", daemon=True
+                )
+                self._thread.start()
+            self._timer_cond.notify()
+
+    def _run(self):
+        while True:
+            with self._timer_cond:
+                while True:
+                    now = time.monotonic()
+                    if self._timers and self._timers[0][0] <= now:
+                        break
+                    timeout = self._timers[0][0] - now if self._timers else None
+                    self._timer_cond.wait(timeout)
+                _, _, function, args = heapq.heappop(self._timers)
+            try:
+                function(*args)
+            except Exception:
+                logger.exception("Simulated radio callback %r failed", function)
+
+    def rpc_round_trip(self):
+        if self.latency_ms:
+            time.sleep(2 * self.latency_ms / 1000.0)
+
+    def lost(self):
+        return self.packet_loss > 0 and self.random.random() < self.packet_loss
+
+    def open_devices(self, exclude=None):
+        return [d for d in self.devices if d.is_open and d.enabled and d is not exclude]
+
+    def unplug(self, port):
+        """Take the adapter on port away, as if its cable was pulled.
+
+        Its peers lose their links once the supervision timeout expires and
+        the host gets an IO_RESOURCES_UNAVAILABLE status.
+        """
+        with self.lock:
+            device = next(d for d in self.devices if d.is_open and d.port == port)
+            adapter, status_handler = device.adapter, device.status_handler
+            device.close()
+        self.call_later(
+            0, status_handler, adapter, IO_RESOURCES_UNAVAILABLE, "Serial port lost"
+        )
+
+
+radio = VirtualRadio()
+
+
+class _Pdu(object):
+    __slots__ = ("remaining", "on_receive", "kind")
+
+    def __init__(self, length, on_receive, kind):
+        # Every ATT and SMP PDU carries a 4 byte L2CAP header
+        self.remaining = length + 4
+        self.on_receive = on_receive
+        self.kind = kind
+
+
+class _Link(object):
+    """Connection between two simulated devices, driven by connection events."""
+
+    def __init__(self, radio, conn_params, event_length):
+        self.radio = radio
+        self.requested_interval = conn_params.min_conn_interval
+        self.slave_latency = conn_params.slave_latency
+        self.conn_sup_timeout = conn_params.conn_sup_timeout
+        self.event_length = event_length
+        self.central = None
+        self.periph = None
+        self.closed = False
+        self.anchor = time.monotonic()
+        self.event_pending = False
+        self.last_progress = self.anchor
+        self.pairing = None
+        self.encryption = None
+        self.dl_request = None
+        self.phy_request = None
+
+    @property
+    def interval(self):
+        """Connection interval in units of 1.25 ms."""
+        if self.radio.conn_interval_ms is not None:
+            return max(6, int(round(self.radio.conn_interval_ms / 1.25)))
+        return self.requested_interval
+
+    @property
+    def interval_s(self):
+        return self.interval * 1.25e-3
+
+    def conn_params(self):
+        return _conn_params(self.interval, self.slave_latency, self.conn_sup_timeout)
+
+    def conns(self):
+        return (self.central, self.periph)
+
+    def send(self, conn, length, on_receive, kind=None):
+        conn.txq.append(_Pdu(length, on_receive, kind))
+        self.wake()
+
+    def wake(self):
+        if self.event_pending or self.closed:
+            return
+        self.event_pending = True
+        now = time.monotonic()
+        if now - self.last_progress > self.interval_s:
+            # The link has been idle, traffic only starts to count from here
+            self.last_progress = now
+        interval = self.interval_s
+        events = int((now - self.anchor) / interval) + 1
+        self.radio.call_later(self.anchor + events * interval - now, self._connection_event)
+
+    def packets_per_event(self, conn):
+        if self.radio.packets_per_event is not None:
+            return self.radio.packets_per_event
+        rate = 2 if conn.tx_phy == BLE_GAP_PHY_2MBPS else 1
+        # Data packet and empty acknowledgement, each with 10 bytes of overhead,
+        # separated by the 150 us inter frame space
+        pair_us = (conn.tx_octets + 10) * 8 / rate + 10 * 8 / rate + 300
+        event_us = min(self.event_length * 1250, self.interval * 1250)
+        return max(1, int(event_us // pair_us))
+
+    def _connection_event(self):
+        with self.radio.lock:
+            self.event_pending = False
+            if self.closed:
+                return
+            now = time.monotonic()
+            progressed = False
+            for conn in self.conns():
+                for _ in range(self.packets_per_event(conn)):
+                    if not conn.txq:
+                        break
+                    if self.radio.lost():
+                        continue
+                    progressed = True
+                    pdu = conn.txq[0]
+                    pdu.remaining -= conn.tx_octets
+                    if pdu.remaining > 0:
+                        continue
+                    conn.txq.popleft()
+                    if pdu.kind is not None:
+                        conn.tx_complete[pdu.kind] += 1
+                    pdu.on_receive()
+                    if self.closed:
+                        return
+            for conn in self.conns():
+                conn.report_tx_complete()
+            if progressed:
+                self.last_progress = now
+            elif now - self.last_progress > self.conn_sup_timeout * 0.01:
+                self.close(None, BLE_HCI_CONNECTION_TIMEOUT)
+                return
+            if self.central.txq or self.periph.txq:
+                self.wake()
+
+    def close(self, initiator, reason):
+        """Take the link down, as seen from both ends.
+
+        initiator is the connection whose host asked for the disconnection, it
+        is told the local host terminated the link. None for link loss.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for conn in self.conns():
+            local_reason = reason
+            if conn is initiator:
+                local_reason = BLE_HCI_LOCAL_HOST_TERMINATED_CONNECTION
+            conn.device.drop(conn, local_reason)
+
+
+class _Connection(object):
+    def __init__(self, device, conn_handle, role, conn_cfg, link):
+        self.device = device
+        self.conn_handle = conn_handle
+        self.role = role
+        self.link = link
+        self.peer = None
+        self.cfg_att_mtu = conn_cfg["att_mtu"]
+        self.att_mtu = BLE_GATT_ATT_MTU_DEFAULT
+        self.mtu_exchanged = False
+        self.mtu_request = None
+        self.write_cmd_tx_queue_size = conn_cfg["write_cmd_tx_queue_size"]
+        self.hvn_tx_queue_size = conn_cfg["hvn_tx_queue_size"]
+        self.tx_queued = collections.Counter()
+        self.tx_complete = collections.Counter()
+        self.txq = collections.deque()
+        self.att_request = False
+        self.indication = None
+        self.indication_received = None
+        self.prepared = list()
+        self.cccds = dict()
+        self.sec_level = 1
+        self.encr_key_size = 0
+        self.tx_octets = 27
+        self.rx_octets = 27
+        self.tx_phy = BLE_GAP_PHY_1MBPS
+        self.rx_phy = BLE_GAP_PHY_1MBPS
+        self.conn_param_update_pending = False
+
+    @property
+    def addr(self):
+        return self.device.addr_struct()
+
+    def send(self, length, on_receive, kind=None):
+        self.link.send(self, length, on_receive, kind)
+
+    def report_tx_complete(self):
+        count = self.tx_complete.pop("write_cmd", 0)
+        if count:
+            self.tx_queued["write_cmd"] -= count
+            self.device.post(
+                _gattc_evt(
+                    BLE_GATTC_EVT_WRITE_CMD_TX_COMPLETE,
+                    self.conn_handle,
+                    BLE_GATT_STATUS_SUCCESS,
+                    BLE_GATT_HANDLE_INVALID,
+                    "write_cmd_tx_complete",
+                    count=count,
+                )
+            )
+        count = self.tx_complete.pop("hvn", 0)
+        if count:
+            self.tx_queued["hvn"] -= count
+            self.device.post(
+                _evt(
+                    BLE_GATTS_EVT_HVN_TX_COMPLETE,
+                    self.conn_handle,
+                    "hvn_tx_complete",
+                    count=count,
+                )
+            )
+
+
+class _Attribute(object):
+    def __init__(self, handle, uuid, value=b"", max_len=None, vlen=True,
+                 read_perm=(1, 1), write_perm=(0, 0)):
+        self.handle = handle
+        self.uuid = uuid
+        self.value = bytearray(value)
+        self.max_len = len(self.value) if max_len is None else max_len
+        self.vlen = vlen
+        self.read_perm = read_perm
+        self.write_perm = write_perm
+        self.service = None
+        self.cccd = False
+
+    @property
+    def is_declaration(self):
+        return self.uuid in (
+            (BLE_UUID_TYPE_BLE, BLE_UUID_SERVICE_PRIMARY),
+            (BLE_UUID_TYPE_BLE, BLE_UUID_SERVICE_SECONDARY),
+            (BLE_UUID_TYPE_BLE, BLE_UUID_CHARACTERISTIC),
+        )
+
+
+def _permits(perm, conn):
+    """GATT status of an access with the given (sm, lv) permission."""
+    sm, lv = perm
+    if sm == 0 or lv == 0:
+        return None
+    if lv > conn.sec_level:
+        if conn.sec_level == 1:
+            return BLE_GATT_STATUS_ATTERR_INSUF_AUTHENTICATION
+        return BLE_GATT_STATUS_ATTERR_INSUF_ENCRYPTION
+    return BLE_GATT_STATUS_SUCCESS
+
+
+class _SoftDevice(object):
+    """State of one simulated connectivity IC."""
+
+    def __init__(self, radio, port):
+        self.radio = radio
+        self.port = port
+        self.adapter = None
+        self.is_open = False
+        self.generation = 0
+        self.status_handler = None
+        self.evt_handler = None
+        self.log_handler = None
+        self.log_severity = SD_RPC_LOG_INFO
+        self.reset()
+
+    def reset(self):
+        self.enabled = False
+        digest = bytearray(hashlib.sha1(self.port.encode("utf-8")).digest()[:6])
+        digest[5] |= 0xC0
+        self.addr = bytes(digest)
+        self.addr_type = BLE_GAP_ADDR_TYPE_RANDOM_STATIC
+        self.irk = bytes(hashlib.sha1(b"irk" + self.addr).digest()[:BLE_GAP_SEC_KEY_LEN])
+        self.conn_cfgs = dict()
+        self.vs_uuid_count = BLE_UUID_VS_COUNT_DEFAULT
+        self.periph_role_count = BLE_GAP_ROLE_COUNT_PERIPH_DEFAULT
+        self.central_role_count = BLE_GAP_ROLE_COUNT_CENTRAL_DEFAULT
+        self.device_name = BLE_GAP_DEVNAME_DEFAULT.encode("ascii")
+        self.device_name_write_perm = (0, 0)
+        self.service_changed = False
+        self.vs_uuids = list()
+        self.attrs = list()
+        self.services = list()
+        self.conns = dict()
+        self.advertising = None
+        self.adv_data = b""
+        self.scan_rsp_data = b""
+        self.scanning = None
+        self.connecting = None
+
+    # Host transport
+
+    def post(self, ble_evt):
+        delay = self.radio.latency_ms / 1000.0
+        self.radio.call_later(delay, self._dispatch, ble_evt, self.generation)
+
+    def _dispatch(self, ble_evt, generation):
+        if self.is_open and generation == self.generation:
+            self.evt_handler(self.adapter, ble_evt)
+
+    def log(self, severity, message):
+        if self.log_handler is not None and severity >= self.log_severity:
+            self.log_handler(self.adapter, severity, message)
+
+    def open(self, adapter, status_handler, evt_handler, log_handler):
+        with self.radio.lock:
+            if self.is_open:
+                return NRF_ERROR_INVALID_STATE
+            for device in self.radio.devices:
+                if device.is_open and device.port == self.port:
+                    return NRF_ERROR_INVALID_STATE
+            self.generation += 1
+            self.reset()
+            self.adapter = adapter
+            self.status_handler = status_handler
+            self.evt_handler = evt_handler
+            self.log_handler = log_handler
+            self.is_open = True
+            if self not in self.radio.devices:
+                self.radio.devices.append(self)
+        self.radio.rpc_round_trip()
+        self.status_handler(adapter, CONNECTION_ACTIVE, "Target Reset performed")
+        self.log(SD_RPC_LOG_INFO, "Simulated connectivity on {} opened".format(self.port))
+        return NRF_SUCCESS
+
+    def close(self):
+        with self.radio.lock:
+            if not self.is_open:
+                return NRF_ERROR_INVALID_STATE
+            self.is_open = False
+            self.generation += 1
+            for conn in list(self.conns.values()):
+                link = conn.link
+                link.closed = True
+                self.conns.pop(conn.conn_handle, None)
+                # The peer only notices once the supervision timer expires
+                self.radio.call_later(
+                    link.conn_sup_timeout * 0.01,
+                    conn.peer.device.drop_locked,
+                    conn.peer,
+                    BLE_HCI_CONNECTION_TIMEOUT,
+                )
+            self.advertising = None
+            self.scanning = None
+            self.connecting = None
+            self.radio.devices.remove(self)
+        return NRF_SUCCESS
+
+    # Configuration
+
+    def conn_cfg(self, conn_cfg_tag):
+        defaults = dict(
+            conn_count=BLE_GAP_CONN_COUNT_DEFAULT,
+            event_length=BLE_GAP_EVENT_LENGTH_DEFAULT,
+            write_cmd_tx_queue_size=BLE_GATTC_WRITE_CMD_TX_QUEUE_SIZE_DEFAULT,
+            hvn_tx_queue_size=BLE_GATTS_HVN_TX_QUEUE_SIZE_DEFAULT,
+            att_mtu=BLE_GATT_ATT_MTU_DEFAULT,
+        )
+        if conn_cfg_tag == BLE_CONN_CFG_TAG_DEFAULT:
+            return defaults
+        return self.conn_cfgs.get(conn_cfg_tag)
+
+    def cfg_set(self, cfg_id, cfg, app_ram_base):
+        if self.enabled:
+            return NRF_ERROR_INVALID_STATE
+        if BLE_CONN_CFG_GAP <= cfg_id <= BLE_CONN_CFG_L2CAP:
+            tag = cfg.conn_cfg.conn_cfg_tag
+            if tag == BLE_CONN_CFG_TAG_DEFAULT:
+                return NRF_ERROR_INVALID_PARAM
+            conn_cfg = self.conn_cfgs.setdefault(tag, self.conn_cfg(BLE_CONN_CFG_TAG_DEFAULT))
+            params = cfg.conn_cfg.params
+            if cfg_id == BLE_CONN_CFG_GAP:
+                conn_cfg["conn_count"] = params.gap_conn_cfg.conn_count
+                conn_cfg["event_length"] = params.gap_conn_cfg.event_length
+            elif cfg_id == BLE_CONN_CFG_GATTC:
+                size = params.gattc_conn_cfg.write_cmd_tx_queue_size
+                if size < 1:
+                    return NRF_ERROR_INVALID_PARAM
+                conn_cfg["write_cmd_tx_queue_size"] = size
+            elif cfg_id == BLE_CONN_CFG_GATTS:
+                size = params.gatts_conn_cfg.hvn_tx_queue_size
+                if size < 1:
+                    return NRF_ERROR_INVALID_PARAM
+                conn_cfg["hvn_tx_queue_size"] = size
+            elif cfg_id == BLE_CONN_CFG_GATT:
+                att_mtu = params.gatt_conn_cfg.att_mtu
+                if att_mtu < BLE_GATT_ATT_MTU_DEFAULT:
+                    return NRF_ERROR_INVALID_PARAM
+                conn_cfg["att_mtu"] = att_mtu
+            return NRF_SUCCESS
+        if cfg_id == BLE_COMMON_CFG_VS_UUID:
+            self.vs_uuid_count = cfg.common_cfg.vs_uuid_cfg.vs_uuid_count
+        elif cfg_id == BLE_GAP_CFG_ROLE_COUNT:
+            role_count = cfg.gap_cfg.role_count_cfg
+            self.periph_role_count = role_count.periph_role_count
+            self.central_role_count = role_count.central_role_count
+        elif cfg_id == BLE_GAP_CFG_DEVICE_NAME:
+            name_cfg = cfg.gap_cfg.device_name_cfg
+            write_perm = name_cfg.write_perm
+            self.device_name_write_perm = (write_perm.sm, write_perm.lv)
+            if name_cfg.p_value is not None:
+                self.device_name = _bytes(name_cfg.p_value, name_cfg.current_len)
+        elif cfg_id == BLE_GATTS_CFG_SERVICE_CHANGED:
+            self.service_changed = bool(cfg.gatts_cfg.service_changed.service_changed)
+        elif cfg_id == BLE_GATTS_CFG_ATTR_TAB_SIZE:
+            pass
+        else:
+            return NRF_ERROR_INVALID_PARAM
+        return NRF_SUCCESS
+
+    def enable(self, app_ram_base):
+        if self.enabled:
+            return NRF_ERROR_INVALID_STATE
+        self.enabled = True
+        self.add_service(BLE_GATTS_SRVC_TYPE_PRIMARY, self.ble_uuid_bytes(BLE_UUID_GAP))
+        self.add_characteristic(
+            (BLE_UUID_TYPE_BLE, BLE_UUID_GAP_CHARACTERISTIC_DEVICE_NAME),
+            0x02 if self.device_name_write_perm[0] == 0 else 0x0A,
+            self.device_name,
+            max_len=248,
+            write_perm=self.device_name_write_perm,
+        )
+        self.add_characteristic(
+            (BLE_UUID_TYPE_BLE, BLE_UUID_GAP_CHARACTERISTIC_APPEARANCE), 0x02, bytes(2)
+        )
+        self.add_characteristic(
+            (BLE_UUID_TYPE_BLE, BLE_UUID_GAP_CHARACTERISTIC_PPCP), 0x02, bytes(8)
+        )
+        self.add_service(BLE_GATTS_SRVC_TYPE_PRIMARY, self.ble_uuid_bytes(BLE_UUID_GATT))
+        if self.service_changed:
+            self.add_characteristic(
+                (BLE_UUID_TYPE_BLE, BLE_UUID_GATT_CHARACTERISTIC_SERVICE_CHANGED),
+                0x20,
+                bytes(4),
+                cccd_write_perm=(1, 1),
+            )
+        return NRF_SUCCESS
+
+    def version_get(self, version):
+        version.version_number = _VERSION_NUMBER
+        version.company_id = _COMPANY_ID
+        version.subversion_number = _SUBVERSION_NUMBER
+        return NRF_SUCCESS
+
+    # UUIDs
+
+    @staticmethod
+    def ble_uuid_bytes(value):
+        return value.to_bytes(2, "little")
+
+    def uuid_bytes(self, uuid_type, value):
+        if uuid_type == BLE_UUID_TYPE_BLE:
+            return self.ble_uuid_bytes(value)
+        index = uuid_type - BLE_UUID_TYPE_VENDOR_BEGIN
+        if 0 <= index < len(self.vs_uuids):
+            base = bytearray(self.vs_uuids[index])
+            base[12:14] = value.to_bytes(2, "little")
+            return bytes(base)
+        return None
+
+    def uuid_from_bytes(self, data):
+        if len(data) == 2:
+            return BLE_UUID_TYPE_BLE, int.from_bytes(data, "little")
+        base = bytearray(data)
+        value = int.from_bytes(base[12:14], "little")
+        base[12:14] = bytes(2)
+        base = bytes(base)
+        if base in self.vs_uuids:
+            return BLE_UUID_TYPE_VENDOR_BEGIN + self.vs_uuids.index(base), value
+        return BLE_UUID_TYPE_UNKNOWN, 0
+
+    def uuid_struct(self, data):
+        uuid = ble_uuid_t()
+        uuid.type, uuid.uuid = self.uuid_from_bytes(data)
+        return uuid
+
+    def uuid_vs_add(self, p_vs_uuid, p_uuid_type):
+        base = bytearray(_bytes(p_vs_uuid.uuid128, 16))
+        base[12:14] = bytes(2)
+        base = bytes(base)
+        if base in self.vs_uuids:
+            uint8_assign(p_uuid_type, BLE_UUID_TYPE_VENDOR_BEGIN + self.vs_uuids.index(base))
+            return NRF_SUCCESS
+        if len(self.vs_uuids) >= self.vs_uuid_count:
+            return NRF_ERROR_NO_MEM
+        self.vs_uuids.append(base)
+        uint8_assign(p_uuid_type, BLE_UUID_TYPE_VENDOR_BEGIN + len(self.vs_uuids) - 1)
+        return NRF_SUCCESS
+
+    def uuid_decode(self, uuid_le_len, p_uuid_le, p_uuid):
+        if uuid_le_len not in (2, 16):
+            return NRF_ERROR_INVALID_LENGTH
+        uuid_type, value = self.uuid_from_bytes(_bytes(p_uuid_le, uuid_le_len))
+        p_uuid.type = uuid_type
+        p_uuid.uuid = value
+        if uuid_type == BLE_UUID_TYPE_UNKNOWN:
+            return NRF_ERROR_NOT_FOUND
+        return NRF_SUCCESS
+
+    # GAP
+
+    def addr_struct(self):
+        addr = ble_gap_addr_t()
+        addr.addr_type = self.addr_type
+        addr.addr = _array(self.addr)
+        return addr
+
+    def matches(self, p_addr):
+        return p_addr is not None and _bytes(p_addr.addr, BLE_GAP_ADDR_LEN) == self.addr
+
+    def addr_set(self, p_addr):
+        if p_addr is None:
+            return NRF_ERROR_NULL
+        if self.advertising or self.scanning or self.connecting:
+            return NRF_ERROR_INVALID_STATE
+        self.addr_type = p_addr.addr_type
+        self.addr = _bytes(p_addr.addr, BLE_GAP_ADDR_LEN)
+        return NRF_SUCCESS
+
+    def addr_get(self, p_addr):
+        p_addr.addr_type = self.addr_type
+        p_addr.addr = _array(self.addr)
+        return NRF_SUCCESS
+
+    def privacy_set(self, p_privacy_params):
+        if p_privacy_params.p_device_irk is not None:
+            self.irk = _bytes(p_privacy_params.p_device_irk.irk, BLE_GAP_SEC_KEY_LEN)
+        return NRF_SUCCESS
+
+    def tx_power_set(self, tx_power):
+        if tx_power not in (-40, -20, -16, -12, -8, -4, 0, 3, 4):
+            return NRF_ERROR_INVALID_PARAM
+        return NRF_SUCCESS
+
+    def role_count(self, role):
+        return sum(1 for conn in self.conns.values() if conn.role == role)
+
+    def adv_data_set(self, p_data, dlen, p_sr_data, srdlen):
+        if dlen > BLE_GAP_ADV_MAX_SIZE or srdlen > BLE_GAP_ADV_MAX_SIZE:
+            return NRF_ERROR_INVALID_LENGTH
+        self.adv_data = _bytes(p_data, dlen)
+        self.scan_rsp_data = _bytes(p_sr_data, srdlen)
+        return NRF_SUCCESS
+
+    def adv_start(self, p_adv_params, conn_cfg_tag):
+        if self.advertising is not None:
+            return NRF_ERROR_INVALID_STATE
+        if not BLE_GAP_ADV_INTERVAL_MIN <= p_adv_params.interval <= BLE_GAP_ADV_INTERVAL_MAX:
+            return NRF_ERROR_INVALID_PARAM
+        connectable = p_adv_params.type in (
+            BLE_GAP_ADV_TYPE_ADV_IND,
+            BLE_GAP_ADV_TYPE_ADV_DIRECT_IND,
+        )
+        if connectable:
+            if self.conn_cfg(conn_cfg_tag) is None:
+                return NRF_ERROR_NOT_FOUND
+            if self.role_count(BLE_GAP_ROLE_PERIPH) >= self.periph_role_count:
+                return NRF_ERROR_CONN_COUNT
+        self.generation += 1
+        now = time.monotonic()
+        self.advertising = dict(
+            type=p_adv_params.type,
+            interval=p_adv_params.interval * 0.625e-3,
+            deadline=now + p_adv_params.timeout if p_adv_params.timeout else None,
+            conn_cfg_tag=conn_cfg_tag,
+            connectable=connectable,
+            generation=self.generation,
+        )
+        self.radio.call_later(0, self._advertise, self.generation)
+        return NRF_SUCCESS
+
+    def adv_stop(self):
+        if self.advertising is None:
+            return NRF_ERROR_INVALID_STATE
+        self.advertising = None
+        return NRF_SUCCESS
+
+    def _advertise(self, generation):
+        with self.radio.lock:
+            adv = self.advertising
+            if not self.is_open or adv is None or adv["generation"] != generation:
+                return
+            now = time.monotonic()
+            if adv["deadline"] is not None and now >= adv["deadline"]:
+                self.advertising = None
+                self.post(
+                    _evt(
+                        BLE_GAP_EVT_TIMEOUT,
+                        BLE_CONN_HANDLE_INVALID,
+                        "timeout",
+                        src=BLE_GAP_TIMEOUT_SRC_ADVERTISING,
+                    )
+                )
+                return
+            for device in self.radio.open_devices(exclude=self):
+                if (
+                    adv["connectable"]
+                    and device.connecting is not None
+                    and self.matches(device.connecting["peer_addr"])
+                    and not self.radio.lost()
+                ):
+                    self.accept(device)
+                    return
+            for device in self.radio.open_devices(exclude=self):
+                if device.scanning is not None and not self.radio.lost():
+                    device.adv_report(self, adv["type"], False, self.adv_data)
+                    if device.scanning["active"] and adv["type"] in (
+                        BLE_GAP_ADV_TYPE_ADV_IND,
+                        BLE_GAP_ADV_TYPE_ADV_SCAN_IND,
+                    ):
+                        device.adv_report(self, adv["type"], True, self.scan_rsp_data)
+            # Advertising events are spread by a pseudo random 0-10 ms delay
+            delay = adv["interval"] + self.radio.random.uniform(0, 0.01)
+            self.radio.call_later(delay, self._advertise, generation)
+
+    def adv_report(self, advertiser, adv_type, scan_rsp, data):
+        self.post(
+            _evt(
+                BLE_GAP_EVT_ADV_REPORT,
+                BLE_CONN_HANDLE_INVALID,
+                "adv_report",
+                peer_addr=advertiser.addr_struct(),
+                direct_addr=ble_gap_addr_t(),
+                rssi=self.radio.rssi,
+                scan_rsp=int(scan_rsp),
+                type=adv_type,
+                dlen=len(data),
+                data=_array(data),
+            )
+        )
+
+    def scan_start(self, p_scan_params):
+        if self.scanning is not None or self.connecting is not None:
+            return NRF_ERROR_INVALID_STATE
+        self.generation += 1
+        timeout = p_scan_params.timeout
+        self.scanning = dict(active=bool(p_scan_params.active), generation=self.generation)
+        if timeout:
+            self.radio.call_later(timeout, self._scan_timeout, self.generation)
+        return NRF_SUCCESS
+
+    def scan_stop(self):
+        if self.scanning is None:
+            return NRF_ERROR_INVALID_STATE
+        self.scanning = None
+        return NRF_SUCCESS
+
+    def _scan_timeout(self, generation):
+        with self.radio.lock:
+            if self.scanning is None or self.scanning["generation"] != generation:
+                return
+            self.scanning = None
+            self.post(
+                _evt(
+                    BLE_GAP_EVT_TIMEOUT,
+                    BLE_CONN_HANDLE_INVALID,
+                    "timeout",
+                    src=BLE_GAP_TIMEOUT_SRC_SCAN,
+                )
+            )
+
+    def connect(self, p_peer_addr, p_scan_params, p_conn_params, conn_cfg_tag):
+        if self.connecting is not None:
+            return NRF_ERROR_INVALID_STATE
+        conn_cfg = self.conn_cfg(conn_cfg_tag)
+        if conn_cfg is None:
+            return NRF_ERROR_NOT_FOUND
+        if self.role_count(BLE_GAP_ROLE_CENTRAL) >= self.central_role_count:
+            return NRF_ERROR_CONN_COUNT
+        if p_conn_params.min_conn_interval > p_conn_params.max_conn_interval:
+            return NRF_ERROR_INVALID_PARAM
+        self.scanning = None
+        self.generation += 1
+        self.connecting = dict(
+            peer_addr=copy.deepcopy(p_peer_addr),
+            conn_params=copy.deepcopy(p_conn_params),
+            conn_cfg_tag=conn_cfg_tag,
+            generation=self.generation,
+        )
+        if p_scan_params.timeout:
+            self.radio.call_later(p_scan_params.timeout, self._connect_timeout, self.generation)
+        return NRF_SUCCESS
+
+    def connect_cancel(self):
+        if self.connecting is None:
+            return NRF_ERROR_INVALID_STATE
+        self.connecting = None
+        return NRF_SUCCESS
+
+    def _connect_timeout(self, generation):
+        with self.radio.lock:
+            if self.connecting is None or self.connecting["generation"] != generation:
+                return
+            self.connecting = None
+            self.post(
+                _evt(
+                    BLE_GAP_EVT_TIMEOUT,
+                    BLE_CONN_HANDLE_INVALID,
+                    "timeout",
+                    src=BLE_GAP_TIMEOUT_SRC_CONN,
+                )
+            )
+
+    def _conn_handle(self):
+        return next(h for h in itertools.count() if h not in self.conns)
+
+    def accept(self, central):
+        """Take a connect request from central while advertising."""
+        request = central.connecting
+        adv = self.advertising
+        central.connecting = None
+        self.advertising = None
+        central_cfg = central.conn_cfg(request["conn_cfg_tag"])
+        periph_cfg = self.conn_cfg(adv["conn_cfg_tag"])
+        link = _Link(self.radio, request["conn_params"], central_cfg["event_length"])
+        link.central = _Connection(
+            central, central._conn_handle(), BLE_GAP_ROLE_CENTRAL, central_cfg, link
+        )
+        link.periph = _Connection(
+            self, self._conn_handle(), BLE_GAP_ROLE_PERIPH, periph_cfg, link
+        )
+        link.central.peer = link.periph
+        link.periph.peer = link.central
+        for conn in link.conns():
+            conn.device.conns[conn.conn_handle] = conn
+            conn.device.post(
+                _evt(
+                    BLE_GAP_EVT_CONNECTED,
+                    conn.conn_handle,
+                    "connected",
+                    peer_addr=conn.peer.addr,
+                    role=conn.role,
+                    conn_params=link.conn_params(),
+                )
+            )
+
+    def conn(self, conn_handle):
+        return self.conns.get(conn_handle)
+
+    def drop(self, conn, reason):
+        """Forget conn and tell the application it is gone."""
+        if self.conns.get(conn.conn_handle) is not conn:
+            return
+        del self.conns[conn.conn_handle]
+        self.post(
+            _evt(BLE_GAP_EVT_DISCONNECTED, conn.conn_handle, "disconnected", reason=reason)
+        )
+
+    def drop_locked(self, conn, reason):
+        with self.radio.lock:
+            self.drop(conn, reason)
+
+    def disconnect(self, conn_handle, hci_status_code):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        if hci_status_code not in (
+            BLE_HCI_REMOTE_USER_TERMINATED_CONNECTION,
+            BLE_HCI_CONN_INTERVAL_UNACCEPTABLE,
+        ):
+            return NRF_ERROR_INVALID_PARAM
+        conn.txq.clear()
+        conn.send(2, lambda: conn.link.close(conn, hci_status_code))
+        return NRF_SUCCESS
+
+    def conn_param_update(self, conn_handle, p_conn_params):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        link = conn.link
+        if conn.role == BLE_GAP_ROLE_PERIPH:
+            if p_conn_params is None:
+                return NRF_ERROR_INVALID_PARAM
+            requested = copy.deepcopy(p_conn_params)
+
+            def request():
+                conn.peer.conn_param_update_pending = True
+                conn.peer.device.post(
+                    _evt(
+                        BLE_GAP_EVT_CONN_PARAM_UPDATE_REQUEST,
+                        conn.peer.conn_handle,
+                        "conn_param_update_request",
+                        conn_params=requested,
+                    )
+                )
+
+            conn.send(16, request)
+            return NRF_SUCCESS
+        if p_conn_params is None:
+            # The central rejects the request of the peripheral
+            conn.conn_param_update_pending = False
+            return NRF_SUCCESS
+        if p_conn_params.min_conn_interval > p_conn_params.max_conn_interval:
+            return NRF_ERROR_INVALID_PARAM
+        requested = copy.deepcopy(p_conn_params)
+        conn.conn_param_update_pending = False
+
+        def update():
+            link.requested_interval = requested.min_conn_interval
+            link.slave_latency = requested.slave_latency
+            link.conn_sup_timeout = requested.conn_sup_timeout
+            for c in link.conns():
+                c.device.post(
+                    _evt(
+                        BLE_GAP_EVT_CONN_PARAM_UPDATE,
+                        c.conn_handle,
+                        "conn_param_update",
+                        conn_params=link.conn_params(),
+                    )
+                )
+
+        conn.send(12, update)
+        return NRF_SUCCESS
+
+    def data_length_update(self, conn_handle, p_dl_params, p_dl_limitation):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        if p_dl_params is None:
+            octets = (251, 251)
+        else:
+            octets = (
+                p_dl_params.max_tx_octets or 251,
+                p_dl_params.max_rx_octets or 251,
+            )
+        if not all(27 <= o <= 251 for o in octets):
+            return NRF_ERROR_INVALID_PARAM
+        link = conn.link
+        if link.dl_request is not None and link.dl_request[0] is conn.peer:
+            initiator, initiator_octets = link.dl_request
+            link.dl_request = None
+            self._data_length_complete(initiator, initiator_octets, conn, octets)
+            return NRF_SUCCESS
+        if link.dl_request is not None:
+            return NRF_ERROR_BUSY
+        link.dl_request = (conn, octets)
+        peer_params = self._dl_params(*octets)
+        conn.send(
+            10,
+            lambda: conn.peer.device.post(
+                _evt(
+                    BLE_GAP_EVT_DATA_LENGTH_UPDATE_REQUEST,
+                    conn.peer.conn_handle,
+                    "data_length_update_request",
+                    peer_params=peer_params,
+                )
+            ),
+        )
+        return NRF_SUCCESS
+
+    @staticmethod
+    def _dl_params(tx_octets, rx_octets):
+        params = ble_gap_data_length_params_t()
+        params.max_tx_octets = tx_octets
+        params.max_rx_octets = rx_octets
+        params.max_tx_time_us = (tx_octets + 14) * 8
+        params.max_rx_time_us = (rx_octets + 14) * 8
+        return params
+
+    def _data_length_complete(self, initiator, initiator_octets, responder, responder_octets):
+        def complete():
+            initiator.tx_octets = min(initiator_octets[0], responder_octets[1])
+            initiator.rx_octets = min(initiator_octets[1], responder_octets[0])
+            responder.tx_octets = initiator.rx_octets
+            responder.rx_octets = initiator.tx_octets
+            for c in (initiator, responder):
+                c.device.post(
+                    _evt(
+                        BLE_GAP_EVT_DATA_LENGTH_UPDATE,
+                        c.conn_handle,
+                        "data_length_update",
+                        effective_params=self._dl_params(c.tx_octets, c.rx_octets),
+                    )
+                )
+
+        responder.send(10, complete)
+
+    def phy_update(self, conn_handle, p_gap_phys):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        phys = (p_gap_phys.tx_phys, p_gap_phys.rx_phys)
+        supported = BLE_GAP_PHY_1MBPS | BLE_GAP_PHY_2MBPS
+        if any(p != BLE_GAP_PHY_AUTO and not p & supported for p in phys):
+            return NRF_ERROR_NOT_SUPPORTED
+        link = conn.link
+        if link.phy_request is not None and link.phy_request[0] is conn.peer:
+            initiator, initiator_phys = link.phy_request
+            link.phy_request = None
+            self._phy_complete(initiator, initiator_phys, conn, phys)
+            return NRF_SUCCESS
+        if link.phy_request is not None:
+            return NRF_ERROR_BUSY
+        link.phy_request = (conn, phys)
+        preferred = ble_gap_phys_t()
+        preferred.tx_phys, preferred.rx_phys = phys
+        conn.send(
+            4,
+            lambda: conn.peer.device.post(
+                _evt(
+                    BLE_GAP_EVT_PHY_UPDATE_REQUEST,
+                    conn.peer.conn_handle,
+                    "phy_update_request",
+                    peer_preferred_phys=preferred,
+                )
+            ),
+        )
+        return NRF_SUCCESS
+
+    @staticmethod
+    def _phy_pick(phys_a, phys_b):
+        common = (phys_a or 0x03) & (phys_b or 0x03)
+        return BLE_GAP_PHY_2MBPS if common & BLE_GAP_PHY_2MBPS else BLE_GAP_PHY_1MBPS
+
+    def _phy_complete(self, initiator, initiator_phys, responder, responder_phys):
+        def complete():
+            initiator.tx_phy = self._phy_pick(initiator_phys[0], responder_phys[1])
+            initiator.rx_phy = self._phy_pick(initiator_phys[1], responder_phys[0])
+            responder.tx_phy = initiator.rx_phy
+            responder.rx_phy = initiator.tx_phy
+            for c in (initiator, responder):
+                c.device.post(
+                    _evt(
+                        BLE_GAP_EVT_PHY_UPDATE,
+                        c.conn_handle,
+                        "phy_update",
+                        status=BLE_HCI_STATUS_CODE_SUCCESS,
+                        tx_phy=c.tx_phy,
+                        rx_phy=c.rx_phy,
+                    )
+                )
+
+        responder.send(5, complete)
+
+    def rssi_start(self, conn_handle, threshold_dbm, skip_count):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        self.radio.call_later(
+            conn.link.interval_s,
+            self._rssi_changed,
+            conn,
+        )
+        return NRF_SUCCESS
+
+    def _rssi_changed(self, conn):
+        with self.radio.lock:
+            if self.conns.get(conn.conn_handle) is conn:
+                self.post(
+                    _evt(
+                        BLE_GAP_EVT_RSSI_CHANGED,
+                        conn.conn_handle,
+                        "rssi_changed",
+                        rssi=self.radio.rssi,
+                    )
+                )
+
+    def rssi_stop(self, conn_handle):
+        if self.conn(conn_handle) is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        return NRF_SUCCESS
+
+    # Security
+
+    def authenticate(self, conn_handle, p_sec_params):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        link = conn.link
+        if link.pairing is not None:
+            return NRF_ERROR_BUSY
+        if p_sec_params is None:
+            return NRF_ERROR_NULL
+        params = copy.deepcopy(p_sec_params)
+        if conn.role == BLE_GAP_ROLE_PERIPH:
+            conn.send(
+                2,
+                lambda: conn.peer.device.post(
+                    _evt(
+                        BLE_GAP_EVT_SEC_REQUEST,
+                        conn.peer.conn_handle,
+                        "sec_request",
+                        bond=params.bond,
+                        mitm=params.mitm,
+                        lesc=params.lesc,
+                        keypress=params.keypress,
+                    )
+                ),
+            )
+            return NRF_SUCCESS
+        central_params = params
+        link.pairing = dict(
+            state="pairing_request", central_params=central_params, keysets={}
+        )
+
+        def pairing_request():
+            link.pairing["state"] = "periph_params"
+            conn.peer.device.post(
+                _evt(
+                    BLE_GAP_EVT_SEC_PARAMS_REQUEST,
+                    conn.peer.conn_handle,
+                    "sec_params_request",
+                    peer_params=copy.deepcopy(central_params),
+                )
+            )
+
+        conn.send(7, pairing_request)
+        return NRF_SUCCESS
+
+    def sec_params_reply(self, conn_handle, sec_status, p_sec_params, p_sec_keyset):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        link = conn.link
+        pairing = link.pairing
+        expected = "periph_params" if conn.role == BLE_GAP_ROLE_PERIPH else "central_params"
+        if pairing is None or pairing["state"] != expected:
+            return NRF_ERROR_INVALID_STATE
+        if sec_status != BLE_GAP_SEC_STATUS_SUCCESS:
+            link.pairing = None
+            self._auth_status(conn, sec_status, BLE_GAP_SEC_STATUS_SOURCE_LOCAL)
+            conn.send(
+                2,
+                lambda: conn.peer.device._auth_status(
+                    conn.peer, sec_status, BLE_GAP_SEC_STATUS_SOURCE_REMOTE
+                ),
+            )
+            return NRF_SUCCESS
+        pairing["keysets"][conn] = p_sec_keyset
+        if conn.role == BLE_GAP_ROLE_CENTRAL:
+            # The central got the pairing response already. In LESC pairing the
+            # peer learns the public key of the central from here on.
+            pairing["state"] = "phase2"
+            if pairing["lesc"]:
+                self._pairing_dhkey_request(conn)
+                pairing["waiting"].add(("dhkey", conn.peer))
+                conn.send(69, lambda: conn.peer.device._pairing_dhkey_request(conn.peer))
+            self._pairing_passkey(conn)
+            self._pairing_check(link)
+            return NRF_SUCCESS
+        if p_sec_params is None:
+            return NRF_ERROR_NULL
+        periph_params = copy.deepcopy(p_sec_params)
+        pairing["periph_params"] = periph_params
+        pairing["state"] = "pairing_response"
+        self._pairing_negotiate(pairing)
+        self._pairing_passkey(conn)
+
+        def pairing_response():
+            pairing["state"] = "central_params"
+            conn.peer.device.post(
+                _evt(
+                    BLE_GAP_EVT_SEC_PARAMS_REQUEST,
+                    conn.peer.conn_handle,
+                    "sec_params_request",
+                    peer_params=copy.deepcopy(periph_params),
+                )
+            )
+
+        conn.send(7, pairing_response)
+        return NRF_SUCCESS
+
+    def _pairing_negotiate(self, pairing):
+        c, p = pairing["central_params"], pairing["periph_params"]
+        pairing["lesc"] = bool(c.lesc and p.lesc)
+        pairing["mitm"] = bool(c.mitm or p.mitm)
+        pairing["bond"] = bool(c.bond and p.bond)
+        pairing["key_size"] = min(c.max_key_size or 16, p.max_key_size or 16)
+        pairing["dhkeys"] = dict()
+        pairing["passkeys"] = dict()
+        pairing["waiting"] = set()
+        roles = None
+        if pairing["mitm"] and c.io_caps < 5 and p.io_caps < 5:
+            roles = _PASSKEY_ROLES[c.io_caps][p.io_caps]
+        pairing["roles"] = roles
+        pairing["passkey"] = None
+        if roles is not None and _D in roles:
+            passkey = "{:06d}".format(self.radio.random.randrange(1000000))
+            pairing["passkey"] = passkey.encode("ascii")
+
+    def _pairing_dhkey_request(self, conn):
+        pairing = conn.link.pairing
+        if pairing is None:
+            return
+        keyset = pairing["keysets"].get(conn.peer)
+        peer_pk = ble_gap_lesc_p256_pk_t()
+        if keyset is not None and keyset.keys_own.p_pk is not None:
+            peer_pk.pk = _array(_bytes(keyset.keys_own.p_pk.pk, BLE_GAP_LESC_P256_PK_LEN))
+        pairing["waiting"].add(("dhkey", conn))
+        self.post(
+            _evt(
+                BLE_GAP_EVT_LESC_DHKEY_REQUEST,
+                conn.conn_handle,
+                "lesc_dhkey_request",
+                p_pk_peer=peer_pk,
+                oobd_req=0,
+            )
+        )
+
+    def _pairing_passkey(self, conn):
+        pairing = conn.link.pairing
+        if pairing["roles"] is None:
+            return
+        role = pairing["roles"][0 if conn.role == BLE_GAP_ROLE_CENTRAL else 1]
+        if role == _D:
+            self.post(
+                _evt(
+                    BLE_GAP_EVT_PASSKEY_DISPLAY,
+                    conn.conn_handle,
+                    "passkey_display",
+                    passkey=_array(pairing["passkey"]),
+                    match_request=0,
+                )
+            )
+        else:
+            pairing["waiting"].add(("passkey", conn))
+            self.post(
+                _evt(
+                    BLE_GAP_EVT_AUTH_KEY_REQUEST,
+                    conn.conn_handle,
+                    "auth_key_request",
+                    key_type=BLE_GAP_AUTH_KEY_TYPE_PASSKEY,
+                )
+            )
+
+    def lesc_dhkey_reply(self, conn_handle, p_dhkey):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        pairing = conn.link.pairing
+        if pairing is None or ("dhkey", conn) not in pairing.get("waiting", ()):
+            return NRF_ERROR_INVALID_STATE
+        pairing["waiting"].discard(("dhkey", conn))
+        pairing["dhkeys"][conn] = _bytes(p_dhkey.key, BLE_GAP_LESC_DHKEY_LEN)
+        self._pairing_check(conn.link)
+        return NRF_SUCCESS
+
+    def auth_key_reply(self, conn_handle, key_type, p_key):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        pairing = conn.link.pairing
+        if pairing is None or ("passkey", conn) not in pairing.get("waiting", ()):
+            return NRF_ERROR_INVALID_STATE
+        pairing["waiting"].discard(("passkey", conn))
+        if key_type == BLE_GAP_AUTH_KEY_TYPE_PASSKEY and p_key is not None:
+            pairing["passkeys"][conn] = _bytes(p_key, BLE_GAP_PASSKEY_LEN)
+        else:
+            pairing["passkeys"][conn] = None
+        self._pairing_check(conn.link)
+        return NRF_SUCCESS
+
+    def _pairing_check(self, link):
+        pairing = link.pairing
+        if pairing is None or pairing["state"] != "phase2" or pairing["waiting"]:
+            return
+        status = BLE_GAP_SEC_STATUS_SUCCESS
+        passkeys = set(pairing["passkeys"].values())
+        if pairing.get("passkey") is not None:
+            passkeys.add(pairing["passkey"])
+        if None in passkeys or len(passkeys) > 1:
+            status = BLE_GAP_SEC_STATUS_PASSKEY_ENTRY_FAILED
+        dhkeys = set(pairing["dhkeys"].values())
+        if pairing["lesc"] and (len(dhkeys) != 1 or dhkeys == {bytes(32)}):
+            status = BLE_GAP_SEC_STATUS_DHKEY_FAILURE
+        link.pairing = None
+        central = link.central
+        central.send(16, lambda: self._pairing_complete(link, pairing, status))
+
+    def _pairing_complete(self, link, pairing, status):
+        if status != BLE_GAP_SEC_STATUS_SUCCESS:
+            for conn in link.conns():
+                conn.device._auth_status(conn, status, BLE_GAP_SEC_STATUS_SOURCE_LOCAL)
+            return
+        level = 2
+        if pairing["roles"] is not None:
+            level = 4 if pairing["lesc"] else 3
+        ltk = bytes(self.radio.random.getrandbits(8) for _ in range(16))
+        c, p = pairing["central_params"], pairing["periph_params"]
+        kdist = {
+            link.central: (_kdist(c.kdist_own, p.kdist_peer), _kdist(c.kdist_peer, p.kdist_own)),
+            link.periph: (_kdist(p.kdist_own, c.kdist_peer), _kdist(p.kdist_peer, c.kdist_own)),
+        }
+        if pairing["bond"]:
+            self._distribute_keys(link, pairing, kdist, ltk, level)
+        link.encryption = dict(ltk=ltk, lesc=pairing["lesc"], level=level)
+        for conn in link.conns():
+            conn.sec_level = level
+            conn.encr_key_size = pairing["key_size"]
+            conn.device.post(self._conn_sec_update(conn))
+            conn.device._auth_status(
+                conn,
+                BLE_GAP_SEC_STATUS_SUCCESS,
+                BLE_GAP_SEC_STATUS_SOURCE_LOCAL,
+                bonded=pairing["bond"],
+                lesc=pairing["lesc"],
+                level=level,
+                kdist_own=kdist[conn][0],
+                kdist_peer=kdist[conn][1],
+            )
+
+    def _distribute_keys(self, link, pairing, kdist, ltk, level):
+        for sender in link.conns():
+            receiver = sender.peer
+            own = pairing["keysets"].get(sender)
+            peer = pairing["keysets"].get(receiver)
+            keys = []
+            if own is not None:
+                keys.append(own.keys_own)
+            if peer is not None:
+                keys.append(peer.keys_peer)
+            sent = kdist[sender][0]
+            if pairing["lesc"] or sent.enc:
+                ediv, rand = 0, bytes(8)
+                if not pairing["lesc"]:
+                    ediv = self.radio.random.getrandbits(16)
+                    rand = bytes(self.radio.random.getrandbits(8) for _ in range(8))
+                for k in keys:
+                    if k.p_enc_key is None:
+                        continue
+                    k.p_enc_key.enc_info.ltk = _array(ltk)
+                    k.p_enc_key.enc_info.lesc = int(pairing["lesc"])
+                    k.p_enc_key.enc_info.auth = int(level > 2)
+                    k.p_enc_key.enc_info.ltk_len = BLE_GAP_SEC_KEY_LEN
+                    k.p_enc_key.master_id.ediv = ediv
+                    k.p_enc_key.master_id.rand = _array(rand)
+            if sent.id:
+                for k in keys:
+                    if k.p_id_key is None:
+                        continue
+                    k.p_id_key.id_info.irk = _array(sender.device.irk)
+                    k.p_id_key.id_addr_info = sender.device.addr_struct()
+
+    @staticmethod
+    def _conn_sec_update(conn):
+        conn_sec = ble_gap_conn_sec_t()
+        conn_sec.sec_mode.sm = 1
+        conn_sec.sec_mode.lv = conn.sec_level
+        conn_sec.encr_key_size = conn.encr_key_size
+        return _evt(
+            BLE_GAP_EVT_CONN_SEC_UPDATE, conn.conn_handle, "conn_sec_update", conn_sec=conn_sec
+        )
+
+    def _auth_status(self, conn, status, error_src, bonded=False, lesc=False, level=1,
+                     kdist_own=None, kdist_peer=None):
+        self.post(
+            _evt(
+                BLE_GAP_EVT_AUTH_STATUS,
+                conn.conn_handle,
+                "auth_status",
+                auth_status=status,
+                error_src=error_src,
+                bonded=int(bonded),
+                lesc=int(lesc),
+                sm1_levels=_sec_levels(level if status == BLE_GAP_SEC_STATUS_SUCCESS else 1),
+                sm2_levels=ble_gap_sec_levels_t(),
+                kdist_own=kdist_own or ble_gap_sec_kdist_t(),
+                kdist_peer=kdist_peer or ble_gap_sec_kdist_t(),
+            )
+        )
+
+    def encrypt(self, conn_handle, p_master_id, p_enc_info):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        if conn.role != BLE_GAP_ROLE_CENTRAL:
+            return BLE_ERROR_INVALID_ROLE
+        if p_master_id is None or p_enc_info is None:
+            return NRF_ERROR_NULL
+        master_id = copy.deepcopy(p_master_id)
+        ltk = _bytes(p_enc_info.ltk, p_enc_info.ltk_len or BLE_GAP_SEC_KEY_LEN)
+        conn.link.encryption = dict(ltk=ltk, lesc=bool(p_enc_info.lesc), level=None)
+        periph = conn.peer
+
+        def request():
+            periph.device.post(
+                _evt(
+                    BLE_GAP_EVT_SEC_INFO_REQUEST,
+                    periph.conn_handle,
+                    "sec_info_request",
+                    peer_addr=conn.addr,
+                    master_id=master_id,
+                    enc_info=1,
+                    id_info=0,
+                    sign_info=0,
+                )
+            )
+
+        conn.send(23, request)
+        return NRF_SUCCESS
+
+    def sec_info_reply(self, conn_handle, p_enc_info, p_id_info, p_sign_info):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        link = conn.link
+        if link.encryption is None or link.encryption["level"] is not None:
+            return NRF_ERROR_INVALID_STATE
+        requested = link.encryption
+        if p_enc_info is None:
+            link.encryption = None
+            conn.send(2, lambda: conn.peer.device.post(self._conn_sec_update(conn.peer)))
+            return NRF_SUCCESS
+        ltk = _bytes(p_enc_info.ltk, p_enc_info.ltk_len or BLE_GAP_SEC_KEY_LEN)
+        if ltk != requested["ltk"]:
+            link.encryption = None
+            conn.send(
+                2, lambda: link.close(None, BLE_HCI_CONN_TERMINATED_DUE_TO_MIC_FAILURE)
+            )
+            return NRF_SUCCESS
+        level = 2
+        if p_enc_info.auth:
+            level = 4 if p_enc_info.lesc else 3
+        requested["level"] = level
+
+        def encrypted():
+            for c in link.conns():
+                c.sec_level = level
+                c.encr_key_size = BLE_GAP_SEC_KEY_LEN
+                c.device.post(self._conn_sec_update(c))
+
+        conn.send(2, encrypted)
+        return NRF_SUCCESS
+
+    def conn_sec_get(self, conn_handle, p_conn_sec):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        p_conn_sec.sec_mode.sm = 1
+        p_conn_sec.sec_mode.lv = conn.sec_level
+        p_conn_sec.encr_key_size = conn.encr_key_size
+        return NRF_SUCCESS
+
+    # GATT server
+
+    def add_attribute(self, uuid, value=b"", **kwargs):
+        attr = _Attribute(len(self.attrs) + 1, uuid, value, **kwargs)
+        attr.service = self.services[-1] if self.services else None
+        self.attrs.append(attr)
+        return attr
+
+    def add_service(self, srvc_type, uuid_bytes):
+        decl = BLE_UUID_SERVICE_PRIMARY
+        if srvc_type == BLE_GATTS_SRVC_TYPE_SECONDARY:
+            decl = BLE_UUID_SERVICE_SECONDARY
+        attr = self.add_attribute((BLE_UUID_TYPE_BLE, decl), uuid_bytes)
+        self.services.append(attr)
+        attr.service = attr
+        return attr.handle
+
+    def add_characteristic(self, uuid, props, value, max_len=None, vlen=True,
+                           read_perm=(1, 1), write_perm=(0, 0), user_desc=None,
+                           cccd_write_perm=None):
+        decl = self.add_attribute((BLE_UUID_TYPE_BLE, BLE_UUID_CHARACTERISTIC))
+        value_attr = self.add_attribute(
+            uuid, value, max_len=max_len, vlen=vlen, read_perm=read_perm, write_perm=write_perm
+        )
+        decl.value = bytearray(
+            bytes([props])
+            + value_attr.handle.to_bytes(2, "little")
+            + self.uuid_bytes(*uuid)
+        )
+        handles = dict(value_handle=value_attr.handle, user_desc_handle=0, cccd_handle=0)
+        if user_desc is not None:
+            handles["user_desc_handle"] = self.add_attribute(
+                (BLE_UUID_TYPE_BLE, BLE_UUID_DESCRIPTOR_CHAR_USER_DESC), user_desc
+            ).handle
+        if props & 0x30:
+            cccd = self.add_attribute(
+                (BLE_UUID_TYPE_BLE, BLE_UUID_DESCRIPTOR_CLIENT_CHAR_CONFIG),
+                bytes(2),
+                write_perm=cccd_write_perm or (1, 1),
+            )
+            cccd.cccd = True
+            handles["cccd_handle"] = cccd.handle
+        return handles
+
+    def attr(self, handle):
+        if 1 <= handle <= len(self.attrs):
+            return self.attrs[handle - 1]
+        return None
+
+    def service_end(self, service):
+        index = self.services.index(service)
+        if index + 1 < len(self.services):
+            return self.services[index + 1].handle - 1
+        return BLE_GATT_HANDLE_END
+
+    def service_add(self, srvc_type, p_uuid, p_handle):
+        if srvc_type not in (BLE_GATTS_SRVC_TYPE_PRIMARY, BLE_GATTS_SRVC_TYPE_SECONDARY):
+            return NRF_ERROR_INVALID_PARAM
+        uuid_bytes = self.uuid_bytes(p_uuid.type, p_uuid.uuid)
+        if uuid_bytes is None:
+            return NRF_ERROR_NOT_FOUND
+        uint16_assign(p_handle, self.add_service(srvc_type, uuid_bytes))
+        return NRF_SUCCESS
+
+    def characteristic_add(self, service_handle, p_char_md, p_attr_char_value, p_handles):
+        if not self.services or self.services[-1].handle != service_handle:
+            return NRF_ERROR_INVALID_PARAM
+        uuid = (p_attr_char_value.p_uuid.type, p_attr_char_value.p_uuid.uuid)
+        if self.uuid_bytes(*uuid) is None:
+            return NRF_ERROR_NOT_FOUND
+        props = p_char_md.char_props
+        props_byte = (
+            props.broadcast
+            | props.read << 1
+            | props.write_wo_resp << 2
+            | props.write << 3
+            | props.notify << 4
+            | props.indicate << 5
+            | props.auth_signed_wr << 6
+        )
+        attr_md = p_attr_char_value.p_attr_md
+        if attr_md is None:
+            return NRF_ERROR_NULL
+        if p_attr_char_value.init_len > p_attr_char_value.max_len:
+            return NRF_ERROR_INVALID_PARAM
+        user_desc = None
+        if p_char_md.p_char_user_desc is not None:
+            user_desc = _bytes(p_char_md.p_char_user_desc, p_char_md.char_user_desc_size)
+        cccd_write_perm = None
+        if p_char_md.p_cccd_md is not None:
+            cccd_write_perm = (
+                p_char_md.p_cccd_md.write_perm.sm,
+                p_char_md.p_cccd_md.write_perm.lv,
+            )
+        handles = self.add_characteristic(
+            uuid,
+            props_byte,
+            _bytes(p_attr_char_value.p_value, p_attr_char_value.init_len),
+            max_len=p_attr_char_value.max_len,
+            vlen=bool(attr_md.vlen),
+            read_perm=(attr_md.read_perm.sm, attr_md.read_perm.lv),
+            write_perm=(attr_md.write_perm.sm, attr_md.write_perm.lv),
+            user_desc=user_desc,
+            cccd_write_perm=cccd_write_perm,
+        )
+        for name, handle in handles.items():
+            setattr(p_handles, name, handle)
+        return NRF_SUCCESS
+
+    def sys_attr_set(self, conn_handle, p_sys_attr_data, length, flags):
+        if self.conn(conn_handle) is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        return NRF_SUCCESS
+
+    def cccd_value(self, conn, attr):
+        return conn.cccds.get(attr.handle, 0)
+
+    def read_value(self, conn, attr):
+        if attr.cccd:
+            return self.cccd_value(conn, attr).to_bytes(2, "little")
+        return bytes(attr.value)
+
+    def server_read(self, conn, handle, offset):
+        """Status and value of an ATT read of handle by the client of conn."""
+        attr = self.attr(handle)
+        if attr is None:
+            return BLE_GATT_STATUS_ATTERR_INVALID_HANDLE, b""
+        if not attr.is_declaration and not attr.cccd:
+            status = _permits(attr.read_perm, conn)
+            if status is None:
+                return BLE_GATT_STATUS_ATTERR_READ_NOT_PERMITTED, b""
+            if status != BLE_GATT_STATUS_SUCCESS:
+                return status, b""
+        value = self.read_value(conn, attr)
+        if offset > len(value):
+            return BLE_GATT_STATUS_ATTERR_INVALID_OFFSET, b""
+        return BLE_GATT_STATUS_SUCCESS, value[offset : offset + conn.att_mtu - 1]
+
+    def server_write(self, conn, handle, offset, data, op):
+        """Apply an ATT write to the local table and tell the application."""
+        attr = self.attr(handle)
+        if attr is None:
+            return BLE_GATT_STATUS_ATTERR_INVALID_HANDLE
+        if attr.is_declaration:
+            return BLE_GATT_STATUS_ATTERR_WRITE_NOT_PERMITTED
+        status = _permits(attr.write_perm, conn)
+        if status is None:
+            return BLE_GATT_STATUS_ATTERR_WRITE_NOT_PERMITTED
+        if status != BLE_GATT_STATUS_SUCCESS:
+            return status
+        if attr.cccd:
+            if offset != 0 or len(data) != 2:
+                return BLE_GATT_STATUS_ATTERR_INVALID_ATT_VAL_LENGTH
+            conn.cccds[handle] = int.from_bytes(data, "little")
+        else:
+            if offset > len(attr.value):
+                return BLE_GATT_STATUS_ATTERR_INVALID_OFFSET
+            if offset + len(data) > attr.max_len:
+                return BLE_GATT_STATUS_ATTERR_INVALID_ATT_VAL_LENGTH
+            if attr.vlen:
+                attr.value[offset:] = data
+            else:
+                attr.value[offset : offset + len(data)] = data
+        uuid = ble_uuid_t()
+        uuid.type, uuid.uuid = attr.uuid
+        self.post(
+            _evt(
+                BLE_GATTS_EVT_WRITE,
+                conn.conn_handle,
+                "write",
+                handle=handle,
+                uuid=uuid,
+                op=op,
+                auth_required=0,
+                offset=offset,
+                len=len(data),
+                data=_array(data),
+            )
+        )
+        return BLE_GATT_STATUS_SUCCESS
+
+    def hvx(self, conn_handle, p_hvx_params):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        attr = self.attr(p_hvx_params.handle)
+        if attr is None:
+            return BLE_ERROR_INVALID_ATTR_HANDLE
+        cccd = self.attr(attr.handle + 1)
+        while cccd is not None and not cccd.cccd and not cccd.is_declaration:
+            cccd = self.attr(cccd.handle + 1)
+        if cccd is None or not cccd.cccd:
+            return BLE_ERROR_GATTS_INVALID_ATTR_TYPE
+        hvx_type = p_hvx_params.type
+        if hvx_type not in (BLE_GATT_HVX_NOTIFICATION, BLE_GATT_HVX_INDICATION):
+            return NRF_ERROR_INVALID_PARAM
+        if not self.cccd_value(conn, cccd) & hvx_type:
+            return NRF_ERROR_INVALID_STATE
+        offset = p_hvx_params.offset
+        if hvx_type == BLE_GATT_HVX_NOTIFICATION:
+            if conn.tx_queued["hvn"] >= conn.hvn_tx_queue_size:
+                return NRF_ERROR_RESOURCES
+        elif conn.indication is not None:
+            return NRF_ERROR_BUSY
+        if p_hvx_params.p_data is not None:
+            length = uint16_value(p_hvx_params.p_len)
+            if offset + length > attr.max_len:
+                return NRF_ERROR_INVALID_PARAM
+            data = _bytes(p_hvx_params.p_data, length)
+            if attr.vlen:
+                attr.value[offset:] = data
+            else:
+                attr.value[offset : offset + length] = data
+            data = data[: conn.att_mtu - 3]
+        else:
+            data = bytes(attr.value[offset : offset + conn.att_mtu - 3])
+        if p_hvx_params.p_len is not None:
+            uint16_assign(p_hvx_params.p_len, len(data))
+        client = conn.peer
+        handle = attr.handle
+
+        def received():
+            if hvx_type == BLE_GATT_HVX_INDICATION:
+                client.indication_received = handle
+            client.device.post(
+                _gattc_evt(
+                    BLE_GATTC_EVT_HVX,
+                    client.conn_handle,
+                    BLE_GATT_STATUS_SUCCESS,
+                    BLE_GATT_HANDLE_INVALID,
+                    "hvx",
+                    handle=handle,
+                    type=hvx_type,
+                    len=len(data),
+                    data=_array(data),
+                )
+            )
+
+        if hvx_type == BLE_GATT_HVX_NOTIFICATION:
+            conn.tx_queued["hvn"] += 1
+            conn.send(3 + len(data), received, kind="hvn")
+        else:
+            conn.indication = handle
+            conn.send(3 + len(data), received)
+        return NRF_SUCCESS
+
+    def exchange_mtu_reply(self, conn_handle, server_rx_mtu):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        if conn.mtu_request is None:
+            return NRF_ERROR_INVALID_STATE
+        if not BLE_GATT_ATT_MTU_DEFAULT <= server_rx_mtu <= conn.cfg_att_mtu:
+            return NRF_ERROR_INVALID_PARAM
+        client_rx_mtu = conn.mtu_request
+        conn.mtu_request = None
+        if self.radio.att_mtu is not None:
+            server_rx_mtu = max(BLE_GATT_ATT_MTU_DEFAULT, min(server_rx_mtu, self.radio.att_mtu))
+        mtu = min(client_rx_mtu, server_rx_mtu)
+        conn.att_mtu = mtu
+        client = conn.peer
+
+        def response():
+            client.att_mtu = mtu
+            client.att_request = False
+            client.device.post(
+                _gattc_evt(
+                    BLE_GATTC_EVT_EXCHANGE_MTU_RSP,
+                    client.conn_handle,
+                    BLE_GATT_STATUS_SUCCESS,
+                    BLE_GATT_HANDLE_INVALID,
+                    "exchange_mtu_rsp",
+                    server_rx_mtu=server_rx_mtu,
+                )
+            )
+
+        conn.send(3, response)
+        return NRF_SUCCESS
+
+    # GATT client
+
+    def _request(self, conn_handle, length, serve):
+        """Send an ATT request, serve runs at the server when it arrives."""
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        if conn.att_request:
+            return NRF_ERROR_BUSY
+        conn.att_request = True
+        conn.send(length, lambda: serve(conn, conn.peer))
+        return NRF_SUCCESS
+
+    def _respond(self, server, length, evt_id, gatt_status, error_handle, name, **params):
+        client = server.peer
+
+        def response():
+            client.att_request = False
+            client.device.post(
+                _gattc_evt(
+                    evt_id, client.conn_handle, gatt_status, error_handle, name, **params
+                )
+            )
+
+        server.send(length, response)
+
+    def exchange_mtu_request(self, conn_handle, client_rx_mtu):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        if conn.mtu_exchanged:
+            return NRF_ERROR_INVALID_STATE
+        if not BLE_GATT_ATT_MTU_DEFAULT <= client_rx_mtu <= conn.cfg_att_mtu:
+            return NRF_ERROR_INVALID_PARAM
+        if self.radio.att_mtu is not None:
+            client_rx_mtu = max(BLE_GATT_ATT_MTU_DEFAULT, min(client_rx_mtu, self.radio.att_mtu))
+
+        def serve(client, server):
+            server.mtu_request = client_rx_mtu
+            server.device.post(
+                _evt(
+                    BLE_GATTS_EVT_EXCHANGE_MTU_REQUEST,
+                    server.conn_handle,
+                    "exchange_mtu_request",
+                    client_rx_mtu=client_rx_mtu,
+                )
+            )
+
+        err_code = self._request(conn_handle, 3, serve)
+        if err_code == NRF_SUCCESS:
+            conn.mtu_exchanged = True
+        return err_code
+
+    def primary_services_discover(self, conn_handle, start_handle, p_srvc_uuid):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        wanted = None
+        if p_srvc_uuid is not None:
+            wanted = self.uuid_bytes(p_srvc_uuid.type, p_srvc_uuid.uuid)
+            if wanted is None:
+                return NRF_ERROR_INVALID_PARAM
+
+        def serve(client, server):
+            found = [
+                s
+                for s in server.device.services
+                if s.handle >= start_handle
+                and s.uuid == (BLE_UUID_TYPE_BLE, BLE_UUID_SERVICE_PRIMARY)
+                and (wanted is None or bytes(s.value) == wanted)
+            ]
+            if wanted is None and found:
+                size = len(found[0].value)
+                found = [s for s in found if len(s.value) == size]
+                found = found[: (server.att_mtu - 2) // (4 + size)]
+            elif found:
+                found = found[: (server.att_mtu - 1) // 4]
+            services = []
+            for s in found:
+                service = ble_gattc_service_t()
+                service.uuid = client.device.uuid_struct(bytes(s.value))
+                service.handle_range.start_handle = s.handle
+                service.handle_range.end_handle = server.device.service_end(s)
+                services.append(service)
+            self._respond(
+                server,
+                2 + 20 * len(services),
+                BLE_GATTC_EVT_PRIM_SRVC_DISC_RSP,
+                BLE_GATT_STATUS_SUCCESS if services else BLE_GATT_STATUS_ATTERR_ATTRIBUTE_NOT_FOUND,
+                BLE_GATT_HANDLE_INVALID if services else start_handle,
+                "prim_srvc_disc_rsp",
+                count=len(services),
+                services=_array_of(ble_gattc_service_array, services),
+            )
+
+        return self._request(conn_handle, 7 if wanted is None else 7 + len(wanted), serve)
+
+    def characteristics_discover(self, conn_handle, p_handle_range):
+        start, end = p_handle_range.start_handle, p_handle_range.end_handle
+
+        def serve(client, server):
+            found = [
+                a
+                for a in server.device.attrs[start - 1 : end]
+                if a.uuid == (BLE_UUID_TYPE_BLE, BLE_UUID_CHARACTERISTIC)
+            ]
+            if found:
+                size = len(found[0].value)
+                found = [a for a in found if len(a.value) == size]
+                found = found[: (server.att_mtu - 2) // (2 + size)]
+            chars = []
+            for decl in found:
+                value = bytes(decl.value)
+                char = ble_gattc_char_t()
+                char.uuid = client.device.uuid_struct(value[3:])
+                for bit, name in enumerate(
+                    ("broadcast", "read", "write_wo_resp", "write", "notify", "indicate", "auth_signed_wr")
+                ):
+                    setattr(char.char_props, name, (value[0] >> bit) & 1)
+                char.handle_decl = decl.handle
+                char.handle_value = int.from_bytes(value[1:3], "little")
+                chars.append(char)
+            self._respond(
+                server,
+                2 + 21 * len(chars),
+                BLE_GATTC_EVT_CHAR_DISC_RSP,
+                BLE_GATT_STATUS_SUCCESS if chars else BLE_GATT_STATUS_ATTERR_ATTRIBUTE_NOT_FOUND,
+                BLE_GATT_HANDLE_INVALID if chars else start,
+                "char_disc_rsp",
+                count=len(chars),
+                chars=_array_of(ble_gattc_char_array, chars),
+            )
+
+        if not 0 < start <= end:
+            return NRF_ERROR_INVALID_PARAM
+        return self._request(conn_handle, 7, serve)
+
+    def descriptors_discover(self, conn_handle, p_handle_range):
+        start, end = p_handle_range.start_handle, p_handle_range.end_handle
+
+        def serve(client, server):
+            found = server.device.attrs[start - 1 : end]
+            if found:
+                size = len(server.device.uuid_bytes(*found[0].uuid) or b"")
+                found = [a for a in found if len(server.device.uuid_bytes(*a.uuid) or b"") == size]
+                found = found[: (server.att_mtu - 2) // (2 + size)]
+            descs = []
+            for attr in found:
+                desc = ble_gattc_desc_t()
+                desc.handle = attr.handle
+                desc.uuid = client.device.uuid_struct(server.device.uuid_bytes(*attr.uuid))
+                descs.append(desc)
+            self._respond(
+                server,
+                2 + 18 * len(descs),
+                BLE_GATTC_EVT_DESC_DISC_RSP,
+                BLE_GATT_STATUS_SUCCESS if descs else BLE_GATT_STATUS_ATTERR_ATTRIBUTE_NOT_FOUND,
+                BLE_GATT_HANDLE_INVALID if descs else start,
+                "desc_disc_rsp",
+                count=len(descs),
+                descs=_array_of(ble_gattc_desc_array, descs),
+            )
+
+        if not 0 < start <= end:
+            return NRF_ERROR_INVALID_PARAM
+        return self._request(conn_handle, 5, serve)
+
+    def read(self, conn_handle, handle, offset):
+        def serve(client, server):
+            status, value = server.device.server_read(server, handle, offset)
+            self._respond(
+                server,
+                1 + len(value),
+                BLE_GATTC_EVT_READ_RSP,
+                status,
+                BLE_GATT_HANDLE_INVALID if status == BLE_GATT_STATUS_SUCCESS else handle,
+                "read_rsp",
+                handle=handle,
+                offset=offset,
+                len=len(value),
+                data=_array(value),
+            )
+
+        return self._request(conn_handle, 3 if offset == 0 else 5, serve)
+
+    def write(self, conn_handle, p_write_params):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        write_op = p_write_params.write_op
+        handle = p_write_params.handle
+        offset = p_write_params.offset
+        data = _bytes(p_write_params.p_value, p_write_params.len)
+        if write_op in (BLE_GATT_OP_WRITE_CMD, BLE_GATT_OP_SIGN_WRITE_CMD):
+            if len(data) > conn.att_mtu - 3:
+                return NRF_ERROR_DATA_SIZE
+            if conn.tx_queued["write_cmd"] >= conn.write_cmd_tx_queue_size:
+                return NRF_ERROR_RESOURCES
+            conn.tx_queued["write_cmd"] += 1
+            server = conn.peer
+            conn.send(
+                3 + len(data),
+                lambda: server.device.server_write(
+                    server, handle, 0, data, BLE_GATTS_OP_WRITE_CMD
+                ),
+                kind="write_cmd",
+            )
+            return NRF_SUCCESS
+
+        def write_rsp(server, status, echo=b""):
+            self._respond(
+                server,
+                1 + len(echo) + (4 if echo else 0),
+                BLE_GATTC_EVT_WRITE_RSP,
+                status,
+                BLE_GATT_HANDLE_INVALID if status == BLE_GATT_STATUS_SUCCESS else handle,
+                "write_rsp",
+                handle=handle,
+                write_op=write_op,
+                offset=offset,
+                len=len(echo),
+                data=_array(echo),
+            )
+
+        if write_op == BLE_GATT_OP_WRITE_REQ:
+            if len(data) > conn.att_mtu - 3:
+                return NRF_ERROR_DATA_SIZE
+
+            def serve(client, server):
+                status = server.device.server_write(
+                    server, handle, offset, data, BLE_GATTS_OP_WRITE_REQ
+                )
+                write_rsp(server, status)
+
+            return self._request(conn_handle, 3 + len(data), serve)
+        if write_op == BLE_GATT_OP_PREP_WRITE_REQ:
+            if len(data) > conn.att_mtu - 5:
+                return NRF_ERROR_DATA_SIZE
+
+            def serve(client, server):
+                attr = server.device.attr(handle)
+                if attr is None:
+                    write_rsp(server, BLE_GATT_STATUS_ATTERR_INVALID_HANDLE)
+                    return
+                server.prepared.append((handle, offset, data))
+                write_rsp(server, BLE_GATT_STATUS_SUCCESS, data)
+
+            return self._request(conn_handle, 5 + len(data), serve)
+        if write_op == BLE_GATT_OP_EXEC_WRITE_REQ:
+            flags = p_write_params.flags
+
+            def serve(client, server):
+                prepared, server.prepared = server.prepared, []
+                status = BLE_GATT_STATUS_SUCCESS
+                if flags == BLE_GATT_EXEC_WRITE_FLAG_PREPARED_WRITE:
+                    for prep_handle, prep_offset, prep_data in prepared:
+                        status = server.device.server_write(
+                            server,
+                            prep_handle,
+                            prep_offset,
+                            prep_data,
+                            BLE_GATTS_OP_EXEC_WRITE_REQ_NOW,
+                        )
+                        if status != BLE_GATT_STATUS_SUCCESS:
+                            break
+                write_rsp(server, status)
+
+            return self._request(conn_handle, 2, serve)
+        return NRF_ERROR_INVALID_PARAM
+
+    def hv_confirm(self, conn_handle, handle):
+        conn = self.conn(conn_handle)
+        if conn is None:
+            return BLE_ERROR_INVALID_CONN_HANDLE
+        if conn.indication_received != handle:
+            return NRF_ERROR_INVALID_STATE
+        conn.indication_received = None
+        server = conn.peer
+
+        def confirmed():
+            server.indication = None
+            server.device.post(
+                _evt(BLE_GATTS_EVT_HVC, server.conn_handle, "hvc", handle=handle)
+            )
+
+        conn.send(1, confirmed)
+        return NRF_SUCCESS
+
+
+class adapter_t(object):
+    def __init__(self, internal, device):
+        self.internal = internal
+        self.device = device
+
+
+def _call(adapter, method, *args, **kwargs):
+    """Run a command on the simulated connectivity IC of adapter."""
+    device = adapter.device
+    device.radio.rpc_round_trip()
+    with device.radio.lock:
+        if not device.is_open:
+            return NRF_ERROR_INVALID_STATE
+        if kwargs.get("enabled", True) and not device.enabled:
+            return BLE_ERROR_NOT_ENABLED
+        return method(device, *args)
+
+
+# sd_rpc transport
+
+
+def sd_rpc_physical_layer_create_uart(port_name, baud_rate, flow_control, parity):
+    return _Record(port_name=port_name, baud_rate=baud_rate)
+
+
+def sd_rpc_data_link_layer_create_bt_three_wire(physical_layer, retransmission_interval):
+    return _Record(physical_layer=physical_layer)
+
+
+def sd_rpc_transport_layer_create(data_link_layer, response_timeout):
+    return _Record(data_link_layer=data_link_layer)
+
+
+def sd_rpc_adapter_create(transport_layer):
+    port_name = transport_layer.data_link_layer.physical_layer.port_name
+    return adapter_t(next(radio._internal), _SoftDevice(radio, port_name))
+
+
+def sd_rpc_adapter_delete(adapter):
+    pass
+
+
+def sd_rpc_log_handler_severity_filter_set(adapter, severity_filter):
+    adapter.device.log_severity = severity_filter
+    return NRF_SUCCESS
+
+
+def sd_rpc_serial_port_enum(serial_port_descs, p_size):
+    with radio.lock:
+        ports = sorted(set(d.port for d in radio.devices))
+    ports = ports[: uint32_value(p_size)] if uint32_value(p_size) else ports
+    for index, port in enumerate(ports):
+        desc = serial_port_descs[index]
+        desc.port = port
+        desc.manufacturer = "Simulated"
+        desc.serialNumber = "sim-{}".format(index)
+    uint32_assign(p_size, len(ports))
+    return NRF_SUCCESS
+
+
+def sd_rpc_open(adapter, status_handler, event_handler, log_handler):
+    return adapter.device.open(adapter, status_handler, event_handler, log_handler)
+
+
+def sd_rpc_close(adapter):
+    return adapter.device.close()
+
+
+def sd_rpc_conn_reset(adapter, reset_mode):
+    return NRF_SUCCESS
+
+
+# SoftDevice API
+
+
+def sd_ble_cfg_set(adapter, cfg_id, p_cfg, app_ram_base):
+    return _call(adapter, _SoftDevice.cfg_set, cfg_id, p_cfg, app_ram_base, enabled=False)
+
+
+def sd_ble_enable(adapter, p_app_ram_base):
+    return _call(adapter, _SoftDevice.enable, p_app_ram_base, enabled=False)
+
+
+def sd_ble_version_get(adapter, p_version):
+    return _call(adapter, _SoftDevice.version_get, p_version, enabled=False)
+
+
+def sd_ble_uuid_vs_add(adapter, p_vs_uuid, p_uuid_type):
+    return _call(adapter, _SoftDevice.uuid_vs_add, p_vs_uuid, p_uuid_type)
+
+
+def sd_ble_uuid_decode(adapter, uuid_le_len, p_uuid_le, p_uuid):
+    return _call(adapter, _SoftDevice.uuid_decode, uuid_le_len, p_uuid_le, p_uuid)
+
+
+def sd_ble_gap_addr_set(adapter, p_addr):
+    return _call(adapter, _SoftDevice.addr_set, p_addr)
+
+
+def sd_ble_gap_addr_get(adapter, p_addr):
+    return _call(adapter, _SoftDevice.addr_get, p_addr)
+
+
+def sd_ble_gap_privacy_set(adapter, p_privacy_params):
+    return _call(adapter, _SoftDevice.privacy_set, p_privacy_params)
+
+
+def sd_ble_gap_tx_power_set(adapter, tx_power):
+    return _call(adapter, _SoftDevice.tx_power_set, tx_power)
+
+
+def sd_ble_gap_adv_data_set(adapter, p_data, dlen, p_sr_data, srdlen):
+    return _call(adapter, _SoftDevice.adv_data_set, p_data, dlen, p_sr_data, srdlen)
+
+
+def sd_ble_gap_adv_start(adapter, p_adv_params, conn_cfg_tag=BLE_CONN_CFG_TAG_DEFAULT):
+    return _call(adapter, _SoftDevice.adv_start, p_adv_params, conn_cfg_tag)
+
+
+def sd_ble_gap_adv_stop(adapter):
+    return _call(adapter, _SoftDevice.adv_stop)
+
+
+def sd_ble_gap_scan_start(adapter, p_scan_params):
+    return _call(adapter, _SoftDevice.scan_start, p_scan_params)
+
+
+def sd_ble_gap_scan_stop(adapter):
+    return _call(adapter, _SoftDevice.scan_stop)
+
+
+def sd_ble_gap_connect(
+    adapter, p_peer_addr, p_scan_params, p_conn_params, conn_cfg_tag=BLE_CONN_CFG_TAG_DEFAULT
+):
+    return _call(
+        adapter, _SoftDevice.connect, p_peer_addr, p_scan_params, p_conn_params, conn_cfg_tag
+    )
+
+
+def sd_ble_gap_connect_cancel(adapter):
+    return _call(adapter, _SoftDevice.connect_cancel)
+
+
+def sd_ble_gap_disconnect(adapter, conn_handle, hci_status_code):
+    return _call(adapter, _SoftDevice.disconnect, conn_handle, hci_status_code)
+
+
+def sd_ble_gap_conn_param_update(adapter, conn_handle, p_conn_params):
+    return _call(adapter, _SoftDevice.conn_param_update, conn_handle, p_conn_params)
+
+
+def sd_ble_gap_data_length_update(adapter, conn_handle, p_dl_params, p_dl_limitation):
+    return _call(
+        adapter, _SoftDevice.data_length_update, conn_handle, p_dl_params, p_dl_limitation
+    )
+
+
+def sd_ble_gap_phy_update(adapter, conn_handle, p_gap_phys):
+    return _call(adapter, _SoftDevice.phy_update, conn_handle, p_gap_phys)
+
+
+def sd_ble_gap_rssi_start(adapter, conn_handle, threshold_dbm, skip_count):
+    return _call(adapter, _SoftDevice.rssi_start, conn_handle, threshold_dbm, skip_count)
+
+
+def sd_ble_gap_rssi_stop(adapter, conn_handle):
+    return _call(adapter, _SoftDevice.rssi_stop, conn_handle)
+
+
+def sd_ble_gap_authenticate(adapter, conn_handle, p_sec_params):
+    return _call(adapter, _SoftDevice.authenticate, conn_handle, p_sec_params)
+
+
+def sd_ble_gap_sec_params_reply(adapter, conn_handle, sec_status, p_sec_params, p_sec_keyset):
+    return _call(
+        adapter,
+        _SoftDevice.sec_params_reply,
+        conn_handle,
+        sec_status,
+        p_sec_params,
+        p_sec_keyset,
+    )
+
+
+def sd_ble_gap_lesc_dhkey_reply(adapter, conn_handle, p_dhkey):
+    return _call(adapter, _SoftDevice.lesc_dhkey_reply, conn_handle, p_dhkey)
+
+
+def sd_ble_gap_auth_key_reply(adapter, conn_handle, key_type, p_key):
+    return _call(adapter, _SoftDevice.auth_key_reply, conn_handle, key_type, p_key)
+
+
+def sd_ble_gap_encrypt(adapter, conn_handle, p_master_id, p_enc_info):
+    return _call(adapter, _SoftDevice.encrypt, conn_handle, p_master_id, p_enc_info)
+
+
+def sd_ble_gap_sec_info_reply(adapter, conn_handle, p_enc_info, p_id_info, p_sign_info):
+    return _call(
+        adapter, _SoftDevice.sec_info_reply, conn_handle, p_enc_info, p_id_info, p_sign_info
+    )
+
+
+def sd_ble_gap_conn_sec_get(adapter, conn_handle, p_conn_sec):
+    return _call(adapter, _SoftDevice.conn_sec_get, conn_handle, p_conn_sec)
+
+
+def sd_ble_gattc_primary_services_discover(adapter, conn_handle, start_handle, p_srvc_uuid):
+    return _call(
+        adapter, _SoftDevice.primary_services_discover, conn_handle, start_handle, p_srvc_uuid
+    )
+
+
+def sd_ble_gattc_characteristics_discover(adapter, conn_handle, p_handle_range):
+    return _call(adapter, _SoftDevice.characteristics_discover, conn_handle, p_handle_range)
+
+
+def sd_ble_gattc_descriptors_discover(adapter, conn_handle, p_handle_range):
+    return _call(adapter, _SoftDevice.descriptors_discover, conn_handle, p_handle_range)
+
+
+def sd_ble_gattc_read(adapter, conn_handle, handle, offset):
+    return _call(adapter, _SoftDevice.read, conn_handle, handle, offset)
+
+
+def sd_ble_gattc_write(adapter, conn_handle, p_write_params):
+    return _call(adapter, _SoftDevice.write, conn_handle, p_write_params)
+
+
+def sd_ble_gattc_hv_confirm(adapter, conn_handle, handle):
+    return _call(adapter, _SoftDevice.hv_confirm, conn_handle, handle)
+
+
+def sd_ble_gattc_exchange_mtu_request(adapter, conn_handle, client_rx_mtu):
+    return _call(adapter, _SoftDevice.exchange_mtu_request, conn_handle, client_rx_mtu)
+
+
+def sd_ble_gatts_service_add(adapter, srvc_type, p_uuid, p_handle):
+    return _call(adapter, _SoftDevice.service_add, srvc_type, p_uuid, p_handle)
+
+
+def sd_ble_gatts_characteristic_add(
+    adapter, service_handle, p_char_md, p_attr_char_value, p_handles
+):
+    return _call(
+        adapter,
+        _SoftDevice.characteristic_add,
+        service_handle,
+        p_char_md,
+        p_attr_char_value,
+        p_handles,
+    )
+
+
+def sd_ble_gatts_hvx(adapter, conn_handle, p_hvx_params):
+    return _call(adapter, _SoftDevice.hvx, conn_handle, p_hvx_params)
+
+
+def sd_ble_gatts_sys_attr_set(adapter, conn_handle, p_sys_attr_data, length, flags):
+    return _call(
+        adapter, _SoftDevice.sys_attr_set, conn_handle, p_sys_attr_data, length, flags
+    )
+
+
+def sd_ble_gatts_exchange_mtu_reply(adapter, conn_handle, server_rx_mtu):
+    return _call(adapter, _SoftDevice.exchange_mtu_reply, conn_handle, server_rx_mtu)
@@ -0,0 +1,237 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+Aggregate command throughput over several adapters in one process.
+
+Each adapter gets its own threads that issue commands back to back for a
+fixed time, on the simulated backend with a configurable serial round trip.
+Runs are repeated for each adapter count, to show how throughput scales with
+the number of dongles. --global-lock serializes every command over all
+adapters, as a class wide API lock does, for comparison:
+
+    python benchmark_api_throughput.py --adapters 1,2,4,8 --latency-ms 1 \\
+        --output api_throughput.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import platform
+import sys
+import threading
+import time
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_driver import BLEAdvData, BLEDriver
+from pc_ble_driver_py.sim_driver import radio
+
+from benchmark_event_path import latency_summary
+
+logger = logging.getLogger(__name__)
+
+COMMANDS = dict(
+    version_get=lambda ble_driver: ble_driver.ble_version_get(),
+    addr_get=lambda ble_driver: ble_driver.ble_gap_addr_get(),
+    adv_data_set=lambda ble_driver: ble_driver.ble_gap_adv_data_set(
+        BLEAdvData(complete_local_name="bench")
+    ),
+)
+
+
+class ApiThroughputBenchmark(object):
+    """Issues commands to a number of BLEDrivers from parallel threads."""
+
+    def __init__(self, commands=None, threads_per_adapter=2, global_lock=False):
+        self.commands = list(commands or sorted(COMMANDS))
+        unknown = set(self.commands) - set(COMMANDS)
+        if unknown:
+            raise ValueError("Unknown command: {}".format(", ".join(sorted(unknown))))
+        self.threads_per_adapter = threads_per_adapter
+        self.global_lock = threading.Lock() if global_lock else None
+
+    def _worker(self, ble_driver, deadline, latencies):
+        commands = itertools.cycle(self.commands)
+        while time.perf_counter() < deadline:
+            name = next(commands)
+            start = time.perf_counter()
+            if self.global_lock is not None:
+                with self.global_lock:
+                    COMMANDS[name](ble_driver)
+            else:
+                COMMANDS[name](ble_driver)
+            latencies[name].append(time.perf_counter() - start)
+
+    def run(self, adapters, duration):
+        drivers = list()
+        try:
+            for i in range(adapters):
+                ble_driver = BLEDriver(serial_port="bench-api-{}".format(i), auto_flash=False)
+                ble_driver.open()
+                drivers.append(ble_driver)
+                ble_driver.ble_enable()
+
+            latencies = list()
+            threads = list()
+            deadline = time.perf_counter() + duration
+            for ble_driver in drivers:
+                for _ in range(self.threads_per_adapter):
+                    worker_latencies = dict((name, list()) for name in self.commands)
+                    latencies.append(worker_latencies)
+                    threads.append(
+                        threading.Thread(
+                            target=self._worker, args=(ble_driver, deadline, worker_latencies)
+                        )
+                    )
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            for ble_driver in drivers:
+                ble_driver.close()
+
+        by_command = dict(
+            (
+                name,
+                list(itertools.chain.from_iterable(worker[name] for worker in latencies)),
+            )
+            for name in self.commands
+        )
+        count = sum(len(values) for values in by_command.values())
+        return dict(
+            adapters=adapters,
+            threads=len(threads),
+            duration=elapsed,
+            commands=count,
+            throughput=count / elapsed,
+            throughput_per_adapter=count / elapsed / adapters,
+            latency_us=latency_summary(itertools.chain.from_iterable(by_command.values())),
+            latency_us_by_command=dict(
+                (name, latency_summary(values)) for name, values in by_command.items()
+            ),
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--adapters",
+        type=lambda text: [int(n) for n in text.split(",")],
+        default=[1, 2, 4, 8],
+        help="comma separated adapter counts to run",
+    )
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds per run")
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=1.0,
+        help="one way latency of the simulated serial transport",
+    )
+    parser.add_argument("--threads", type=int, default=2, help="threads per adapter")
+    parser.add_argument(
+        "--commands",
+        type=lambda text: text.split(","),
+        default=sorted(COMMANDS),
+        help="commands to cycle through, from {}".format(", ".join(sorted(COMMANDS))),
+    )
+    parser.add_argument(
+        "--global-lock",
+        action="store_true",
+        help="serialize all commands over all adapters",
+    )
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(message)s")
+
+    benchmark = ApiThroughputBenchmark(
+        commands=args.commands,
+        threads_per_adapter=args.threads,
+        global_lock=args.global_lock,
+    )
+    radio.configure(latency_ms=args.latency_ms)
+    runs = list()
+    try:
+        for adapters in args.adapters:
+            result = benchmark.run(adapters, args.duration)
+            result["speedup"] = result["throughput"] / runs[0]["throughput"] if runs else 1.0
+            runs.append(result)
+            logger.info(
+                "%d adapters: %8.0f commands/s, %6.0f per adapter, p50 %6.0f us, "
+                "p99 %6.0f us, %.2fx",
+                adapters,
+                result["throughput"],
+                result["throughput_per_adapter"],
+                result["latency_us"].get("p50", 0),
+                result["latency_us"].get("p99", 0),
+                result["speedup"],
+            )
+    finally:
+        radio.reset()
+
+    results = dict(
+        benchmark="api_throughput",
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        config=dict(
+            duration=args.duration,
+            latency_ms=args.latency_ms,
+            threads=args.threads,
+            commands=args.commands,
+            global_lock=args.global_lock,
+        ),
+        runs=runs,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,502 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+"""
+Throughput and latency of the Python event path.
+
+Synthetic advertising reports, HVX notifications and write responses are
+handed to BLEDriver.ble_event_handler, the callback the RPC transport calls,
+at a fixed rate. They then go through ble_event_queue, the EventThread, the
+decoders and the registered observers, which record when each event
+arrived. Events are built with the simulated backend, so no connectivity IC
+is needed.
+
+For each rate the run reports latency percentiles from injection to
+observer, the event queue depth, and the CPU time spent per event. Rates
+are swept upwards until the queue can no longer be drained as fast as it is
+filled, and the highest sustained rate is reported. Results can be written
+to JSON for regression tracking:
+
+    python benchmark_event_path.py --mix adv_report=8,hvx=1,write_rsp=1 \\
+        --duration 2 --output event_path.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import platform
+import sys
+import threading
+import time
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_driver import (
+    BLEAdvData,
+    BLEDriver,
+    BLEEvtID,
+    BLEGattWriteOperation,
+    driver,
+)
+from pc_ble_driver_py.observers import BLEDriverObserver
+from pc_ble_driver_py.sim_driver import _array, _evt, _gattc_evt
+
+logger = logging.getLogger(__name__)
+
+EVENT_KINDS = ("adv_report", "hvx", "write_rsp")
+PERCENTILES = (50, 90, 99, 99.9)
+COMPANY_ID = [0x59, 0x00]
+CONN_HANDLE = 0
+ATTR_HANDLE = 0x10
+
+
+def adv_report_evt(seq, payload_len):
+    data = [2, driver.BLE_GAP_AD_TYPE_FLAGS, 0x06]
+    manufacturer_data = COMPANY_ID + list(seq.to_bytes(4, "little"))
+    manufacturer_data += [0] * max(0, payload_len - len(manufacturer_data))
+    data += [len(manufacturer_data) + 1, driver.BLE_GAP_AD_TYPE_MANUFACTURER_SPECIFIC_DATA]
+    data += manufacturer_data
+    peer_addr = driver.ble_gap_addr_t()
+    peer_addr.addr_type = driver.BLE_GAP_ADDR_TYPE_RANDOM_STATIC
+    peer_addr.addr = [0xC0, 0x01, 0x02, 0x03, 0x04, 0x05]
+    return _evt(
+        BLEEvtID.gap_evt_adv_report.value,
+        driver.BLE_CONN_HANDLE_INVALID,
+        "adv_report",
+        peer_addr=peer_addr,
+        direct_addr=driver.ble_gap_addr_t(),
+        rssi=-50,
+        scan_rsp=0,
+        type=driver.BLE_GAP_ADV_TYPE_ADV_IND,
+        dlen=len(data),
+        data=_array(data),
+    )
+
+
+def _payload(seq, payload_len):
+    data = seq.to_bytes(4, "little")
+    return data + bytes(max(0, payload_len - len(data)))
+
+
+def hvx_evt(seq, payload_len):
+    data = _payload(seq, payload_len)
+    return _gattc_evt(
+        BLEEvtID.gattc_evt_hvx.value,
+        CONN_HANDLE,
+        driver.BLE_GATT_STATUS_SUCCESS,
+        driver.BLE_GATT_HANDLE_INVALID,
+        "hvx",
+        handle=ATTR_HANDLE,
+        type=driver.BLE_GATT_HVX_NOTIFICATION,
+        len=len(data),
+        data=_array(data),
+    )
+
+
+def write_rsp_evt(seq, payload_len):
+    data = _payload(seq, payload_len)
+    return _gattc_evt(
+        BLEEvtID.gattc_evt_write_rsp.value,
+        CONN_HANDLE,
+        driver.BLE_GATT_STATUS_SUCCESS,
+        driver.BLE_GATT_HANDLE_INVALID,
+        "write_rsp",
+        handle=ATTR_HANDLE,
+        write_op=BLEGattWriteOperation.write_req.value,
+        offset=0,
+        len=len(data),
+        data=_array(data),
+    )
+
+
+EVENT_BUILDERS = dict(adv_report=adv_report_evt, hvx=hvx_evt, write_rsp=write_rsp_evt)
+
+
+class ArrivalObserver(BLEDriverObserver):
+    """Records the sequence number and arrival time of every synthetic event."""
+
+    def __init__(self):
+        super(ArrivalObserver, self).__init__()
+        self.arrivals = list()
+        self.first_cpu = None
+        self.last_cpu = None
+        self.done = threading.Event()
+        self.expected = None
+
+    def reset(self):
+        self.arrivals = list()
+        self.first_cpu = None
+        self.last_cpu = None
+        self.done.clear()
+        self.expected = None
+
+    def _arrived(self, seq):
+        now = time.perf_counter()
+        cpu = time.thread_time()
+        if self.first_cpu is None:
+            self.first_cpu = cpu
+        self.last_cpu = cpu
+        self.arrivals.append((seq, now))
+        if self.expected is not None and len(self.arrivals) >= self.expected:
+            self.done.set()
+
+    def on_gap_evt_adv_report(self, ble_driver, conn_handle, peer_addr, rssi, adv_type, adv_data):
+        data = adv_data.records[BLEAdvData.Types.manufacturer_specific_data]
+        self._arrived(int.from_bytes(bytes(data[2:6]), "little"))
+
+    def on_gattc_evt_hvx(self, ble_driver, conn_handle, status, error_handle, attr_handle, hvx_type, data):
+        self._arrived(int.from_bytes(bytes(data)[:4], "little"))
+
+    def on_gattc_evt_write_rsp(
+        self, ble_driver, conn_handle, status, error_handle, attr_handle, write_op, offset, data
+    ):
+        self._arrived(int.from_bytes(bytes(data)[:4], "little"))
+
+
+def growth_rate(samples):
+    """Least squares slope of (time, queue depth) samples, in events per second."""
+    if len(samples) < 2:
+        return 0.0
+    n = float(len(samples))
+    mean_t = sum(t for t, _ in samples) / n
+    mean_d = sum(d for _, d in samples) / n
+    var_t = sum((t - mean_t) ** 2 for t, _ in samples)
+    if not var_t:
+        return 0.0
+    return sum((t - mean_t) * (d - mean_d) for t, d in samples) / var_t
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = int(round(pct / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def latency_summary(latencies):
+    """Latency statistics in microseconds."""
+    values = sorted(latencies)
+    summary = dict(count=len(values))
+    if not values:
+        return summary
+    for pct in PERCENTILES:
+        summary["p{:g}".format(pct)] = percentile(values, pct) * 1e6
+    summary["mean"] = sum(values) / len(values) * 1e6
+    summary["max"] = values[-1] * 1e6
+    return summary
+
+
+class EventPathBenchmark(object):
+    """Injects synthetic events into one or more BLEDrivers at a fixed rate."""
+
+    def __init__(self, mix=None, payload_len=20, observers=0, adapters=1, lazy_payloads=False):
+        self.mix = mix or dict(adv_report=1, hvx=1, write_rsp=1)
+        unknown = set(self.mix) - set(EVENT_KINDS)
+        if unknown:
+            raise ValueError("Unknown event kind: {}".format(", ".join(sorted(unknown))))
+        self.payload_len = payload_len
+        self.drivers = list()
+        self.arrival_observers = list()
+        for i in range(adapters):
+            ble_driver = BLEDriver(
+                serial_port="bench-{}".format(i), auto_flash=False, lazy_payloads=lazy_payloads
+            )
+            arrival_observer = ArrivalObserver()
+            ble_driver.observer_register(arrival_observer)
+            # Observers that ignore events, standing in for the rest of an application
+            for _ in range(observers):
+                ble_driver.observer_register(BLEDriverObserver())
+            self.drivers.append(ble_driver)
+            self.arrival_observers.append(arrival_observer)
+        self._schedule = list(
+            itertools.chain.from_iterable([kind] * weight for kind, weight in sorted(self.mix.items()))
+        )
+
+    def open(self):
+        for ble_driver in self.drivers:
+            ble_driver.open()
+
+    def close(self):
+        for ble_driver in self.drivers:
+            ble_driver.close()
+
+    def _inject(self, ble_driver, rate, duration, sent, queue_depths):
+        """Feed events at rate for duration, recording when each was handed over."""
+        kinds = itertools.cycle(self._schedule)
+        total = int(rate * duration)
+        start = time.perf_counter()
+        seq = 0
+        while seq < total:
+            now = time.perf_counter()
+            due = min(total, int((now - start) * rate) + 1)
+            while seq < due:
+                kind = next(kinds)
+                ble_event = EVENT_BUILDERS[kind](seq, self.payload_len)
+                sent.append((kind, time.perf_counter()))
+                ble_driver.ble_event_handler(ble_driver.rpc_adapter, ble_event)
+                seq += 1
+            queue_depths.append((now - start, ble_driver.ble_event_queue.qsize()))
+            wait = start + seq / float(rate) - time.perf_counter()
+            if wait > 0:
+                time.sleep(min(wait, 0.001))
+        return time.perf_counter() - start
+
+    def run(self, rate, duration, drain_timeout=10.0):
+        """Run at rate events per second per adapter and return the measurements."""
+        per_driver = list()
+        for arrival_observer in self.arrival_observers:
+            arrival_observer.reset()
+            arrival_observer.expected = int(rate * duration)
+            per_driver.append(dict(sent=list(), queue_depths=list(), elapsed=None))
+
+        def inject(index):
+            record = per_driver[index]
+            record["elapsed"] = self._inject(
+                self.drivers[index], rate, duration, record["sent"], record["queue_depths"]
+            )
+            record["backlog"] = self.drivers[index].ble_event_queue.qsize()
+            record["injected_at"] = time.perf_counter()
+
+        cpu_start = time.process_time()
+        threads = [
+            threading.Thread(target=inject, args=(i,), name="Injector-{}".format(i))
+            for i in range(len(self.drivers))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for arrival_observer in self.arrival_observers:
+            arrival_observer.done.wait(drain_timeout)
+        cpu_total = time.process_time() - cpu_start
+
+        latencies = dict((kind, list()) for kind in self.mix)
+        sent_count = delivered = backlog = max_depth = 0
+        queue_growth = drain_time = 0.0
+        event_thread_cpu = 0.0
+        elapsed = 0.0
+        for record, arrival_observer in zip(per_driver, self.arrival_observers):
+            sent = record["sent"]
+            arrivals = list(arrival_observer.arrivals)
+            for seq, arrived in arrivals:
+                kind, injected = sent[seq]
+                latencies[kind].append(arrived - injected)
+            sent_count += len(sent)
+            delivered += len(arrivals)
+            backlog += record["backlog"]
+            max_depth = max([max_depth] + [d for _, d in record["queue_depths"]])
+            queue_growth += growth_rate(record["queue_depths"])
+            if arrivals:
+                drain_time = max(drain_time, max(0.0, arrivals[-1][1] - record["injected_at"]))
+            if arrival_observer.first_cpu is not None:
+                event_thread_cpu += arrival_observer.last_cpu - arrival_observer.first_cpu
+            elapsed = max(elapsed, record["elapsed"])
+
+        all_latencies = list(itertools.chain.from_iterable(latencies.values()))
+        offered = rate * len(self.drivers)
+        achieved = sent_count / elapsed if elapsed else 0.0
+        result = dict(
+            rate=offered,
+            adapters=len(self.drivers),
+            duration=elapsed,
+            achieved_rate=achieved,
+            sent=sent_count,
+            delivered=delivered,
+            lost=sent_count - delivered,
+            max_queue_depth=max_depth,
+            queue_growth=queue_growth,
+            backlog_at_end=backlog,
+            drain_time=drain_time if delivered == sent_count else None,
+            latency_us=latency_summary(all_latencies),
+            latency_us_by_kind=dict(
+                (kind, latency_summary(values)) for kind, values in latencies.items()
+            ),
+            cpu_us_per_event=cpu_total / delivered * 1e6 if delivered else None,
+            event_thread_cpu_us_per_event=(
+                event_thread_cpu / max(1, delivered - len(self.drivers)) * 1e6
+                if delivered
+                else None
+            ),
+        )
+        # The event path keeps up when the injector reached the offered rate
+        # and the queue did not grow by more than 1% of it
+        result["sustained"] = (
+            delivered == sent_count
+            and achieved >= 0.95 * offered
+            and queue_growth <= 0.01 * offered
+        )
+        return result
+
+    def sweep(self, start_rate, max_rate, duration, factor=2.0, refine=3):
+        """Raise the rate until it can no longer be sustained.
+
+        Returns all runs and the highest sustained rate per adapter.
+        """
+        runs = list()
+        best = None
+        failed = None
+        rate = start_rate
+        while rate <= max_rate:
+            result = self.run(rate, duration)
+            runs.append(result)
+            logger.info(_format_result(result))
+            if not result["sustained"]:
+                failed = rate
+                break
+            best = rate
+            rate = int(rate * factor)
+
+        if best is not None and failed is not None:
+            for _ in range(refine):
+                rate = (best + failed) // 2
+                if rate in (best, failed):
+                    break
+                result = self.run(rate, duration)
+                runs.append(result)
+                logger.info(_format_result(result))
+                if result["sustained"]:
+                    best = rate
+                else:
+                    failed = rate
+        return runs, best
+
+
+def _format_result(result):
+    latency = result["latency_us"]
+    return (
+        "{rate:>8.0f} ev/s offered {achieved:>8.0f} ev/s achieved, p50 {p50} us, p99 {p99} us, "
+        "max queue {depth}, {cpu} us CPU/event, {state}".format(
+            rate=result["rate"],
+            achieved=result["achieved_rate"],
+            p50="{:.0f}".format(latency["p50"]) if "p50" in latency else "-",
+            p99="{:.0f}".format(latency["p99"]) if "p99" in latency else "-",
+            depth=result["max_queue_depth"],
+            cpu="{:.1f}".format(result["cpu_us_per_event"]) if result["cpu_us_per_event"] else "-",
+            state="sustained" if result["sustained"] else "NOT sustained",
+        )
+    )
+
+
+def parse_mix(text):
+    mix = dict()
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        mix[kind.strip()] = int(weight) if weight else 1
+    return mix
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=parse_mix("adv_report,hvx,write_rsp"),
+        help="event kinds and their weights, e.g. adv_report=8,hvx=1",
+    )
+    parser.add_argument(
+        "--rates",
+        type=lambda text: [int(r) for r in text.split(",")],
+        help="comma separated event rates per adapter to run, instead of a sweep",
+    )
+    parser.add_argument("--start-rate", type=int, default=1000, help="first rate of the sweep")
+    parser.add_argument("--max-rate", type=int, default=1000000, help="last rate of the sweep")
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds per rate")
+    parser.add_argument("--payload", type=int, default=20, help="payload bytes per event")
+    parser.add_argument("--observers", type=int, default=0, help="extra observers per driver")
+    parser.add_argument("--adapters", type=int, default=1, help="drivers fed in parallel")
+    parser.add_argument(
+        "--lazy-payloads",
+        action="store_true",
+        help="pass GATTC payloads as BLEEvtPayload instead of lists",
+    )
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(message)s")
+
+    benchmark = EventPathBenchmark(
+        mix=args.mix,
+        payload_len=args.payload,
+        observers=args.observers,
+        adapters=args.adapters,
+        lazy_payloads=args.lazy_payloads,
+    )
+    benchmark.open()
+    try:
+        if args.rates:
+            runs = list()
+            for rate in args.rates:
+                runs.append(benchmark.run(rate, args.duration))
+                logger.info(_format_result(runs[-1]))
+            sustained = [run["rate"] / args.adapters for run in runs if run["sustained"]]
+            max_sustained = max(sustained) if sustained else None
+        else:
+            runs, max_sustained = benchmark.sweep(args.start_rate, args.max_rate, args.duration)
+    finally:
+        benchmark.close()
+
+    results = dict(
+        benchmark="event_path",
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        config=dict(
+            mix=args.mix,
+            duration=args.duration,
+            payload=args.payload,
+            observers=args.observers,
+            adapters=args.adapters,
+            lazy_payloads=args.lazy_payloads,
+        ),
+        max_sustained_rate=max_sustained,
+        runs=runs,
+    )
+    logger.info("Max sustained rate: %s events/s per adapter", max_sustained)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -34,8 +34,9 @@ class Settings(object):
         mtu,
         nrf_family,
         test_output_directory,
+        driver_backend="serial",
     ):
-        # type: (List[str], int, str, str, int, int, int, int, str, str) -> Settings
+        # type: (List[str], int, str, str, int, int, int, int, str, str, str) -> Settings
         self.serial_ports = serial_ports  # type: List[str]
         self.number_of_iterations = number_of_iterations  # type: int
         self.log_level = getattr(logging, log_level.upper(), None)  # type: int
@@ -46,6 +47,7 @@ class Settings(object):
         self.mtu = mtu  # type: int
         self.nrf_family = nrf_family  # type: str
         self.test_output_directory = test_output_directory  # type: str
+        self.driver_backend = driver_backend  # type: str
 
     @classmethod
     def current(cls):
@@ -71,6 +73,7 @@ class Settings(object):
             "--driver-log-level",
             "--nrf-family",
             "--test-output-directory",
+            "--driver-backend",
         ]
 
         retval = list(sys.argv)
@@ -148,6 +151,12 @@ class Settings(object):
             type=str,
             default="test-reports",
         )
+        parser.add_argument(
+            "--driver-backend",
+            help="serial uses the connectivity IC on the ports, sim simulates both",
+            choices=["serial", "sim"],
+            default="serial",
+        )
         args = parser.parse_args()
 
         cls.settings = Settings(
@@ -161,6 +170,7 @@ class Settings(object):
             args.mtu,
             args.nrf_family,
             args.test_output_directory,
+            args.driver_backend,
         )
 
         return cls.settings
@@ -169,6 +179,7 @@ class Settings(object):
 from pc_ble_driver_py import config
 
 config.__conn_ic_id__ = Settings.current().nrf_family
+config.__driver_backend__ = Settings.current().driver_backend
 
 from pc_ble_driver_py.ble_adapter import BLEAdapter
 
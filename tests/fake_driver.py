@@ -0,0 +1,108 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+"""Stand-in for BLEDriver in tests that need no adapter.
+
+Test modules subclass FakeDriver with the requests they use, and answer them
+with post(), which hands an observer call to the event thread as the driver
+does with SoftDevice events.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class FakeDriver(object):
+    """Calls observers from an event thread, stop() ends it.
+
+    With delay, the event thread sleeps that long before each event.
+    """
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.observers = list()
+        self.observer_lock = threading.Lock()
+        self.events = queue.Queue()
+        self.thread = threading.Thread(
+            target=self._event_thread, name="FakeEventThread", daemon=True
+        )
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def observer_register(self, observer):
+        with self.observer_lock:
+            self.observers = self.observers + [observer]
+
+    def observer_unregister(self, observer):
+        with self.observer_lock:
+            observers = list(self.observers)
+            observers.remove(observer)
+            self.observers = observers
+
+    def post(self, method, **kwargs):
+        """Call method on the observers from the event thread."""
+        self.events.put((method, kwargs))
+
+    def dispatch(self, method, kwargs):
+        for obs in self.observers:
+            getattr(obs, method)(ble_driver=self, **kwargs)
+
+    def stop(self):
+        if self.thread.is_alive():
+            self.events.put(None)
+            self.thread.join()
+
+    def _event_thread(self):
+        while True:
+            item = self.events.get()
+            if item is None:
+                return
+            if self.delay:
+                time.sleep(self.delay)
+            try:
+                self.dispatch(*item)
+            except Exception:
+                logger.exception("Exception in fake event thread")
@@ -0,0 +1,292 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import logging
+import threading
+import time
+import unittest
+from queue import Queue
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.adapter_pool import AdapterPool
+from pc_ble_driver_py.ble_adapter import BLEAdapter
+from pc_ble_driver_py.ble_driver import (
+    BLEUUID,
+    BLEAdvData,
+    BLEConfig,
+    BLEConfigConnGap,
+    BLEConfigGapRoleCount,
+    BLEDriver,
+    BLEGapConnParams,
+    BLEGapConnSecMode,
+    BLEGattCharProps,
+    BLEGattHandle,
+    BLEGattsAttr,
+    BLEGattsAttrMD,
+    BLEGattsCharHandles,
+    BLEGattsCharMD,
+    BLEGattsHVXParams,
+    driver,
+)
+from pc_ble_driver_py.exceptions import NordicSemiException
+from pc_ble_driver_py.observers import AdapterPoolObserver, BLEDriverObserver
+from pc_ble_driver_py.sim_driver import radio
+
+logger = logging.getLogger(__name__)
+
+CFG_TAG = 1
+LINKS_PER_ADAPTER = 2
+UUID_CUSTOM_SERVICE = 0x1111
+UUID_CUSTOM_CHAR = 0x2222
+
+
+class Peripheral(BLEDriverObserver):
+    """Advertises again whenever its link is gone."""
+
+    def __init__(self, port):
+        self.driver = BLEDriver(serial_port=port, auto_flash=False)
+        self.driver.observer_register(self)
+        self.driver.open()
+        self.driver.ble_cfg_set(BLEConfig.conn_gap, BLEConfigConnGap())
+        self.driver.ble_enable()
+        self.write_q = Queue()
+        self.conn_handle = None
+
+        self.char_uuid = BLEUUID(UUID_CUSTOM_CHAR)
+        self.char_handles = BLEGattsCharHandles()
+        serv_handle = BLEGattHandle()
+        perm = BLEGapConnSecMode()
+        perm.set_open()
+        attr = BLEGattsAttr(
+            uuid=self.char_uuid,
+            attr_md=BLEGattsAttrMD(read_perm=perm, write_perm=perm),
+            max_len=20,
+            value=[0],
+        )
+        props = BLEGattCharProps(read=True, write=True, notify=True)
+        self.driver.ble_gatts_service_add(
+            driver.BLE_GATTS_SRVC_TYPE_PRIMARY, BLEUUID(UUID_CUSTOM_SERVICE), serv_handle
+        )
+        self.driver.ble_gatts_characteristic_add(
+            serv_handle.handle, BLEGattsCharMD(char_props=props), attr, self.char_handles
+        )
+        self.driver.ble_gap_adv_data_set(BLEAdvData(complete_local_name=port))
+        self.address = self.driver.ble_gap_addr_get()
+        self.driver.ble_gap_adv_start(tag=CFG_TAG)
+
+    def notify(self, data):
+        hvx_params = BLEGattsHVXParams(
+            handle=self.char_handles, hvx_type=driver.BLE_GATT_HVX_NOTIFICATION, data=data
+        )
+        self.driver.ble_gatts_hvx(self.conn_handle, hvx_params)
+
+    def on_gap_evt_connected(self, ble_driver, conn_handle, peer_addr, role, conn_params):
+        self.conn_handle = conn_handle
+
+    def on_gap_evt_disconnected(self, ble_driver, conn_handle, reason):
+        self.conn_handle = None
+        ble_driver.ble_gap_adv_start(tag=CFG_TAG)
+
+    def on_gatts_evt_write(self, ble_driver, conn_handle, attr_handle, uuid, op,
+                           auth_required, offset, length, data):
+        if attr_handle == self.char_handles.value_handle:
+            self.write_q.put(list(data))
+
+
+class PoolObserver(AdapterPoolObserver):
+    def __init__(self):
+        self.adv_report_q = Queue()
+        self.notification_q = Queue()
+        self.disconnect_q = Queue()
+        self.lost_q = Queue()
+
+    def on_pool_adv_report(self, pool, peer_addr, rssi, adv_type, adv_data):
+        self.adv_report_q.put(tuple(peer_addr.addr))
+
+    def on_pool_notification(self, pool, peer_addr, uuid, data):
+        self.notification_q.put((tuple(peer_addr.addr), data))
+
+    def on_pool_disconnected(self, pool, peer_addr, reason):
+        self.disconnect_q.put((tuple(peer_addr.addr), reason))
+
+    def on_pool_adapter_lost(self, pool, adapter):
+        self.lost_q.put(adapter)
+
+
+def open_central(port):
+    adapter = BLEAdapter(BLEDriver(serial_port=port, auto_flash=False))
+    adapter.open()
+    adapter.driver.ble_cfg_set(
+        BLEConfig.role_count, BLEConfigGapRoleCount(central_role_count=LINKS_PER_ADAPTER)
+    )
+    adapter.driver.ble_cfg_set(
+        BLEConfig.conn_gap, BLEConfigConnGap(conn_count=LINKS_PER_ADAPTER)
+    )
+    adapter.driver.ble_enable()
+    return adapter
+
+
+def close_quietly(ble_driver):
+    try:
+        ble_driver.close()
+    except NordicSemiException:
+        pass
+
+
+class AdapterPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.centrals = [open_central("sim-pool-{}".format(i)) for i in range(3)]
+        self.peripherals = [Peripheral("sim-peer-{}".format(i)) for i in range(5)]
+        conn_params = BLEGapConnParams(
+            min_conn_interval_ms=15,
+            max_conn_interval_ms=15,
+            conn_sup_timeout_ms=500,
+            slave_latency=0,
+        )
+        self.pool = AdapterPool(self.centrals, conn_params=conn_params)
+        self.observer = PoolObserver()
+        self.pool.observer_register(self.observer)
+
+    def tearDown(self):
+        self.pool.close()
+        radio.reset()
+        # Closing joins the worker threads of every driver, do it in parallel
+        drivers = [a.driver for a in self.centrals] + [p.driver for p in self.peripherals]
+        closers = [threading.Thread(target=close_quietly, args=(d,)) for d in drivers]
+        for closer in closers:
+            closer.start()
+        for closer in closers:
+            closer.join()
+
+    def link_counts(self):
+        return sorted(stats["links"] for stats in self.pool.stats())
+
+    def test_capacity_from_configuration(self):
+        self.assertEqual([s["capacity"] for s in self.pool.stats()], [LINKS_PER_ADAPTER] * 3)
+
+    def test_connections_are_balanced(self):
+        links = self.pool.connect_all([p.address for p in self.peripherals])
+        self.assertEqual(self.link_counts(), [1, 2, 2])
+        for link, peripheral in zip(links, self.peripherals):
+            self.assertEqual(link.address.addr, peripheral.address.addr)
+            self.assertIs(self.pool.link(peripheral.address), link)
+
+    def test_pool_full(self):
+        extra = [Peripheral("sim-peer-extra-{}".format(i)) for i in range(2)]
+        self.peripherals.extend(extra)
+        self.pool.connect_all([p.address for p in self.peripherals[:-1]])
+        self.assertEqual(self.link_counts(), [LINKS_PER_ADAPTER] * 3)
+        with self.assertRaises(NordicSemiException):
+            self.pool.connect(extra[-1].address, timeout=0.5)
+        self.assertIsNone(self.pool.link(extra[-1].address))
+
+    def test_shared_scanner(self):
+        self.pool.start_scan()
+        seen = set()
+        while len(seen) < len(self.peripherals):
+            seen.add(self.observer.adv_report_q.get(timeout=5))
+
+        # The scanner has the most airtime, so it is the last one used
+        link = self.pool.connect(self.peripherals[0].address)
+        self.assertIsNot(link.member, self.pool.scanner)
+        self.assertGreater(self.pool.scanner.airtime, 0)
+
+        # Scanning goes on once the scanner had to connect as well
+        self.pool.connect_all([p.address for p in self.peripherals[1:]])
+        while not self.observer.adv_report_q.empty():
+            self.observer.adv_report_q.get()
+        extra = Peripheral("sim-peer-extra")
+        self.peripherals.append(extra)
+        while self.observer.adv_report_q.get(timeout=5) != tuple(extra.address.addr):
+            pass
+        self.pool.stop_scan()
+
+    def test_operations_by_address(self):
+        self.pool.connect_all([p.address for p in self.peripherals])
+        for i, peripheral in enumerate(self.peripherals):
+            self.pool.service_discovery(peripheral.address)
+            self.pool.enable_notification(peripheral.address, peripheral.char_uuid)
+            self.pool.write_req(peripheral.address, peripheral.char_uuid, [i])
+            self.assertEqual(peripheral.write_q.get(timeout=2), [i])
+
+        self.peripherals[3].notify([7, 8])
+        self.assertEqual(
+            self.observer.notification_q.get(timeout=2),
+            (tuple(self.peripherals[3].address.addr), [7, 8]),
+        )
+
+        self.pool.disconnect(self.peripherals[0].address)
+        peer, _ = self.observer.disconnect_q.get(timeout=2)
+        self.assertEqual(peer, tuple(self.peripherals[0].address.addr))
+        time.sleep(0.5)
+        self.assertIsNone(self.pool.link(self.peripherals[0].address))
+        with self.assertRaises(NordicSemiException):
+            self.pool.read_req(self.peripherals[0].address, self.peripherals[0].char_uuid)
+
+    def test_adapter_lost(self):
+        addresses = [p.address for p in self.peripherals[:4]]
+        links = self.pool.connect_all(addresses)
+        lost = links[0].adapter
+        moved = [link.address for link in links if link.adapter is lost]
+
+        radio.unplug("sim-pool-{}".format(self.centrals.index(lost)))
+        self.assertIs(self.observer.lost_q.get(timeout=2), lost)
+        for address in moved:
+            peer, reason = self.observer.disconnect_q.get(timeout=2)
+            self.assertIsNone(reason)
+
+        deadline = time.monotonic() + 10
+        while any(self.pool.link(address) is None for address in addresses):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+        for address in addresses:
+            self.assertIsNot(self.pool.link(address).adapter, lost)
+        self.assertEqual(
+            [s["links"] for s in self.pool.stats() if s["alive"]], [LINKS_PER_ADAPTER] * 2
+        )
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
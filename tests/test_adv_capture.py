@@ -0,0 +1,227 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from queue import Queue
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.adv_capture import (
+    AdvCaptureRecord,
+    AdvRecorder,
+    AdvReplayer,
+    read_adv_capture,
+)
+from pc_ble_driver_py.adv_filter import AdvFilter
+from pc_ble_driver_py.ble_driver import (
+    BLEAdvData,
+    BLEDriver,
+    BLEGapAdvParams,
+    BLEGapScanParams,
+    driver,
+)
+from pc_ble_driver_py.observers import BLEDriverObserver
+
+logger = logging.getLogger(__name__)
+
+ADDR = bytes([1, 2, 3, 4, 5, 0xC6])
+
+
+def records(count, start=1000.0, step=0.1):
+    return [
+        AdvCaptureRecord(
+            timestamp=start + i * step,
+            addr_type=driver.BLE_GAP_ADDR_TYPE_RANDOM_STATIC,
+            addr=ADDR,
+            rssi=-40 - i % 50,
+            adv_type=driver.BLE_GAP_ADV_TYPE_ADV_IND,
+            scan_rsp=i % 2,
+            data=bytes([i % 256]) * (i % 32),
+        )
+        for i in range(count)
+    ]
+
+
+class Observer(BLEDriverObserver):
+    def __init__(self):
+        self.adv_reports = Queue()
+
+    def on_gap_evt_adv_report(self, ble_driver, conn_handle, peer_addr, rssi, adv_type, adv_data):
+        self.adv_reports.put((peer_addr, rssi, adv_type, adv_data))
+
+
+class AdvCaptureFile(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "capture.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, recs, **kwargs):
+        with AdvRecorder(self.path, **kwargs) as recorder:
+            for record in recs:
+                recorder.record_fields(*record)
+        return recorder
+
+    def test_round_trip(self):
+        recs = records(2500)
+        recorder = self.write(recs, block_records=1000)
+        self.assertEqual(recorder.recorded, len(recs))
+        self.assertEqual(list(read_adv_capture(self.path)), recs)
+        # Fixed part, length prefix and data, plus one header per block
+        size = os.path.getsize(self.path)
+        self.assertEqual(size, 12 + 3 * 24 + sum(20 + len(r.data) for r in recs))
+
+    def test_append(self):
+        recs = records(10)
+        self.write(recs[:4])
+        self.write(recs[4:])
+        self.assertEqual(list(read_adv_capture(self.path)), recs)
+
+    def test_time_range(self):
+        recs = records(100, step=1.0)
+        self.write(recs, block_records=10)
+        selected = list(read_adv_capture(self.path, start=1025.0, end=1034.5))
+        self.assertEqual(selected, recs[25:35])
+
+    def test_truncated_block(self):
+        recs = records(30)
+        self.write(recs, block_records=10)
+        with open(self.path, "r+b") as capture:
+            capture.truncate(os.path.getsize(self.path) - 5)
+        self.assertEqual(list(read_adv_capture(self.path)), recs[:20])
+
+    def test_not_a_capture(self):
+        with open(self.path, "wb") as capture:
+            capture.write(b"\x00" * 64)
+        with self.assertRaises(ValueError):
+            list(read_adv_capture(self.path))
+
+    def test_replay_decodes_like_a_report(self):
+        data = bytes([0x05, 0x09]) + b"name"
+        with AdvRecorder(self.path) as recorder:
+            recorder.record_fields(
+                1000.0, 1, ADDR, -42, driver.BLE_GAP_ADV_TYPE_ADV_IND, 0, data
+            )
+        ble_driver = BLEDriver(serial_port="sim-replay-sync")
+        observer = Observer()
+        ble_driver.observer_register(observer)
+        self.assertEqual(AdvReplayer(ble_driver, self.path, queued=False).run(), 1)
+        peer_addr, rssi, adv_type, adv_data = observer.adv_reports.get_nowait()
+        self.assertEqual(peer_addr.addr, list(ADDR[::-1]))
+        self.assertEqual(rssi, -42)
+        self.assertEqual(adv_type.value, driver.BLE_GAP_ADV_TYPE_ADV_IND)
+        self.assertEqual(adv_data.records[BLEAdvData.Types.complete_local_name], list(b"name"))
+
+    def test_replay_speed(self):
+        self.write(records(5, step=0.1))
+        ble_driver = BLEDriver(serial_port="sim-replay-speed")
+        started = time.monotonic()
+        AdvReplayer(ble_driver, self.path, speed=2.0, queued=False).run()
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+
+class AdvCaptureDriver(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "capture.bin")
+        self.drivers = [
+            BLEDriver(serial_port="sim-capture-{}".format(i)) for i in range(4)
+        ]
+        for ble_driver in self.drivers:
+            ble_driver.open()
+            ble_driver.ble_enable()
+        self.central, self.replay = self.drivers[:2]
+
+    def tearDown(self):
+        for ble_driver in self.drivers:
+            ble_driver.close()
+        shutil.rmtree(self.dir)
+
+    def test_capture_and_replay(self):
+        for i, peripheral in enumerate(self.drivers[2:]):
+            peripheral.ble_gap_adv_data_set(BLEAdvData(complete_local_name="dev-{}".format(i)))
+            peripheral.ble_gap_adv_start(BLEGapAdvParams(interval_ms=20, timeout_s=0))
+
+        recorder = AdvRecorder(self.path)
+        self.central.adv_recorder_set(recorder)
+        # Captured before the filter
+        self.central.adv_filter_set(AdvFilter(name_prefix="nothing"))
+        self.central.ble_gap_scan_start(
+            BLEGapScanParams(interval_ms=20, window_ms=20, timeout_s=0, active=False)
+        )
+        time.sleep(0.3)
+        self.central.ble_gap_scan_stop()
+        self.central.adv_recorder_set(None)
+        recorder.close()
+        self.assertGreater(recorder.recorded, 10)
+
+        observer = Observer()
+        self.replay.observer_register(observer)
+        self.replay.adv_filter_set(AdvFilter(name_prefix="dev-1"))
+        # Replayed reports are not captured again
+        replay_recorder = AdvRecorder(os.path.join(self.dir, "replay.bin"))
+        self.replay.adv_recorder_set(replay_recorder)
+        count = AdvReplayer(self.replay, self.path, speed=None).run()
+        self.replay.adv_recorder_set(None)
+        replay_recorder.close()
+        self.assertEqual(count, recorder.recorded)
+        self.assertEqual(replay_recorder.recorded, 0)
+        time.sleep(0.2)
+        names = set()
+        while not observer.adv_reports.empty():
+            adv_data = observer.adv_reports.get()[3]
+            names.add(bytes(adv_data.records[BLEAdvData.Types.complete_local_name]))
+        self.assertEqual(names, {b"dev-1"})
+        self.assertGreater(self.replay.adv_filtered, 0)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,154 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import logging
+import pickle
+import random
+import unittest
+from types import SimpleNamespace
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_driver import BLEAdvData, driver
+
+logger = logging.getLogger(__name__)
+
+Types = BLEAdvData.Types
+
+
+def reference_records(data):
+    """Records as decoded by the Enum based parser BLEAdvData.from_c used to have."""
+    ad_list = list(data)
+    records = dict()
+    index = 0
+    while index < len(ad_list):
+        try:
+            ad_len = ad_list[index]
+            if ad_len == 0:
+                return records
+            ad_type = ad_list[index + 1]
+            offset = index + 2
+            records[Types(ad_type)] = ad_list[offset: offset + ad_len - 1]
+        except ValueError:
+            pass
+        except IndexError:
+            return records
+        index += ad_len + 1
+    return records
+
+
+def adv_report(data):
+    array = driver.uint8_array(len(data))
+    array[:] = data
+    return SimpleNamespace(data=array, dlen=len(data))
+
+
+ADV = bytes(
+    [0x02, Types.flags.value, 0x06]
+    + [0x05, Types.complete_local_name.value] + list(b"name")
+    + [0x03, 0xF0, 0x01, 0x02]  # Unknown AD type
+    + [0x05, Types.manufacturer_specific_data.value, 0x59, 0x00, 0x01, 0x02]
+)
+
+
+class AdvData(unittest.TestCase):
+    def test_all_records(self):
+        adv_data = BLEAdvData.from_bytes(ADV)
+        self.assertEqual(
+            adv_data.records,
+            {
+                Types.flags: [0x06],
+                Types.complete_local_name: list(b"name"),
+                Types.manufacturer_specific_data: [0x59, 0x00, 0x01, 0x02],
+            },
+        )
+        self.assertEqual(adv_data.raw, ADV)
+
+    def test_from_c(self):
+        self.assertEqual(BLEAdvData.from_c(adv_report(ADV)).records, reference_records(ADV))
+
+    def test_memoryview(self):
+        self.assertEqual(
+            BLEAdvData.from_bytes(memoryview(ADV)).records, reference_records(ADV)
+        )
+
+    def test_ad_type_allowlist(self):
+        ad_types = BLEAdvData.ad_type_values([Types.complete_local_name, 0xF0])
+        adv_data = BLEAdvData.from_bytes(ADV, ad_types)
+        self.assertEqual(adv_data.records, {Types.complete_local_name: list(b"name")})
+
+    def test_lazy(self):
+        adv_data = BLEAdvData.from_bytes(ADV, lazy=True)
+        self.assertIsNone(adv_data._records)
+        self.assertEqual(adv_data.records, reference_records(ADV))
+        self.assertIs(adv_data.records, adv_data.records)
+
+    def test_malformed(self):
+        for data in (
+            b"",
+            b"\x05",
+            b"\x00\x02\x01\x06",
+            b"\x02\x01\x06\x09\x09ab",
+            bytes([0x02, 0x01]),
+        ):
+            self.assertEqual(BLEAdvData.from_bytes(data).records, reference_records(data))
+
+    def test_matches_reference_parser(self):
+        rand = random.Random(1)
+        for _ in range(2000):
+            data = bytes(rand.randrange(256) for _ in range(rand.randrange(32)))
+            self.assertEqual(
+                BLEAdvData.from_bytes(data).records, reference_records(data), data.hex()
+            )
+
+    def test_pickle(self):
+        adv_data = pickle.loads(pickle.dumps(BLEAdvData.from_bytes(ADV, lazy=True)))
+        self.assertEqual(adv_data.records, reference_records(ADV))
+        adv_data = pickle.loads(pickle.dumps(BLEAdvData(complete_local_name="name")))
+        self.assertEqual(adv_data.records, {Types.complete_local_name: "name"})
+        self.assertEqual(adv_data.to_c()[0], 6)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,192 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import logging
+import time
+import unittest
+from queue import Queue
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.adv_filter import AdvFilter, compile_adv_filters
+from pc_ble_driver_py.ble_driver import (
+    BLEUUID,
+    BLEAdvData,
+    BLEDriver,
+    BLEGapAddr,
+    BLEGapAdvParams,
+    BLEGapScanParams,
+    BLEUUIDBase,
+    driver,
+)
+from pc_ble_driver_py.observers import BLEDriverObserver
+
+logger = logging.getLogger(__name__)
+
+# Over the air order, least significant byte first
+ADDR = bytes([0x66, 0x55, 0x44, 0x33, 0x22, 0xC1])
+VENDOR_BASE = [0x11, 0x22, 0x00, 0x00, 0x33, 0x44, 0x55, 0x66,
+               0x77, 0x88, 0x99, 0xAA, 0xBB, 0xCC, 0xDD, 0xEE]
+ADV = bytes(
+    [0x02, 0x01, 0x06]
+    + [0x05, 0x03, 0x0D, 0x18, 0x0F, 0x18]  # Heart rate, battery
+    + [0x11, 0x07] + [0xEE, 0xDD, 0xCC, 0xBB, 0xAA, 0x99, 0x88, 0x77,
+                      0x66, 0x55, 0x44, 0x33, 0x34, 0x12, 0x22, 0x11]
+    + [0x05, 0xFF, 0x59, 0x00, 0x01, 0x02]
+    + [0x08, 0x09] + list(b"sensor1")
+)
+
+
+def matches(adv_filter, addr_type=1, addr=ADDR, rssi=-50, data=ADV):
+    return adv_filter.compile()(addr_type, addr, rssi, data)
+
+
+class AdvFilterPredicate(unittest.TestCase):
+    def test_empty_filter_matches_all(self):
+        self.assertTrue(matches(AdvFilter()))
+        self.assertTrue(matches(AdvFilter(), data=b""))
+
+    def test_addr(self):
+        self.assertTrue(matches(AdvFilter(addr=[0xC1, 0x22, 0x33, 0x44, 0x55, 0x66])))
+        self.assertTrue(matches(AdvFilter(addr=[0xC1, 0x22, 0x33])))
+        self.assertTrue(
+            matches(AdvFilter(addr=BLEGapAddr(BLEGapAddr.Types.random_static, [0xC1])))
+        )
+        self.assertFalse(matches(AdvFilter(addr=[0x22, 0x33])))
+
+    def test_addr_type(self):
+        self.assertTrue(matches(AdvFilter(addr_type=BLEGapAddr.Types.random_static)))
+        self.assertTrue(matches(AdvFilter(addr_type=[0, 1])))
+        self.assertFalse(matches(AdvFilter(addr_type=BLEGapAddr.Types.public)))
+
+    def test_rssi(self):
+        self.assertTrue(matches(AdvFilter(rssi_min=-50)))
+        self.assertFalse(matches(AdvFilter(rssi_min=-49)))
+
+    def test_service_uuid(self):
+        self.assertTrue(matches(AdvFilter(service_uuid=0x180F)))
+        self.assertTrue(matches(AdvFilter(service_uuid=BLEUUID(0x180D))))
+        self.assertTrue(matches(AdvFilter(service_uuid=BLEUUID(0x1234, BLEUUIDBase(VENDOR_BASE)))))
+        self.assertFalse(matches(AdvFilter(service_uuid=0x1810)))
+        # BLEUUIDs from events and discovery carry the type but not the base
+        sig_base = BLEUUIDBase(None, driver.BLE_UUID_TYPE_BLE)
+        self.assertTrue(matches(AdvFilter(service_uuid=BLEUUID(0x180D, sig_base))))
+        vendor_base = BLEUUIDBase(None, driver.BLE_UUID_TYPE_VENDOR_BEGIN)
+        with self.assertRaises(ValueError):
+            AdvFilter(service_uuid=BLEUUID(0x1234, vendor_base)).compile()
+        # Only whole UUIDs in the list match
+        self.assertFalse(matches(AdvFilter(service_uuid=0x0F18)))
+        self.assertFalse(matches(AdvFilter(service_uuid=0x180D0F18)))
+
+    def test_company_id(self):
+        self.assertTrue(matches(AdvFilter(company_id=0x0059)))
+        self.assertFalse(matches(AdvFilter(company_id=0x004C)))
+
+    def test_name_prefix(self):
+        self.assertTrue(matches(AdvFilter(name_prefix="sens")))
+        self.assertTrue(matches(AdvFilter(name_prefix=b"sensor1")))
+        self.assertFalse(matches(AdvFilter(name_prefix="sensor12")))
+        self.assertFalse(matches(AdvFilter(name_prefix="sens"), data=ADV[:-9]))
+
+    def test_all_conditions(self):
+        self.assertTrue(matches(AdvFilter(rssi_min=-60, company_id=0x0059, name_prefix="s")))
+        self.assertFalse(matches(AdvFilter(rssi_min=-40, company_id=0x0059, name_prefix="s")))
+
+    def test_any_filter(self):
+        predicate = compile_adv_filters([AdvFilter(name_prefix="x"), AdvFilter(rssi_min=-60)])
+        self.assertTrue(predicate(1, ADDR, -50, ADV))
+        self.assertFalse(predicate(1, ADDR, -70, ADV))
+
+    def test_malformed_data(self):
+        for data in (b"\x05", b"\x00\x09abc", b"\x09\x09sens", ADV[:-3] + b"\x10"):
+            matches(AdvFilter(name_prefix="sens", service_uuid=0x180F), data=data)
+
+
+class Observer(BLEDriverObserver):
+    def __init__(self):
+        self.names = Queue()
+
+    def on_gap_evt_adv_report(self, ble_driver, conn_handle, peer_addr, rssi, adv_type, adv_data):
+        self.names.put(bytes(adv_data.records[BLEAdvData.Types.complete_local_name]))
+
+
+class AdvFilterDriver(unittest.TestCase):
+    def setUp(self):
+        self.central = BLEDriver(serial_port="sim-filter-central")
+        self.peripherals = [BLEDriver(serial_port="sim-filter-{}".format(i)) for i in range(3)]
+        for ble_driver in [self.central] + self.peripherals:
+            ble_driver.open()
+            ble_driver.ble_enable()
+        self.observer = Observer()
+        self.central.observer_register(self.observer)
+
+    def tearDown(self):
+        for ble_driver in [self.central] + self.peripherals:
+            ble_driver.close()
+
+    def test_reports_filtered_before_queue(self):
+        for i, peripheral in enumerate(self.peripherals):
+            name = "{}-{}".format("sensor" if i == 1 else "other", i)
+            peripheral.ble_gap_adv_data_set(BLEAdvData(complete_local_name=name))
+            peripheral.ble_gap_adv_start(BLEGapAdvParams(interval_ms=20, timeout_s=0))
+
+        self.central.adv_filter_set(AdvFilter(name_prefix="sensor"))
+        self.central.ble_gap_scan_start(
+            BLEGapScanParams(interval_ms=20, window_ms=20, timeout_s=0, active=False)
+        )
+        time.sleep(0.5)
+        self.central.ble_gap_scan_stop()
+        time.sleep(0.1)
+
+        names = set()
+        while not self.observer.names.empty():
+            names.add(self.observer.names.get())
+        self.assertEqual(names, {b"sensor-1"})
+        stats = self.central.queue_stats()
+        self.assertGreater(stats["adv_filtered"], 0)
+        self.assertEqual(stats["ble_event"]["adv_report"]["dropped"], 0)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
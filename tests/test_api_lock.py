@@ -0,0 +1,111 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import logging
+import threading
+import time
+import unittest
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_driver import BLEDriver
+from pc_ble_driver_py.sim_driver import radio
+
+import benchmark_api_throughput
+
+logger = logging.getLogger(__name__)
+
+LATENCY_MS = 50  # One way, so each command takes 100 ms
+
+
+def timed_parallel(calls):
+    threads = [threading.Thread(target=call) for call in calls]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - start
+
+
+class ApiLockTest(unittest.TestCase):
+    def setUp(self):
+        self.drivers = list()
+        for port in ("sim-api-a", "sim-api-b"):
+            ble_driver = BLEDriver(serial_port=port, auto_flash=False)
+            ble_driver.open()
+            ble_driver.ble_enable()
+            self.drivers.append(ble_driver)
+        radio.configure(latency_ms=LATENCY_MS)
+
+    def tearDown(self):
+        radio.reset()
+        for ble_driver in self.drivers:
+            ble_driver.close()
+
+    def test_adapters_in_parallel(self):
+        elapsed = timed_parallel([driver.ble_version_get for driver in self.drivers])
+        self.assertLess(elapsed, 3 * LATENCY_MS / 1000.0)
+
+    def test_one_adapter_serialized(self):
+        ble_driver = self.drivers[0]
+        elapsed = timed_parallel([ble_driver.ble_version_get, ble_driver.ble_gap_addr_get])
+        self.assertGreaterEqual(elapsed, 4 * LATENCY_MS / 1000.0)
+
+
+class ApiThroughputBenchmarkTest(unittest.TestCase):
+    def test_scales_with_adapters(self):
+        results = benchmark_api_throughput.main(
+            ["--adapters", "1,4", "--duration", "0.5", "--latency-ms", "5"]
+            + ["--log-level", "warning"]
+        )
+        one, four = results["runs"]
+        self.assertEqual(four["adapters"], 4)
+        self.assertGreater(four["commands"], 0)
+        self.assertGreater(four["speedup"], 2)
+        self.assertEqual(radio.latency_ms, 0.0)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,111 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+import benchmark_event_path
+from benchmark_event_path import EventPathBenchmark, growth_rate, parse_mix
+
+logger = logging.getLogger(__name__)
+
+
+class EventPathBenchmarkTest(unittest.TestCase):
+    def setUp(self):
+        self.benchmark = EventPathBenchmark(observers=2)
+        self.benchmark.open()
+
+    def tearDown(self):
+        self.benchmark.close()
+
+    def test_all_events_delivered(self):
+        result = self.benchmark.run(rate=300, duration=0.5)
+        self.assertEqual(result["sent"], 150)
+        self.assertEqual(result["delivered"], 150)
+        self.assertTrue(result["sustained"])
+        for kind in ("adv_report", "hvx", "write_rsp"):
+            self.assertEqual(result["latency_us_by_kind"][kind]["count"], 50)
+        latency = result["latency_us"]
+        self.assertLessEqual(latency["p50"], latency["p99"])
+        self.assertLessEqual(latency["p99"], latency["max"])
+        self.assertGreater(result["event_thread_cpu_us_per_event"], 0)
+
+    def test_lazy_payloads(self):
+        self.benchmark.close()
+        self.benchmark = EventPathBenchmark(mix=dict(hvx=1), lazy_payloads=True)
+        self.benchmark.open()
+        result = self.benchmark.run(rate=200, duration=0.25)
+        self.assertEqual(result["delivered"], 50)
+
+
+class HelperTest(unittest.TestCase):
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix("adv_report=8,hvx"), dict(adv_report=8, hvx=1))
+
+    def test_growth_rate(self):
+        self.assertAlmostEqual(growth_rate([(0, 0), (1, 10), (2, 20)]), 10.0)
+        self.assertEqual(growth_rate([(0, 5), (1, 5)]), 0.0)
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            EventPathBenchmark(mix=dict(connected=1))
+
+    def test_json_output(self):
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            benchmark_event_path.main(
+                ["--rates", "200", "--duration", "0.25", "--output", path, "--log-level", "warning"]
+            )
+            with open(path) as f:
+                results = json.load(f)
+        finally:
+            os.remove(path)
+        self.assertEqual(results["max_sustained_rate"], 200)
+        self.assertEqual(len(results["runs"]), 1)
+        self.assertEqual(results["runs"][0]["delivered"], 50)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
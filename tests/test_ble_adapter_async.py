@@ -0,0 +1,377 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import asyncio
+import logging
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_adapter import BLEAdapter
+from pc_ble_driver_py.ble_adapter_async import AsyncBLEAdapter, AsyncSubscriber
+from pc_ble_driver_py.ble_driver import (
+    BLEEvtID,
+    BLEGapAddr,
+    BLEGapEncInfo,
+    BLEGapEncKey,
+    BLEGapMasterId,
+    BLEGapRoles,
+    BLEGattHVXType,
+    BLEGattStatusCode,
+)
+from pc_ble_driver_py.bond_store import Bond, BondStore
+from pc_ble_driver_py.event_queue import QueuePolicy
+from pc_ble_driver_py.exceptions import NordicSemiException
+
+from fake_driver import FakeDriver
+
+logger = logging.getLogger(__name__)
+
+CONNECTIONS = 20
+# Writes to this handle get no response
+SILENT_HANDLE = 0x5117
+# Reads of this handle block in the driver call
+SLOW_HANDLE = 0x510
+
+
+class PeerDriver(FakeDriver):
+    """Connects to any address and answers GATTC requests of every connection."""
+
+    def __init__(self):
+        super(PeerDriver, self).__init__(delay=0.001)
+        self.conn_cfg_tags = dict()
+        self.write_cmd_tx_queue_sizes = dict()
+        self.hvn_tx_queue_sizes = dict()
+        self.next_conn_handle = 0
+        self.encrypted = list()
+
+    def ble_gap_connect(self, address, scan_params=None, conn_params=None, tag=0):
+        conn_handle = self.next_conn_handle
+        self.next_conn_handle += 1
+        self.post(
+            "on_gap_evt_connected",
+            conn_handle=conn_handle,
+            peer_addr=address,
+            role=BLEGapRoles.central,
+            conn_params=conn_params,
+        )
+
+    def ble_gap_disconnect(self, conn_handle):
+        self.post("on_gap_evt_disconnected", conn_handle=conn_handle, reason=0x16)
+
+    def ble_gattc_read(self, conn_handle, handle, offset):
+        if handle == SLOW_HANDLE:
+            # A response timeout in the serial transport
+            time.sleep(0.5)
+        self.post(
+            "on_gattc_evt_read_rsp",
+            conn_handle=conn_handle,
+            status=BLEGattStatusCode.success,
+            error_handle=0,
+            attr_handle=handle,
+            offset=offset,
+            data=[conn_handle, handle],
+        )
+
+    def ble_gattc_write(self, conn_handle, write_params):
+        if write_params.handle == SILENT_HANDLE:
+            return
+        self.post(
+            "on_gattc_evt_write_rsp",
+            conn_handle=conn_handle,
+            status=BLEGattStatusCode.write_not_permitted
+            if write_params.handle == 0xBAD
+            else BLEGattStatusCode.success,
+            error_handle=0,
+            attr_handle=write_params.handle,
+            write_op=write_params.write_op,
+            offset=0,
+            data=write_params.data,
+        )
+
+    def ble_gattc_hv_confirm(self, conn_handle, attr_handle):
+        pass
+
+    def ble_gap_conn_param_update(self, conn_handle, conn_params):
+        pass
+
+    def ble_gattc_prim_srvc_disc(self, conn_handle, srvc_uuid, start_handle):
+        if conn_handle == SILENT_HANDLE:
+            return
+        # Every peer has an empty database
+        self.post(
+            "on_gattc_evt_prim_srvc_disc_rsp",
+            conn_handle=conn_handle,
+            status=BLEGattStatusCode.attribute_not_found,
+            services=[],
+        )
+
+    def ble_gap_encrypt(self, conn_handle, master_id, enc_info, lesc):
+        self.encrypted.append((master_id.ediv, list(enc_info.ltk)))
+        self.post("on_gap_evt_conn_sec_update", conn_handle=conn_handle, conn_sec="conn_sec")
+
+    def hvx(self, conn_handle, attr_handle, hvx_type, data):
+        self.post(
+            "on_gattc_evt_hvx",
+            conn_handle=conn_handle,
+            status=BLEGattStatusCode.success,
+            error_handle=0,
+            attr_handle=attr_handle,
+            hvx_type=hvx_type,
+            data=data,
+        )
+
+
+class AsyncBLEAdapterTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.driver = PeerDriver()
+        self.adapter = AsyncBLEAdapter(BLEAdapter(self.driver), loop=self.loop)
+
+    def tearDown(self):
+        self.driver.stop()
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def run_async(self, coro):
+        return self.loop.run_until_complete(asyncio.wait_for(coro, 10))
+
+    def _address(self, i):
+        return BLEGapAddr(BLEGapAddr.Types.random_static, [i] * 6)
+
+    def test_many_connections_one_loop(self):
+        async def main():
+            results = list()
+            # One connection can be in progress at a time
+            for i in range(CONNECTIONS):
+                conn_handle = await self.adapter.connect(self._address(i))
+                results.append(
+                    self.adapter.read_req(conn_handle, None, attr_handle=0x10)
+                )
+            return await asyncio.gather(*results)
+
+        threads = threading.active_count()
+        start = time.perf_counter()
+        results = self.run_async(main())
+        logger.info(
+            "%d connections: %.3f s, %d threads",
+            CONNECTIONS,
+            time.perf_counter() - start,
+            threading.active_count(),
+        )
+        # Driver calls share the one executor thread of the adapter
+        self.assertLessEqual(threading.active_count(), threads + 1)
+        self.assertEqual(
+            [(BLEGattStatusCode.success, [i, 0x10]) for i in range(CONNECTIONS)], results
+        )
+
+    def test_write_status_is_checked(self):
+        async def main():
+            conn_handle = await self.adapter.connect(self._address(1))
+            await self.adapter.write_req(conn_handle, None, [1], attr_handle=0x12)
+            with self.assertRaises(NordicSemiException) as ctx:
+                await self.adapter.write_req(conn_handle, None, [1], attr_handle=0xBAD)
+            self.assertEqual(BLEGattStatusCode.write_not_permitted, ctx.exception.error_code)
+
+        self.run_async(main())
+
+    def test_blocking_call_keeps_loop_running(self):
+        async def main():
+            conn_handle = await self.adapter.connect(self._address(1))
+            read = asyncio.ensure_future(
+                self.adapter.read_req(conn_handle, None, attr_handle=SLOW_HANDLE)
+            )
+            ticks = 0
+            while not read.done():
+                await asyncio.sleep(0.01)
+                ticks += 1
+            await read
+            return ticks
+
+        self.assertGreater(self.run_async(main()), 10)
+
+    def test_discover_services(self):
+        async def main():
+            conn_handle = await self.adapter.connect(self._address(1))
+            stats = await self.adapter.discover_services(conn_handle)
+            self.assertEqual([], self.adapter.adapter.db_conns[conn_handle].services)
+            with self.assertRaises(NordicSemiException):
+                await self.adapter.discover_services(SILENT_HANDLE, timeout=0.1)
+            return stats
+
+        self.assertEqual(1, self.run_async(main())["services"]["requests"])
+
+    def test_encrypt_with_bond(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        store = BondStore(path)
+        store.store(
+            Bond(
+                self._address(1),
+                peer_enc_key=BLEGapEncKey(
+                    BLEGapMasterId(ediv=0x1234, rand=[1] * 8),
+                    BLEGapEncInfo(ltk=[2] * 16, auth=1, lesc=0, ltk_len=16),
+                ),
+            )
+        )
+        self.adapter.adapter.bond_store = store
+
+        async def main():
+            conn_handle = await self.adapter.connect(self._address(1))
+            conn_sec = await self.adapter.encrypt(conn_handle)
+            unbonded = await self.adapter.connect(self._address(2))
+            with self.assertRaises(NordicSemiException):
+                await self.adapter.encrypt(unbonded)
+            return conn_sec
+
+        self.assertEqual("conn_sec", self.run_async(main()))
+        self.assertEqual([(0x1234, [2] * 16)], self.driver.encrypted)
+
+    def test_disconnect_fails_requests(self):
+        async def main():
+            conn_handle = await self.adapter.connect(self._address(1))
+            write = asyncio.ensure_future(
+                self.adapter.write_req(conn_handle, None, [1], attr_handle=SILENT_HANDLE)
+            )
+            update = asyncio.ensure_future(
+                self.adapter.conn_param_update(conn_handle, "params")
+            )
+            await asyncio.sleep(0)
+            await self.adapter.disconnect(conn_handle)
+            for request in (write, update):
+                with self.assertRaises(NordicSemiException):
+                    await request
+
+        start = time.perf_counter()
+        self.run_async(main())
+        self.assertLess(time.perf_counter() - start, 1)
+
+    def test_notifications(self):
+        async def main():
+            conn_handle = await self.adapter.connect(self._address(1))
+            received = list()
+
+            async def consume():
+                async for hvx in self.adapter.notifications(conn_handle, attr_handle=0x20):
+                    received.append((hvx["hvx_type"], hvx["data"]))
+                    if len(received) == 3:
+                        break
+
+            consumer = asyncio.ensure_future(consume())
+            await asyncio.sleep(0)
+            self.driver.hvx(conn_handle, 0x20, BLEGattHVXType.notification, [1])
+            self.driver.hvx(conn_handle, 0x30, BLEGattHVXType.notification, [9])
+            self.driver.hvx(conn_handle, 0x20, BLEGattHVXType.indication, [2])
+            self.driver.hvx(conn_handle, 0x20, BLEGattHVXType.notification, [3])
+            await consumer
+            return received
+
+        self.assertEqual(
+            [
+                (BLEGattHVXType.notification, [1]),
+                (BLEGattHVXType.indication, [2]),
+                (BLEGattHVXType.notification, [3]),
+            ],
+            self.run_async(main()),
+        )
+        self.assertEqual([], self.adapter._hvx)
+
+    def test_subscriber_policies(self):
+        async def main():
+            oldest = AsyncSubscriber(2, QueuePolicy.drop_oldest)
+            newest = AsyncSubscriber(2, QueuePolicy.drop_newest)
+            for i in range(5):
+                self.adapter._publish([oldest, newest], i)
+            return (
+                [await oldest.get() for _ in range(2)],
+                [await newest.get() for _ in range(2)],
+                oldest.dropped,
+                newest.dropped,
+            )
+
+        self.assertEqual(([3, 4], [0, 1], 3, 3), self.run_async(main()))
+        with self.assertRaises(ValueError):
+            AsyncSubscriber(2, QueuePolicy.block)
+
+    def test_advertising_reports_are_bounded(self):
+        async def main():
+            reports = self.adapter.advertising_reports(maxsize=2)
+            first = asyncio.ensure_future(reports.__anext__())
+            await asyncio.sleep(0)
+            self.adapter._publish(self.adapter._adv_reports, dict(rssi=0))
+            received = [await first]
+            # The consumer falls behind, only the latest two are kept
+            for i in range(1, 6):
+                self.adapter._publish(self.adapter._adv_reports, dict(rssi=i))
+            received.append(await reports.__anext__())
+            received.append(await reports.__anext__())
+            await reports.aclose()
+            return [report["rssi"] for report in received]
+
+        self.assertEqual([0, 4, 5], self.run_async(main()))
+        self.assertEqual([], self.adapter._adv_reports)
+
+    def test_disconnect_wakes_waiters(self):
+        async def main():
+            conn_handle = await self.adapter.connect(self._address(1))
+            responses = self.adapter.expect(conn_handle, BLEEvtID.gattc_evt_read_rsp)
+            reason = await self.adapter.disconnect(conn_handle)
+            self.assertIsNone(await responses.wait(timeout=1))
+            responses.close()
+            return reason
+
+        start = time.perf_counter()
+        self.assertEqual(0x16, self.run_async(main()))
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(dict(), self.adapter._queues)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
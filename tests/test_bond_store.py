@@ -0,0 +1,295 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from queue import Queue
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_adapter import BLEAdapter
+from pc_ble_driver_py.ble_driver import (
+    BLEAdvData,
+    BLEConfig,
+    BLEConfigConnGap,
+    BLEDriver,
+    BLEEvtID,
+    BLEGapAddr,
+    BLEGapEncInfo,
+    BLEGapEncKey,
+    BLEGapIdKey,
+    BLEGapMasterId,
+    BLEGapSecKDist,
+    BLEGapSecKeys,
+    BLEGapSecKeyset,
+    BLEGapSecParams,
+    BLEGapSecStatus,
+    BLEGapSignInfo,
+    BLEGapLescP256Pk,
+)
+from pc_ble_driver_py.bond_store import Bond, BondStore
+from pc_ble_driver_py.exceptions import NordicSemiException
+from pc_ble_driver_py.observers import BLEDriverObserver
+from pc_ble_driver_py.rpa_resolver import RpaResolver
+from pc_ble_driver_py.sim_driver import radio
+from rpa_vectors import SAMPLE_IRK, sample_rpa
+
+logger = logging.getLogger(__name__)
+
+CFG_TAG = 1
+PERIPHERAL = "sim-bond-peripheral"
+IRK = SAMPLE_IRK
+IDENTITY = BLEGapAddr(BLEGapAddr.Types.random_static, [0xC1, 2, 3, 4, 5, 6])
+
+
+def make_rpa(*args):
+    return BLEGapAddr(BLEGapAddr.Types.random_private_resolvable, list(sample_rpa(*args)))
+
+
+def make_bond(peer_addr=IDENTITY, ediv=0x1234, irk=IRK):
+    enc_key = BLEGapEncKey(
+        BLEGapMasterId(ediv=ediv, rand=list(range(8))),
+        BLEGapEncInfo(ltk=list(range(16, 32)), auth=1, lesc=0, ltk_len=16),
+    )
+    return Bond(
+        peer_addr,
+        own_enc_key=enc_key,
+        peer_enc_key=enc_key,
+        peer_id_key=BLEGapIdKey(list(irk), IDENTITY),
+    )
+
+
+class BondStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_store_and_reload(self):
+        store = BondStore(self.path)
+        store.store(make_bond())
+        with open(os.path.join(self.path, "broken.bond"), "wb") as f:
+            f.write(b"not a bond")
+
+        store = BondStore(self.path)
+        self.assertEqual(len(store), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.path, "broken.bond")))
+        bond = store.find(BLEGapAddr(BLEGapAddr.Types.random_static, list(IDENTITY.addr)))
+        self.assertIsNotNone(bond)
+        self.assertEqual(bond.irk, IRK)
+        self.assertEqual(bond.own_enc_key.enc_info.ltk, list(range(16, 32)))
+
+        self.assertIs(store.find(make_rpa()), bond)
+        self.assertIsNone(store.find(make_rpa(b"\x12\x34\x56")))
+        self.assertIs(store.find_master_id(BLEGapMasterId(0x1234, list(range(8)))), bond)
+        self.assertIsNone(store.find_master_id(BLEGapMasterId(0x1235, list(range(8)))))
+
+        store.remove(make_rpa())
+        self.assertEqual(len(store), 0)
+        self.assertEqual(len(BondStore(self.path)), 0)
+
+    def test_clear_keeps_shared_irks(self):
+        resolver = RpaResolver()
+        resolver.add(IRK, IDENTITY)
+        store = BondStore(self.path, resolver)
+        store.store(make_bond(irk=bytes(range(16))))
+        self.assertEqual(len(resolver), 2)
+        store.clear()
+        self.assertEqual(len(store), 0)
+        self.assertEqual(len(resolver), 1)
+        self.assertIsNotNone(resolver.resolve(make_rpa()))
+
+    def test_keyset_to_c(self):
+        bond = make_bond()
+        keys = BLEGapSecKeys(
+            enc_key=bond.own_enc_key,
+            id_key=bond.peer_id_key,
+            sign_key=BLEGapSignInfo(list(range(16))),
+            pk=BLEGapLescP256Pk(bytes(range(64))),
+        )
+        keyset = BLEGapSecKeyset.from_c(BLEGapSecKeyset(keys, keys).to_c())
+        for k in (keyset.keys_own, keyset.keys_peer):
+            self.assertEqual(k.enc_key.master_id.ediv, 0x1234)
+            self.assertEqual(k.enc_key.enc_info.ltk, list(range(16, 32)))
+            self.assertEqual(k.id_key.irk, list(IRK))
+            self.assertEqual(k.id_key.id_addr_info.addr, IDENTITY.addr)
+            self.assertEqual(k.sign_key.csrk, list(range(16)))
+            self.assertEqual(bytes(k.pk.pk), bytes(range(64)))
+
+
+class Node(BLEDriverObserver):
+    """BLEDriver and BLEAdapter with a bond store."""
+
+    def __init__(self, port, path, role):
+        self.role = role
+        self.driver = BLEDriver(serial_port=port)
+        self.store = BondStore(path)
+        self.adapter = BLEAdapter(self.driver, bond_store=self.store)
+        self.driver.observer_register(self)
+        self.driver.open()
+        self.driver.ble_cfg_set(BLEConfig.conn_gap, BLEConfigConnGap())
+        self.driver.ble_enable()
+        self.conn_q = Queue()
+        self.disconnect_q = Queue()
+        self.lesc = False
+
+    def on_gap_evt_connected(self, ble_driver, conn_handle, peer_addr, role, conn_params):
+        self.conn_q.put(conn_handle)
+
+    def on_gap_evt_disconnected(self, ble_driver, conn_handle, reason):
+        self.disconnect_q.put(conn_handle)
+
+    def on_gap_evt_sec_params_request(self, ble_driver, conn_handle, peer_params):
+        if self.role == "central":
+            # BLEAdapter.authenticate replies unless LESC is used
+            if self.lesc and peer_params.lesc:
+                ble_driver.ble_gap_sec_params_reply(
+                    conn_handle, BLEGapSecStatus.success, None, ble_driver.generate_lesc_keyset()
+                )
+            return
+        sec_params = BLEGapSecParams.from_c(peer_params)
+        sec_params.kdist_own = BLEGapSecKDist(True, True, False, False)
+        sec_params.kdist_peer = BLEGapSecKDist(True, True, False, False)
+        keyset = ble_driver.generate_lesc_keyset() if self.lesc else None
+        ble_driver.ble_gap_sec_params_reply(
+            conn_handle, BLEGapSecStatus.success, sec_params=sec_params, keyset=keyset
+        )
+
+    def on_gap_evt_lesc_dhkey_request(self, ble_driver, conn_handle, peer_public_key, oobd_req):
+        ble_driver.ble_gap_lesc_dhkey_reply(
+            conn_handle, ble_driver.generate_lesc_dhkey(peer_public_key)
+        )
+
+
+class BondedReconnect(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.central = Node("sim-bond-central", os.path.join(self.dir, "central"), "central")
+        self.peripheral = Node(
+            PERIPHERAL, os.path.join(self.dir, "peripheral"), "peripheral"
+        )
+        self.peripheral.driver.ble_gap_adv_data_set(BLEAdvData(complete_local_name="bond"))
+        self.address = self.peripheral.driver.ble_gap_addr_get()
+
+    def tearDown(self):
+        self.central.driver.close()
+        self.peripheral.driver.close()
+        shutil.rmtree(self.dir)
+
+    def peripheral_irk(self):
+        return next(device.irk for device in radio.devices if device.port == PERIPHERAL)
+
+    def connect(self):
+        self.peripheral.driver.ble_gap_adv_start(tag=CFG_TAG)
+        self.central.adapter.connect(self.address, tag=CFG_TAG)
+        conn_handle = self.central.conn_q.get(timeout=5)
+        self.peripheral_conn_handle = self.peripheral.conn_q.get(timeout=5)
+        return conn_handle
+
+    def disconnect(self, conn_handle):
+        self.central.adapter.disconnect(conn_handle)
+        self.central.disconnect_q.get(timeout=5)
+        self.peripheral.disconnect_q.get(timeout=5)
+
+    def pair_and_reconnect(self, lesc):
+        for node in (self.central, self.peripheral):
+            node.lesc = lesc
+
+        conn_handle = self.connect()
+        # Raises unless pairing succeeds
+        self.central.adapter.authenticate(
+            conn_handle, None, bond=True, lesc=lesc, id_peer=True, id_own=True
+        )
+        self.assertEqual(len(self.central.store), 1)
+        # The auth status of the peripheral can come after that of the central
+        deadline = time.monotonic() + 5
+        while not len(self.peripheral.store) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.peripheral.store), 1)
+        bond = self.central.store.bonds()[0]
+        self.assertEqual(bond.lesc, lesc)
+        self.assertEqual(bond.irk, self.peripheral_irk())
+        self.disconnect(conn_handle)
+
+        # A new store reads the bonds from disk
+        self.central.adapter.bond_store = BondStore(self.central.store.path)
+        conn_handle = self.connect()
+        self.assertEqual(
+            self.central.adapter.db_conns[conn_handle].identity, self.peripheral_irk()
+        )
+        evt_sync = self.peripheral.adapter.evt_sync[self.peripheral_conn_handle]
+        with evt_sync.expect(BLEEvtID.gap_evt_sec_info_request) as sec_info_requests:
+            conn_sec = self.central.adapter.encrypt(conn_handle)
+            # Answered by the bond store, not passed on to the application
+            self.assertIsNone(sec_info_requests.wait(timeout=0.1))
+        self.assertEqual(conn_sec.sec_mode.lv, 2)
+        self.assertEqual(conn_sec.encr_key_size, 16)
+        self.disconnect(conn_handle)
+
+    def test_legacy(self):
+        self.pair_and_reconnect(lesc=False)
+
+    def test_lesc(self):
+        self.pair_and_reconnect(lesc=True)
+
+    def test_unknown_peer(self):
+        conn_handle = self.connect()
+        with self.assertRaises(NordicSemiException):
+            self.central.adapter.encrypt(conn_handle)
+
+        # The central has a bond, the peripheral has lost it
+        self.central.store.store(
+            Bond(self.address, peer_enc_key=make_bond().peer_enc_key)
+        )
+        conn_sec = self.central.adapter.encrypt(conn_handle)
+        self.assertEqual(conn_sec.sec_mode.lv, 1)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,214 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import logging
+import random
+import timeit
+import unittest
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+
+from pc_ble_driver_py.ble_adapter import DbConnection
+from pc_ble_driver_py.ble_driver import (
+    BLECharacteristic,
+    BLECharProperties,
+    BLEDescriptor,
+    BLEService,
+    BLEUUID,
+    BLEUUIDBase,
+)
+
+logger = logging.getLogger(__name__)
+
+VENDOR_BASE = BLEUUIDBase(list(range(16)), 2)
+
+
+class LinearDbConnection(DbConnection):
+    """Linear scan lookups, as done before DbConnection was indexed."""
+
+    def get_char_value_handle(self, uuid, service_uuid=None):
+        for s in self.services:
+            if service_uuid is None or (
+                (s.uuid.value == service_uuid.value)
+                and (s.uuid.base.type == service_uuid.base.type)
+            ):
+                for c in s.chars:
+                    if (c.uuid.value == uuid.value) and (
+                        c.uuid.base.type == uuid.base.type
+                    ):
+                        for d in c.descs:
+                            if d.uuid.value == uuid.value:
+                                return d.handle
+        return None
+
+    def get_cccd_handle(self, uuid, attr_handle=None):
+        for s in self.services:
+            for c in s.chars:
+                if (c.uuid.value == uuid.value) and (
+                    c.uuid.base.type == uuid.base.type):
+                    if attr_handle is None:
+                        for d in c.descs:
+                            if d.uuid.value == BLEUUID.Standard.cccd:
+                                return d.handle
+                        break
+                    elif attr_handle == c.handle_value:
+                        for d in c.descs:
+                            if d.uuid.value == BLEUUID.Standard.cccd:
+                                return d.handle
+        return None
+
+    def get_char_handle(self, uuid):
+        for s in self.services:
+            for c in s.chars:
+                if (c.uuid.value == uuid.value) and (
+                    c.uuid.base.type == uuid.base.type
+                ):
+                    return c.handle_decl
+        return None
+
+    def get_char_uuid(self, handle):
+        for s in self.services:
+            for c in s.chars:
+                if (c.handle_decl <= handle) and (c.end_handle >= handle):
+                    return c.uuid
+
+    def get_char_props(self, handle):
+        for s in self.services:
+            for c in s.chars:
+                if (c.handle_decl <= handle) and (c.end_handle >= handle):
+                    return c.char_props
+
+
+def make_services(service_count, chars_per_service):
+    rng = random.Random(1)
+    props = BLECharProperties(0, 1, 0, 1, 1, 0, 0)
+    services = list()
+    handle = 1
+    for i in range(service_count):
+        base = VENDOR_BASE if i % 2 else BLEUUIDBase()
+        service = BLEService(BLEUUID(0x1800 + i, base), handle, None)
+        handle += 1
+        for _ in range(chars_per_service):
+            # Reuse a small set of UUIDs so that lookups hit duplicates
+            uuid = BLEUUID(0x3000 + rng.randrange(8), base)
+            char = BLECharacteristic(uuid, props, handle, handle + 1)
+            char.descs.append(BLEDescriptor(BLEUUID(uuid.value, base), handle + 1))
+            handle += 2
+            if rng.random() < 0.7:
+                char.descs.append(BLEDescriptor(BLEUUID(0x2902), handle))
+                handle += 1
+            service.end_handle = handle - 1
+            service.char_add(char)
+        services.append(service)
+    return services, handle
+
+
+class DbConnectionTest(unittest.TestCase):
+    def setUp(self):
+        self.services, self.last_handle = make_services(6, 6)
+        self.indexed = DbConnection()
+        self.indexed.services = self.services
+        self.linear = LinearDbConnection()
+        self.linear.services = self.services
+        self.uuids = [
+            BLEUUID(0x3000 + i, base)
+            for i in range(9)
+            for base in (BLEUUIDBase(), VENDOR_BASE)
+        ]
+
+    def test_uuid_lookups_match_linear_scan(self):
+        for uuid in self.uuids:
+            self.assertEqual(
+                self.linear.get_char_handle(uuid), self.indexed.get_char_handle(uuid)
+            )
+            self.assertEqual(
+                self.linear.get_cccd_handle(uuid), self.indexed.get_cccd_handle(uuid)
+            )
+            for s in self.services:
+                self.assertEqual(
+                    self.linear.get_char_value_handle(uuid, s.uuid),
+                    self.indexed.get_char_value_handle(uuid, s.uuid),
+                )
+                for c in s.chars:
+                    self.assertEqual(
+                        self.linear.get_cccd_handle(uuid, c.handle_value),
+                        self.indexed.get_cccd_handle(uuid, c.handle_value),
+                    )
+
+    def test_handle_lookups_match_linear_scan(self):
+        for handle in range(0, self.last_handle + 2):
+            self.assertIs(
+                self.linear.get_char_uuid(handle), self.indexed.get_char_uuid(handle)
+            )
+            self.assertIs(
+                self.linear.get_char_props(handle), self.indexed.get_char_props(handle)
+            )
+
+    def test_invalidate_index(self):
+        uuid = BLEUUID(0x4000)
+        self.assertIsNone(self.indexed.get_char_handle(uuid))
+        char = BLECharacteristic(uuid, None, self.last_handle, self.last_handle + 1)
+        self.services[0].chars.append(char)
+        self.indexed.invalidate_index()
+        self.assertEqual(self.last_handle, self.indexed.get_char_handle(uuid))
+
+    def test_lookup_benchmark(self):
+        services, last_handle = make_services(8, 8)
+        for db in (LinearDbConnection(), DbConnection()):
+            db.services = services
+            handles = list(range(1, last_handle))
+            elapsed = min(
+                timeit.repeat(
+                    lambda: [db.get_char_uuid(h) for h in handles], number=100, repeat=3
+                )
+            )
+            logger.info(
+                "%s: %.2f us per get_char_uuid",
+                db.__class__.__name__,
+                elapsed / (100 * len(handles)) * 1e6,
+            )
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,696 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import logging
+import timeit
+import unittest
+from enum import Enum
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_driver import (
+    BLE_EVT_DECODERS,
+    BLEAdvData,
+    BLECharacteristic,
+    BLEDescriptor,
+    BLEDriver,
+    BLEEvtID,
+    BLEEvtPayload,
+    BLEGapAddr,
+    BLEGapAdvType,
+    BLEGapConnParams,
+    BLEGapConnSec,
+    BLEGapDataLengthParams,
+    BLEGapLescP256Pk,
+    BLEGapPhys,
+    BLEGapRoles,
+    BLEGapSecKDist,
+    BLEGapSecParams,
+    BLEGapSecStatus,
+    BLEGapTimeoutSrc,
+    BLEGattHVXType,
+    BLEGattStatusCode,
+    BLEGattWriteOperation,
+    BLEHci,
+    BLEService,
+    driver,
+    util,
+)
+from pc_ble_driver_py.observers import BLEDriverObserver
+from pc_ble_driver_py.sim_driver import _array, _array_of, _evt, _gattc_evt
+
+logger = logging.getLogger(__name__)
+
+ITERATIONS = 1000
+CONN_HANDLE = 1
+
+
+def addr(addr_type=driver.BLE_GAP_ADDR_TYPE_RANDOM_STATIC):
+    peer_addr = driver.ble_gap_addr_t()
+    peer_addr.addr_type = addr_type
+    peer_addr.addr[:] = b"\x01\x02\x03\x04\x05\xc6"
+    return peer_addr
+
+
+def conn_params():
+    params = driver.ble_gap_conn_params_t()
+    params.min_conn_interval = 24
+    params.max_conn_interval = 40
+    params.slave_latency = 0
+    params.conn_sup_timeout = 400
+    return params
+
+
+def kdist():
+    kdist = driver.ble_gap_sec_kdist_t()
+    kdist.enc = 1
+    kdist.id = 1
+    return kdist
+
+
+def uuid(value):
+    ble_uuid = driver.ble_uuid_t()
+    ble_uuid.type = driver.BLE_UUID_TYPE_BLE
+    ble_uuid.uuid = value
+    return ble_uuid
+
+
+def data_length_params():
+    params = driver.ble_gap_data_length_params_t()
+    params.max_tx_octets = 251
+    params.max_rx_octets = 251
+    params.max_tx_time_us = 2120
+    params.max_rx_time_us = 2120
+    return params
+
+
+def gattc_evt(evt_id, name, **params):
+    return _gattc_evt(
+        evt_id.value,
+        CONN_HANDLE,
+        driver.BLE_GATT_STATUS_SUCCESS,
+        driver.BLE_GATT_HANDLE_INVALID,
+        name,
+        **params
+    )
+
+
+def make_events():
+    # One event for each decoder, built from the same structs the sim driver
+    # fills in.
+    sec_params = driver.ble_gap_sec_params_t()
+    sec_params.bond = 1
+    sec_params.lesc = 1
+    sec_params.io_caps = driver.BLE_GAP_IO_CAPS_NONE
+    sec_params.min_key_size = 7
+    sec_params.max_key_size = 16
+    sec_params.kdist_own = kdist()
+    sec_params.kdist_peer = kdist()
+
+    master_id = driver.ble_gap_master_id_t()
+    master_id.ediv = 0x1234
+
+    public_key = driver.ble_gap_lesc_p256_pk_t()
+    public_key.pk[:] = bytes(range(driver.BLE_GAP_LESC_P256_PK_LEN))
+
+    sec_levels = driver.ble_gap_sec_levels_t()
+    sec_levels.lv1 = 1
+    sec_levels.lv2 = 1
+
+    conn_sec = driver.ble_gap_conn_sec_t()
+    conn_sec.sec_mode.sm = 1
+    conn_sec.sec_mode.lv = 2
+    conn_sec.encr_key_size = 16
+
+    service = driver.ble_gattc_service_t()
+    service.uuid = uuid(0x180D)
+    service.handle_range.start_handle = 1
+    service.handle_range.end_handle = 5
+
+    char = driver.ble_gattc_char_t()
+    char.uuid = uuid(0x2A37)
+    char.char_props.notify = 1
+    char.handle_decl = 2
+    char.handle_value = 3
+
+    desc = driver.ble_gattc_desc_t()
+    desc.handle = 4
+    desc.uuid = uuid(0x2902)
+
+    phys = driver.ble_gap_phys_t()
+    phys.tx_phys = driver.BLE_GAP_PHY_2MBPS
+    phys.rx_phys = driver.BLE_GAP_PHY_2MBPS
+
+    adv_data = b"\x02\x01\x06\x05\x09test\x03\x03\x0d\x18"
+    value = b"\x00\x01\x7f\x80\xff"
+
+    return [
+        _evt(
+            BLEEvtID.gap_evt_connected.value,
+            CONN_HANDLE,
+            "connected",
+            peer_addr=addr(),
+            role=driver.BLE_GAP_ROLE_CENTRAL,
+            conn_params=conn_params(),
+        ),
+        _evt(
+            BLEEvtID.gap_evt_disconnected.value,
+            CONN_HANDLE,
+            "disconnected",
+            reason=driver.BLE_HCI_REMOTE_USER_TERMINATED_CONNECTION,
+        ),
+        _evt(
+            BLEEvtID.gap_evt_sec_params_request.value,
+            CONN_HANDLE,
+            "sec_params_request",
+            peer_params=sec_params,
+        ),
+        _evt(
+            BLEEvtID.gap_evt_sec_info_request.value,
+            CONN_HANDLE,
+            "sec_info_request",
+            peer_addr=addr(),
+            master_id=master_id,
+            enc_info=1,
+            id_info=0,
+            sign_info=0,
+        ),
+        _evt(
+            BLEEvtID.gap_evt_sec_request.value,
+            CONN_HANDLE,
+            "sec_request",
+            bond=1,
+            mitm=0,
+            lesc=1,
+            keypress=0,
+        ),
+        _evt(
+            BLEEvtID.gap_evt_passkey_display.value,
+            CONN_HANDLE,
+            "passkey_display",
+            passkey=_array(b"123456"),
+            match_request=0,
+        ),
+        _evt(
+            BLEEvtID.gap_evt_timeout.value,
+            driver.BLE_CONN_HANDLE_INVALID,
+            "timeout",
+            src=driver.BLE_GAP_TIMEOUT_SRC_SCAN,
+        ),
+        _evt(
+            BLEEvtID.gap_evt_adv_report.value,
+            driver.BLE_CONN_HANDLE_INVALID,
+            "adv_report",
+            peer_addr=addr(),
+            direct_addr=driver.ble_gap_addr_t(),
+            rssi=-50,
+            scan_rsp=0,
+            type=driver.BLE_GAP_ADV_TYPE_ADV_IND,
+            dlen=len(adv_data),
+            data=_array(adv_data),
+        ),
+        _evt(
+            BLEEvtID.gap_evt_conn_param_update_request.value,
+            CONN_HANDLE,
+            "conn_param_update_request",
+            conn_params=conn_params(),
+        ),
+        _evt(
+            BLEEvtID.gap_evt_conn_param_update.value,
+            CONN_HANDLE,
+            "conn_param_update",
+            conn_params=conn_params(),
+        ),
+        _evt(
+            BLEEvtID.gap_evt_lesc_dhkey_request.value,
+            CONN_HANDLE,
+            "lesc_dhkey_request",
+            p_pk_peer=public_key,
+            oobd_req=0,
+        ),
+        _evt(
+            BLEEvtID.gap_evt_auth_status.value,
+            CONN_HANDLE,
+            "auth_status",
+            auth_status=driver.BLE_GAP_SEC_STATUS_SUCCESS,
+            error_src=0,
+            bonded=1,
+            lesc=1,
+            sm1_levels=sec_levels,
+            sm2_levels=driver.ble_gap_sec_levels_t(),
+            kdist_own=kdist(),
+            kdist_peer=kdist(),
+        ),
+        _evt(
+            BLEEvtID.gap_evt_auth_key_request.value,
+            CONN_HANDLE,
+            "auth_key_request",
+            key_type=driver.BLE_GAP_AUTH_KEY_TYPE_PASSKEY,
+        ),
+        _evt(
+            BLEEvtID.gap_evt_conn_sec_update.value,
+            CONN_HANDLE,
+            "conn_sec_update",
+            conn_sec=conn_sec,
+        ),
+        _evt(BLEEvtID.gap_evt_rssi_changed.value, CONN_HANDLE, "rssi_changed", rssi=-40),
+        gattc_evt(
+            BLEEvtID.gattc_evt_write_rsp,
+            "write_rsp",
+            handle=3,
+            write_op=driver.BLE_GATT_OP_WRITE_REQ,
+            offset=0,
+            len=0,
+            data=_array(b""),
+        ),
+        gattc_evt(
+            BLEEvtID.gattc_evt_read_rsp,
+            "read_rsp",
+            handle=3,
+            offset=0,
+            len=len(value),
+            data=_array(value),
+        ),
+        gattc_evt(
+            BLEEvtID.gattc_evt_hvx,
+            "hvx",
+            handle=3,
+            type=driver.BLE_GATT_HVX_NOTIFICATION,
+            len=len(value),
+            data=_array(value),
+        ),
+        gattc_evt(
+            BLEEvtID.gattc_evt_prim_srvc_disc_rsp,
+            "prim_srvc_disc_rsp",
+            count=1,
+            services=_array_of(driver.ble_gattc_service_array, [service]),
+        ),
+        gattc_evt(
+            BLEEvtID.gattc_evt_char_disc_rsp,
+            "char_disc_rsp",
+            count=1,
+            chars=_array_of(driver.ble_gattc_char_array, [char]),
+        ),
+        gattc_evt(
+            BLEEvtID.gattc_evt_desc_disc_rsp,
+            "desc_disc_rsp",
+            count=1,
+            descs=_array_of(driver.ble_gattc_desc_array, [desc]),
+        ),
+        _evt(BLEEvtID.gatts_evt_hvc.value, CONN_HANDLE, "hvc", handle=3),
+        _evt(
+            BLEEvtID.gatts_evt_write.value,
+            CONN_HANDLE,
+            "write",
+            handle=4,
+            uuid=uuid(0x2902),
+            op=driver.BLE_GATTS_OP_WRITE_REQ,
+            auth_required=0,
+            offset=0,
+            len=2,
+            data=_array(b"\x01\x00"),
+        ),
+        _evt(
+            BLEEvtID.gatts_evt_sys_attr_missing.value,
+            CONN_HANDLE,
+            "sys_attr_missing",
+            hint=0,
+        ),
+        gattc_evt(
+            BLEEvtID.gattc_evt_write_cmd_tx_complete, "write_cmd_tx_complete", count=2
+        ),
+        _evt(
+            BLEEvtID.gatts_evt_hvn_tx_complete.value,
+            CONN_HANDLE,
+            "hvn_tx_complete",
+            count=3,
+        ),
+        _evt(
+            BLEEvtID.gatts_evt_exchange_mtu_request.value,
+            CONN_HANDLE,
+            "exchange_mtu_request",
+            client_rx_mtu=247,
+        ),
+        gattc_evt(BLEEvtID.gattc_evt_exchange_mtu_rsp, "exchange_mtu_rsp", server_rx_mtu=247),
+        _evt(
+            BLEEvtID.gap_evt_data_length_update.value,
+            CONN_HANDLE,
+            "data_length_update",
+            effective_params=data_length_params(),
+        ),
+        _evt(
+            BLEEvtID.gap_evt_data_length_update_request.value,
+            CONN_HANDLE,
+            "data_length_update_request",
+            peer_params=data_length_params(),
+        ),
+        _evt(
+            BLEEvtID.gap_evt_phy_update_request.value,
+            CONN_HANDLE,
+            "phy_update_request",
+            peer_preferred_phys=phys,
+        ),
+        _evt(
+            BLEEvtID.gap_evt_phy_update.value,
+            CONN_HANDLE,
+            "phy_update",
+            status=driver.BLE_HCI_STATUS_CODE_SUCCESS,
+            tx_phy=driver.BLE_GAP_PHY_2MBPS,
+            rx_phy=driver.BLE_GAP_PHY_2MBPS,
+        ),
+    ]
+
+
+INVALID = driver.BLE_CONN_HANDLE_INVALID
+VALUE = list(b"\x00\x01\x7f\x80\xff")
+# Observer call of each event from make_events. A class stands for an
+# instance of it, a list of classes for a list of instances, anything else
+# is compared with plain().
+EXPECTED_CALLS = {
+    BLEEvtID.gap_evt_connected: ("on_gap_evt_connected", dict(
+        conn_handle=CONN_HANDLE,
+        peer_addr=BLEGapAddr,
+        role=BLEGapRoles.central,
+        conn_params=BLEGapConnParams,
+    )),
+    BLEEvtID.gap_evt_disconnected: ("on_gap_evt_disconnected", dict(
+        conn_handle=CONN_HANDLE, reason=BLEHci.remote_user_terminated_connection
+    )),
+    BLEEvtID.gap_evt_sec_params_request: ("on_gap_evt_sec_params_request", dict(
+        conn_handle=CONN_HANDLE, peer_params=BLEGapSecParams
+    )),
+    BLEEvtID.gap_evt_sec_info_request: ("on_gap_evt_sec_info_request", dict(
+        conn_handle=CONN_HANDLE,
+        peer_addr=driver.ble_gap_addr_t,
+        master_id=driver.ble_gap_master_id_t,
+        enc_info=1,
+        id_info=0,
+        sign_info=0,
+    )),
+    BLEEvtID.gap_evt_sec_request: ("on_gap_evt_sec_request", dict(
+        conn_handle=CONN_HANDLE, bond=1, mitm=0, lesc=1, keypress=0
+    )),
+    BLEEvtID.gap_evt_passkey_display: ("on_gap_evt_passkey_display", dict(
+        conn_handle=CONN_HANDLE, passkey=list(b"123456")
+    )),
+    BLEEvtID.gap_evt_timeout: ("on_gap_evt_timeout", dict(
+        conn_handle=INVALID, src=BLEGapTimeoutSrc.scan
+    )),
+    BLEEvtID.gap_evt_adv_report: ("on_gap_evt_adv_report", dict(
+        conn_handle=INVALID,
+        peer_addr=BLEGapAddr,
+        rssi=-50,
+        adv_type=BLEGapAdvType.connectable_undirected,
+        adv_data=BLEAdvData,
+    )),
+    BLEEvtID.gap_evt_conn_param_update_request: ("on_gap_evt_conn_param_update_request", dict(
+        conn_handle=CONN_HANDLE, conn_params=BLEGapConnParams
+    )),
+    BLEEvtID.gap_evt_conn_param_update: ("on_gap_evt_conn_param_update", dict(
+        conn_handle=CONN_HANDLE, conn_params=BLEGapConnParams
+    )),
+    BLEEvtID.gap_evt_lesc_dhkey_request: ("on_gap_evt_lesc_dhkey_request", dict(
+        conn_handle=CONN_HANDLE, peer_public_key=BLEGapLescP256Pk, oobd_req=0
+    )),
+    BLEEvtID.gap_evt_auth_status: ("on_gap_evt_auth_status", dict(
+        conn_handle=CONN_HANDLE,
+        auth_status=BLEGapSecStatus.success,
+        error_src=0,
+        bonded=1,
+        sm1_levels=driver.ble_gap_sec_levels_t,
+        sm2_levels=driver.ble_gap_sec_levels_t,
+        kdist_own=BLEGapSecKDist,
+        kdist_peer=BLEGapSecKDist,
+    )),
+    BLEEvtID.gap_evt_auth_key_request: ("on_gap_evt_auth_key_request", dict(
+        conn_handle=CONN_HANDLE, key_type=driver.BLE_GAP_AUTH_KEY_TYPE_PASSKEY
+    )),
+    BLEEvtID.gap_evt_conn_sec_update: ("on_gap_evt_conn_sec_update", dict(
+        conn_handle=CONN_HANDLE, conn_sec=BLEGapConnSec
+    )),
+    BLEEvtID.gap_evt_rssi_changed: ("on_gap_evt_rssi_changed", dict(
+        conn_handle=CONN_HANDLE, rssi=-40
+    )),
+    BLEEvtID.gattc_evt_write_rsp: ("on_gattc_evt_write_rsp", dict(
+        conn_handle=CONN_HANDLE,
+        status=BLEGattStatusCode.success,
+        error_handle=driver.BLE_GATT_HANDLE_INVALID,
+        attr_handle=3,
+        write_op=BLEGattWriteOperation.write_req,
+        offset=0,
+        data=[],
+    )),
+    BLEEvtID.gattc_evt_read_rsp: ("on_gattc_evt_read_rsp", dict(
+        conn_handle=CONN_HANDLE,
+        status=BLEGattStatusCode.success,
+        error_handle=driver.BLE_GATT_HANDLE_INVALID,
+        attr_handle=3,
+        offset=0,
+        data=VALUE,
+    )),
+    BLEEvtID.gattc_evt_hvx: ("on_gattc_evt_hvx", dict(
+        conn_handle=CONN_HANDLE,
+        status=BLEGattStatusCode.success,
+        error_handle=driver.BLE_GATT_HANDLE_INVALID,
+        attr_handle=3,
+        hvx_type=BLEGattHVXType.notification,
+        data=VALUE,
+    )),
+    BLEEvtID.gattc_evt_prim_srvc_disc_rsp: ("on_gattc_evt_prim_srvc_disc_rsp", dict(
+        conn_handle=CONN_HANDLE, status=BLEGattStatusCode.success, services=[BLEService]
+    )),
+    BLEEvtID.gattc_evt_char_disc_rsp: ("on_gattc_evt_char_disc_rsp", dict(
+        conn_handle=CONN_HANDLE,
+        status=BLEGattStatusCode.success,
+        characteristics=[BLECharacteristic],
+    )),
+    BLEEvtID.gattc_evt_desc_disc_rsp: ("on_gattc_evt_desc_disc_rsp", dict(
+        conn_handle=CONN_HANDLE, status=BLEGattStatusCode.success, descriptors=[BLEDescriptor]
+    )),
+    BLEEvtID.gatts_evt_hvc: ("on_gatts_evt_hvc", dict(conn_handle=CONN_HANDLE, attr_handle=3)),
+    BLEEvtID.gatts_evt_write: ("on_gatts_evt_write", dict(
+        conn_handle=CONN_HANDLE,
+        attr_handle=4,
+        uuid=driver.ble_uuid_t,
+        op=driver.BLE_GATTS_OP_WRITE_REQ,
+        auth_required=0,
+        offset=0,
+        length=2,
+        data=[1, 0],
+    )),
+    BLEEvtID.gatts_evt_sys_attr_missing: ("on_gatts_evt_sys_attr_missing", dict(
+        conn_handle=CONN_HANDLE, hint=0
+    )),
+    BLEEvtID.gattc_evt_write_cmd_tx_complete: ("on_gattc_evt_write_cmd_tx_complete", dict(
+        conn_handle=CONN_HANDLE, count=2
+    )),
+    BLEEvtID.gatts_evt_hvn_tx_complete: ("on_gatts_evt_hvn_tx_complete", dict(
+        conn_handle=CONN_HANDLE, count=3
+    )),
+    BLEEvtID.gatts_evt_exchange_mtu_request: ("on_gatts_evt_exchange_mtu_request", dict(
+        conn_handle=CONN_HANDLE, client_mtu=247
+    )),
+    BLEEvtID.gattc_evt_exchange_mtu_rsp: ("on_gattc_evt_exchange_mtu_rsp", dict(
+        conn_handle=CONN_HANDLE, status=BLEGattStatusCode.success, att_mtu=247
+    )),
+    BLEEvtID.gap_evt_data_length_update: ("on_gap_evt_data_length_update", dict(
+        conn_handle=CONN_HANDLE, data_length_params=BLEGapDataLengthParams
+    )),
+    BLEEvtID.gap_evt_data_length_update_request: ("on_gap_evt_data_length_update_request", dict(
+        conn_handle=CONN_HANDLE, data_length_params=BLEGapDataLengthParams
+    )),
+    BLEEvtID.gap_evt_phy_update_request: ("on_gap_evt_phy_update_request", dict(
+        conn_handle=CONN_HANDLE, peer_preferred_phys=BLEGapPhys
+    )),
+    BLEEvtID.gap_evt_phy_update: ("on_gap_evt_phy_update", dict(
+        conn_handle=CONN_HANDLE,
+        status=BLEHci.success,
+        tx_phy=driver.BLE_GAP_PHY_2MBPS,
+        rx_phy=driver.BLE_GAP_PHY_2MBPS,
+    )),
+}
+
+
+def plain(value):
+    # Decoded values as comparable builtins, as the decoder classes have no __eq__
+    if isinstance(value, (Enum, str, bytes, int, float)) or value is None:
+        return value
+    if isinstance(value, BLEAdvData):
+        return {k: plain(v) for k, v in value.records.items()}
+    if isinstance(value, (list, tuple, bytearray, BLEEvtPayload)):
+        return [plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: plain(v) for k, v in value.items()}
+    return (type(value).__name__, plain(vars(value)))
+
+
+class RecordingObserver(BLEDriverObserver):
+    """Records the arguments of every observer call of the decoder table."""
+
+    def __init__(self):
+        super(RecordingObserver, self).__init__()
+        self.calls = list()
+        for _decoder, observer_method in BLE_EVT_DECODERS.values():
+            setattr(self, observer_method, self.recorder(observer_method))
+
+    def recorder(self, observer_method):
+        def record(ble_driver, **kwargs):
+            self.calls.append((observer_method, kwargs))
+
+        return record
+
+
+class CountingObserver(BLEDriverObserver):
+    def __init__(self):
+        super(CountingObserver, self).__init__()
+        self.count = 0
+        for _decoder, observer_method in BLE_EVT_DECODERS.values():
+            setattr(self, observer_method, self.called)
+
+    def called(self, ble_driver, **kwargs):
+        self.count += 1
+
+
+class EventDispatchTest(unittest.TestCase):
+    def setUp(self):
+        # Not opened, dispatch only needs the observers and the decode settings
+        self.driver = BLEDriver(serial_port="sim-dispatch", auto_flash=False)
+        self.observer = RecordingObserver()
+        self.driver.observer_register(self.observer)
+        self.events = make_events()
+
+    def test_events_cover_decoder_table(self):
+        self.assertEqual(
+            sorted(BLE_EVT_DECODERS), sorted(e.header.evt_id for e in self.events)
+        )
+
+    def test_observer_calls(self):
+        for ble_event in self.events:
+            evt_id = BLEEvtID(ble_event.header.evt_id)
+            with self.subTest(evt_id=evt_id.name):
+                del self.observer.calls[:]
+                self.driver.ble_event_handler_sync(None, ble_event)
+                self.assertEqual(1, len(self.observer.calls))
+                observer_method, kwargs = self.observer.calls[0]
+                expected_method, expected_kwargs = EXPECTED_CALLS[evt_id]
+                self.assertEqual(expected_method, observer_method)
+                self.assertEqual(sorted(expected_kwargs), sorted(kwargs))
+                for name, expected in expected_kwargs.items():
+                    self.check_value(expected, kwargs[name])
+
+    def check_value(self, expected, value):
+        if isinstance(expected, type):
+            self.assertIsInstance(value, expected)
+        elif isinstance(expected, list) and expected and isinstance(expected[0], type):
+            self.assertEqual(len(expected), len(value))
+            for cls, item in zip(expected, value):
+                self.assertIsInstance(item, cls)
+        else:
+            self.assertEqual(expected, plain(value))
+
+    def test_lazy_payloads_opt_in(self):
+        hvx = [e for e in self.events if e.header.evt_id == BLEEvtID.gattc_evt_hvx.value][0]
+        received = list()
+        self.observer.on_gattc_evt_hvx = lambda ble_driver, data, **kwargs: received.append(data)
+
+        self.driver.ble_event_handler_sync(None, hvx)
+        self.driver.lazy_payloads = True
+        self.driver.ble_event_handler_sync(None, hvx)
+        self.assertIs(list, type(received[0]))
+        self.assertIsInstance(received[1], BLEEvtPayload)
+        self.assertEqual(received[0], received[1])
+
+    def test_unknown_evt_id_is_ignored(self):
+        ble_event = driver.ble_evt_t()
+        ble_event.header.evt_id = 0xFFFF
+        self.driver.ble_event_handler_sync(None, ble_event)
+        self.assertEqual([], self.observer.calls)
+
+    def test_dispatch_benchmark(self):
+        observer = CountingObserver()
+        self.driver.observers = [observer]
+        events = self.events
+
+        def dispatch():
+            for ble_event in events:
+                self.driver.ble_event_handler_sync(None, ble_event)
+
+        n = ITERATIONS * len(events)
+        dispatch_time = min(timeit.repeat(dispatch, number=ITERATIONS, repeat=3))
+        self.assertEqual(3 * n, observer.count)
+        logger.info("Table dispatch: %.2f us/event", dispatch_time / n * 1e6)
+
+
+class EventPayloadTest(unittest.TestCase):
+    def setUp(self):
+        self.value = [0x00, 0x01, 0x7F, 0x80, 0xFF]
+        self.array = util.list_to_uint8_array(self.value)
+        self.payload = BLEEvtPayload(None, self.array.cast(), len(self.value))
+
+    def test_len_does_not_decode(self):
+        self.assertEqual(len(self.value), len(self.payload))
+        self.assertIsNone(self.payload._value)
+
+    def test_bytes_access(self):
+        self.assertEqual(bytes(self.value), bytes(self.payload))
+        self.assertEqual(bytes(self.value), self.payload.view().tobytes())
+        self.assertIsNone(self.payload._array)
+
+    def test_memoryview(self):
+        # Not a buffer on any Python version, view() is the API
+        with self.assertRaises(TypeError):
+            memoryview(self.payload)
+        self.assertEqual(memoryview(bytes(self.value)), self.payload.view())
+
+    def test_list_compatibility(self):
+        self.assertEqual(self.value, self.payload)
+        self.assertEqual(self.value, list(self.payload))
+        self.assertEqual(self.value[::-1], self.payload[::-1])
+        self.assertEqual(self.value[2], self.payload[2])
+        self.assertEqual(str(self.value), str(self.payload))
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,339 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import logging
+import queue
+import threading
+import time
+import unittest
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_driver import BLEDriver, BLEEventClass, BLEEvtID, driver
+from pc_ble_driver_py.event_queue import EventQueue, QueuePolicy
+from pc_ble_driver_py.sim_driver import _array, _evt, _gattc_evt
+
+logger = logging.getLogger(__name__)
+
+
+def classify(item):
+    return item[0]
+
+
+def key(item):
+    return item[1]
+
+
+def drain(event_queue):
+    items = list()
+    while not event_queue.empty():
+        items.append(event_queue.get_nowait())
+    return items
+
+
+class EventQueueTest(unittest.TestCase):
+    def make_queue(self, policy, block_timeout=1.0):
+        return EventQueue(
+            maxsize=2,
+            classify=classify,
+            policies=dict(bulk=policy, control=QueuePolicy.never_drop),
+            coalesce_key=key,
+            block_timeout=block_timeout,
+        )
+
+    def test_order_across_classes(self):
+        q = self.make_queue(QueuePolicy.drop_oldest)
+        items = [("bulk", 1), ("control", 2), ("bulk", 3), ("control", 4)]
+        for item in items:
+            q.put(item)
+        self.assertEqual(drain(q), items)
+        with self.assertRaises(queue.Empty):
+            q.get(timeout=0.01)
+
+    def test_never_drop(self):
+        q = self.make_queue(QueuePolicy.drop_oldest)
+        for i in range(5):
+            self.assertTrue(q.put(("control", i)))
+        self.assertEqual(q.qsize(), 5)
+        self.assertEqual(q.stats()["control"]["dropped"], 0)
+
+    def test_drop_oldest(self):
+        q = self.make_queue(QueuePolicy.drop_oldest)
+        for i in range(4):
+            self.assertTrue(q.put(("bulk", i)))
+        self.assertEqual(drain(q), [("bulk", 2), ("bulk", 3)])
+        stats = q.stats()
+        self.assertEqual(stats["bulk"]["dropped"], 2)
+        self.assertEqual(stats["bulk"]["high_water"], 2)
+        self.assertEqual(stats["total"]["dropped"], 2)
+
+    def test_drop_newest(self):
+        q = self.make_queue(QueuePolicy.drop_newest)
+        results = [q.put(("bulk", i)) for i in range(4)]
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(drain(q), [("bulk", 0), ("bulk", 1)])
+
+    def test_coalesce(self):
+        q = self.make_queue(QueuePolicy.coalesce)
+        q.put(("bulk", "a", 1))
+        q.put(("bulk", "b", 1))
+        q.put(("bulk", "a", 2))
+        self.assertEqual(q.qsize(), 2)
+        self.assertEqual(drain(q), [("bulk", "a", 2), ("bulk", "b", 1)])
+        # A key that is no longer queued starts a new entry
+        q.put(("bulk", "a", 3))
+        q.put(("bulk", "b", 2))
+        q.put(("bulk", "c", 1))
+        self.assertEqual(drain(q), [("bulk", "b", 2), ("bulk", "c", 1)])
+        stats = q.stats()["bulk"]
+        self.assertEqual(stats["coalesced"], 1)
+        self.assertEqual(stats["dropped"], 1)
+
+    def test_block_until_room(self):
+        q = self.make_queue(QueuePolicy.block)
+        q.put(("bulk", 0))
+        q.put(("bulk", 1))
+        threading.Timer(0.1, q.get).start()
+        start = time.monotonic()
+        self.assertTrue(q.put(("bulk", 2)))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(drain(q), [("bulk", 1), ("bulk", 2)])
+        self.assertEqual(q.stats()["bulk"]["blocked"], 1)
+
+    def test_block_timeout(self):
+        q = self.make_queue(QueuePolicy.block, block_timeout=0.05)
+        q.put(("bulk", 0))
+        q.put(("bulk", 1))
+        self.assertFalse(q.put(("bulk", 2)))
+        self.assertEqual(q.stats()["bulk"]["dropped"], 1)
+
+    def test_block_from_consumer(self):
+        q = self.make_queue(QueuePolicy.block, block_timeout=5)
+        q.put(("control", 0))
+        q.get()
+        q.put(("bulk", 0))
+        q.put(("bulk", 1))
+        start = time.monotonic()
+        self.assertTrue(q.put(("bulk", 2)))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(q.qsize(), 3)
+
+    def test_priorities(self):
+        q = EventQueue(classify=classify, priorities=dict(high=0, low=1))
+        items = [("low", 1), ("high", 2), ("low", 3), ("high", 4)]
+        for item in items:
+            q.put(item)
+        self.assertEqual(drain(q), [("high", 2), ("high", 4), ("low", 1), ("low", 3)])
+        self.assertEqual(q.stats()["high"]["priority"], 0)
+
+    def test_connection_order(self):
+        q = EventQueue(
+            classify=classify,
+            priorities=dict(high=0, low=1),
+            connection=lambda item: item[1],
+        )
+        items = [("low", None), ("low", "a"), ("low", "b"), ("low", "a"), ("high", "a")]
+        for item in items:
+            q.put(item)
+        # The high item waits for the older items of connection a
+        self.assertEqual(
+            drain(q),
+            [("low", "a"), ("low", "a"), ("high", "a"), ("low", None), ("low", "b")],
+        )
+        self.assertEqual(q.stats()["total"]["connections"], 0)
+
+    def test_connection_order_after_drop(self):
+        q = EventQueue(
+            maxsize=1,
+            classify=classify,
+            policies=dict(low=QueuePolicy.drop_oldest),
+            priorities=dict(high=0, low=1),
+            connection=lambda item: item[1],
+        )
+        q.put(("low", "a", 1))
+        q.put(("low", "a", 2))
+        q.put(("high", "a", 3))
+        self.assertEqual(drain(q), [("low", "a", 2), ("high", "a", 3)])
+        self.assertEqual(q.stats()["low"]["dropped"], 1)
+
+    def test_unbounded(self):
+        q = EventQueue()
+        for i in range(100):
+            q.put(i)
+        self.assertEqual(q.stats()["default"]["queued"], 100)
+
+
+def adv_report(addr):
+    peer_addr = driver.ble_gap_addr_t()
+    peer_addr.addr = [addr, 0, 0, 0, 0, 0xC0]
+    return _evt(
+        BLEEvtID.gap_evt_adv_report.value,
+        driver.BLE_CONN_HANDLE_INVALID,
+        "adv_report",
+        peer_addr=peer_addr,
+        rssi=-50,
+        scan_rsp=0,
+        type=driver.BLE_GAP_ADV_TYPE_ADV_IND,
+        dlen=0,
+        data=_array([]),
+    )
+
+
+def hvx(hvx_type):
+    return _gattc_evt(
+        BLEEvtID.gattc_evt_hvx.value,
+        0,
+        driver.BLE_GATT_STATUS_SUCCESS,
+        driver.BLE_GATT_HANDLE_INVALID,
+        "hvx",
+        handle=0x10,
+        type=hvx_type,
+        len=1,
+        data=_array([1]),
+    )
+
+
+class BLEDriverQueueTest(unittest.TestCase):
+    def make_driver(self, event_queue_size=3, **kwargs):
+        # Not opened, so events stay queued
+        return BLEDriver(
+            serial_port="sim-queue",
+            auto_flash=False,
+            event_queue_size=event_queue_size,
+            **kwargs
+        )
+
+    def test_event_classes(self):
+        ble_driver = self.make_driver()
+        for addr in range(5):
+            ble_driver.ble_event_handler(ble_driver.rpc_adapter, adv_report(addr))
+        for _ in range(5):
+            indication = hvx(driver.BLE_GATT_HVX_INDICATION)
+            ble_driver.ble_event_handler(ble_driver.rpc_adapter, indication)
+        disconnected = _evt(
+            BLEEvtID.gap_evt_disconnected.value, 0, "disconnected", reason=0x13
+        )
+        ble_driver.ble_event_handler(ble_driver.rpc_adapter, disconnected)
+
+        stats = ble_driver.queue_stats()["ble_event"]
+        self.assertEqual(stats[BLEEventClass.adv_report.name]["dropped"], 2)
+        self.assertEqual(stats[BLEEventClass.adv_report.name]["queued"], 3)
+        self.assertEqual(stats[BLEEventClass.gatt_response.name]["queued"], 5)
+        self.assertEqual(stats[BLEEventClass.gatt_response.name]["dropped"], 0)
+        self.assertEqual(stats[BLEEventClass.control.name]["queued"], 1)
+
+    def test_priority_lanes(self):
+        ble_driver = self.make_driver(event_queue_size=0)
+        events = [adv_report(addr) for addr in range(3)]
+        events.append(hvx(driver.BLE_GATT_HVX_NOTIFICATION))
+        read_rsp = _gattc_evt(
+            BLEEvtID.gattc_evt_read_rsp.value,
+            1,
+            driver.BLE_GATT_STATUS_SUCCESS,
+            driver.BLE_GATT_HANDLE_INVALID,
+            "read_rsp",
+            handle=0x10,
+            offset=0,
+            len=0,
+            data=_array([]),
+        )
+        events.append(read_rsp)
+        disconnected = _evt(
+            BLEEvtID.gap_evt_disconnected.value, 0, "disconnected", reason=0x13
+        )
+        events.append(disconnected)
+        for ble_event in events:
+            ble_driver.ble_event_handler(ble_driver.rpc_adapter, ble_event)
+
+        order = [item[1] for item in drain(ble_driver.ble_event_queue)]
+        # The notification on connection 0 goes before its disconnect
+        self.assertEqual(order, [events[3], disconnected, read_rsp] + events[:3])
+
+    def test_notifications_never_drop(self):
+        ble_driver = self.make_driver()
+        for _ in range(4):
+            notification = hvx(driver.BLE_GATT_HVX_NOTIFICATION)
+            ble_driver.ble_event_handler(ble_driver.rpc_adapter, notification)
+        stats = ble_driver.queue_stats()["ble_event"][BLEEventClass.notification.name]
+        self.assertEqual(stats["queued"], 4)
+        self.assertEqual(stats["blocked"], 0)
+        self.assertEqual(stats["dropped"], 0)
+
+    def test_notifications_block(self):
+        ble_driver = self.make_driver(
+            event_queue_policies={BLEEventClass.notification: QueuePolicy.block}
+        )
+        ble_driver.ble_event_queue.block_timeout = 0.05
+        for _ in range(4):
+            notification = hvx(driver.BLE_GATT_HVX_NOTIFICATION)
+            ble_driver.ble_event_handler(ble_driver.rpc_adapter, notification)
+        stats = ble_driver.queue_stats()["ble_event"][BLEEventClass.notification.name]
+        self.assertEqual(stats["queued"], 3)
+        self.assertEqual(stats["blocked"], 1)
+        self.assertEqual(stats["dropped"], 1)
+
+    def test_status_queue_is_bounded(self):
+        ble_driver = self.make_driver(status_queue_size=2)
+        for i in range(4):
+            ble_driver.status_handler(ble_driver.rpc_adapter, 0, "status {}".format(i))
+        stats = ble_driver.queue_stats()["status"]["default"]
+        self.assertEqual(stats["queued"], 2)
+        self.assertEqual(stats["dropped"], 2)
+        self.assertEqual([item[2] for item in drain(ble_driver.status_queue)],
+                         ["status 2", "status 3"])
+
+    def test_coalesce_adv_reports(self):
+        ble_driver = self.make_driver(
+            event_queue_policies={BLEEventClass.adv_report: QueuePolicy.coalesce}
+        )
+        for addr in (1, 2, 1, 1, 3):
+            ble_driver.ble_event_handler(ble_driver.rpc_adapter, adv_report(addr))
+        stats = ble_driver.queue_stats()["ble_event"][BLEEventClass.adv_report.name]
+        self.assertEqual(stats["queued"], 3)
+        self.assertEqual(stats["coalesced"], 2)
+        self.assertEqual(stats["dropped"], 0)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
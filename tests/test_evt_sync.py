@@ -0,0 +1,189 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import logging
+import threading
+import time
+import unittest
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_adapter import BLEAdapter, Connection, EvtSync
+from pc_ble_driver_py.ble_driver import (
+    BLEEvtID,
+    BLEGapAddr,
+    BLEGapRoles,
+    BLEGattStatusCode,
+)
+
+from fake_driver import FakeDriver
+
+logger = logging.getLogger(__name__)
+
+CONN_HANDLE = 0
+
+
+class RequestDriver(FakeDriver):
+    """Answers requests from the event thread, or before the request call returns."""
+
+    def __init__(self, delay=0, immediate=False):
+        super(RequestDriver, self).__init__(delay)
+        self.immediate = immediate
+
+    def post(self, method, **kwargs):
+        if self.immediate:
+            self.dispatch(method, kwargs)
+        else:
+            super(RequestDriver, self).post(method, **kwargs)
+
+    def ble_gattc_read(self, conn_handle, handle, offset):
+        self.post(
+            "on_gattc_evt_read_rsp",
+            conn_handle=conn_handle,
+            status=BLEGattStatusCode.success,
+            error_handle=0,
+            attr_handle=handle,
+            offset=offset,
+            data=[handle],
+        )
+
+    def ble_gattc_exchange_mtu_req(self, conn_handle, mtu):
+        self.post("on_gattc_evt_exchange_mtu_rsp", conn_handle=conn_handle, status=0, att_mtu=mtu)
+
+    def ble_gap_conn_param_update(self, conn_handle, conn_params):
+        self.post("on_gap_evt_conn_param_update", conn_handle=conn_handle, conn_params=conn_params)
+
+
+class EvtSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.evt_sync = EvtSync(events=BLEEvtID)
+
+    def test_event_before_wait_is_kept(self):
+        with self.evt_sync.expect(BLEEvtID.gattc_evt_read_rsp) as responses:
+            self.evt_sync.notify(BLEEvtID.gattc_evt_read_rsp, data=dict(data=[1]))
+            self.assertEqual(dict(data=[1]), responses.wait(timeout=0))
+
+    def test_event_types_are_separate(self):
+        reads = self.evt_sync.expect(BLEEvtID.gattc_evt_read_rsp)
+        writes = self.evt_sync.expect(BLEEvtID.gattc_evt_write_rsp)
+        self.evt_sync.notify(BLEEvtID.gattc_evt_read_rsp, data="read")
+        self.evt_sync.notify(BLEEvtID.gattc_evt_write_rsp, data="write")
+        self.assertEqual("write", writes.wait(timeout=0))
+        self.assertEqual("read", reads.wait(timeout=0))
+
+    def test_events_go_to_oldest_queue(self):
+        first = self.evt_sync.expect(BLEEvtID.gattc_evt_read_rsp)
+        second = self.evt_sync.expect(BLEEvtID.gattc_evt_read_rsp)
+        self.evt_sync.notify(BLEEvtID.gattc_evt_read_rsp, data=1)
+        first.close()
+        self.evt_sync.notify(BLEEvtID.gattc_evt_read_rsp, data=2)
+        self.assertEqual(2, second.wait(timeout=0))
+
+    def test_timeout_and_close(self):
+        with self.evt_sync.expect(BLEEvtID.gattc_evt_read_rsp) as responses:
+            self.assertIsNone(responses.wait(timeout=0.01))
+        # No queue open, the event is dropped
+        self.evt_sync.notify(BLEEvtID.gattc_evt_read_rsp, data=1)
+        self.assertIsNone(self.evt_sync.wait(BLEEvtID.gattc_evt_read_rsp, timeout=0.01))
+
+        responses = self.evt_sync.expect(BLEEvtID.gattc_evt_read_rsp)
+        threading.Timer(0.05, self.evt_sync.close).start()
+        start = time.perf_counter()
+        self.assertIsNone(responses.wait(timeout=5))
+        self.assertLess(time.perf_counter() - start, 1)
+
+
+class AdapterRequestTest(unittest.TestCase):
+    def setUp(self):
+        self.drivers = list()
+
+    def tearDown(self):
+        for ble_driver in self.drivers:
+            ble_driver.stop()
+
+    def _adapter(self, ble_driver):
+        self.drivers.append(ble_driver)
+        adapter = BLEAdapter(ble_driver)
+        adapter.db_conns[CONN_HANDLE] = Connection(
+            BLEGapAddr(BLEGapAddr.Types.public, [0] * 6), BLEGapRoles.central
+        )
+        adapter.evt_sync[CONN_HANDLE] = EvtSync(events=BLEEvtID)
+        return adapter
+
+    def test_response_before_wait(self):
+        adapter = self._adapter(RequestDriver(immediate=True))
+        start = time.perf_counter()
+        self.assertEqual(
+            (BLEGattStatusCode.success, [3]),
+            adapter.read_req(CONN_HANDLE, None, attr_handle=3),
+        )
+        self.assertEqual(100, adapter.att_mtu_exchange(CONN_HANDLE, 100))
+        self.assertLess(time.perf_counter() - start, 1)
+
+    def test_concurrent_requests(self):
+        adapter = self._adapter(RequestDriver(delay=0.05))
+        results = dict()
+
+        def run(name, call, *args):
+            results[name] = call(CONN_HANDLE, *args)
+
+        threads = [
+            threading.Thread(target=run, args=("read", adapter.read_req, None, 0, 7)),
+            threading.Thread(target=run, args=("mtu", adapter.att_mtu_exchange, 247)),
+            threading.Thread(target=run, args=("conn", adapter.conn_param_update, "params")),
+        ]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual((BLEGattStatusCode.success, [7]), results["read"])
+        self.assertEqual(247, results["mtu"])
+        self.assertEqual("params", results["conn"])
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,283 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_adapter import BLEAdapter
+from pc_ble_driver_py.ble_driver import (
+    BLECharacteristic,
+    BLECharProperties,
+    BLEDescriptor,
+    BLEGapAddr,
+    BLEGapRoles,
+    BLEGattHVXType,
+    BLEGattStatusCode,
+    BLEService,
+    BLEUUID,
+    BLEUUIDBase,
+)
+from pc_ble_driver_py.gatt_cache import GattCache, GattCacheEntry
+
+from fake_driver import FakeDriver
+
+VENDOR_BASE = [0x6E, 0x40, 0x00, 0x00, 0xB5, 0xA3, 0xF3, 0x93,
+               0xE0, 0xA9, 0xE5, 0x0E, 0x24, 0xDC, 0xCA, 0x9E]
+PROPS = BLECharProperties(0, 1, 0, 1, 1, 0, 0)
+CONN_HANDLE = 0
+PEER_ADDR = BLEGapAddr(BLEGapAddr.Types.random_static, [0xC0, 0x01, 0x02, 0x03, 0x04, 0x05])
+
+# (service uuid, start, end, [(char uuid, decl, value, [CCCD handles])])
+PEER_DB = [
+    (0x1801, 1, 6, [
+        (BLEUUID.Standard.service_changed.value, 2, 3, [4]),
+        (BLEUUID.Standard.database_hash.value, 5, 6, []),
+    ]),
+    (0x180F, 7, 0xFFFF, [
+        (0x2A19, 8, 9, [10]),
+    ]),
+]
+
+
+def make_services():
+    props = BLECharProperties(0, 1, 0, 1, 1, 0, 0)
+    gatt = BLEService(BLEUUID(0x1801), 1, 5)
+    char = BLECharacteristic(BLEUUID(BLEUUID.Standard.database_hash), props, 2, 3)
+    char.descs.append(BLEDescriptor(BLEUUID(BLEUUID.Standard.database_hash), 3))
+    gatt.char_add(char)
+
+    base = BLEUUIDBase(VENDOR_BASE, 3)
+    # Make sure the SWIG array created by to_c() is not pickled
+    base.to_c()
+    vendor = BLEService(BLEUUID(0x0001, base), 6, 10)
+    char = BLECharacteristic(BLEUUID(0x0003, BLEUUIDBase(uuid_type=3)), props, 7, 8)
+    char.descs.append(BLEDescriptor(BLEUUID(0x0003, BLEUUIDBase(uuid_type=3)), 8))
+    char.descs.append(BLEDescriptor(BLEUUID(BLEUUID.Standard.cccd), 9))
+    vendor.char_add(char)
+    return [gatt, vendor]
+
+
+class PeerDbDriver(FakeDriver):
+    """Answers discovery requests from PEER_DB and reads with db_hash."""
+
+    def __init__(self):
+        super(PeerDbDriver, self).__init__()
+        self.conn_cfg_tags = dict()
+        self.write_cmd_tx_queue_sizes = dict()
+        self.hvn_tx_queue_sizes = dict()
+        self.db_hash = b"\x01" * 16
+        self.requests = list()
+
+    def _respond(self, method, key, items):
+        status = BLEGattStatusCode.success if items else BLEGattStatusCode.attribute_not_found
+        self.post(method, conn_handle=CONN_HANDLE, status=status, **{key: items})
+
+    def ble_gattc_prim_srvc_disc(self, conn_handle, srvc_uuid, start_handle):
+        self.requests.append("services")
+        services = [
+            BLEService(BLEUUID(uuid), start, end)
+            for uuid, start, end, _ in PEER_DB
+            if start >= start_handle
+        ]
+        self._respond("on_gattc_evt_prim_srvc_disc_rsp", "services", services)
+
+    def ble_gattc_char_disc(self, conn_handle, start_handle, end_handle):
+        chars = [
+            BLECharacteristic(BLEUUID(uuid), PROPS, decl, value)
+            for _, _, _, chars in PEER_DB
+            for uuid, decl, value, _ in chars
+            if start_handle <= decl <= end_handle
+        ]
+        self._respond("on_gattc_evt_char_disc_rsp", "characteristics", chars)
+
+    def ble_gattc_desc_disc(self, conn_handle, start_handle, end_handle):
+        descs = list()
+        for _, _, _, chars in PEER_DB:
+            for uuid, _, value, cccds in chars:
+                descs.append(BLEDescriptor(BLEUUID(uuid), value))
+                descs.extend(BLEDescriptor(BLEUUID(BLEUUID.Standard.cccd), h) for h in cccds)
+        descs = [d for d in descs if start_handle <= d.handle <= end_handle]
+        self._respond("on_gattc_evt_desc_disc_rsp", "descriptors", descs)
+
+    def ble_gattc_read(self, conn_handle, handle, offset):
+        self.requests.append("read")
+        self.post(
+            "on_gattc_evt_read_rsp",
+            conn_handle=conn_handle,
+            status=BLEGattStatusCode.success,
+            error_handle=0,
+            attr_handle=handle,
+            offset=offset,
+            data=list(self.db_hash),
+        )
+
+    def ble_gattc_hv_confirm(self, conn_handle, attr_handle):
+        pass
+
+
+class GattCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = GattCache(self.path)
+        self.peer_addr = BLEGapAddr(BLEGapAddr.Types.random_static,
+                                    [0xC0, 0x01, 0x02, 0x03, 0x04, 0x05])
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_store_and_load(self):
+        self.cache.store(self.peer_addr, GattCacheEntry(make_services(), b"\x01" * 16))
+        entry = self.cache.load(self.peer_addr)
+
+        self.assertEqual(b"\x01" * 16, entry.db_hash)
+        self.assertEqual(2, len(entry.services))
+        vendor = entry.services[1]
+        self.assertEqual(VENDOR_BASE, vendor.uuid.base.base)
+        self.assertEqual(0x0003, vendor.chars[0].uuid.value)
+        self.assertEqual(BLEUUID.Standard.cccd, vendor.chars[0].descs[1].uuid.value)
+        self.assertEqual(10, vendor.chars[0].end_handle)
+        self.assertEqual([], [n for n in os.listdir(self.path) if n.endswith(".tmp")])
+
+    def test_identity_is_part_of_key(self):
+        identity = [0xAA] * 16
+        self.cache.store(self.peer_addr, GattCacheEntry(make_services()), identity)
+        self.assertIsNone(self.cache.load(self.peer_addr))
+        self.assertIsNotNone(self.cache.load(self.peer_addr, identity))
+
+    def test_invalidate(self):
+        self.cache.store(self.peer_addr, GattCacheEntry(make_services()))
+        self.cache.invalidate(self.peer_addr)
+        self.assertIsNone(self.cache.load(self.peer_addr))
+
+    def test_corrupt_entry_is_discarded(self):
+        file_name = os.path.join(self.path, GattCache.key(self.peer_addr) + ".gatt")
+        with open(file_name, "wb") as f:
+            f.write(b"not a pickle")
+        self.assertIsNone(self.cache.load(self.peer_addr))
+        self.assertFalse(os.path.exists(file_name))
+
+    def test_remap_uuid_types(self):
+        entry = GattCacheEntry(make_services())
+        bases = entry.vendor_bases()
+        self.assertEqual(1, len(bases))
+        self.assertEqual(VENDOR_BASE, bases[0].base)
+
+        entry.remap_uuid_types({3: 4})
+        vendor = entry.services[1]
+        self.assertEqual(4, vendor.uuid.base.type)
+        self.assertEqual(4, vendor.chars[0].uuid.base.type)
+        self.assertEqual(4, vendor.chars[0].descs[0].uuid.base.type)
+        self.assertEqual(BLEUUIDBase().type, vendor.chars[0].descs[1].uuid.base.type)
+
+
+class GattCacheAdapterTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.driver = PeerDbDriver()
+        self.adapter = BLEAdapter(self.driver, gatt_cache=GattCache(self.path))
+
+    def tearDown(self):
+        self.driver.stop()
+        shutil.rmtree(self.path)
+
+    def connect(self):
+        # Events are handled on the test thread, as on the driver event thread
+        self.adapter.on_gap_evt_connected(
+            self.driver, CONN_HANDLE, PEER_ADDR, BLEGapRoles.central, None
+        )
+        self.driver.requests = list()
+        return self.adapter.db_conns[CONN_HANDLE]
+
+    def reconnect(self):
+        self.adapter.on_gap_evt_disconnected(self.driver, CONN_HANDLE, 0x13)
+        return self.connect()
+
+    def test_cache_is_validated_before_use(self):
+        self.connect()
+        self.adapter.service_discovery(CONN_HANDLE)
+        self.assertEqual("services", self.driver.requests[0])
+
+        db_conn = self.reconnect()
+        # Nothing is restored before service_discovery checks the Database Hash
+        self.assertEqual([], db_conn.services)
+        self.assertEqual([], self.driver.requests)
+        self.adapter.service_discovery(CONN_HANDLE)
+        self.assertEqual(["read"], self.driver.requests)
+        self.assertEqual(9, db_conn.get_char_value_handle(BLEUUID(0x2A19)))
+
+        self.driver.db_hash = b"\x02" * 16
+        self.reconnect()
+        self.adapter.service_discovery(CONN_HANDLE)
+        self.assertEqual(["read", "services"], self.driver.requests[:2])
+
+    def test_service_changed_rediscovers(self):
+        db_conn = self.connect()
+        self.adapter.service_discovery(CONN_HANDLE)
+        self.driver.requests = list()
+
+        self.adapter.on_gattc_evt_hvx(
+            self.driver,
+            CONN_HANDLE,
+            BLEGattStatusCode.success,
+            0,
+            3,
+            BLEGattHVXType.indication,
+            [0x01, 0x00, 0xFF, 0xFF],
+        )
+        self.assertTrue(db_conn.services_stale)
+        self.assertIsNone(self.adapter.gatt_cache.load(PEER_ADDR))
+
+        status, _ = self.adapter.read_req(CONN_HANDLE, BLEUUID(0x2A19))
+        self.assertEqual(BLEGattStatusCode.success, status)
+        self.assertEqual("services", self.driver.requests[0])
+        self.assertFalse(db_conn.services_stale)
+        self.assertIsNotNone(self.adapter.gatt_cache.load(PEER_ADDR))
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,223 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import logging
+import unittest
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_driver import (
+    BLECharacteristic,
+    BLECharProperties,
+    BLEDescriptor,
+    BLEGattStatusCode,
+    BLEService,
+    BLEUUID,
+    BLEUUIDBase,
+)
+from pc_ble_driver_py.gatt_discovery import GattDiscovery
+
+from fake_driver import FakeDriver
+
+logger = logging.getLogger(__name__)
+
+CONN_HANDLE = 0
+VENDOR_UUID = [0x6E, 0x40, 0x00, 0x01, 0xB5, 0xA3, 0xF3, 0x93,
+               0xE0, 0xA9, 0xE5, 0x0E, 0x24, 0xDC, 0xCA, 0x9E]
+PROPS = BLECharProperties(0, 1, 0, 1, 1, 0, 0)
+
+# (service uuid, start, end, [(char uuid, decl, value, [(desc uuid, handle)])])
+# A vendor service uuid is given as a 128-bit list, most significant byte first.
+PEER_DB = [
+    (0x1800, 1, 5, [
+        (0x2A00, 2, 3, []),
+        (0x2A01, 4, 5, []),
+    ]),
+    (0x1801, 6, 9, [
+        (0x2A05, 7, 8, [(0x2902, 9)]),
+    ]),
+    (VENDOR_UUID, 10, 17, [
+        (0x0002, 11, 12, [(0x2902, 13), (0x2901, 14)]),
+        (0x0003, 15, 16, [(0x2902, 17)]),
+    ]),
+    (0x180F, 18, 0xFFFF, [
+        (0x2A19, 19, 20, [(0x2902, 21)]),
+    ]),
+]
+
+
+class PeerDbDriver(FakeDriver):
+    """Answers GATTC discovery requests from PEER_DB."""
+
+    vendor_type = 2
+
+    def __init__(self):
+        super(PeerDbDriver, self).__init__()
+        self.requests = list()
+
+    def _uuid(self, value, vendor=False):
+        if vendor:
+            return BLEUUID(value, BLEUUIDBase(uuid_type=self.vendor_type))
+        return BLEUUID(value)
+
+    def _respond(self, method, items, key, **kwargs):
+        if items:
+            kwargs[key] = items
+            self.post(method, conn_handle=CONN_HANDLE, status=BLEGattStatusCode.success, **kwargs)
+        else:
+            kwargs[key] = []
+            self.post(
+                method,
+                conn_handle=CONN_HANDLE,
+                status=BLEGattStatusCode.attribute_not_found,
+                **kwargs
+            )
+
+    def ble_gattc_prim_srvc_disc(self, conn_handle, srvc_uuid, start_handle):
+        self.requests.append(("services", start_handle))
+        services = [
+            BLEService(BLEUUID(0) if isinstance(uuid, list) else BLEUUID(uuid), start, end)
+            for uuid, start, end, _ in PEER_DB
+            if start >= start_handle
+        ][:2]
+        self._respond("on_gattc_evt_prim_srvc_disc_rsp", services, "services")
+
+    def ble_gattc_read(self, conn_handle, handle, offset):
+        self.requests.append(("read", handle))
+        for uuid, start, _, _ in PEER_DB:
+            if start == handle:
+                self.post(
+                    "on_gattc_evt_read_rsp",
+                    conn_handle=CONN_HANDLE,
+                    status=BLEGattStatusCode.success,
+                    error_handle=0,
+                    attr_handle=handle,
+                    offset=0,
+                    data=uuid[::-1],
+                )
+
+    def ble_vs_uuid_add(self, base):
+        base.type = self.vendor_type
+
+    def ble_gattc_char_disc(self, conn_handle, start_handle, end_handle):
+        self.requests.append(("characteristics", start_handle))
+        chars = [
+            BLECharacteristic(self._uuid(uuid, isinstance(s_uuid, list)), PROPS, decl, value)
+            for s_uuid, _, _, chars in PEER_DB
+            for uuid, decl, value, _ in chars
+            if start_handle <= decl <= end_handle
+        ][:3]
+        self._respond("on_gattc_evt_char_disc_rsp", chars, "characteristics")
+
+    def ble_gattc_desc_disc(self, conn_handle, start_handle, end_handle):
+        self.requests.append(("descriptors", start_handle))
+        attrs = list()
+        for s_uuid, _, _, chars in PEER_DB:
+            for uuid, decl, value, descs in chars:
+                uuid = self._uuid(uuid, isinstance(s_uuid, list))
+                attrs.append(BLEDescriptor(uuid, value))
+                attrs.extend(BLEDescriptor(BLEUUID(d), h) for d, h in descs)
+        descs = [d for d in attrs if start_handle <= d.handle <= end_handle][:4]
+        self._respond("on_gattc_evt_desc_disc_rsp", descs, "descriptors")
+
+
+class GattDiscoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = PeerDbDriver()
+
+    def tearDown(self):
+        self.driver.stop()
+
+    def test_full_discovery(self):
+        discovery = GattDiscovery(self.driver, CONN_HANDLE)
+        self.assertEqual(BLEGattStatusCode.success, discovery.run(timeout=2))
+
+        self.assertEqual([1, 6, 10, 18], [s.start_handle for s in discovery.services])
+        vendor = discovery.services[2]
+        self.assertEqual(0x0001, vendor.uuid.value)
+        self.assertEqual(VENDOR_UUID, vendor.uuid.base.base)
+        self.assertEqual(PeerDbDriver.vendor_type, vendor.uuid.base.type)
+
+        chars = [c for s in discovery.services for c in s.chars]
+        self.assertEqual([2, 4, 7, 11, 15, 19], [c.handle_decl for c in chars])
+        self.assertEqual([3, 5, 9, 14, 17, 0xFFFF], [c.end_handle for c in chars])
+        self.assertEqual([[3], [5], [8, 9], [12, 13, 14], [16, 17], [20, 21]],
+                         [[d.handle for d in c.descs] for c in chars])
+
+        # Characteristics with handle_value == end_handle need no request
+        desc_requests = [h for phase, h in self.driver.requests if phase == "descriptors"]
+        self.assertEqual([8, 12, 16, 20, 22], desc_requests)
+        self.assertEqual(len(desc_requests), discovery.stats["descriptors"]["requests"])
+        self.assertEqual(1, discovery.stats["vendor_uuids"]["requests"])
+        for phase in GattDiscovery.PHASES:
+            logger.info("%s: %s", phase, discovery.stats[phase])
+
+    def test_progress_callback(self):
+        discovery = GattDiscovery(self.driver, CONN_HANDLE)
+        responses = list()
+        discovery.progress_callback = lambda: responses.append(None)
+        self.assertEqual(BLEGattStatusCode.success, discovery.run(timeout=2))
+        # One call for every response
+        self.assertEqual(len(self.driver.requests), len(responses))
+
+    def test_filtered_discovery(self):
+        discovery = GattDiscovery(
+            self.driver,
+            CONN_HANDLE,
+            service_uuids=[BLEUUID(0x180F), BLEUUID(0x1801)],
+            char_uuids=[BLEUUID(0x2A19)],
+        )
+        self.assertEqual(BLEGattStatusCode.success, discovery.run(timeout=2))
+
+        self.assertEqual([6, 18], [s.start_handle for s in discovery.services])
+        self.assertEqual([], discovery.services[0].chars)
+        self.assertEqual([19], [c.handle_decl for c in discovery.services[1].chars])
+        char_requests = [h for phase, h in self.driver.requests if phase == "characteristics"]
+        # The last service ends at 0xFFFF, so there may be more characteristics
+        self.assertEqual([6, 18, 21], char_requests)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,171 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import logging
+import queue
+import threading
+import unittest
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_adapter import BLEAdapter, Connection, EvtSync
+from pc_ble_driver_py.ble_driver import (
+    BLEEvtID,
+    BLEGapAddr,
+    BLEGapRoles,
+    BLEGattHVXType,
+    BLEGattsCharHandles,
+    driver,
+)
+from pc_ble_driver_py.exceptions import NordicSemiException
+from pc_ble_driver_py.hvx_notifier import HvxNotifier
+
+from fake_driver import FakeDriver
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 3
+CHAR_HANDLES = BLEGattsCharHandles(value_handle=0x10, cccd_handle=0x11)
+
+
+class HvnQueueDriver(FakeDriver):
+    """Accepts notifications while the HVN queue of the connection has room."""
+
+    def __init__(self, queue_size):
+        super(HvnQueueDriver, self).__init__()
+        self.queue_size = queue_size
+        self.queued = dict()
+        self.sent = dict()
+        self.lock = threading.Lock()
+
+    def ble_gatts_hvx(self, conn_handle, hvx_params):
+        with self.lock:
+            if hvx_params.type == BLEGattHVXType.indication:
+                self.post("on_gatts_evt_hvc", conn_handle=conn_handle, attr_handle=0x10)
+            elif self.queued.get(conn_handle, 0) == self.queue_size:
+                raise NordicSemiException(
+                    "Failed to ble_gatts_hvx. Error code: NRF_ERROR_RESOURCES",
+                    error_code=driver.NRF_ERROR_RESOURCES,
+                )
+            else:
+                self.queued[conn_handle] = self.queued.get(conn_handle, 0) + 1
+                self.post("on_gatts_evt_hvn_tx_complete", conn_handle=conn_handle, count=1)
+            self.sent.setdefault(conn_handle, list()).append(bytes(hvx_params.data))
+
+    def dispatch(self, method, kwargs):
+        if method == "on_gatts_evt_hvn_tx_complete":
+            with self.lock:
+                self.queued[kwargs["conn_handle"]] -= kwargs["count"]
+        super(HvnQueueDriver, self).dispatch(method, kwargs)
+
+
+class HvxNotifierTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = HvnQueueDriver(QUEUE_SIZE)
+        self.adapter = BLEAdapter(self.driver)
+        for conn_handle in (0, 1):
+            self.adapter.db_conns[conn_handle] = Connection(
+                BLEGapAddr(BLEGapAddr.Types.public, [conn_handle] * 6),
+                BLEGapRoles.periph,
+                hvn_tx_queue_size=QUEUE_SIZE,
+            )
+            self.adapter.evt_sync[conn_handle] = EvtSync(events=BLEEvtID)
+        self.notifier = HvxNotifier(self.adapter)
+        self.notifier.start()
+
+    def tearDown(self):
+        self.notifier.stop()
+        self.driver.stop()
+
+    def test_iterable_stream(self):
+        values = [bytes([i]) * 20 for i in range(200)]
+        self.notifier.stream(0, CHAR_HANDLES, values)
+        self.notifier.drain(timeout=2)
+
+        self.assertEqual(values, self.driver.sent[0])
+        stats = self.notifier.stats()[(0, 0x10)]
+        self.assertEqual(200, stats["sent"])
+        self.assertEqual(200 * 20, stats["bytes"])
+        self.assertEqual(0, stats["pending"])
+        self.assertEqual(0, stats["in_flight"])
+        logger.info("notifier: %s", stats)
+
+    def test_queue_source(self):
+        source = queue.Queue()
+        self.notifier.stream(1, CHAR_HANDLES, source)
+        for i in range(10):
+            source.put([i])
+        source.put(None)
+        self.notifier.drain(timeout=2)
+        self.assertEqual([bytes([i]) for i in range(10)], self.driver.sent[1])
+
+    def test_fan_out(self):
+        streams = [self.notifier.stream(c, CHAR_HANDLES) for c in (0, 1)]
+        for i in range(50):
+            self.notifier.publish(CHAR_HANDLES, [i, i])
+        for stream in streams:
+            stream.close()
+        self.notifier.drain(timeout=2)
+        for conn_handle in (0, 1):
+            self.assertEqual([bytes([i, i]) for i in range(50)], self.driver.sent[conn_handle])
+
+    def test_indications(self):
+        stream = self.notifier.stream(
+            0, CHAR_HANDLES, [[1], [2], [3]], hvx_type=BLEGattHVXType.indication
+        )
+        self.notifier.drain(timeout=2)
+        self.assertEqual(3, stream.sent)
+        self.assertEqual([b"\x01", b"\x02", b"\x03"], self.driver.sent[0])
+
+    def test_disconnect_fails_stream(self):
+        stream = self.notifier.stream(0, CHAR_HANDLES)
+        for obs in list(self.driver.observers):
+            obs.on_gap_evt_disconnected(ble_driver=self.driver, conn_handle=0, reason=0x13)
+        self.assertIsNotNone(stream.error)
+        self.assertEqual([], self.notifier.streams)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,184 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import logging
+import time
+import unittest
+
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_driver import BLEDriver, BLEGapDHKey, BLEGapLescP256Pk
+from pc_ble_driver_py.lesc_key_pool import LescKeyPool, generate_lesc_private_key
+
+logger = logging.getLogger(__name__)
+
+
+def reference_pk(private_key):
+    """Public key list the way generate_lesc_keyset used to build it."""
+    numbers = private_key.public_key().public_numbers()
+
+    def _int_to_list(value):
+        hex_string = "{:064X}".format(value)
+        return [int(hex_string[i:i + 2], 16) for i in range(0, 64, 2)]
+
+    return _int_to_list(numbers.x)[::-1] + _int_to_list(numbers.y)[::-1]
+
+
+class LescKeyConversion(unittest.TestCase):
+    def test_public_key(self):
+        for _ in range(8):
+            private_key = generate_lesc_private_key()
+            pk = BLEGapLescP256Pk.from_public_key(private_key.public_key())
+            self.assertEqual(list(pk.pk), reference_pk(private_key))
+            self.assertEqual(
+                pk.public_key().public_numbers(),
+                private_key.public_key().public_numbers(),
+            )
+            # Lists, as from older callers, convert the same way
+            self.assertEqual(
+                BLEGapLescP256Pk(list(pk.pk)).public_key().public_numbers(),
+                private_key.public_key().public_numbers(),
+            )
+
+    def test_dhkey(self):
+        own, peer = generate_lesc_private_key(), generate_lesc_private_key()
+        shared_secret = own.exchange(ec.ECDH(), peer.public_key())
+        dhkey = BLEGapDHKey.from_shared_secret(shared_secret)
+        self.assertEqual(list(dhkey.key), list(shared_secret)[::-1])
+        self.assertEqual(str(dhkey), "key({})".format(shared_secret[::-1].hex()))
+
+
+class LescKeyPoolTest(unittest.TestCase):
+    def test_get(self):
+        pool = LescKeyPool(size=3)
+        self.assertEqual(len(pool), 3)
+        keys = [pool.get() for _ in range(4)]
+        numbers = set(key.private_numbers().private_value for key in keys)
+        self.assertEqual(len(numbers), 4)
+        self.assertEqual(
+            pool.stats(),
+            dict(ready=0, size=3, generated=3, taken=4, misses=1, expired=0, running=False),
+        )
+        self.assertEqual(pool.fill(), 3)
+
+    def test_max_uses(self):
+        pool = LescKeyPool(size=2, max_uses=2)
+        first, second, third = pool.get(), pool.get(), pool.get()
+        self.assertIs(first, second)
+        self.assertIsNot(second, third)
+        self.assertEqual(len(pool), 1)
+
+    def test_max_age(self):
+        now = [0.0]
+        pool = LescKeyPool(size=2, max_age=10.0, clock=lambda: now[0])
+        keys = list(pool._keys)
+        now[0] = 10.0
+        self.assertEqual(len(pool), 2)
+        self.assertNotIn(pool.get(), [entry.key for entry in keys])
+        self.assertEqual(pool.stats()["expired"], 2)
+        self.assertEqual(pool.stats()["misses"], 1)
+
+    def wait_ready(self, pool, count, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while len(pool) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return len(pool)
+
+    def test_background_refill(self):
+        with LescKeyPool(size=3, fill=False) as pool:
+            self.assertEqual(self.wait_ready(pool, 3), 3)
+            for _ in range(3):
+                pool.get()
+            self.assertEqual(self.wait_ready(pool, 3), 3)
+            self.assertEqual(pool.stats()["misses"], 0)
+        self.assertFalse(pool.stats()["running"])
+        generated = pool.generated
+        pool.get()
+        time.sleep(0.1)
+        self.assertEqual(pool.generated, generated)
+
+    def test_background_rotation(self):
+        with LescKeyPool(size=2, fill=False, max_age=0.2) as pool:
+            self.wait_ready(pool, 2)
+            time.sleep(0.5)
+            self.assertEqual(self.wait_ready(pool, 2), 2)
+            self.assertGreaterEqual(pool.stats()["expired"], 2)
+            self.assertGreaterEqual(pool.generated, 4)
+
+    def test_driver_pool(self):
+        ble_driver = BLEDriver(serial_port="sim-lesc-pool", lesc_key_pool_size=2)
+        self.assertEqual(len(ble_driver.lesc_key_pool), 0)
+        ble_driver.open()
+        try:
+            self.assertEqual(self.wait_ready(ble_driver.lesc_key_pool, 2), 2)
+            ble_driver.generate_lesc_keyset()
+            self.assertEqual(ble_driver.lesc_key_pool.stats()["misses"], 0)
+        finally:
+            ble_driver.close()
+        self.assertFalse(ble_driver.lesc_key_pool.stats()["running"])
+
+    def test_pairing_keys(self):
+        pool = LescKeyPool(size=2)
+        central = BLEDriver(serial_port="sim-lesc-central", lesc_key_pool=pool)
+        peripheral = BLEDriver(serial_port="sim-lesc-peripheral")
+
+        central_pk = BLEGapLescP256Pk.from_c(central.generate_lesc_keyset().keys_own.p_pk)
+        self.assertEqual(len(pool), 1)
+        private_key = generate_lesc_private_key()
+        peripheral_pk = BLEGapLescP256Pk.from_c(
+            peripheral.generate_lesc_keyset(private_key).keys_own.p_pk
+        )
+        self.assertEqual(list(peripheral_pk.pk), reference_pk(private_key))
+
+        central_dhkey = BLEGapDHKey.from_shared_secret(
+            central._lesc_private_key.exchange(ec.ECDH(), peripheral_pk.public_key())
+        )
+        p_dhkey = peripheral.generate_lesc_dhkey(central_pk)
+        self.assertEqual(bytes(p_dhkey.key[:32]), bytes(central_dhkey.key))
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
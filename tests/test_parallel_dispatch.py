@@ -0,0 +1,216 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import logging
+import threading
+import unittest
+from queue import Queue
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_driver import BLEDriver, BLEEvtID, RpcLogSeverity, driver
+from pc_ble_driver_py.event_queue import EventQueue
+from pc_ble_driver_py.observers import BLEDriverObserver
+from pc_ble_driver_py.sim_driver import _evt
+
+logger = logging.getLogger(__name__)
+
+
+def conn_param_update(conn_handle, n):
+    # slave_latency carries a sequence number
+    conn_params = driver.ble_gap_conn_params_t()
+    conn_params.min_conn_interval = 6
+    conn_params.max_conn_interval = 6
+    conn_params.slave_latency = n
+    conn_params.conn_sup_timeout = 400
+    return _evt(
+        BLEEvtID.gap_evt_conn_param_update.value,
+        conn_handle,
+        "conn_param_update",
+        conn_params=conn_params,
+    )
+
+
+class BlockingObserver(BLEDriverObserver):
+    """Holds up events of the connections in hold until release is set."""
+
+    def __init__(self, hold=()):
+        super(BlockingObserver, self).__init__()
+        self.hold = set(hold)
+        self.holding = threading.Event()
+        self.release = threading.Event()
+        self.events = Queue()
+
+    def on_gap_evt_conn_param_update(self, ble_driver, conn_handle, conn_params):
+        if conn_handle in self.hold:
+            self.holding.set()
+            self.release.wait(5)
+        self.events.put((conn_handle, conn_params.slave_latency, threading.current_thread().name))
+
+    def on_rpc_log_entry(self, ble_driver, severity, message):
+        if message == "held back":
+            self.events.put(("log", message, threading.current_thread().name))
+
+
+def inject(ble_driver, ble_event):
+    ble_driver.ble_event_handler(ble_driver.rpc_adapter, ble_event)
+
+
+class ParallelDispatchTest(unittest.TestCase):
+    def setUp(self):
+        self.drivers = list()
+
+    def tearDown(self):
+        for ble_driver in self.drivers:
+            ble_driver.close()
+
+    def open_driver(self, port, **kwargs):
+        ble_driver = BLEDriver(serial_port=port, auto_flash=False, **kwargs)
+        ble_driver.open()
+        self.drivers.append(ble_driver)
+        return ble_driver
+
+    def test_drivers_do_not_block_each_other(self):
+        driver_a = self.open_driver("sim-a")
+        driver_b = self.open_driver("sim-b")
+        observer_a = BlockingObserver(hold=[0])
+        observer_b = BlockingObserver()
+        driver_a.observer_register(observer_a)
+        driver_b.observer_register(observer_b)
+
+        inject(driver_a, conn_param_update(0, 1))
+        self.assertTrue(observer_a.holding.wait(2))
+        inject(driver_b, conn_param_update(0, 1))
+        self.assertEqual(observer_b.events.get(timeout=2)[:2], (0, 1))
+        observer_a.release.set()
+        self.assertEqual(observer_a.events.get(timeout=2)[:2], (0, 1))
+
+    def test_connections_in_parallel(self):
+        ble_driver = self.open_driver("sim-workers", dispatch_workers=3)
+        observer = BlockingObserver(hold=[0])
+        ble_driver.observer_register(observer)
+
+        inject(ble_driver, conn_param_update(0, 0))
+        self.assertTrue(observer.holding.wait(2))
+        for n in range(1, 4):
+            inject(ble_driver, conn_param_update(0, n))
+        for n in range(10):
+            inject(ble_driver, conn_param_update(1, n))
+
+        # Connection 1 goes ahead while connection 0 is held up, in order
+        self.assertEqual(
+            [observer.events.get(timeout=2)[:2] for _ in range(10)],
+            [(1, n) for n in range(10)],
+        )
+        observer.hold.clear()
+        observer.release.set()
+        self.assertEqual(
+            [observer.events.get(timeout=2)[:2] for _ in range(4)],
+            [(0, n) for n in range(4)],
+        )
+
+    def test_log_waits_for_event_dispatch(self):
+        ble_driver = self.open_driver("sim-serial")
+        observer = BlockingObserver(hold=[0])
+        ble_driver.observer_register(observer)
+
+        inject(ble_driver, conn_param_update(0, 0))
+        self.assertTrue(observer.holding.wait(2))
+        ble_driver.log_message_handler(
+            ble_driver.rpc_adapter, RpcLogSeverity.info.value, "held back"
+        )
+        # The log thread waits for the event thread's observer call
+        self.assertRaises(Exception, observer.events.get, timeout=0.2)
+        observer.release.set()
+        self.assertEqual(observer.events.get(timeout=2)[:2], (0, 0))
+        self.assertEqual(observer.events.get(timeout=2)[:2], ("log", "held back"))
+
+    def test_unregister_during_dispatch(self):
+        ble_driver = self.open_driver("sim-unregister")
+        observer = BlockingObserver(hold=[0])
+        other = BlockingObserver()
+        ble_driver.observer_register(observer)
+        ble_driver.observer_register(other)
+
+        inject(ble_driver, conn_param_update(0, 0))
+        self.assertTrue(observer.holding.wait(2))
+        # Does not wait for the dispatch, which goes on with its own copy
+        ble_driver.observer_unregister(other)
+        observer.release.set()
+        self.assertEqual(observer.events.get(timeout=2)[:2], (0, 0))
+        self.assertEqual(other.events.get(timeout=2)[:2], (0, 0))
+
+        inject(ble_driver, conn_param_update(0, 1))
+        self.assertEqual(observer.events.get(timeout=2)[:2], (0, 1))
+        self.assertTrue(other.events.empty())
+
+
+class ExclusiveGetTest(unittest.TestCase):
+    def test_connection_held_until_release(self):
+        q = EventQueue(connection=lambda item: item[0])
+        for item in [("a", 1), ("a", 2), ("b", 1), (None, 1), (None, 2)]:
+            q.put(item)
+        conn, item = q.get_exclusive(timeout=0)
+        self.assertEqual((conn, item), ("a", ("a", 1)))
+        self.assertEqual(q.get_exclusive(timeout=0)[1], ("b", 1))
+        self.assertEqual(q.get_exclusive(timeout=0)[1], (None, 1))
+        # a, b and the items without a connection are all held
+        with self.assertRaises(Exception):
+            q.get_exclusive(timeout=0.01)
+        q.release("a")
+        self.assertEqual(q.get_exclusive(timeout=0)[1], ("a", 2))
+        q.release(None)
+        self.assertEqual(q.get_exclusive(timeout=0)[1], (None, 2))
+
+    def test_release_wakes_waiting_worker(self):
+        q = EventQueue(connection=lambda item: item[0])
+        q.put(("a", 1))
+        q.put(("a", 2))
+        q.get_exclusive(timeout=0)
+        threading.Timer(0.05, q.release, args=("a",)).start()
+        self.assertEqual(q.get_exclusive(timeout=2)[1], ("a", 2))
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,191 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import logging
+import shutil
+import tempfile
+import time
+import unittest
+from queue import Queue
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_driver import (
+    BLEAdvData,
+    BLEDriver,
+    BLEGapAddr,
+    BLEGapAdvParams,
+    BLEGapEncInfo,
+    BLEGapEncKey,
+    BLEGapIdKey,
+    BLEGapMasterId,
+    BLEGapScanParams,
+)
+from pc_ble_driver_py.bond_store import Bond, BondStore
+from pc_ble_driver_py.observers import BLEDriverObserver
+from pc_ble_driver_py.rpa_resolver import RpaResolver, is_rpa, resolve_rpa
+from rpa_vectors import SAMPLE_IRK, sample_rpa
+
+logger = logging.getLogger(__name__)
+
+
+def irk(i):
+    return i.to_bytes(4, "little") * 4
+
+
+class RpaResolverTest(unittest.TestCase):
+    def test_resolve_rpa(self):
+        self.assertTrue(resolve_rpa(SAMPLE_IRK, sample_rpa()))
+        self.assertFalse(resolve_rpa(SAMPLE_IRK, sample_rpa(b"\x0d\xfb\xab")))
+        self.assertFalse(resolve_rpa(irk(1), sample_rpa()))
+        self.assertTrue(is_rpa(sample_rpa()))
+        self.assertFalse(is_rpa(bytes.fromhex("C081940dfbaa")))
+
+    def test_resolve_many(self):
+        resolver = RpaResolver()
+        for i in range(1000):
+            resolver.add(irk(i), "peer-{}".format(i))
+        resolver.add(SAMPLE_IRK, "peer")
+        addrs = [sample_rpa(), sample_rpa(b"\x00\x00\x01"), sample_rpa(b"\x00\x00\x02")]
+        addrs.append(addrs[0])
+        addrs.append(bytes.fromhex("C10203040506"))
+        self.assertEqual(resolver.resolve_many(addrs), ["peer", None, None, "peer", None])
+        stats = resolver.stats()
+        self.assertEqual((stats["misses"], stats["resolved"], stats["cached"]), (3, 1, 3))
+
+        # Cached, misses included
+        self.assertEqual(resolver.resolve(BLEGapAddr(2, list(addrs[0]))), "peer")
+        self.assertIsNone(resolver.resolve(addrs[1]))
+        self.assertEqual(resolver.stats()["hits"], 2)
+        self.assertEqual(resolver.stats()["misses"], 3)
+
+    def test_add_and_remove(self):
+        resolver = RpaResolver()
+        addr = sample_rpa()
+        self.assertIsNone(resolver.resolve(addr))
+        resolver.add(SAMPLE_IRK)
+        self.assertEqual(resolver.resolve(addr), SAMPLE_IRK)
+        resolver.remove(SAMPLE_IRK)
+        self.assertIsNone(resolver.resolve(addr))
+        self.assertEqual(len(resolver), 0)
+
+    def test_expiry_and_lru(self):
+        now = [0.0]
+        resolver = RpaResolver(cache_size=2, rotation_period=10.0, clock=lambda: now[0])
+        resolver.add(SAMPLE_IRK, "peer")
+        addrs = [sample_rpa(bytes([0, 0, i])) for i in range(2)]
+        addrs.insert(0, sample_rpa())
+        resolver.resolve_many(addrs[:2])
+        resolver.resolve(addrs[0])
+        resolver.resolve(addrs[2])
+        # addrs[1] was least recently used
+        self.assertEqual(list(resolver._cache), [addrs[0], addrs[2]])
+        misses = resolver.misses
+        now[0] = 10.0
+        self.assertEqual(resolver.resolve(addrs[0]), "peer")
+        self.assertEqual(resolver.misses, misses + 1)
+
+
+class Observer(BLEDriverObserver):
+    def __init__(self):
+        self.adv_reports = Queue()
+
+    def on_gap_evt_adv_report(self, ble_driver, conn_handle, peer_addr, rssi, adv_type, adv_data):
+        self.adv_reports.put(peer_addr)
+
+
+class AdvReportIdentity(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.drivers = []
+
+    def tearDown(self):
+        for ble_driver in self.drivers:
+            ble_driver.close()
+        shutil.rmtree(self.path)
+
+    def open(self, port, **kwargs):
+        ble_driver = BLEDriver(serial_port=port, **kwargs)
+        ble_driver.open()
+        ble_driver.ble_enable()
+        self.drivers.append(ble_driver)
+        return ble_driver
+
+    def test_identity(self):
+        identity = BLEGapAddr(BLEGapAddr.Types.random_static, [0xC1, 2, 3, 4, 5, 6])
+        enc_key = BLEGapEncKey(
+            BLEGapMasterId(ediv=1, rand=[0] * 8),
+            BLEGapEncInfo(ltk=[0] * 16, auth=0, lesc=0, ltk_len=16),
+        )
+        store = BondStore(self.path)
+        store.store(
+            Bond(identity, peer_enc_key=enc_key, peer_id_key=BLEGapIdKey(list(SAMPLE_IRK), identity))
+        )
+        central = self.open("sim-rpa-central", rpa_resolver=BondStore(self.path).resolver)
+        observer = Observer()
+        central.observer_register(observer)
+
+        peripheral = self.open("sim-rpa-peripheral")
+        rpa = sample_rpa()
+        peripheral.ble_gap_addr_set(
+            BLEGapAddr(BLEGapAddr.Types.random_private_resolvable, list(rpa))
+        )
+        peripheral.ble_gap_adv_data_set(BLEAdvData(complete_local_name="rpa"))
+        peripheral.ble_gap_adv_start(BLEGapAdvParams(interval_ms=20, timeout_s=0))
+
+        central.ble_gap_scan_start(
+            BLEGapScanParams(interval_ms=20, window_ms=20, timeout_s=0, active=False)
+        )
+        peer_addr = observer.adv_reports.get(timeout=2)
+        time.sleep(0.2)
+        central.ble_gap_scan_stop()
+        self.assertEqual(peer_addr.addr, list(rpa))
+        self.assertEqual(peer_addr.identity.addr, identity.addr)
+        stats = central.rpa_resolver.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertGreater(stats["hits"], 0)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
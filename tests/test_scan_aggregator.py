@@ -0,0 +1,173 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import logging
+import time
+import unittest
+from queue import Queue
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_driver import BLEAdvData, BLEDriver, BLEGapAdvParams, BLEGapScanParams
+from pc_ble_driver_py.observers import BLEDriverObserver
+from pc_ble_driver_py.scan_aggregator import ScanAggregator
+
+logger = logging.getLogger(__name__)
+
+ADDR = bytes([1, 2, 3, 4, 5, 0xC6])
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class ScanAggregatorTable(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+
+    def test_repeats_held_back(self):
+        aggregator = ScanAggregator(clock=self.clock)
+        self.assertTrue(aggregator.update(1, ADDR, False, b"\x02\x01\x06", -40))
+        for rssi in (-50, -60, -30):
+            self.clock.now += 0.02
+            self.assertFalse(aggregator.update(1, ADDR, False, b"\x02\x01\x06", rssi))
+        # Scan responses are tracked apart from the advertising data
+        self.assertTrue(aggregator.update(1, ADDR, True, b"\x03\x09ab", -40))
+        self.assertFalse(aggregator.update(1, ADDR, False, b"\x02\x01\x06", -40))
+        self.assertTrue(aggregator.update(1, ADDR, False, b"\x02\x01\x04", -40))
+        # Same address of another type is another advertiser
+        self.assertTrue(aggregator.update(2, ADDR, False, b"\x02\x01\x04", -40))
+
+        entry = next(e for e in aggregator.snapshot() if e.addr_type == 1)
+        self.assertEqual(entry.count, 7)
+        self.assertEqual((entry.rssi_min, entry.rssi_max, entry.rssi), (-60, -30, -40))
+        self.assertAlmostEqual(entry.rssi_mean, -300 / 7.0)
+        self.assertEqual(entry.first_seen, 100.0)
+        self.assertAlmostEqual(entry.last_seen, 100.06)
+        self.assertEqual(aggregator.stats(), dict(advertisers=2, received=8, reported=4))
+
+    def test_report_interval(self):
+        aggregator = ScanAggregator(report_interval=1.0, clock=self.clock)
+        reported = 0
+        for _ in range(100):
+            reported += aggregator.update(1, ADDR, False, b"", -40)
+            self.clock.now += 0.05
+        self.assertEqual(reported, 5)
+
+    def test_max_age(self):
+        aggregator = ScanAggregator(max_age=10, clock=self.clock)
+        self.assertTrue(aggregator.update(1, ADDR, False, b"", -40))
+        self.clock.now += 5
+        self.assertFalse(aggregator.update(1, ADDR, False, b"", -40))
+        self.clock.now += 11
+        self.assertTrue(aggregator.update(1, ADDR, False, b"", -40))
+        self.assertEqual(aggregator.snapshot()[0].count, 1)
+
+        self.clock.now += 11
+        self.assertEqual(aggregator.expire(), 1)
+        self.assertEqual(aggregator.snapshot(), [])
+
+    def test_snapshot_since(self):
+        aggregator = ScanAggregator(clock=self.clock)
+        aggregator.update(1, ADDR, False, b"", -40)
+        self.clock.now += 1
+        aggregator.update(1, bytes(6), False, b"", -40)
+        snapshot = aggregator.snapshot(since=100.5)
+        self.assertEqual([entry.addr for entry in snapshot], [bytes(6)])
+        # Copies, the table goes on changing
+        aggregator.update(1, bytes(6), False, b"", -40)
+        self.assertEqual(snapshot[0].count, 1)
+
+
+class Observer(BLEDriverObserver):
+    def __init__(self):
+        self.adv_reports = Queue()
+
+    def on_gap_evt_adv_report(self, ble_driver, conn_handle, peer_addr, rssi, adv_type, adv_data):
+        self.adv_reports.put((adv_type, adv_data.records))
+
+
+class ScanAggregatorDriver(unittest.TestCase):
+    def setUp(self):
+        self.aggregator = ScanAggregator()
+        self.central = BLEDriver(
+            serial_port="sim-aggregator-central", scan_aggregator=self.aggregator
+        )
+        self.peripheral = BLEDriver(serial_port="sim-aggregator-peripheral")
+        for ble_driver in (self.central, self.peripheral):
+            ble_driver.open()
+            ble_driver.ble_enable()
+        self.observer = Observer()
+        self.central.observer_register(self.observer)
+
+    def tearDown(self):
+        self.central.close()
+        self.peripheral.close()
+
+    def test_repeated_reports_dropped(self):
+        self.peripheral.ble_gap_adv_data_set(BLEAdvData(complete_local_name="one"))
+        self.peripheral.ble_gap_adv_start(BLEGapAdvParams(interval_ms=20, timeout_s=0))
+        self.central.ble_gap_scan_start(
+            BLEGapScanParams(interval_ms=20, window_ms=20, timeout_s=0, active=False)
+        )
+        time.sleep(0.5)
+        self.assertEqual(self.observer.adv_reports.qsize(), 1)
+        _, records = self.observer.adv_reports.get()
+        self.assertEqual(records[BLEAdvData.Types.complete_local_name], list(b"one"))
+
+        self.peripheral.ble_gap_adv_data_set(BLEAdvData(complete_local_name="two"))
+        _, records = self.observer.adv_reports.get(timeout=1)
+        self.assertEqual(records[BLEAdvData.Types.complete_local_name], list(b"two"))
+
+        stats = self.aggregator.stats()
+        self.assertEqual(stats["advertisers"], 1)
+        self.assertGreater(stats["received"], 5 * stats["reported"])
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,208 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import logging
+import unittest
+from queue import Queue
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_adapter import BLEAdapter
+from pc_ble_driver_py.ble_driver import (
+    BLEUUID,
+    BLEAdvData,
+    BLEConfig,
+    BLEConfigConnGatt,
+    BLEDriver,
+    BLEGapConnSecMode,
+    BLEGattCharProps,
+    BLEGattHandle,
+    BLEGattsAttr,
+    BLEGattsAttrMD,
+    BLEGattsCharHandles,
+    BLEGattsCharMD,
+    BLEGattsHVXParams,
+    BLEUUIDBase,
+    driver,
+)
+from pc_ble_driver_py.observers import BLEAdapterObserver, BLEDriverObserver
+from pc_ble_driver_py.sim_driver import radio
+
+logger = logging.getLogger(__name__)
+
+CFG_TAG = 1
+ADV_NAME = "sim_driver"
+UUID_CUSTOM_SERVICE = 0x1111
+UUID_CUSTOM_CHAR = 0x2222
+CUSTOM_BASE = [0x11, 0x22, 0x33, 0x44, 0x00, 0x00, 0x55, 0x66,
+               0x77, 0x88, 0x99, 0xAA, 0xBB, 0xCC, 0xDD, 0xEE]
+
+
+class Observer(BLEDriverObserver, BLEAdapterObserver):
+    def __init__(self, adapter):
+        self.adapter = adapter
+        self.conn_q = Queue()
+        self.disconnect_q = Queue()
+        self.notification_q = Queue()
+        self.write_q = Queue()
+        adapter.observer_register(self)
+        adapter.driver.observer_register(self)
+
+    def on_gap_evt_connected(self, ble_driver, conn_handle, peer_addr, role, conn_params):
+        self.conn_q.put(conn_handle)
+
+    def on_gap_evt_disconnected(self, ble_driver, conn_handle, reason):
+        self.disconnect_q.put((conn_handle, reason))
+
+    def on_gap_evt_adv_report(self, ble_driver, conn_handle, peer_addr, rssi, adv_type, adv_data):
+        name = adv_data.records.get(BLEAdvData.Types.complete_local_name)
+        if name and "".join(chr(c) for c in name) == ADV_NAME:
+            self.adapter.connect(peer_addr, tag=CFG_TAG)
+
+    def on_gatts_evt_write(self, ble_driver, conn_handle, attr_handle, uuid, op, auth_required, offset, length, data):
+        self.write_q.put((attr_handle, list(data)))
+
+    def on_notification(self, ble_adapter, conn_handle, uuid, data):
+        self.notification_q.put(data)
+
+
+def open_adapter(port, att_mtu=247):
+    adapter = BLEAdapter(BLEDriver(serial_port=port, auto_flash=False))
+    adapter.default_mtu = att_mtu
+    adapter.open()
+    gatt_cfg = BLEConfigConnGatt(att_mtu=att_mtu)
+    adapter.driver.ble_cfg_set(BLEConfig.conn_gatt, gatt_cfg)
+    adapter.driver.ble_enable()
+    return adapter
+
+
+class SimDriver(unittest.TestCase):
+    def setUp(self):
+        self.central = Observer(open_adapter("sim-central"))
+        self.peripheral = Observer(open_adapter("sim-peripheral"))
+
+        base = BLEUUIDBase(CUSTOM_BASE)
+        self.char_uuid = BLEUUID(UUID_CUSTOM_CHAR, base)
+        self.char_handles = BLEGattsCharHandles()
+        serv_handle = BLEGattHandle()
+        props = BLEGattCharProps(read=True, write=True, write_wo_resp=True, notify=True)
+        perm = BLEGapConnSecMode()
+        perm.set_open()
+        attr_md = BLEGattsAttrMD(read_perm=perm, write_perm=perm)
+        attr = BLEGattsAttr(uuid=self.char_uuid, attr_md=attr_md, max_len=244, value=[0])
+        peripheral = self.peripheral.adapter.driver
+        peripheral.ble_vs_uuid_add(base)
+        peripheral.ble_gatts_service_add(
+            driver.BLE_GATTS_SRVC_TYPE_PRIMARY, BLEUUID(UUID_CUSTOM_SERVICE, base), serv_handle
+        )
+        peripheral.ble_gatts_characteristic_add(
+            serv_handle.handle, BLEGattsCharMD(char_props=props), attr, self.char_handles
+        )
+        peripheral.ble_gap_adv_data_set(BLEAdvData(complete_local_name=ADV_NAME))
+        peripheral.ble_gap_adv_start(tag=CFG_TAG)
+
+    def tearDown(self):
+        radio.reset()
+        self.central.adapter.close()
+        self.peripheral.adapter.close()
+
+    def connect(self):
+        self.central.adapter.driver.ble_gap_scan_start()
+        self.conn_handle = self.central.conn_q.get(timeout=5)
+        self.periph_conn_handle = self.peripheral.conn_q.get(timeout=5)
+        self.central.adapter.service_discovery(self.conn_handle)
+
+    def test_discovery(self):
+        self.connect()
+        db_conn = self.central.adapter.db_conns[self.conn_handle]
+        self.assertEqual(
+            db_conn.get_char_value_handle(self.char_uuid), self.char_handles.value_handle
+        )
+
+    def test_read_write_notify(self):
+        self.connect()
+        self.central.adapter.write_req(self.conn_handle, self.char_uuid, [1, 2, 3])
+        self.assertEqual(
+            self.peripheral.write_q.get(timeout=2), (self.char_handles.value_handle, [1, 2, 3])
+        )
+        status, data = self.central.adapter.read_req(self.conn_handle, self.char_uuid)
+        self.assertEqual(data, [1, 2, 3])
+
+        self.central.adapter.enable_notification(self.conn_handle, self.char_uuid)
+        hvx_params = BLEGattsHVXParams(
+            handle=self.char_handles, hvx_type=driver.BLE_GATT_HVX_NOTIFICATION, data=[4, 5]
+        )
+        self.peripheral.adapter.driver.ble_gatts_hvx(self.periph_conn_handle, hvx_params)
+        self.assertEqual(self.central.notification_q.get(timeout=2), [4, 5])
+
+    def test_att_mtu_limit(self):
+        radio.configure(att_mtu=100)
+        self.connect()
+        mtu = self.central.adapter.att_mtu_exchange(self.conn_handle, 247)
+        self.assertEqual(mtu, 100)
+
+    def test_write_cmd_stream_with_packet_loss(self):
+        radio.configure(packet_loss=0.2, seed=1)
+        self.connect()
+        self.central.adapter.att_mtu_exchange(self.conn_handle, 247)
+        data = bytes(i & 0xFF for i in range(5000))
+        stats = self.central.adapter.write_cmd_stream(self.conn_handle, self.char_uuid, data)
+        self.assertEqual(stats["bytes"], len(data))
+
+        received = bytearray()
+        while len(received) < len(data):
+            _, chunk = self.peripheral.write_q.get(timeout=2)
+            received.extend(chunk)
+        self.assertEqual(bytes(received), data)
+
+    def test_disconnect(self):
+        self.connect()
+        self.central.adapter.disconnect(self.conn_handle)
+        conn_handle, _ = self.peripheral.disconnect_q.get(timeout=5)
+        self.assertEqual(conn_handle, self.periph_conn_handle)
+        self.assertEqual(self.central.disconnect_q.get(timeout=5)[0], self.conn_handle)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,106 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import logging
+import timeit
+import unittest
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+
+import pc_ble_driver_py.ble_driver_types as util
+
+logger = logging.getLogger(__name__)
+
+ITERATIONS = 2000
+PAYLOAD_SIZES = (20, 244, 512)
+
+
+def legacy_uint8_array_to_list(array_pointer, length):
+    data_array = util.ble_driver.uint8_array.frompointer(array_pointer)
+    return util._populate_list(data_array, length)
+
+
+def legacy_list_to_uint8_array(data_list):
+    return util._populate_array(data_list, util.ble_driver.uint8_array)
+
+
+class Uint8ConversionTest(unittest.TestCase):
+    def test_round_trip(self):
+        for size in PAYLOAD_SIZES:
+            value = bytes(i & 0xFF for i in range(size))
+            data_array = util.bytes_to_uint8_array(value)
+            self.assertEqual(value, util.uint8_array_to_bytes(data_array.cast(), size))
+            self.assertEqual(
+                legacy_uint8_array_to_list(data_array.cast(), size),
+                util.uint8_array_to_list(data_array.cast(), size),
+            )
+
+    def test_accepts_bytes_like(self):
+        value = [0x01, 0x02, 0xFE, 0xFF]
+        for data in (value, bytes(value), bytearray(value), memoryview(bytes(value))):
+            data_array = util.list_to_uint8_array(data)
+            self.assertEqual(value, util.uint8_array_to_list(data_array.cast(), 4))
+
+    def test_conversion_benchmark(self):
+        for size in PAYLOAD_SIZES:
+            value = bytes(i & 0xFF for i in range(size))
+            value_list = list(value)
+            data_array = util.bytes_to_uint8_array(value)
+            pointer = data_array.cast()
+
+            conversions = dict(
+                to_list_legacy=lambda: legacy_uint8_array_to_list(pointer, size),
+                to_bytes=lambda: util.uint8_array_to_bytes(pointer, size),
+                from_list_legacy=lambda: legacy_list_to_uint8_array(value_list),
+                from_bytes=lambda: util.bytes_to_uint8_array(value),
+            )
+            for name, func in conversions.items():
+                elapsed = min(timeit.repeat(func, number=ITERATIONS, repeat=3))
+                logger.info(
+                    "%3d bytes %-16s %8.2f us", size, name, elapsed / ITERATIONS * 1e6
+                )
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
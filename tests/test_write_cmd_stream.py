@@ -0,0 +1,166 @@
+#
+# Copyright (c) 2019 Nordic Semiconductor ASA
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#   1. Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+#   2. Redistributions in binary form must reproduce the above copyright notice, this
+#   list of conditions and the following disclaimer in the documentation and/or
+#   other materials provided with the distribution.
+#
+#   3. Neither the name of Nordic Semiconductor ASA nor the names of other
+#   contributors to this software may be used to endorse or promote products
+#   derived from this software without specific prior written permission.
+#
+#   4. This software must only be used in or with a processor manufactured by Nordic
+#   Semiconductor ASA, or in or with a processor manufactured by a third party that
+#   is used in combination with a processor manufactured by Nordic Semiconductor.
+#
+#   5. Any software provided in binary or object form under this license must not be
+#   reverse engineered, decompiled, modified and/or disassembled.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import logging
+import threading
+import unittest
+
+from pc_ble_driver_py import config
+
+config.__conn_ic_id__ = "NRF52"
+config.__driver_backend__ = "sim"
+
+from pc_ble_driver_py.ble_adapter import (
+    BLEAdapter,
+    Connection,
+    EvtSync,
+    TxCredits,
+    _split_chunks,
+)
+from pc_ble_driver_py.ble_driver import BLEEvtID, BLEGapAddr, BLEGapRoles, driver
+from pc_ble_driver_py.exceptions import NordicSemiException
+
+from fake_driver import FakeDriver
+
+logger = logging.getLogger(__name__)
+
+CONN_HANDLE = 0
+VALUE_HANDLE = 0x10
+QUEUE_SIZE = 4
+
+
+class TxQueueDriver(FakeDriver):
+    """Accepts write commands while its TX queue has room."""
+
+    def __init__(self, queue_size):
+        super(TxQueueDriver, self).__init__()
+        self.queue_size = queue_size
+        self.queued = 0
+        self.written = list()
+        self.lock = threading.Lock()
+
+    def ble_gattc_write(self, conn_handle, write_params):
+        with self.lock:
+            if self.queued == self.queue_size:
+                raise NordicSemiException(
+                    "Failed to ble_gattc_write. Error code: NRF_ERROR_RESOURCES",
+                    error_code=driver.NRF_ERROR_RESOURCES,
+                )
+            self.queued += 1
+            self.written.append(bytes(write_params.data))
+        self.tx_complete()
+
+    def tx_complete(self):
+        self.post("on_gattc_evt_write_cmd_tx_complete", conn_handle=CONN_HANDLE, count=1)
+
+    def dispatch(self, method, kwargs):
+        with self.lock:
+            self.queued -= kwargs["count"]
+        super(TxQueueDriver, self).dispatch(method, kwargs)
+
+
+class WriteCmdStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = TxQueueDriver(QUEUE_SIZE)
+        self.adapter = self._adapter(self.driver)
+
+    def tearDown(self):
+        self.driver.stop()
+
+    def _adapter(self, ble_driver):
+        adapter = BLEAdapter(ble_driver)
+        adapter.db_conns[CONN_HANDLE] = Connection(
+            BLEGapAddr(BLEGapAddr.Types.public, [0] * 6),
+            BLEGapRoles.central,
+            write_cmd_tx_queue_size=QUEUE_SIZE,
+        )
+        adapter.evt_sync[CONN_HANDLE] = EvtSync(events=BLEEvtID)
+        return adapter
+
+    def test_split_chunks(self):
+        self.assertEqual(
+            [b"abc", b"def", b"g"], [bytes(c) for c in _split_chunks(b"abcdefg", 3)]
+        )
+        self.assertEqual([[1, 2], [3]], [list(c) for c in _split_chunks([1, 2, 3], 2)])
+        self.assertEqual(
+            [b"ab", b"c", b"de"],
+            [bytes(c) for c in _split_chunks(iter([b"abc", [100, 101]]), 2)],
+        )
+
+    def test_tx_credits(self):
+        credits = TxCredits(2)
+        self.assertTrue(credits.acquire(0))
+        self.assertTrue(credits.acquire(0))
+        self.assertFalse(credits.acquire(0))
+        credits.release(5)
+        self.assertEqual(2, credits.available)
+        self.assertTrue(credits.wait_all(0))
+        credits.clear()
+        self.assertFalse(credits.wait_all(0))
+
+    def test_stream(self):
+        data = bytes(range(256)) * 4
+        stats = self.adapter.write_cmd_stream(
+            CONN_HANDLE, None, data, attr_handle=VALUE_HANDLE, timeout=2
+        )
+        self.assertEqual(data, b"".join(self.driver.written))
+        self.assertTrue(all(len(p) <= 20 for p in self.driver.written))
+        self.assertEqual(len(data), stats["bytes"])
+        self.assertEqual(len(self.driver.written), stats["packets"])
+        self.assertEqual(0, stats["resource_errors"])
+        logger.info("write_cmd_stream: %s", stats)
+
+    def test_resources_error_retries(self):
+        # TX queue filled by another writer, sent a bit later
+        self.driver.queued = QUEUE_SIZE
+        for _ in range(QUEUE_SIZE):
+            threading.Timer(0.1, self.driver.tx_complete).start()
+
+        stats = self.adapter.write_cmd_stream(
+            CONN_HANDLE, None, b"x" * 50, attr_handle=VALUE_HANDLE, timeout=2
+        )
+        self.assertEqual(b"x" * 50, b"".join(self.driver.written))
+        self.assertEqual(1, stats["resource_errors"])
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromName(__name__)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()